@@ -10,17 +10,22 @@ from flask_login import LoginManager, login_required, current_user
 # Department will be imported inside functions to avoid circular imports
 
 
-def compute_sqlite_uri():
-    """Compute SQLite database URI for the current instance"""
-    # Create base directory for databases
-    base_dir = os.path.join(os.getcwd(), 'hanamantdatabase')
-    os.makedirs(base_dir, exist_ok=True)
-
+def db_instance_name():
+    """Name of the current database instance; each branch runs its own instance"""
     # Determine instance identifier
     instance = os.environ.get('SPA_DB_INSTANCE') or os.environ.get('REPL_SLUG') or 'default'
 
     # Sanitize instance name to prevent path traversal
-    instance = re.sub(r'[^A-Za-z0-9_-]', '_', instance)
+    return re.sub(r'[^A-Za-z0-9_-]', '_', instance)
+
+
+def compute_sqlite_uri(instance=None):
+    """Compute SQLite database URI for the current instance, or for another branch's instance"""
+    # Create base directory for databases
+    base_dir = os.path.join(os.getcwd(), 'hanamantdatabase')
+    os.makedirs(base_dir, exist_ok=True)
+
+    instance = re.sub(r'[^A-Za-z0-9_-]', '_', instance) if instance else db_instance_name()
 
     # Create absolute path to database file
     db_path = os.path.abspath(os.path.join(base_dir, f'{instance}.db'))
@@ -47,7 +52,9 @@ class Base(DeclarativeBase):
     pass
 
 
-db = SQLAlchemy(model_class=Base)
+# Sessions pick the branch database bound to the current request (services/branch_router.py)
+from services.branch_router import BranchRoutingSession
+db = SQLAlchemy(model_class=Base, session_options={'class_': BranchRoutingSession})
 
 # create the app
 app = Flask(__name__)
@@ -215,6 +222,13 @@ from modules.packages.new_packages_views import *
 from modules.packages.membership_views import *
 from modules.packages.professional_packages_views import *
 
+# Route requests to per-branch databases when SPA_BRANCHES or branch locations are configured
+from services.branch_router import branch_router
+branch_router.init_app(app)
+
+# Periodic maintenance jobs are not started on import; they run from run_background_jobs.py
+# (or the dev server with BACKGROUND_JOBS=1), see services/background_jobs.py
+
 # Missing route endpoints to fix template BuildErrors
 @app.route('/system_management')
 @login_required
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Endpoint Benchmark Suite
+Builds a scaled synthetic database in its own instance with the bulk demo data generator,
+drives the key pages and APIs in-process through the Flask test client and records
+p50/p95 latency and query counts to a JSON baseline that later runs are compared against
+
+Usage:
+    python benchmark_endpoints.py [--appointments N] [--staff N] [--customers N] [--years N]
+                                  [--invoices N] [--batches N] [--seed N] [--scale S]
+                                  [--iterations N] [--baseline PATH] [--update-baseline]
+                                  [--reuse] [--anchor-date YYYY-MM-DD]
+
+The database lives in hanamantdatabase/<BENCHMARK_DB_INSTANCE>.db (default 'benchmark')
+and is rebuilt on every run unless --reuse is given. The size flags map onto ScaleSpec;
+--scale starts from ScaleSpec.from_scale (1.0 = 1M appointments, 200k customers) instead
+of the benchmark's default dataset, and explicit size flags still override it.
+--anchor-date fixes the dataset's 'today' so the same seed builds the same rows on any day;
+without it a run reuses the baseline's anchor date, or today when there is no baseline.
+Exits with 1 when an endpoint is slower or issues more queries than the baseline allows.
+"""
+
+import os
+import sys
+
+# The app picks its database when it is imported, so point it at the benchmark instance first
+os.environ['SPA_DB_INSTANCE'] = os.environ.get('BENCHMARK_DB_INSTANCE', 'benchmark')
+os.environ.setdefault('BACKGROUND_JOBS', '0')
+os.environ.setdefault('SESSION_SECRET', 'benchmark')
+
+import json
+import platform
+import time
+from dataclasses import asdict, dataclass
+from datetime import date, datetime
+from typing import Dict, List
+
+import sqlalchemy
+from sqlalchemy import event
+
+from app import app, db
+from models import User
+from demo_data.scale_data_generator import ScaleDataGenerator, ScaleSpec
+
+DEFAULT_BASELINE_PATH = 'benchmark_baseline.json'
+
+# A run regresses when p95 exceeds the baseline by this fraction and by at least
+# P95_MIN_REGRESSION_MS, or when an endpoint issues more queries than before
+P95_TOLERANCE = 0.25
+P95_MIN_REGRESSION_MS = 5.0
+
+# Benchmark dataset without --scale, as ScaleSpec fields; each size flag overrides one of them
+DEFAULT_DATASET = {'appointments': 75_000, 'customers': 5_000, 'years': 2.0, 'staff': 20,
+                   'invoices': 20_000, 'batches': 500}
+
+
+@dataclass
+class Endpoint:
+    name: str
+    path: str
+
+
+def benchmark_endpoints(today: date) -> List[Endpoint]:
+    day = today.isoformat()
+    month_start = today.replace(day=1).isoformat()
+    return [
+        Endpoint('calendar_booking', f'/calendar-booking?date={day}'),
+        Endpoint('staff_availability', f'/staff-availability?date={day}'),
+        Endpoint('api_appointments', f'/api/appointments?date={day}'),
+        Endpoint('integrated_billing', '/integrated-billing'),
+        Endpoint('api_inventory_products', '/api/inventory/products'),
+        Endpoint('dashboard', '/dashboard'),
+        Endpoint('reports', f'/reports?start_date={month_start}&end_date={day}'),
+    ]
+
+
+class QueryCounter:
+    """Counts statements sent to the engine while active"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    def __enter__(self):
+        self.count = 0
+        event.listen(self.engine, 'before_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, 'before_cursor_execute', self._count)
+
+
+def _percentile(values: List[float], percentile: float) -> float:
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(percentile / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+class BenchmarkRunner:
+    def __init__(self, iterations: int = 20, warmup: int = 2):
+        self.iterations = iterations
+        self.warmup = warmup
+
+    def run(self, endpoints: List[Endpoint]) -> Dict[str, Dict]:
+        client = app.test_client()
+        with app.app_context():
+            admin_id = User.query.filter_by(username='admin').first().id
+            engine = db.engine
+        with client.session_transaction() as session:
+            session['_user_id'] = str(admin_id)
+            session['_fresh'] = True
+
+        results = {}
+        for endpoint in endpoints:
+            timings, queries, status = [], [], None
+            for attempt in range(self.warmup + self.iterations):
+                with QueryCounter(engine) as counter:
+                    started = time.perf_counter()
+                    response = client.get(endpoint.path)
+                    elapsed = (time.perf_counter() - started) * 1000
+                status = response.status_code
+                if attempt >= self.warmup:
+                    timings.append(elapsed)
+                    queries.append(counter.count)
+            results[endpoint.name] = {
+                'path': endpoint.path,
+                'status': status,
+                'p50_ms': round(_percentile(timings, 50), 2),
+                'p95_ms': round(_percentile(timings, 95), 2),
+                'mean_ms': round(sum(timings) / len(timings), 2),
+                'queries': int(_percentile(queries, 50)),
+                'max_queries': max(queries)
+            }
+            print(f"  {endpoint.name:<24} {status}  p50 {results[endpoint.name]['p50_ms']:>8.1f} ms  "
+                  f"p95 {results[endpoint.name]['p95_ms']:>8.1f} ms  queries {results[endpoint.name]['queries']}")
+        return results
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict]) -> List[str]:
+    """Regressions of the current run against a baseline's endpoint results"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        if current['status'] >= 400 and current['status'] != previous['status']:
+            regressions.append(f"{name}: status {previous['status']} -> {current['status']}")
+        allowed = max(previous['p95_ms'] * (1 + P95_TOLERANCE), previous['p95_ms'] + P95_MIN_REGRESSION_MS)
+        if current['p95_ms'] > allowed:
+            regressions.append(f"{name}: p95 {previous['p95_ms']} ms -> {current['p95_ms']} ms")
+        if current['queries'] > previous['queries']:
+            regressions.append(f"{name}: queries {previous['queries']} -> {current['queries']}")
+    return regressions
+
+
+def _parse_args(argv: List[str]) -> Dict:
+    options = {'sizes': {}, 'iterations': 20, 'baseline': DEFAULT_BASELINE_PATH,
+               'update_baseline': False, 'reuse': False, 'scale': None, 'anchor_date': None}
+    size_fields = {'--appointments': 'appointments', '--staff': 'staff', '--customers': 'customers',
+                   '--years': 'years', '--invoices': 'invoices', '--batches': 'batches', '--seed': 'seed'}
+    args = list(argv)
+    while args:
+        arg = args.pop(0)
+        if arg in size_fields:
+            field_name = size_fields[arg]
+            caster = float if field_name == 'years' else int
+            options['sizes'][field_name] = caster(args.pop(0))
+        elif arg == '--iterations':
+            options['iterations'] = int(args.pop(0))
+        elif arg == '--baseline':
+            options['baseline'] = args.pop(0)
+        elif arg == '--update-baseline':
+            options['update_baseline'] = True
+        elif arg == '--reuse':
+            options['reuse'] = True
+        elif arg == '--scale':
+            options['scale'] = float(args.pop(0))
+        elif arg == '--anchor-date':
+            options['anchor_date'] = date.fromisoformat(args.pop(0))
+        else:
+            raise ValueError(f"Unknown argument '{arg}'")
+    return options
+
+
+def dataset_spec(scale, sizes: Dict, anchor: date) -> ScaleSpec:
+    """The ScaleSpec a run builds: the scaled or default dataset with the size flags applied"""
+    if scale:
+        return ScaleSpec.from_scale(scale, anchor_date=anchor, **sizes)
+    return ScaleSpec(**{**DEFAULT_DATASET, **sizes, 'anchor_date': anchor})
+
+
+def main(argv: List[str]) -> int:
+    try:
+        options = _parse_args(argv)
+    except (ValueError, IndexError) as e:
+        print(f"✗ {e}")
+        print(__doc__)
+        return 2
+
+    baseline_path = options['baseline']
+    baseline = None
+    if os.path.exists(baseline_path):
+        with open(baseline_path) as handle:
+            baseline = json.load(handle)
+
+    anchor = options['anchor_date']
+    if anchor is None and baseline and baseline.get('dataset', {}).get('anchor_date'):
+        anchor = date.fromisoformat(baseline['dataset']['anchor_date'])
+    anchor = anchor or date.today()
+
+    spec = dataset_spec(options['scale'], options['sizes'], anchor)
+    dataset = dict(asdict(spec), anchor_date=anchor.isoformat())
+    if options['scale']:
+        dataset['scale'] = options['scale']
+    print(f"Benchmark database: {app.config['SQLALCHEMY_DATABASE_URI']}")
+    if not options['reuse']:
+        started = time.perf_counter()
+        counts = ScaleDataGenerator(spec).generate()
+        print(f"✓ Dataset built in {time.perf_counter() - started:.1f}s: {counts}")
+
+    print(f"Running {options['iterations']} iterations per endpoint...")
+    results = BenchmarkRunner(options['iterations']).run(benchmark_endpoints(anchor))
+
+    run = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'dataset': dataset,
+        'iterations': options['iterations'],
+        'environment': {'python': platform.python_version(), 'sqlalchemy': sqlalchemy.__version__,
+                        'platform': platform.platform()},
+        'endpoints': results
+    }
+
+    if baseline is not None and not options['update_baseline']:
+        if baseline.get('dataset') != run['dataset']:
+            print(f"⚠ Baseline was recorded on a different dataset: {baseline.get('dataset')}")
+        regressions = compare(results, baseline.get('endpoints', {}))
+        if regressions:
+            print("\n❌ Regressions against baseline:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            return 1
+        print("\n🎉 No regressions against baseline")
+        return 0
+
+    with open(baseline_path, 'w') as handle:
+        json.dump(run, handle, indent=2)
+    print(f"\n✓ Baseline written to {baseline_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
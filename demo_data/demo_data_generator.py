@@ -1132,6 +1132,22 @@ class DemoDataGenerator:
 
 def main():
     """Main function to run demo data generation"""
+    import argparse
+    parser = argparse.ArgumentParser(description='Generate demo data for the spa management system')
+    parser.add_argument('--scale', type=float,
+                        help='Bulk mode: recreate the database with 1M appointments and 200k customers per 1.0')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for bulk mode')
+    parser.add_argument('--years', type=float, default=3.0, help='Years of history for bulk mode')
+    parser.add_argument('--anchor-date', type=date.fromisoformat,
+                        help="Bulk mode: 'today' of the dataset (YYYY-MM-DD); defaults to today")
+    args = parser.parse_args()
+
+    if args.scale:
+        from demo_data.scale_data_generator import ScaleDataGenerator, ScaleSpec
+        ScaleDataGenerator(ScaleSpec.from_scale(args.scale, seed=args.seed, years=args.years,
+                                                anchor_date=args.anchor_date)).generate()
+        return
+
     generator = DemoDataGenerator()
     generator.generate_all_demo_data()
 
@@ -0,0 +1,512 @@
+#!/usr/bin/env python3
+"""
+Scale-Factor Demo Data Generator
+Extends DemoDataGenerator with a bulk mode for load testing: the reference data (roles,
+departments, categories, service catalog) comes from the regular generator, and staff,
+shifts, customers, appointments, invoices, package usage and inventory movements are
+streamed into the database with chunked bulk INSERTs in a single time-ordered pass.
+Scale 1.0 is 1M appointments and 200k customers; the same seed and anchor date always
+produce the same rows, apart from password salts and the refresh time of derived summaries
+"""
+
+import math
+import random
+import time as clock
+from dataclasses import asdict, dataclass
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import insert, update
+from werkzeug.security import generate_password_hash
+
+from app import app, db
+from models import (
+    Appointment, Category, Customer, CustomerPackage, CustomerPackageItem, Department, EnhancedInvoice,
+    InvoiceItem, InvoicePayment, PackageTemplate, PackageTemplateItem, PackageUsage, Role, Service,
+    ShiftLogs, ShiftManagement, User
+)
+from modules.inventory.models import (
+    InventoryAuditLog, InventoryBatch, InventoryCategory, InventoryConsumption, InventoryLocation,
+    InventoryProduct
+)
+from demo_data.demo_data_generator import DemoDataGenerator
+
+# Rows per bulk INSERT statement
+INSERT_CHUNK_SIZE = 10000
+
+# Volume at scale 1.0
+BASE_APPOINTMENTS = 1_000_000
+BASE_CUSTOMERS = 200_000
+BASE_BATCHES = 5_000
+
+APPOINTMENTS_PER_STAFF_DAY = 6
+OPENING_HOUR = 9
+LAST_START_HOUR = 20
+
+# Relative booking volume per weekday (Monday first); the spa is closed on Sundays
+WEEKDAY_DEMAND = [0.8, 0.85, 0.9, 1.0, 1.15, 1.3, 0.0]
+
+# Share of customers already on the books when the generated history starts; the rest
+# sign up evenly over the period and only book after signing up
+EXISTING_CUSTOMER_SHARE = 0.3
+
+PAST_STATUS_WEIGHTS = {'completed': 85, 'cancelled': 10, 'no_show': 5}
+# Share of a package holder's bookings that are for a service their package covers
+PACKAGE_BOOKING_SHARE = 0.6
+
+PAYMENT_METHODS = ['cash', 'card', 'upi', 'wallet']
+GST_RATE = 18.0
+
+# Days an appointment can be booked ahead of the anchor date
+FUTURE_BOOKING_DAYS = 14
+
+FIRST_NAMES = ['Aarav', 'Priya', 'Rohan', 'Ananya', 'Vikram', 'Sneha', 'Arjun', 'Kavya', 'Rahul', 'Isha',
+               'Karan', 'Meera', 'Aditya', 'Pooja', 'Siddharth', 'Neha', 'Varun', 'Riya', 'Nikhil', 'Tara',
+               'Emma', 'Liam', 'Olivia', 'Noah', 'Sophia', 'Lucas', 'Mia', 'Ethan', 'Zara', 'Kabir']
+LAST_NAMES = ['Sharma', 'Patel', 'Reddy', 'Iyer', 'Gupta', 'Singh', 'Nair', 'Kulkarni', 'Mehta', 'Joshi',
+              'Rao', 'Desai', 'Chopra', 'Menon', 'Bhat', 'Verma', 'Kapoor', 'Pillai', 'Shah', 'Das',
+              'Johnson', 'Wilson', 'Rodriguez', 'Chen', 'Brown', 'Khan', 'Fernandes', 'Thomas', 'Mathew', 'Bose']
+
+INVENTORY_LOCATIONS = [('LOC001', 'Main Branch', 'branch'), ('LOC002', 'Central Warehouse', 'warehouse'),
+                       ('LOC003', 'Treatment Rooms', 'room')]
+INVENTORY_CATEGORIES = ['Massage Oils', 'Skin Care', 'Hair Care', 'Nail Care', 'Consumables']
+
+
+@dataclass
+class ScaleSpec:
+    """Volumes for one generated dataset; counts left as None follow from the others"""
+    appointments: int = BASE_APPOINTMENTS
+    customers: int = BASE_CUSTOMERS
+    years: float = 3.0
+    staff: Optional[int] = None              # enough for APPOINTMENTS_PER_STAFF_DAY
+    invoices: Optional[int] = None           # one per completed appointment
+    batches: int = BASE_BATCHES
+    movements_per_batch: int = 20
+    package_share: float = 0.05              # customers holding a prepaid package
+    seed: int = 42
+    anchor_date: Optional[date] = None       # 'today' of the dataset; defaults to today
+
+    @classmethod
+    def from_scale(cls, scale: float, **overrides) -> 'ScaleSpec':
+        spec = cls(
+            appointments=max(1, int(BASE_APPOINTMENTS * scale)),
+            customers=max(1, int(BASE_CUSTOMERS * scale)),
+            batches=max(1, int(BASE_BATCHES * scale))
+        )
+        for name, value in overrides.items():
+            if value is not None:
+                setattr(spec, name, value)
+        return spec
+
+
+class ScaleDataGenerator(DemoDataGenerator):
+    """Bulk, seeded, referentially consistent demo data at any volume"""
+
+    def __init__(self, spec: ScaleSpec):
+        super().__init__()
+        self.spec = spec
+        self.random = random.Random(spec.seed)
+        self.anchor = spec.anchor_date or date.today()
+        self.start = self.anchor - timedelta(days=int(spec.years * 365))
+        self.end = self.anchor + timedelta(days=FUTURE_BOOKING_DAYS)
+        # Timestamps derive from the anchor so reruns produce identical rows
+        self.stamp = datetime.combine(self.start, time(8, 0))
+        self.counts: Dict[str, int] = {}
+        self._buffers: Dict[object, List[Dict]] = {}
+
+    # ------------------------------------------------------------------ helpers
+
+    def _add(self, model, row: Dict) -> None:
+        rows = self._buffers.setdefault(model, [])
+        rows.append(row)
+        if len(rows) >= INSERT_CHUNK_SIZE:
+            self._flush()
+
+    def _flush(self) -> None:
+        """Write every buffer in insertion order, so parents always land before children"""
+        for model, rows in self._buffers.items():
+            if rows:
+                db.session.execute(insert(model), rows)
+                self.counts[model.__tablename__] = self.counts.get(model.__tablename__, 0) + len(rows)
+                rows.clear()
+
+    def _working_days(self) -> List[date]:
+        days, day = [], self.start
+        while day <= self.end:
+            if WEEKDAY_DEMAND[day.weekday()] > 0:
+                days.append(day)
+            day += timedelta(days=1)
+        return days
+
+    # ------------------------------------------------------------------ generation
+
+    def generate(self) -> Dict[str, int]:
+        """Recreate the schema and fill it; returns row counts per table"""
+        started = clock.perf_counter()
+        print(f"🏗️ Generating scaled demo data: {asdict(self.spec)}")
+        with app.app_context():
+            try:
+                db.drop_all()
+                db.create_all()
+                self.create_system_data()
+                self.create_service_data()
+                for model in (Role, Department, Category, Service):
+                    db.session.execute(update(model).values(created_at=self.stamp))
+                db.session.commit()
+
+                self.services = [
+                    {'id': service_id, 'duration': duration, 'price': float(price)}
+                    for service_id, duration, price in db.session.query(
+                        Service.id, Service.duration, Service.price
+                    ).order_by(Service.id).all()
+                ]
+                days = self._working_days()
+                self.create_bulk_staff(days)
+                self.create_bulk_customers()
+                self.create_bulk_packages()
+                self._flush()
+                self.create_bulk_appointments(days)
+                self.create_bulk_inventory()
+                self._flush()
+                self.finalize_packages()
+                db.session.commit()
+                print(f"✅ Bulk rows written in {clock.perf_counter() - started:.1f}s")
+
+                self.refresh_derived_data()
+            except Exception as e:
+                db.session.rollback()
+                print(f"❌ Error generating scaled demo data: {e}")
+                raise
+
+        self.counts['seconds'] = round(clock.perf_counter() - started, 1)
+        self.print_scale_summary()
+        return self.counts
+
+    def create_bulk_staff(self, days: List[date]) -> None:
+        """Admin plus enough therapists for the booking volume, each with a shift every open day"""
+        demand_days = sum(WEEKDAY_DEMAND[day.weekday()] for day in days) or 1
+        busiest = max(WEEKDAY_DEMAND) * self.spec.appointments / demand_days
+        staff_count = self.spec.staff or max(1, math.ceil(busiest / APPOINTMENTS_PER_STAFF_DAY))
+        password_hash = generate_password_hash('password123')
+
+        self._add(User, self._user_row(1, 'admin', 'Admin', 'User', 'admin', password_hash))
+        self.staff_ids = []
+        for index in range(staff_count):
+            staff_id = index + 2
+            self._add(User, self._user_row(
+                staff_id, f'therapist{index + 1:04d}', self.random.choice(FIRST_NAMES),
+                self.random.choice(LAST_NAMES), 'staff', password_hash
+            ))
+            self.staff_ids.append(staff_id)
+        self._flush()
+
+        for staff_id in self.staff_ids:
+            self._add(ShiftManagement, {'id': staff_id, 'staff_id': staff_id, 'from_date': self.start,
+                                        'to_date': self.end, 'created_at': self.stamp, 'updated_at': self.stamp})
+        self._flush()
+        for day in days:
+            status = 'completed' if day < self.anchor else 'scheduled'
+            for staff_id in self.staff_ids:
+                self._add(ShiftLogs, {
+                    'shift_management_id': staff_id, 'individual_date': day,
+                    'shift_start_time': time(OPENING_HOUR, 0), 'shift_end_time': time(21, 0),
+                    'break_start_time': time(14, 0), 'break_end_time': time(14, 30),
+                    'status': status, 'created_at': self.stamp
+                })
+
+    def _user_row(self, user_id: int, username: str, first_name: str, last_name: str,
+                  role: str, password_hash: str) -> Dict:
+        return {
+            'id': user_id, 'username': username, 'first_name': first_name, 'last_name': last_name,
+            'email': f'{username}@spa.example.com', 'role': role, 'password_hash': password_hash,
+            'is_active': True, 'employee_id': f'EMP{user_id:06d}', 'staff_code': f'STF{user_id:06d}',
+            'designation': 'Therapist' if role == 'staff' else 'Administrator',
+            'commission_rate': 10.0 if role == 'staff' else 0.0, 'hire_date': self.start,
+            'date_of_joining': self.start, 'created_at': self.stamp
+        }
+
+    def create_bulk_customers(self) -> None:
+        """Customers with sign-up dates spread over the period; ids are in sign-up order"""
+        total = self.spec.customers
+        existing = max(1, int(total * EXISTING_CUSTOMER_SHARE))
+        span = max((self.anchor - self.start).days, 1)
+        self.signup_days = []
+        for customer_id in range(1, total + 1):
+            if customer_id <= existing:
+                signup = self.start - timedelta(days=self.random.randint(1, 365))
+            else:
+                signup = self.start + timedelta(days=(customer_id - existing) * span // max(total - existing, 1))
+            self.signup_days.append(signup)
+            first_name = self.random.choice(FIRST_NAMES)
+            self._add(Customer, {
+                'id': customer_id, 'first_name': first_name, 'last_name': self.random.choice(LAST_NAMES),
+                'phone': f'9{customer_id:09d}', 'email': f'customer{customer_id}@example.com',
+                'gender': self.random.choice(['female', 'male']), 'is_active': True,
+                'created_at': datetime.combine(signup, time(10, 0))
+            })
+
+    def create_bulk_packages(self) -> None:
+        """Session packages for a share of customers; redemptions are matched during booking"""
+        service_ids = [service['id'] for service in self.services]
+        templates = []
+        for index in range(1, 5):
+            covered = self.random.sample(service_ids, k=min(2, len(service_ids)))
+            items = [(service_id, self.random.choice([5, 6, 10])) for service_id in covered]
+            price = sum(self._service(service_id)['price'] * qty for service_id, qty in items) * 0.8
+            self._add(PackageTemplate, {'id': index, 'name': f'Wellness Package {index}', 'pkg_type': 'session',
+                                        'price': round(price, 2), 'is_active': True,
+                                        'created_at': self.stamp, 'updated_at': self.stamp})
+            templates.append((index, items, price))
+        self._flush()
+        for package_id, items, _ in templates:
+            for service_id, qty in items:
+                self._add(PackageTemplateItem, {'package_id': package_id, 'service_id': service_id,
+                                                'qty': qty, 'created_at': self.stamp})
+
+        # customer id -> [item id, service id, remaining, package id, valid from, valid to, total]
+        self.package_items: Dict[int, List[List]] = {}
+        self.package_rows: Dict[int, Dict] = {}
+        holders = self.random.sample(range(1, self.spec.customers + 1),
+                                     k=int(self.spec.customers * self.spec.package_share))
+        item_id = 0
+        span = max((self.anchor - self.start).days, 1)
+        for package_row_id, customer_id in enumerate(sorted(holders), start=1):
+            package_id, items, price = self.random.choice(templates)
+            assigned = max(self.start + timedelta(days=self.random.randrange(span)),
+                           self.signup_days[customer_id - 1])
+            expires = assigned + timedelta(days=365)
+            self.package_rows[package_row_id] = {
+                'id': package_row_id, 'customer_id': customer_id, 'package_id': package_id,
+                'assigned_on': datetime.combine(assigned, time(11, 0)),
+                'expires_on': datetime.combine(expires, time(23, 59)),
+                'price_paid': round(price, 2), 'discount': 0, 'status': 'active',
+                'created_at': self.stamp, 'updated_at': self.stamp
+            }
+            self._add(CustomerPackage, self.package_rows[package_row_id])
+            for service_id, qty in items:
+                item_id += 1
+                self._add(CustomerPackageItem, {'id': item_id, 'customer_package_id': package_row_id,
+                                                'service_id': service_id, 'total_qty': qty, 'used_qty': 0,
+                                                'created_at': self.stamp, 'updated_at': self.stamp})
+                self.package_items.setdefault(customer_id, []).append(
+                    [item_id, service_id, qty, package_row_id, assigned, expires, qty])
+
+    def _service(self, service_id: int) -> Dict:
+        return next(service for service in self.services if service['id'] == service_id)
+
+    def _pick_service(self, customer_id: int) -> Dict:
+        """Package holders mostly book the services their package covers"""
+        items = self.package_items.get(customer_id)
+        if items and self.random.random() < PACKAGE_BOOKING_SHARE:
+            return self._service(self.random.choice(items)[1])
+        return self.random.choice(self.services)
+
+    def _pick_customer(self, day: date) -> int:
+        """Customers signed up by this day; earlier customers are regulars and book more often"""
+        existing = max(1, int(self.spec.customers * EXISTING_CUSTOMER_SHARE))
+        span = max((self.anchor - self.start).days, 1)
+        elapsed = min(max((day - self.start).days, 0), span)
+        available = min(self.spec.customers, existing + (self.spec.customers - existing) * elapsed // span)
+        return 1 + int(available * self.random.random() ** 1.6)
+
+    def create_bulk_appointments(self, days: List[date]) -> None:
+        """
+        Appointments day by day, each staff member's bookings back to back with random gaps.
+        Completed visits are billed (invoice, service line, payment) and redeem a package
+        session when the customer holds one for that service.
+        """
+        demand_days = sum(WEEKDAY_DEMAND[day.weekday()] for day in days) or 1
+        per_unit = self.spec.appointments / demand_days
+        invoice_cap = self.spec.invoices
+        appointment_id = invoice_id = usage_id = 0
+        carry = 0.0
+        status_names, status_weights = zip(*PAST_STATUS_WEIGHTS.items())
+
+        for day in days:
+            carry += per_unit * WEEKDAY_DEMAND[day.weekday()]
+            quota = int(carry)
+            carry -= quota
+            cursors = {staff_id: datetime.combine(day, time(OPENING_HOUR, 0)) for staff_id in self.staff_ids}
+            last_start = datetime.combine(day, time(LAST_START_HOUR, 0))
+            staff_cycle = self.staff_ids[:]
+            self.random.shuffle(staff_cycle)
+
+            for index in range(quota):
+                staff_id = staff_cycle[index % len(staff_cycle)]
+                start = cursors[staff_id] + timedelta(minutes=self.random.choice([0, 0, 15, 30, 45]))
+                if start > last_start:
+                    continue
+                customer_id = self._pick_customer(day)
+                service = self._pick_service(customer_id)
+                end = start + timedelta(minutes=service['duration'])
+                cursors[staff_id] = end + timedelta(minutes=15)
+                status = (self.random.choices(status_names, status_weights)[0]
+                          if day < self.anchor else 'scheduled')
+                created = datetime.combine(day - timedelta(days=self.random.randint(0, 10)), time(9, 0))
+                updated = end if day < self.anchor else created
+                completed = status == 'completed'
+                appointment_id += 1
+                self._add(Appointment, {
+                    'id': appointment_id, 'client_id': customer_id, 'service_id': service['id'],
+                    'staff_id': staff_id, 'appointment_date': start, 'end_time': end, 'status': status,
+                    'amount': service['price'], 'discount': 0.0, 'tips': 0.0,
+                    'payment_status': 'paid' if completed else 'pending', 'is_paid': completed,
+                    'inventory_deducted': completed, 'created_at': created, 'updated_at': updated
+                })
+                if not completed:
+                    continue
+
+                redeemed = self._redeem_package(customer_id, service['id'], day)
+                if redeemed is not None:
+                    usage_id += 1
+                    self._add(PackageUsage, {
+                        'id': usage_id, 'customer_package_id': redeemed[3],
+                        'customer_package_item_id': redeemed[0], 'usage_date': end,
+                        'service_id': service['id'], 'qty': 1, 'change_type': 'use', 'staff_id': staff_id,
+                        'appointment_id': appointment_id, 'notes': 'Package session redeemed', 'created_at': end
+                    })
+                if invoice_cap is not None and invoice_id >= invoice_cap:
+                    continue
+                invoice_id += 1
+                self._add_invoice(invoice_id, appointment_id, customer_id, staff_id, service, end,
+                                  redeemed is not None)
+
+    def _redeem_package(self, customer_id: int, service_id: int, day: date) -> Optional[List]:
+        for item in self.package_items.get(customer_id, ()):
+            if item[1] == service_id and item[2] > 0 and item[4] <= day <= item[5]:
+                item[2] -= 1
+                return item
+        return None
+
+    def _add_invoice(self, invoice_id: int, appointment_id: int, customer_id: int, staff_id: int,
+                     service: Dict, issued: datetime, from_package: bool) -> None:
+        price = service['price']
+        deduction = price if from_package else 0.0
+        net = price - deduction
+        tax = round(net * GST_RATE / 100, 2)
+        total = round(net + tax, 2)
+        self._add(EnhancedInvoice, {
+            'id': invoice_id, 'invoice_number': f'INV-{invoice_id:08d}', 'client_id': customer_id,
+            'invoice_date': issued, 'services_subtotal': price, 'packages_deduction': deduction,
+            'gross_subtotal': price, 'total_deductions': deduction, 'net_subtotal': net,
+            'cgst_rate': GST_RATE / 2, 'sgst_rate': GST_RATE / 2, 'cgst_amount': round(tax / 2, 2),
+            'sgst_amount': round(tax / 2, 2), 'tax_amount': tax, 'total_amount': total,
+            'payment_status': 'paid', 'amount_paid': total, 'balance_due': 0.0,
+            'created_at': issued, 'updated_at': issued
+        })
+        self._add(InvoiceItem, {
+            'invoice_id': invoice_id, 'item_type': 'package_service' if from_package else 'service',
+            'item_id': service['id'], 'appointment_id': appointment_id, 'staff_id': staff_id,
+            'item_name': f"Service #{service['id']}", 'quantity': 1.0, 'unit_price': price,
+            'original_amount': price, 'deduction_amount': deduction, 'final_amount': net,
+            'is_package_deduction': from_package
+        })
+        if total > 0:
+            self._add(InvoicePayment, {
+                'invoice_id': invoice_id, 'payment_method': self.random.choice(PAYMENT_METHODS),
+                'amount': total, 'payment_date': issued
+            })
+
+    def finalize_packages(self) -> None:
+        """Write the redeemed counts and final status of every customer package"""
+        item_updates, package_updates = [], {}
+        for items in self.package_items.values():
+            for item_id, _, remaining, package_id, _, expires, total in items:
+                item_updates.append({'id': item_id, 'used_qty': total - remaining, 'updated_at': self.stamp})
+                state = package_updates.setdefault(package_id, {'left': 0, 'expires': expires})
+                state['left'] += remaining
+        if item_updates:
+            db.session.execute(update(CustomerPackageItem), item_updates)
+        status_updates = [{
+            'id': package_id, 'updated_at': self.stamp,
+            'status': 'expired' if state['expires'] < self.anchor else ('completed' if state['left'] == 0 else 'active')
+        } for package_id, state in package_updates.items()]
+        if status_updates:
+            db.session.execute(update(CustomerPackage), status_updates)
+
+    def create_bulk_inventory(self) -> None:
+        """Products and batches, each batch with a receipt and a run of consumptions in its audit log"""
+        for location_id, name, kind in INVENTORY_LOCATIONS:
+            self._add(InventoryLocation, {'id': location_id, 'name': name, 'type': kind, 'status': 'active',
+                                          'created_at': self.stamp, 'updated_at': self.stamp})
+        for category_id, name in enumerate(INVENTORY_CATEGORIES, start=1):
+            self._add(InventoryCategory, {'id': category_id, 'name': name, 'is_active': True,
+                                          'created_at': self.stamp})
+        product_count = max(1, self.spec.batches // 12)
+        for product_id in range(1, product_count + 1):
+            self._add(InventoryProduct, {
+                'id': product_id, 'sku': f'SKU{product_id:06d}', 'name': f'Spa Product {product_id}',
+                'category_id': (product_id - 1) % len(INVENTORY_CATEGORIES) + 1, 'unit_of_measure': 'pcs',
+                'is_active': True, 'is_service_item': True, 'is_retail_item': product_id % 4 == 0,
+                'created_at': self.stamp, 'updated_at': self.stamp
+            })
+        self._flush()
+
+        span = max((self.anchor - self.start).days, 1)
+        audit_id = consumption_id = 0
+        for batch_id in range(1, self.spec.batches + 1):
+            received = self.start + timedelta(days=self.random.randrange(span))
+            received_at = datetime.combine(received, time(8, 30))
+            product_id = self.random.randint(1, product_count)
+            opening = float(self.random.randint(20, 200))
+            unit_cost = float(self.random.randint(50, 900))
+            movements = []
+            stock = opening
+            days_left = max((self.anchor - received).days, 1)
+            for _ in range(self.random.randint(0, 2 * self.spec.movements_per_batch)):
+                used = float(self.random.randint(1, 5))
+                if used > stock:
+                    break
+                moment = received_at + timedelta(days=self.random.randrange(days_left), hours=self.random.randint(1, 10))
+                movements.append((moment, used))
+                stock -= used
+            movements.sort()
+            self._add(InventoryBatch, {
+                'id': batch_id, 'batch_name': f'B{received:%Y%m}-{batch_id:07d}', 'created_date': received,
+                'mfg_date': received - timedelta(days=self.random.randint(10, 120)),
+                'expiry_date': received + timedelta(days=self.random.randint(180, 900)),
+                'product_id': product_id, 'location_id': self.random.choice(INVENTORY_LOCATIONS)[0],
+                'qty_available': stock, 'unit_cost': unit_cost, 'selling_price': round(unit_cost * 1.8, 2),
+                'status': 'active', 'created_at': received_at, 'updated_at': received_at
+            })
+            audit_id += 1
+            self._add(InventoryAuditLog, {
+                'id': audit_id, 'batch_id': batch_id, 'product_id': product_id, 'user_id': 1,
+                'action_type': 'adjustment_add', 'quantity_delta': opening, 'stock_before': 0.0,
+                'stock_after': opening, 'reference_type': 'adjustment', 'notes': 'Stock received',
+                'timestamp': received_at
+            })
+            level = opening
+            for moment, used in movements:
+                consumption_id += 1
+                self._add(InventoryConsumption, {
+                    'id': consumption_id, 'batch_id': batch_id, 'quantity': used,
+                    'issued_to': 'Treatment room', 'reference': f'CON-{consumption_id:08d}',
+                    'created_by': self.random.choice(self.staff_ids), 'created_at': moment
+                })
+                audit_id += 1
+                self._add(InventoryAuditLog, {
+                    'id': audit_id, 'batch_id': batch_id, 'product_id': product_id,
+                    'user_id': 1, 'action_type': 'consumption', 'quantity_delta': -used,
+                    'stock_before': level, 'stock_after': level - used, 'reference_type': 'consumption',
+                    'reference_id': consumption_id, 'timestamp': moment
+                })
+                level -= used
+
+    def refresh_derived_data(self) -> None:
+        """Bring the maintained summaries in line with the bulk-loaded rows"""
+        from modules.clients.customer_metrics import CustomerMetricsMaintainer
+        from modules.staff.demand_cube import DemandCubeMaintainer
+        from modules.inventory.stock_alerts import StockAlertEvaluator
+        print("🔁 Refreshing customer metrics, demand cube and stock alerts...")
+        CustomerMetricsMaintainer.recompute()
+        DemandCubeMaintainer.rebuild()
+        StockAlertEvaluator.rebuild()
+
+    def print_scale_summary(self) -> None:
+        print("\n🎊 SCALED DEMO DATA SUMMARY:")
+        for table, count in self.counts.items():
+            if table != 'seconds':
+                print(f"   • {table}: {count:,}")
+        print(f"   ⏱️ {self.counts.get('seconds', 0)}s (seed {self.spec.seed}, anchor {self.anchor.isoformat()})")
+        print("🔐 Admin: admin / password123")
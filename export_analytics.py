@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Incremental export of reporting tables to month-partitioned Parquet files for analytics
+Usage: python export_analytics.py [TABLE ...] [--full] [--dir PATH] [--chunk-size N]
+"""
+
+from app import app
+import sys
+
+def export_analytics(argv):
+    """Export rows changed since the last run (or everything with --full)"""
+    options = {}
+    for flag in ('--dir', '--chunk-size'):
+        if flag in argv:
+            index = argv.index(flag)
+            if index + 1 >= len(argv):
+                print(f"✗ {flag} expects a value")
+                return False
+            options[flag] = argv[index + 1]
+            argv = argv[:index] + argv[index + 2:]
+
+    try:
+        chunk_size = int(options.get('--chunk-size', 0)) or None
+    except ValueError:
+        print("✗ --chunk-size expects a number")
+        return False
+
+    tables = [arg for arg in argv if not arg.startswith('--')] or None
+
+    with app.app_context():
+        from modules.reports.analytics_export import AnalyticsExport, EXPORT_CHUNK_SIZE
+        print("Exporting analytics tables...")
+        try:
+            result = AnalyticsExport.run(tables=tables, export_dir=options.get('--dir'),
+                                         full='--full' in argv, chunk_size=chunk_size or EXPORT_CHUNK_SIZE)
+        except ValueError as e:
+            print(f"✗ {e}")
+            return False
+
+    for name, counts in result['tables'].items():
+        print(f"✓ {name}: {counts['exported']} rows into {counts['months']} month(s)")
+    for error in result['errors']:
+        print(f"⚠ {error['table']}: {error['error']}")
+    print(f"Export ({result['format']}): {result['export_dir']}")
+    return result['success']
+
+if __name__ == "__main__":
+    success = export_analytics(sys.argv[1:])
+    sys.exit(0 if success else 1)
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Batch export of professional invoices to the on-disk archive
+Usage: python export_invoice_archive.py START_DATE END_DATE [--workers N] [--force]
+"""
+
+from app import app
+from datetime import datetime
+import sys
+
+def export_invoices(argv):
+    """Render invoices dated between START_DATE and END_DATE (YYYY-MM-DD, inclusive)"""
+    workers = None
+    if '--workers' in argv:
+        index = argv.index('--workers')
+        try:
+            workers = int(argv[index + 1])
+        except (IndexError, ValueError):
+            print("✗ --workers expects a number")
+            return False
+        argv = argv[:index] + argv[index + 2:]
+
+    args = [arg for arg in argv if not arg.startswith('--')]
+    if len(args) != 2:
+        print(__doc__.strip())
+        return False
+
+    try:
+        start_date = datetime.strptime(args[0], '%Y-%m-%d').date()
+        end_date = datetime.strptime(args[1], '%Y-%m-%d').date()
+    except ValueError:
+        print("✗ Dates must be in YYYY-MM-DD format")
+        return False
+
+    with app.app_context():
+        from modules.billing.invoice_renderer import InvoiceRenderer
+        print(f"Exporting invoices from {start_date} to {end_date}...")
+        result = InvoiceRenderer.export_archive(start_date, end_date, workers=workers,
+                                                force='--force' in argv)
+
+    print(f"✓ Written: {result['written']} ({result['format']})")
+    print(f"✓ Unchanged since last export: {result['unchanged']}")
+    for error in result['errors']:
+        print(f"⚠ {error['file']}: {error['error']}")
+    print(f"Archive: {result['archive_dir']}")
+    return result['success']
+
+if __name__ == "__main__":
+    success = export_invoices(sys.argv[1:])
+    sys.exit(0 if success else 1)
@@ -25,6 +25,9 @@ def main():
 
     try:
         print("✅ App imported successfully")
+        # Maintenance jobs only run here with BACKGROUND_JOBS=1 (see run_background_jobs.py)
+        from services.background_jobs import start_background_jobs
+        start_background_jobs(app)
         # Start the server (development mode)
         app.run(host="0.0.0.0", port=port, debug=True, threaded=True)
 
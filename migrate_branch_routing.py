@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Migration script to add the branch key to the Location table
+Run this script before registering branch databases through locations
+"""
+
+from app import app, db
+import sys
+
+def add_location_branch_key():
+    """Add the branch_key column that maps a location to its branch database"""
+    try:
+        with app.app_context():
+            print("Adding branch_key to location table...")
+
+            migration_sql = [
+                "ALTER TABLE location ADD COLUMN branch_key VARCHAR(50);",
+                "CREATE UNIQUE INDEX IF NOT EXISTS ix_location_branch_key ON location (branch_key);"
+            ]
+
+            for sql in migration_sql:
+                try:
+                    db.session.execute(db.text(sql))
+                    print(f"✓ Executed: {sql}")
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"⚠ Warning for {sql}: {e}")
+                    # Column may already exist on databases created after the model change
+
+            db.session.commit()
+            print("✓ Location branch key added successfully!")
+            return True
+
+    except Exception as e:
+        print(f"✗ Error during migration: {str(e)}")
+        db.session.rollback()
+        return False
+
+if __name__ == "__main__":
+    success = add_location_branch_key()
+    if success:
+        print("\n🎉 Migration completed successfully!")
+    else:
+        print("\n❌ Migration failed!")
+
+    sys.exit(0 if success else 1)
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Migration script to add the per-product low stock threshold to the inventory product table
+Run this script before using the stock alert evaluator
+"""
+
+from app import app, db
+import sys
+
+def add_product_min_stock_level():
+    """Add the min_stock_level column the alerts page already displays"""
+    try:
+        with app.app_context():
+            print("Adding min_stock_level to inventory_products table...")
+
+            migration_sql = [
+                "ALTER TABLE inventory_products ADD COLUMN min_stock_level FLOAT;"
+            ]
+
+            for sql in migration_sql:
+                try:
+                    db.session.execute(db.text(sql))
+                    print(f"✓ Executed: {sql}")
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"⚠ Warning for {sql}: {e}")
+                    # Column may already exist on databases created after the model change
+
+            db.session.commit()
+            print("✓ Product low stock threshold added successfully!")
+            return True
+
+    except Exception as e:
+        print(f"✗ Error during migration: {str(e)}")
+        db.session.rollback()
+        return False
+
+if __name__ == "__main__":
+    success = add_product_min_stock_level()
+    if success:
+        print("\n🎉 Migration completed successfully!")
+    else:
+        print("\n❌ Migration failed!")
+
+    sys.exit(0 if success else 1)
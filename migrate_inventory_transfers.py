@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Migration script to add multi-line transfer fields to the InventoryTransfer table
+Run this script before using the inventory transfer engine
+"""
+
+from app import app, db
+import sys
+
+def add_inventory_transfer_fields():
+    """Add the transfer reference and source location columns"""
+    try:
+        with app.app_context():
+            print("Adding transfer fields to inventory_transfers table...")
+
+            migration_sql = [
+                "ALTER TABLE inventory_transfers ADD COLUMN reference VARCHAR(50);",
+                "ALTER TABLE inventory_transfers ADD COLUMN source_location_id VARCHAR(50) "
+                "REFERENCES inventory_locations(id);"
+            ]
+
+            for sql in migration_sql:
+                try:
+                    db.session.execute(db.text(sql))
+                    print(f"✓ Executed: {sql}")
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"⚠ Warning for {sql}: {e}")
+                    # Column may already exist on databases created after the model change
+
+            db.session.commit()
+            print("✓ Inventory transfer fields added successfully!")
+            return True
+
+    except Exception as e:
+        print(f"✗ Error during migration: {str(e)}")
+        db.session.rollback()
+        return False
+
+if __name__ == "__main__":
+    success = add_inventory_transfer_fields()
+    if success:
+        print("\n🎉 Migration completed successfully!")
+    else:
+        print("\n❌ Migration failed!")
+
+    sys.exit(0 if success else 1)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Migration script to add performance indexes to existing tables
+db.create_all() only creates indexes for new tables, so run this on existing databases.
+It also backfills the customer metric columns that the segment indexes and customer stats read
+"""
+
+from app import app, db
+import sys
+
+# (index name, table, columns) - keep in sync with __table_args__ on the models
+PERFORMANCE_INDEXES = [
+    ('ix_waitlist_service_status_date', 'waitlist', 'service_id, status, preferred_date'),
+    ('ix_waitlist_status_expires', 'waitlist', 'status, expires_at'),
+    ('ix_customer_package_status_expires', 'customer_package', 'status, expires_on'),
+    ('ix_service_package_assignment_status_expires', 'service_package_assignment', 'status, expires_on'),
+    ('ix_package_benefit_active_valid_to', 'package_benefit_tracker', 'is_active, valid_to'),
+    ('ix_appointment_client_status', 'appointment', 'client_id, status'),
+    ('ix_enhanced_invoice_client_date', 'enhanced_invoice', 'client_id, invoice_date'),
+    ('ix_invoice_payment_invoice', 'invoice_payment', 'invoice_id'),
+    ('ix_invoice_item_appointment', 'invoice_item', 'appointment_id'),
+    ('ix_client_active_last_visit', 'client', 'is_active, last_visit'),
+    ('ix_client_active_visits', 'client', 'is_active, total_visits'),
+    ('ix_client_active_lifetime_value', 'client', 'is_active, lifetime_value'),
+    ('ix_appointment_date_staff', 'appointment', 'appointment_date, staff_id'),
+    ('ix_attendance_date_staff', 'attendance', 'date, staff_id'),
+    ('ix_commission_staff_period', 'commission', 'staff_id, pay_period_start'),
+    ('ix_commission_appointment', 'commission', 'appointment_id'),
+    ('ix_inventory_batch_product_status_expiry', 'inventory_batches', 'product_id, status, expiry_date'),
+    ('ix_inventory_batch_status_expiry_qty', 'inventory_batches', 'status, expiry_date, qty_available'),
+    ('ix_inventory_transfer_reference', 'inventory_transfers', 'reference'),
+    ('ix_inventory_alert_product_resolved_type', 'inventory_alerts', 'product_id, is_resolved, alert_type'),
+    ('ix_appointment_updated_at', 'appointment', 'updated_at'),
+    ('ix_enhanced_invoice_updated_at', 'enhanced_invoice', 'updated_at'),
+    ('ix_shift_logs_date_status', 'shift_logs', 'individual_date, status'),
+]
+
+def add_performance_indexes():
+    """Create any missing performance indexes"""
+    try:
+        with app.app_context():
+            print("Adding performance indexes...")
+
+            for index_name, table, columns in PERFORMANCE_INDEXES:
+                sql = f"CREATE INDEX IF NOT EXISTS {index_name} ON {table} ({columns});"
+                try:
+                    db.session.execute(db.text(sql))
+                    print(f"✓ Executed: {sql}")
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"⚠ Warning for {sql}: {e}")
+
+            db.session.commit()
+            print("✓ Performance indexes added successfully!")
+            return True
+
+    except Exception as e:
+        print(f"✗ Error during migration: {str(e)}")
+        db.session.rollback()
+        return False
+
+def backfill_customer_metrics():
+    """Recompute customer visits, spend and loyalty columns, which existing rows lack"""
+    with app.app_context():
+        from modules.clients.customer_metrics import CustomerMetricsMaintainer
+        print("Backfilling customer metrics...")
+        result = CustomerMetricsMaintainer.recompute()
+
+    if not result['success']:
+        print(f"✗ Error during customer metrics backfill: {result['error']}")
+        return False
+
+    print(f"✓ Customers backfilled: {result['customers_repaired']}")
+    return True
+
+if __name__ == "__main__":
+    success = add_performance_indexes() and backfill_customer_metrics()
+    if success:
+        print("\n🎉 Migration completed successfully!")
+    else:
+        print("\n❌ Migration failed!")
+
+    sys.exit(0 if success else 1)
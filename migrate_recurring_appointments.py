@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Migration script to add expansion tracking to the RecurringAppointment table
+Run this script before using the recurring appointment expansion engine
+"""
+
+from app import app, db
+import sys
+
+def add_recurring_expansion_fields():
+    """Add the generated_until column used to extend occurrences incrementally"""
+    try:
+        with app.app_context():
+            print("Adding expansion tracking fields to recurring_appointment table...")
+
+            migration_sql = [
+                "ALTER TABLE recurring_appointment ADD COLUMN generated_until DATE;"
+            ]
+
+            for sql in migration_sql:
+                try:
+                    db.session.execute(db.text(sql))
+                    print(f"✓ Executed: {sql}")
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"⚠ Warning for {sql}: {e}")
+                    # Column may already exist on databases created after the model change
+
+            db.session.commit()
+            print("✓ Recurring appointment fields added successfully!")
+            return True
+
+    except Exception as e:
+        print(f"✗ Error during migration: {str(e)}")
+        db.session.rollback()
+        return False
+
+if __name__ == "__main__":
+    success = add_recurring_expansion_fields()
+    if success:
+        print("\n🎉 Migration completed successfully!")
+    else:
+        print("\n❌ Migration failed!")
+
+    sys.exit(0 if success else 1)
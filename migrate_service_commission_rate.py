@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Migration script to add the per-service commission rate to the Service table
+Run this script before using the commission engine
+"""
+
+from app import app, db
+import sys
+
+def add_service_commission_rate():
+    """Add the commission_rate column the services form already collects"""
+    try:
+        with app.app_context():
+            print("Adding commission_rate to service table...")
+
+            migration_sql = [
+                "ALTER TABLE service ADD COLUMN commission_rate FLOAT DEFAULT 10.0;"
+            ]
+
+            for sql in migration_sql:
+                try:
+                    db.session.execute(db.text(sql))
+                    print(f"✓ Executed: {sql}")
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"⚠ Warning for {sql}: {e}")
+                    # Column may already exist on databases created after the model change
+
+            db.session.commit()
+            print("✓ Service commission rate added successfully!")
+            return True
+
+    except Exception as e:
+        print(f"✗ Error during migration: {str(e)}")
+        db.session.rollback()
+        return False
+
+if __name__ == "__main__":
+    success = add_service_commission_rate()
+    if success:
+        print("\n🎉 Migration completed successfully!")
+    else:
+        print("\n❌ Migration failed!")
+
+    sys.exit(0 if success else 1)
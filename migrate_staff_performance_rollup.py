@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Migration script to add the monthly rollup fields to the StaffPerformance table
+Run this script before using the staff performance rollup job
+"""
+
+from app import app, db
+import sys
+
+def add_staff_performance_rollup_fields():
+    """Add the rollup metric columns and the one-row-per-staff-per-month index"""
+    try:
+        with app.app_context():
+            print("Adding rollup fields to staff_performance table...")
+
+            migration_sql = [
+                "ALTER TABLE staff_performance ADD COLUMN appointments_total INTEGER DEFAULT 0;",
+                "ALTER TABLE staff_performance ADD COLUMN attendance_days INTEGER DEFAULT 0;",
+                "ALTER TABLE staff_performance ADD COLUMN hours_worked FLOAT DEFAULT 0.0;",
+                "ALTER TABLE staff_performance ADD COLUMN booked_hours FLOAT DEFAULT 0.0;",
+                "ALTER TABLE staff_performance ADD COLUMN utilization_percentage FLOAT DEFAULT 0.0;",
+                "ALTER TABLE staff_performance ADD COLUMN updated_at DATETIME;",
+                # Fails if manual records left duplicates; remove them and rerun
+                "CREATE UNIQUE INDEX IF NOT EXISTS uq_staff_performance_period "
+                "ON staff_performance (staff_id, year, month);"
+            ]
+
+            for sql in migration_sql:
+                try:
+                    db.session.execute(db.text(sql))
+                    print(f"✓ Executed: {sql}")
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"⚠ Warning for {sql}: {e}")
+                    # Column may already exist on databases created after the model change
+
+            db.session.commit()
+            print("✓ Staff performance rollup fields added successfully!")
+            return True
+
+    except Exception as e:
+        print(f"✗ Error during migration: {str(e)}")
+        db.session.rollback()
+        return False
+
+if __name__ == "__main__":
+    success = add_staff_performance_rollup_fields()
+    if success:
+        print("\n🎉 Migration completed successfully!")
+    else:
+        print("\n❌ Migration failed!")
+
+    sys.exit(0 if success else 1)
@@ -184,6 +184,11 @@ class User(UserMixin, db.Model):
     def full_name(self):
         return f"{self.first_name} {self.last_name}"
 
+    @property
+    def user_role(self):
+        """Role record of the dynamic role system"""
+        return self.dynamic_role
+
     def has_role(self, role):
         # Support both dynamic and legacy role systems
         if self.role_id and hasattr(self, 'dynamic_role') and self.dynamic_role:
@@ -281,6 +286,11 @@ class ShiftLogs(db.Model):
     status = db.Column(db.Enum('scheduled', 'absent', 'holiday', 'completed', name='shift_status'), default='scheduled')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Indexes
+    __table_args__ = (
+        db.Index('ix_shift_logs_date_status', 'individual_date', 'status'),
+    )
+
     def get_break_time_display(self):
         """Get formatted break time display"""
         if self.break_start_time and self.break_end_time:
@@ -340,6 +350,13 @@ class Customer(db.Model):
     appointments = db.relationship('Appointment', backref='client', lazy=True)
     # Note: Customer package assignments will be handled separately with new package system
 
+    # Indexes for segment lists (metrics are maintained by modules/clients/customer_metrics.py)
+    __table_args__ = (
+        db.Index('ix_client_active_last_visit', 'is_active', 'last_visit'),
+        db.Index('ix_client_active_visits', 'is_active', 'total_visits'),
+        db.Index('ix_client_active_lifetime_value', 'is_active', 'lifetime_value'),
+    )
+
     @property
     def full_name(self):
         return f"{self.first_name} {self.last_name}"
@@ -363,6 +380,7 @@ class Service(db.Model):
     price = db.Column(db.Float, nullable=False)
     category_id = db.Column(db.Integer, db.ForeignKey('category.id'))
     category = db.Column(db.String(50), nullable=False)  # Fallback for compatibility
+    commission_rate = db.Column(db.Float, default=10.0)  # percentage; staff rates take precedence
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
@@ -370,30 +388,21 @@ class Service(db.Model):
     appointments = db.relationship('Appointment', backref='service', lazy=True)
     # Note: Service-package relationships are handled differently in new package system
 
-    def deduct_inventory_for_service(self):
-        """Deduct inventory items when this service is performed"""
+    def deduct_inventory_for_service(self, issued_to=None, reference=None, user_id=None):
+        """Consume this service's inventory items FEFO; returns per-product movements (not committed)"""
         movements = []
         try:
-            # Check if inventory_items relationship exists
             if hasattr(self, 'inventory_items') and self.inventory_items:
-                for service_item in self.inventory_items:
-                    # Create a basic audit log entry instead
-                    from modules.inventory.models import InventoryAuditLog
-                    audit_entry = InventoryAuditLog(
-                        batch_id=service_item.batch_id if hasattr(service_item, 'batch_id') else None,
-                        product_id=service_item.inventory_id,
-                        user_id=None,  # Will be set by calling code with proper user context
-                        action_type='service_use',
-                        quantity_delta=-service_item.quantity_per_service,  # Negative for outflow
-                        stock_before=0,  # Will be updated in actual implementation
-                        stock_after=0,   # Will be updated in actual implementation
-                        reference_type='service',
-                        reference_id=self.id,
-                        notes=f'Used in service: {self.name}'
-                    )
-                    movements.append(audit_entry)
+                from modules.inventory.fefo_allocator import FefoAllocator
+                movements = FefoAllocator.consume_for_service(
+                    self,
+                    issued_to=issued_to or f'Service: {self.name}',
+                    reference=reference,
+                    user_id=user_id
+                )
         except Exception as e:
             print(f"Error processing inventory deduction: {e}")
+            raise
 
         return movements
 
@@ -420,18 +429,26 @@ class Appointment(db.Model):
     # Relationships - use existing backref from User model
     # staff relationship is already created by User.appointments backref='assigned_staff'
 
-    def process_inventory_deduction(self):
-        """Process inventory deduction when appointment is completed and billed"""
-        if not self.inventory_deducted and self.status == 'completed' and self.is_paid:
+    # Indexes
+    __table_args__ = (
+        db.Index('ix_appointment_client_status', 'client_id', 'status'),
+        db.Index('ix_appointment_date_staff', 'appointment_date', 'staff_id'),
+        db.Index('ix_appointment_updated_at', 'updated_at'),
+    )
+
+    def process_inventory_deduction(self, user_id=None):
+        """Consume the service's inventory once, when the appointment is completed"""
+        if not self.inventory_deducted and self.status == 'completed':
             if hasattr(self, 'service') and self.service:
-                movements = self.service.deduct_inventory_for_service()
-                if movements:
-                    from app import db
-                    for movement in movements:
-                        db.session.add(movement)
-                    self.inventory_deducted = True
-                    db.session.commit()
-                    return True
+                from app import db
+                movements = self.service.deduct_inventory_for_service(
+                    issued_to=f'Appointment #{self.id} - {self.service.name}',
+                    reference=f'APT-{self.id}',
+                    user_id=user_id
+                )
+                self.inventory_deducted = True
+                db.session.commit()
+                return bool(movements)
         return False
 
 # NEW PACKAGE MANAGEMENT SYSTEM - SEPARATE TABLES FOR EACH TYPE
@@ -630,6 +647,11 @@ class ServicePackageAssignment(db.Model):
     service = db.relationship('Service', backref='package_assignments')
     usage_logs = db.relationship('PackageAssignmentUsage', backref='assignment', lazy=True, cascade='all, delete-orphan')
     
+    # Indexes
+    __table_args__ = (
+        db.Index('ix_service_package_assignment_status_expires', 'status', 'expires_on'),
+    )
+    
     def get_package_template(self):
         """Get the package template based on type and reference ID"""
         if self.package_type == 'prepaid':
@@ -761,6 +783,7 @@ class CustomerPackage(db.Model):
     # Indexes
     __table_args__ = (
         db.Index('ix_customer_package_customer_status', 'customer_id', 'status'),
+        db.Index('ix_customer_package_status_expires', 'status', 'expires_on'),
     )
     
     def get_total_services(self):
@@ -989,6 +1012,12 @@ class EnhancedInvoice(db.Model):
     invoice_items = db.relationship('InvoiceItem', backref='invoice', lazy=True, cascade='all, delete-orphan')
     invoice_payments = db.relationship('InvoicePayment', backref='invoice', lazy=True, cascade='all, delete-orphan')
 
+    # Indexes
+    __table_args__ = (
+        db.Index('ix_enhanced_invoice_client_date', 'client_id', 'invoice_date'),
+        db.Index('ix_enhanced_invoice_updated_at', 'updated_at'),
+    )
+
 class InvoiceItem(db.Model):
     """Individual items on an invoice (services, inventory items, etc.)"""
     __tablename__ = 'invoice_item'
@@ -1028,6 +1057,11 @@ class InvoiceItem(db.Model):
     # Note: Package relationships handled separately with new package system
     # Note: Inventory relationships are handled in the inventory module to avoid circular imports
 
+    # Indexes
+    __table_args__ = (
+        db.Index('ix_invoice_item_appointment', 'appointment_id'),
+    )
+
 class InvoicePayment(db.Model):
     """Multiple payment records for a single invoice supporting mixed payment methods"""
     __tablename__ = 'invoice_payment'
@@ -1050,6 +1084,11 @@ class InvoicePayment(db.Model):
     # Relationships
     processor = db.relationship('User', backref='processed_payments')
 
+    # Indexes
+    __table_args__ = (
+        db.Index('ix_invoice_payment_invoice', 'invoice_id'),
+    )
+
 class StaffSchedule(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     staff_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -1110,6 +1149,7 @@ class PackageBenefitTracker(db.Model):
     __table_args__ = (
         db.Index('ix_package_benefit_customer_service_active', 'customer_id', 'service_id', 'is_active'),
         db.Index('ix_package_benefit_validity', 'valid_from', 'valid_to'),
+        db.Index('ix_package_benefit_active_valid_to', 'is_active', 'valid_to'),
     )
 
 class PackageUsageHistory(db.Model):
@@ -1217,6 +1257,12 @@ class Commission(db.Model):
     staff = db.relationship('User', backref='commissions')
     appointment = db.relationship('Appointment', backref='commission', uselist=False)
 
+    # Indexes
+    __table_args__ = (
+        db.Index('ix_commission_staff_period', 'staff_id', 'pay_period_start'),
+        db.Index('ix_commission_appointment', 'appointment_id'),
+    )
+
 # ProductSale model removed - fresh implementation coming
 
 class Promotion(db.Model):
@@ -1252,6 +1298,12 @@ class Waitlist(db.Model):
     service = db.relationship('Service', backref='waitlist_entries')
     staff = db.relationship('User', backref='waitlist_requests')
 
+    # Indexes for slot matching and expiry sweeps
+    __table_args__ = (
+        db.Index('ix_waitlist_service_status_date', 'service_id', 'status', 'preferred_date'),
+        db.Index('ix_waitlist_status_expires', 'status', 'expires_at'),
+    )
+
 class RecurringAppointment(db.Model):
     """Recurring appointment templates"""
     id = db.Column(db.Integer, primary_key=True)
@@ -1263,6 +1315,7 @@ class RecurringAppointment(db.Model):
     time_slot = db.Column(db.Time, nullable=False)
     start_date = db.Column(db.Date, nullable=False)
     end_date = db.Column(db.Date)
+    generated_until = db.Column(db.Date)  # Last date occurrences were expanded through
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
@@ -1281,6 +1334,7 @@ class Location(db.Model):
     manager_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     is_active = db.Column(db.Boolean, default=True)
     operating_hours = db.Column(db.Text)  # JSON for weekly hours
+    branch_key = db.Column(db.String(50), unique=True)  # Database instance of this branch (services/branch_router.py)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # Relationships
@@ -1316,6 +1370,11 @@ class Attendance(db.Model):
     # Relationships
     staff = db.relationship('User', backref='attendance_records')
 
+    # Indexes
+    __table_args__ = (
+        db.Index('ix_attendance_date_staff', 'date', 'staff_id'),
+    )
+
 class Leave(db.Model):
     """Staff leave management"""
     id = db.Column(db.Integer, primary_key=True)
@@ -1356,11 +1415,41 @@ class StaffPerformance(db.Model):
     client_ratings_avg = db.Column(db.Float, default=0.0)
     attendance_percentage = db.Column(db.Float, default=0.0)
     commission_earned = db.Column(db.Float, default=0.0)
+    appointments_total = db.Column(db.Integer, default=0)
+    attendance_days = db.Column(db.Integer, default=0)
+    hours_worked = db.Column(db.Float, default=0.0)
+    booked_hours = db.Column(db.Float, default=0.0)
+    utilization_percentage = db.Column(db.Float, default=0.0)  # booked_hours / hours_worked
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime)  # set by the monthly rollup
 
     # Relationships
     staff = db.relationship('User', backref='performance_records')
 
+    # Indexes
+    __table_args__ = (
+        db.Index('uq_staff_performance_period', 'staff_id', 'year', 'month', unique=True),
+    )
+
+class DemandCube(db.Model):
+    """Bookings and booked minutes per week, weekday, hour, service category and branch"""
+    __tablename__ = 'demand_cube'
+
+    id = db.Column(db.Integer, primary_key=True)
+    branch = db.Column(db.String(100), nullable=False)  # database instance name
+    week_start = db.Column(db.Date, nullable=False)  # Monday
+    weekday = db.Column(db.Integer, nullable=False)  # 0 = Monday
+    hour = db.Column(db.Integer, nullable=False)  # 0-23
+    category = db.Column(db.String(50), nullable=False)
+    bookings = db.Column(db.Integer, default=0)  # appointments starting in this hour
+    booked_minutes = db.Column(db.Float, default=0.0)  # appointment minutes falling in this hour
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Indexes
+    __table_args__ = (
+        db.Index('uq_demand_cube_cell', 'branch', 'week_start', 'weekday', 'hour', 'category', unique=True),
+    )
+
 # Note: MembershipService and KittyPartyService classes are defined earlier in the file
 
 class ServiceInventoryItem(db.Model):
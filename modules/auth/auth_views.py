@@ -8,6 +8,7 @@ from sqlalchemy import func, or_, and_
 from app import app, db
 from forms import LoginForm
 from .auth_queries import validate_user_credentials
+from services.branch_router import branch_router, SESSION_BRANCH_KEY
 from datetime import datetime
 
 # Password verification function with fallback (hash drift)
@@ -90,6 +91,8 @@ def login():
             
             if password_valid and user.is_active:
                 login_user(user, remember=request.form.get('remember') == 'on')
+                # User ids are per branch database, so the login only holds on this branch
+                session[SESSION_BRANCH_KEY] = branch_router.current()
                 print(f"Login successful for user: {user.username}")
                 flash('Login successful!', 'success')
                 
@@ -162,6 +165,7 @@ def api_login():
         session.clear()
         session["uid"] = user.id
         login_user(user)
+        session[SESSION_BRANCH_KEY] = branch_router.current()
         
         # Update last login time if column exists
         try:
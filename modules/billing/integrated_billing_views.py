@@ -2,9 +2,10 @@
 Integrated Billing Views - New Enhanced Billing System
 Supports services, packages, subscriptions, and inventory items
 """
-from flask import render_template, request, redirect, url_for, flash, jsonify
+from flask import render_template, request, redirect, url_for, flash, jsonify, abort
 from flask_login import login_required, current_user
 from app import app, db
+from services.query_budget import query_budget
 from datetime import datetime
 import json
 try:
@@ -83,6 +84,7 @@ def number_to_words(amount):
 
 # Register the template filter
 @app.template_filter('total_amount_words')
+@app.template_global('total_amount_words')
 def total_amount_words_filter(amount):
     return number_to_words(amount)
 
@@ -94,6 +96,7 @@ def from_json_filter(json_str):
         return {}
 
 @app.route('/integrated-billing')
+@query_budget(9)
 @login_required
 def integrated_billing():
     """New integrated billing dashboard"""
@@ -101,6 +104,8 @@ def integrated_billing():
         flash('Access denied', 'danger')
         return redirect(url_for('dashboard'))
 
+    from models import Customer, Service
+
     # Get data for billing interface
     customers = Customer.query.filter_by(is_active=True).all()
     services = Service.query.filter_by(is_active=True).all()
@@ -108,7 +113,9 @@ def integrated_billing():
     # Get inventory products with stock information
     inventory_items = []
     if InventoryProduct is not None:
-        inventory_products = InventoryProduct.query.filter_by(is_active=True).all()
+        inventory_products = InventoryProduct.query.options(
+            db.selectinload(InventoryProduct.batches)
+        ).filter_by(is_active=True).all()
         for product in inventory_products:
             # Only include products that have stock available
             if product.total_stock > 0:
@@ -165,9 +172,11 @@ def create_professional_invoice():
         return jsonify({'success': False, 'message': 'Access denied'}), 403
 
     try:
-        from models import Customer, Service, EnhancedInvoice, InvoiceItem
-        from modules.inventory.models import InventoryBatch, InventoryProduct
-        from modules.inventory.queries import create_consumption_record
+        from models import Customer, EnhancedInvoice
+        from .invoice_pipeline import (
+            InvoicePipeline, InvoiceValidationError, parse_service_lines, parse_inventory_lines,
+            generate_invoice_number
+        )
         import datetime
 
         # Parse form data
@@ -179,35 +188,8 @@ def create_professional_invoice():
         if not customer:
             return jsonify({'success': False, 'message': 'Customer not found'})
 
-        # Parse services data
-        services_data = []
-        service_ids = request.form.getlist('service_ids[]')
-        service_quantities = request.form.getlist('service_quantities[]')
-        appointment_ids = request.form.getlist('appointment_ids[]')
-
-        for i, service_id in enumerate(service_ids):
-            if service_id:
-                services_data.append({
-                    'service_id': int(service_id),
-                    'quantity': float(service_quantities[i]) if i < len(service_quantities) else 1,
-                    'appointment_id': int(appointment_ids[i]) if i < len(appointment_ids) and appointment_ids[i] else None
-                })
-
-        # Parse inventory data
-        inventory_data = []
-        product_ids = request.form.getlist('product_ids[]')
-        batch_ids = request.form.getlist('batch_ids[]')
-        product_quantities = request.form.getlist('product_quantities[]')
-        product_prices = request.form.getlist('product_prices[]')
-
-        for i, product_id in enumerate(product_ids):
-            if product_id and i < len(batch_ids) and batch_ids[i]:
-                inventory_data.append({
-                    'product_id': int(product_id),
-                    'batch_id': int(batch_ids[i]),
-                    'quantity': float(product_quantities[i]) if i < len(product_quantities) else 1,
-                    'unit_price': float(product_prices[i]) if i < len(product_prices) and product_prices[i] else 0
-                })
+        services_data = parse_service_lines(request.form)
+        inventory_data = parse_inventory_lines(request.form)
 
         # Professional Tax Calculation
         cgst_rate = float(request.form.get('cgst_rate', 9)) / 100
@@ -223,30 +205,17 @@ def create_professional_invoice():
         payment_terms = request.form.get('payment_terms', 'immediate')
         payment_method = request.form.get('payment_method', 'cash')
 
-        # Validate inventory stock
-        for item in inventory_data:
-            batch = InventoryBatch.query.get(item['batch_id'])
-            if not batch or batch.is_expired:
-                return jsonify({'success': False, 'message': f'Invalid or expired batch for product ID {item["product_id"]}'})
-            
-            if float(batch.qty_available) < item['quantity']:
-                return jsonify({
-                    'success': False, 
-                    'message': f'Insufficient stock in batch {batch.batch_name}. Available: {batch.qty_available}, Required: {item["quantity"]}'
-                })
-
-        # Calculate amounts
-        services_subtotal = 0
-        for service_data in services_data:
-            service = Service.query.get(service_data['service_id'])
-            if service:
-                services_subtotal += service.price * service_data['quantity']
-
-        inventory_subtotal = 0
-        for item in inventory_data:
-            inventory_subtotal += item['unit_price'] * item['quantity']
+        # Prefetch, validate stock and price all lines in memory
+        try:
+            inventory_data = InvoicePipeline.assign_batches(inventory_data)
+            lines = InvoicePipeline.build(services_data, inventory_data,
+                                          enforce_batch_pricing=False, user_id=current_user.id)
+        except InvoiceValidationError as e:
+            return jsonify({'success': False, 'message': str(e)})
 
-        gross_subtotal = services_subtotal + inventory_subtotal
+        services_subtotal = lines.services_subtotal
+        inventory_subtotal = lines.inventory_subtotal
+        gross_subtotal = lines.gross_subtotal
 
         # Calculate discount
         if discount_type == 'percentage':
@@ -272,20 +241,8 @@ def create_professional_invoice():
 
         # Create professional invoice with proper transaction handling
         try:
-            # Generate professional invoice number
             current_date = datetime.datetime.now()
-            latest_invoice = db.session.query(EnhancedInvoice).order_by(EnhancedInvoice.id.desc()).first()
-            
-            if latest_invoice and latest_invoice.invoice_number.startswith(f"INV-{current_date.strftime('%Y%m%d')}"):
-                try:
-                    last_sequence = int(latest_invoice.invoice_number.split('-')[-1])
-                    invoice_sequence = last_sequence + 1
-                except (ValueError, IndexError):
-                    invoice_sequence = 1
-            else:
-                invoice_sequence = 1
-            
-            invoice_number = f"INV-{current_date.strftime('%Y%m%d')}-{invoice_sequence:04d}"
+            invoice_number = generate_invoice_number(current_date)
 
             # Create enhanced invoice with professional fields
             invoice = EnhancedInvoice()
@@ -332,66 +289,13 @@ def create_professional_invoice():
             invoice.notes = json.dumps(tax_breakdown)
             invoice.payment_methods = json.dumps({payment_method: total_amount})
 
-            db.session.add(invoice)
-            db.session.flush()  # Get the invoice ID
-
-            # Create invoice items for services
-            service_items_created = 0
-            for service_data in services_data:
-                service = Service.query.get(service_data['service_id'])
-                if service:
-                    item = InvoiceItem()
-                    item.invoice_id = invoice.id
-                    item.item_type = 'service'
-                    item.item_id = service.id
-                    item.appointment_id = service_data.get('appointment_id')
-                    item.item_name = service.name
-                    item.description = service.description
-                    item.quantity = service_data['quantity']
-                    item.unit_price = service.price
-                    item.original_amount = service.price * service_data['quantity']
-                    item.final_amount = service.price * service_data['quantity']
-                    db.session.add(item)
-                    service_items_created += 1
-
-            # Create invoice items for inventory and reduce stock
-            inventory_items_created = 0
-            stock_reduced_count = 0
-            
-            for item_data in inventory_data:
-                batch = InventoryBatch.query.get(item_data['batch_id'])
-                product = InventoryProduct.query.get(item_data['product_id'])
-
-                if batch and product:
-                    # Create invoice item
-                    item = InvoiceItem()
-                    item.invoice_id = invoice.id
-                    item.item_type = 'inventory'
-                    item.item_id = product.id
-                    item.product_id = product.id
-                    item.batch_id = batch.id
-                    item.item_name = product.name
-                    item.description = f"Batch: {batch.batch_name}"
-                    item.batch_name = batch.batch_name
-                    item.quantity = item_data['quantity']
-                    item.unit_price = item_data['unit_price']
-                    item.original_amount = item_data['unit_price'] * item_data['quantity']
-                    item.final_amount = item_data['unit_price'] * item_data['quantity']
-                    db.session.add(item)
-                    inventory_items_created += 1
-
-                    # Reduce stock
-                    create_consumption_record(
-                        batch_id=batch.id,
-                        quantity=item_data['quantity'],
-                        issued_to=f"Invoice {invoice_number} - {customer.full_name}",
-                        reference=invoice_number,
-                        notes=f"Professional invoice sale - {invoice_number}",
-                        user_id=current_user.id
-                    )
-                    stock_reduced_count += 1
-
-            # Commit all changes
+            # Invoice, items, stock decrements and audit rows in one transaction
+            written = InvoicePipeline.write(
+                invoice, lines, services_data, inventory_data,
+                issued_to=f"Invoice {invoice_number} - {customer.full_name}",
+                consumption_notes=f"Professional invoice sale - {invoice_number}",
+                user_id=current_user.id
+            )
             db.session.commit()
 
             return jsonify({
@@ -404,9 +308,9 @@ def create_professional_invoice():
                 'sgst_amount': float(sgst_amount),
                 'igst_amount': float(igst_amount),
                 'tax_amount': float(total_tax),
-                'service_items_created': service_items_created,
-                'inventory_items_created': inventory_items_created,
-                'stock_reduced': stock_reduced_count,
+                'service_items_created': written['service_items_created'],
+                'inventory_items_created': written['inventory_items_created'],
+                'stock_reduced': written['stock_reduced'],
                 'deductions_applied': 0
             })
 
@@ -430,9 +334,11 @@ def create_integrated_invoice():
         return jsonify({'success': False, 'message': 'Access denied'}), 403
 
     try:
-        from models import Customer, Service, EnhancedInvoice, InvoiceItem
-        from modules.inventory.models import InventoryBatch, InventoryProduct
-        from modules.inventory.queries import create_consumption_record
+        from models import Customer, EnhancedInvoice
+        from .invoice_pipeline import (
+            InvoicePipeline, InvoiceValidationError, parse_service_lines, parse_inventory_lines,
+            generate_invoice_number
+        )
         import datetime
 
         # Parse form data
@@ -444,100 +350,21 @@ def create_integrated_invoice():
         if not customer:
             return jsonify({'success': False, 'message': 'Customer not found'})
 
-        # Parse services data
-        services_data = []
-        service_ids = request.form.getlist('service_ids[]')
-        service_quantities = request.form.getlist('service_quantities[]')
-        appointment_ids = request.form.getlist('appointment_ids[]')
-
-        for i, service_id in enumerate(service_ids):
-            if service_id:
-                services_data.append({
-                    'service_id': int(service_id),
-                    'quantity': float(service_quantities[i]) if i < len(service_quantities) else 1,
-                    'appointment_id': int(appointment_ids[i]) if i < len(appointment_ids) and appointment_ids[i] else None
-                })
-
-        # Parse batch-wise inventory data
-        inventory_data = []
-        product_ids = request.form.getlist('product_ids[]')
-        batch_ids = request.form.getlist('batch_ids[]')
-        product_quantities = request.form.getlist('product_quantities[]')
-        product_prices = request.form.getlist('product_prices[]')
-
-        for i, product_id in enumerate(product_ids):
-            if product_id and i < len(batch_ids) and batch_ids[i]:
-                inventory_data.append({
-                    'product_id': int(product_id),
-                    'batch_id': int(batch_ids[i]),
-                    'quantity': float(product_quantities[i]) if i < len(product_quantities) else 1,
-                    'unit_price': float(product_prices[i]) if i < len(product_prices) and product_prices[i] else 0
-                })
-
-        # Validate stock availability and prices for all inventory items
-        for item in inventory_data:
-            batch = InventoryBatch.query.get(item['batch_id'])
-            if not batch:
-                return jsonify({'success': False, 'message': f'Batch not found for product ID {item["product_id"]}'})
-
-            if batch.is_expired:
-                return jsonify({'success': False, 'message': f'Cannot use expired batch: {batch.batch_name}'})
+        services_data = parse_service_lines(request.form)
+        inventory_data = parse_inventory_lines(request.form)
 
-            if float(batch.qty_available) < item['quantity']:
-                return jsonify({
-                    'success': False, 
-                    'message': f'Insufficient stock in batch {batch.batch_name}. Available: {batch.qty_available}, Required: {item["quantity"]}'
-                })
-
-            # Server-side price validation - prevent price manipulation
-            if batch.selling_price:
-                actual_price = float(batch.selling_price)
-                submitted_price = item['unit_price']
-                
-                # Allow up to 50% discount, but prevent price inflation or excessive discounts
-                min_allowed_price = actual_price * 0.5  # 50% discount max
-                max_allowed_price = actual_price * 1.1   # 10% markup max for rounding
-                
-                if submitted_price < min_allowed_price or submitted_price > max_allowed_price:
-                    # Log suspicious price manipulation attempt
-                    app.logger.warning(f"Price manipulation attempt detected: User {current_user.id} tried to set price {submitted_price} for batch {batch.batch_name} (actual: {actual_price})")
-                    return jsonify({
-                        'success': False,
-                        'message': f'Invalid price for {batch.product.name} (Batch: {batch.batch_name}). Expected: ${actual_price:.2f}, Submitted: ${submitted_price:.2f}'
-                    })
-            else:
-                # If no selling price set, require manual approval for non-zero prices
-                if item['unit_price'] > 0:
-                    return jsonify({
-                        'success': False,
-                        'message': f'Product {batch.product.name} has no selling price configured. Please set selling price first.'
-                    })
-
-        # Validate service prices to prevent manipulation
-        for service_data in services_data:
-            service = Service.query.get(service_data['service_id'])
-            if not service:
-                return jsonify({'success': False, 'message': f'Service not found: {service_data["service_id"]}'})
-            
-            # For services, we don't accept client price input - always use actual service price
-            # This prevents any service price manipulation
-            # Note: If custom service pricing is needed in the future, implement proper authorization checks
-
-        # Calculate totals first (before any database operations)
-        services_subtotal = 0
-        inventory_subtotal = 0
-
-        # Calculate services subtotal
-        for service_data in services_data:
-            service = Service.query.get(service_data['service_id'])
-            if service:
-                services_subtotal += service.price * service_data['quantity']
-
-        # Calculate inventory subtotal
-        for item in inventory_data:
-            inventory_subtotal += item['unit_price'] * item['quantity']
+        # Validate stock, batch prices and services against prefetched rows, then price
+        # everything in memory. Service prices always come from the catalogue, never the client.
+        try:
+            inventory_data = InvoicePipeline.assign_batches(inventory_data)
+            lines = InvoicePipeline.build(services_data, inventory_data,
+                                          enforce_batch_pricing=True, user_id=current_user.id)
+        except InvoiceValidationError as e:
+            return jsonify({'success': False, 'message': str(e)})
 
-        gross_subtotal = services_subtotal + inventory_subtotal
+        services_subtotal = lines.services_subtotal
+        inventory_subtotal = lines.inventory_subtotal
+        gross_subtotal = lines.gross_subtotal
 
         # Apply tax and discounts
         tax_rate = float(request.form.get('tax_rate', 0.18))
@@ -549,23 +376,9 @@ def create_integrated_invoice():
         tax_amount = net_subtotal * tax_rate
         total_amount = net_subtotal + tax_amount + tips_amount
 
-        # Generate atomic invoice number and create invoice
+        # Generate invoice number and create invoice
         try:
-                # Get latest invoice to generate sequential number
-                latest_invoice = db.session.query(EnhancedInvoice).order_by(EnhancedInvoice.id.desc()).first()
-                
-                if latest_invoice and latest_invoice.invoice_number.startswith(f"INV-{datetime.datetime.now().strftime('%Y%m%d')}"):
-                    # Extract sequence number from existing invoice number
-                    try:
-                        last_sequence = int(latest_invoice.invoice_number.split('-')[-1])
-                        invoice_sequence = last_sequence + 1
-                    except (ValueError, IndexError):
-                        invoice_sequence = 1
-                else:
-                    # First invoice of the day
-                    invoice_sequence = 1
-                
-                invoice_number = f"INV-{datetime.datetime.now().strftime('%Y%m%d')}-{invoice_sequence:04d}"
+                invoice_number = generate_invoice_number()
 
                 # Create enhanced invoice
                 invoice = EnhancedInvoice()
@@ -583,72 +396,13 @@ def create_integrated_invoice():
                 invoice.balance_due = total_amount
                 invoice.notes = request.form.get('notes', '')
 
-                db.session.add(invoice)
-                db.session.flush()  # Get invoice ID
-
-                # Create invoice items for services
-                service_items_created = 0
-                for service_data in services_data:
-                    service = Service.query.get(service_data['service_id'])
-                    if service:
-                        item = InvoiceItem()
-                        item.invoice_id = invoice.id
-                        item.item_type = 'service'
-                        item.item_id = service.id
-                        item.appointment_id = service_data.get('appointment_id')
-                        item.item_name = service.name
-                        item.description = service.description
-                        item.quantity = service_data['quantity']
-                        item.unit_price = service.price
-                        item.original_amount = service.price * service_data['quantity']
-                        item.final_amount = service.price * service_data['quantity']
-                        db.session.add(item)
-                        service_items_created += 1
-
-                # Create invoice items for inventory and reduce stock atomically
-                inventory_items_created = 0
-                stock_reduced_count = 0
-                stock_operations = []  # Track all operations for potential rollback
-                
-                for item_data in inventory_data:
-                    batch = InventoryBatch.query.get(item_data['batch_id'])
-                    product = InventoryProduct.query.get(item_data['product_id'])
-
-                    if not batch or not product:
-                        raise Exception(f"Batch or product not found for item {item_data}")
-
-                    # Create invoice item
-                    item = InvoiceItem()
-                    item.invoice_id = invoice.id
-                    item.item_type = 'inventory'
-                    item.item_id = product.id
-                    item.product_id = product.id
-                    item.batch_id = batch.id
-                    item.item_name = product.name
-                    item.description = f"Batch: {batch.batch_name}"
-                    item.batch_name = batch.batch_name
-                    item.quantity = item_data['quantity']
-                    item.unit_price = item_data['unit_price']
-                    item.original_amount = item_data['unit_price'] * item_data['quantity']
-                    item.final_amount = item_data['unit_price'] * item_data['quantity']
-                    db.session.add(item)
-                    inventory_items_created += 1
-
-                    # Reduce stock from batch via consumption record
-                    create_consumption_record(
-                        batch_id=batch.id,
-                        quantity=item_data['quantity'],
-                        issued_to=f"Invoice {invoice_number} - {customer.full_name}",
-                        reference=invoice_number,
-                        notes=f"Sold via billing system - Invoice {invoice_number}",
-                        user_id=current_user.id
-                    )
-                    stock_reduced_count += 1
-                    stock_operations.append({
-                        'batch_id': batch.id, 
-                        'quantity': item_data['quantity'],
-                        'batch_name': batch.batch_name
-                    })
+                # Invoice, items, guarded stock decrements and audit rows in one transaction
+                written = InvoicePipeline.write(
+                    invoice, lines, services_data, inventory_data,
+                    issued_to=f"Invoice {invoice_number} - {customer.full_name}",
+                    consumption_notes=f"Sold via billing system - Invoice {invoice_number}",
+                    user_id=current_user.id
+                )
 
                 # If we reach here, all operations succeeded
                 # Commit the entire transaction
@@ -660,9 +414,9 @@ def create_integrated_invoice():
                     'invoice_id': invoice.id,
                     'invoice_number': invoice_number,
                     'total_amount': float(total_amount),
-                    'service_items_created': service_items_created,
-                    'inventory_items_created': inventory_items_created,
-                    'stock_reduced': stock_reduced_count,
+                    'service_items_created': written['service_items_created'],
+                    'inventory_items_created': written['inventory_items_created'],
+                    'stock_reduced': written['stock_reduced'],
                     'deductions_applied': 0  # Future enhancement for package deductions
                 })
 
@@ -680,6 +434,7 @@ def create_integrated_invoice():
         return jsonify({'success': False, 'message': f'Error creating invoice: {str(e)}'})
 
 @app.route('/integrated-billing/customer-packages/<int:client_id>')
+@query_budget(3)
 @login_required
 def get_customer_packages(client_id):
     """Get customer's active packages and available sessions"""
@@ -687,35 +442,34 @@ def get_customer_packages(client_id):
         return jsonify({'error': 'Access denied'}), 403
 
     try:
-        from models import CustomerPackage, CustomerPackageSession # Ensure these are imported correctly
-        # Get active packages
-        packages = CustomerPackage.query.filter_by(
-            client_id=client_id,
-            is_active=True
+        from models import CustomerPackage, CustomerPackageItem
+        from sqlalchemy.orm import joinedload, selectinload
+        # Get active packages with their items and services
+        packages = CustomerPackage.query.options(
+            joinedload(CustomerPackage.package_template),
+            selectinload(CustomerPackage.package_items).joinedload(CustomerPackageItem.service)
+        ).filter_by(
+            customer_id=client_id,
+            status='active'
         ).all()
 
         package_data = []
         for pkg in packages:
-            # Get session details
-            sessions = CustomerPackageSession.query.filter_by(
-                client_package_id=pkg.id
-            ).all()
-
             session_details = []
-            for session in sessions:
+            for item in pkg.package_items:
                 session_details.append({
-                    'service_id': session.service_id,
-                    'service_name': session.service.name,
-                    'sessions_total': session.sessions_total,
-                    'sessions_used': session.sessions_used,
-                    'sessions_remaining': session.sessions_remaining,
-                    'is_unlimited': session.is_unlimited
+                    'service_id': item.service_id,
+                    'service_name': item.service.name if item.service else '',
+                    'sessions_total': item.total_qty,
+                    'sessions_used': item.used_qty,
+                    'sessions_remaining': item.get_remaining_qty(),
+                    'is_unlimited': False
                 })
 
             package_data.append({
                 'id': pkg.id,
-                'package_name': pkg.package.name,
-                'expiry_date': pkg.expiry_date.strftime('%Y-%m-%d'),
+                'package_name': pkg.package_template.name if pkg.package_template else '',
+                'expiry_date': pkg.expires_on.strftime('%Y-%m-%d') if pkg.expires_on else None,
                 'sessions': session_details
             })
 
@@ -861,6 +615,7 @@ def process_payment(invoice_id):
         return jsonify({'success': False, 'message': f'Error processing payment: {str(e)}'})
 
 @app.route('/integrated-billing/invoice/<int:invoice_id>')
+@query_budget(5)
 @login_required
 def view_integrated_invoice(invoice_id):
     """View detailed invoice with all components"""
@@ -937,22 +692,56 @@ def print_professional_invoice(invoice_id):
         flash('Access denied', 'danger')
         return redirect(url_for('dashboard'))
     
-    from models import EnhancedInvoice, InvoiceItem
-    invoice = EnhancedInvoice.query.get_or_404(invoice_id)
-    invoice_items = InvoiceItem.query.filter_by(invoice_id=invoice_id).all()
-    
-    # Parse tax details from notes
-    import json
-    tax_details = {}
+    # Rendered HTML is cached per (invoice id, updated_at); edits produce a fresh render
+    from .invoice_renderer import InvoiceRenderer
+    html = InvoiceRenderer.render_html(invoice_id)
+    if html is None:
+        abort(404)
+    return html
+
+@app.route('/api/invoices/archive', methods=['POST'])
+@login_required
+def api_export_invoice_archive():
+    """Queue an export of all invoices in a date range to the on-disk invoice archive"""
+    if not current_user.can_access('billing'):
+        return jsonify({'success': False, 'error': 'Access denied'}), 403
+
     try:
-        tax_details = json.loads(invoice.notes) if invoice.notes else {}
-    except:
-        pass
-    
-    return render_template('professional_invoice_print.html',
-                         invoice=invoice,
-                         invoice_items=invoice_items,
-                         tax_details=tax_details)
+        data = request.get_json(silent=True) or request.form
+        start_date = datetime.strptime(data.get('start_date'), '%Y-%m-%d').date()
+        end_date = datetime.strptime(data.get('end_date'), '%Y-%m-%d').date()
+        workers = int(data['workers']) if data.get('workers') else None
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'start_date and end_date are required (YYYY-MM-DD)'}), 400
+    if end_date < start_date:
+        return jsonify({'success': False, 'error': 'end_date must be on or after start_date'}), 400
+
+    from services.background_jobs import background_jobs
+    from .invoice_renderer import InvoiceRenderer
+    task = background_jobs.submit(
+        'invoice_archive', InvoiceRenderer.export_archive, start_date, end_date,
+        workers=workers,
+        force=str(data.get('force', '')).lower() in ('1', 'true', 'yes')
+    )
+    return jsonify({
+        'success': True,
+        'job_id': task.id,
+        'status': task.status,
+        'status_url': url_for('api_invoice_archive_status', job_id=task.id)
+    }), 202
+
+@app.route('/api/invoices/archive/<job_id>')
+@login_required
+def api_invoice_archive_status(job_id):
+    """Progress and result of a queued invoice archive export"""
+    if not current_user.can_access('billing'):
+        return jsonify({'success': False, 'error': 'Access denied'}), 403
+
+    from services.background_jobs import background_jobs
+    task = background_jobs.task_status(job_id)
+    if task is None or task['name'] != 'invoice_archive':
+        return jsonify({'success': False, 'error': 'Export job not found'}), 404
+    return jsonify({'success': True, **task})
 
 @app.route('/api/invoice-preview', methods=['POST'])
 @login_required
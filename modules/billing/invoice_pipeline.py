@@ -0,0 +1,336 @@
+"""
+Invoice Build Pipeline
+Parses, prefetches, validates and prices invoice lines in memory, then writes the invoice,
+its items, stock decrements and audit rows in a single transaction
+"""
+from dataclasses import dataclass, field
+from datetime import datetime, date
+from typing import Dict, List, Optional
+from sqlalchemy import insert
+from app import db
+from models import Service, EnhancedInvoice, InvoiceItem
+from modules.inventory.models import InventoryBatch, InventoryProduct, InventoryConsumption
+from modules.inventory.fefo_allocator import FefoAllocator, InsufficientStockError
+from modules.inventory.audit_log import AuditLogWriter
+from modules.clients.customer_metrics import CustomerMetricsMaintainer
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Accepted band for submitted batch prices, relative to the batch selling price
+MIN_PRICE_FACTOR = 0.5   # 50% discount max
+MAX_PRICE_FACTOR = 1.1   # 10% markup max for rounding
+
+
+class InvoiceValidationError(ValueError):
+    """Raised when a line fails validation before anything is written"""
+
+
+def parse_service_lines(form) -> List[Dict]:
+    """Read service_ids[] / service_quantities[] / appointment_ids[] from a submitted form"""
+    service_ids = form.getlist('service_ids[]')
+    service_quantities = form.getlist('service_quantities[]')
+    appointment_ids = form.getlist('appointment_ids[]')
+
+    lines = []
+    for i, service_id in enumerate(service_ids):
+        if service_id:
+            lines.append({
+                'service_id': int(service_id),
+                'quantity': float(service_quantities[i]) if i < len(service_quantities) else 1,
+                'appointment_id': int(appointment_ids[i]) if i < len(appointment_ids) and appointment_ids[i] else None
+            })
+    return lines
+
+
+def parse_inventory_lines(form) -> List[Dict]:
+    """Read product_ids[] / batch_ids[] / product_quantities[] / product_prices[] from a submitted form"""
+    product_ids = form.getlist('product_ids[]')
+    batch_ids = form.getlist('batch_ids[]')
+    product_quantities = form.getlist('product_quantities[]')
+    product_prices = form.getlist('product_prices[]')
+
+    lines = []
+    for i, product_id in enumerate(product_ids):
+        if product_id:
+            lines.append({
+                'product_id': int(product_id),
+                # No batch chosen: assign_batches() picks them first-expiry-first-out
+                'batch_id': int(batch_ids[i]) if i < len(batch_ids) and batch_ids[i] else None,
+                'quantity': float(product_quantities[i]) if i < len(product_quantities) else 1,
+                'unit_price': float(product_prices[i]) if i < len(product_prices) and product_prices[i] else 0
+            })
+    return lines
+
+
+def generate_invoice_number(now: Optional[datetime] = None) -> str:
+    """Next INV-YYYYMMDD-NNNN number, restarting the sequence each day"""
+    now = now or datetime.now()
+    prefix = f"INV-{now.strftime('%Y%m%d')}"
+    latest_number = db.session.query(EnhancedInvoice.invoice_number).order_by(
+        EnhancedInvoice.id.desc()
+    ).limit(1).scalar()
+
+    invoice_sequence = 1
+    if latest_number and latest_number.startswith(prefix):
+        try:
+            invoice_sequence = int(latest_number.split('-')[-1]) + 1
+        except (ValueError, IndexError):
+            invoice_sequence = 1
+    return f"{prefix}-{invoice_sequence:04d}"
+
+
+@dataclass
+class InvoiceLineContext:
+    """Everything the invoice lines reference, loaded with one IN query per table"""
+    services: Dict[int, Service] = field(default_factory=dict)
+    batches: Dict[int, InventoryBatch] = field(default_factory=dict)
+    products: Dict[int, InventoryProduct] = field(default_factory=dict)
+    services_subtotal: float = 0.0
+    inventory_subtotal: float = 0.0
+
+    @property
+    def gross_subtotal(self) -> float:
+        return self.services_subtotal + self.inventory_subtotal
+
+
+class InvoicePipeline:
+    """Builds invoices with a fixed number of queries regardless of line count"""
+
+    @classmethod
+    def assign_batches(cls, inventory_lines: List[Dict]) -> List[Dict]:
+        """
+        Replace lines without a batch_id by FEFO lines, split across batches when one batch
+        cannot cover the quantity. Stock already claimed by explicit lines is respected, and
+        a missing unit price falls back to the batch selling price.
+        """
+        auto_lines = [line for line in inventory_lines if not line.get('batch_id')]
+        if not auto_lines:
+            return inventory_lines
+
+        candidates = FefoAllocator.candidates(line['product_id'] for line in auto_lines)
+        reserved: Dict[int, float] = {}
+        for line in inventory_lines:
+            if line.get('batch_id'):
+                reserved[line['batch_id']] = reserved.get(line['batch_id'], 0) + line['quantity']
+
+        assigned = []
+        for line in inventory_lines:
+            if line.get('batch_id'):
+                assigned.append(line)
+                continue
+            allocations, shortfall = FefoAllocator.plan(candidates.get(line['product_id'], []),
+                                                        line['quantity'], reserved)
+            if shortfall:
+                raise InvoiceValidationError(
+                    f'Insufficient stock for product ID {line["product_id"]}. '
+                    f'Available: {line["quantity"] - shortfall}, Required: {line["quantity"]}'
+                )
+            for allocation in allocations:
+                batch = allocation.batch
+                reserved[batch.id] = reserved.get(batch.id, 0) + allocation.quantity
+                assigned.append({
+                    **line,
+                    'batch_id': batch.id,
+                    'quantity': allocation.quantity,
+                    'unit_price': line['unit_price'] or float(batch.selling_price or 0)
+                })
+        return assigned
+
+    @classmethod
+    def prefetch(cls, service_lines: List[Dict], inventory_lines: List[Dict]) -> InvoiceLineContext:
+        """
+        Load referenced services, batches and products in three IN queries. Batches are
+        read with FOR UPDATE where the backend supports it; SQLite relies on the guarded
+        decrement in write() instead.
+        """
+        context = InvoiceLineContext()
+
+        service_ids = {line['service_id'] for line in service_lines}
+        if service_ids:
+            context.services = {
+                service.id: service for service in Service.query.filter(Service.id.in_(service_ids)).all()
+            }
+
+        batch_ids = {line['batch_id'] for line in inventory_lines}
+        if batch_ids:
+            context.batches = {
+                batch.id: batch for batch in InventoryBatch.query.filter(
+                    InventoryBatch.id.in_(batch_ids)
+                ).with_for_update().all()
+            }
+
+        product_ids = {line['product_id'] for line in inventory_lines}
+        product_ids |= {batch.product_id for batch in context.batches.values() if batch.product_id}
+        if product_ids:
+            context.products = {
+                product.id: product for product in InventoryProduct.query.filter(
+                    InventoryProduct.id.in_(product_ids)
+                ).all()
+            }
+        return context
+
+    @classmethod
+    def validate(cls, context: InvoiceLineContext, service_lines: List[Dict], inventory_lines: List[Dict],
+                 enforce_batch_pricing: bool = True, user_id: Optional[int] = None) -> None:
+        """
+        Check every line against the prefetched rows and raise InvoiceValidationError on the
+        first failure. Quantities are summed per batch so repeated lines cannot oversell.
+        """
+        today = date.today()
+        requested_per_batch: Dict[int, float] = {}
+
+        for line in inventory_lines:
+            batch = context.batches.get(line['batch_id'])
+            if not batch:
+                raise InvoiceValidationError(f'Batch not found for product ID {line["product_id"]}')
+            if batch.expiry_date and batch.expiry_date < today:
+                raise InvoiceValidationError(f'Cannot use expired batch: {batch.batch_name}')
+            if line['product_id'] not in context.products:
+                raise InvoiceValidationError(f'Product not found: {line["product_id"]}')
+
+            requested = requested_per_batch.get(batch.id, 0) + line['quantity']
+            requested_per_batch[batch.id] = requested
+            if float(batch.qty_available) < requested:
+                raise InvoiceValidationError(
+                    f'Insufficient stock in batch {batch.batch_name}. '
+                    f'Available: {batch.qty_available}, Required: {requested}'
+                )
+
+            if enforce_batch_pricing:
+                cls._validate_batch_price(context, batch, line['unit_price'], user_id)
+
+        for line in service_lines:
+            if line['service_id'] not in context.services:
+                raise InvoiceValidationError(f'Service not found: {line["service_id"]}')
+
+    @staticmethod
+    def _validate_batch_price(context: InvoiceLineContext, batch: InventoryBatch,
+                              submitted_price: float, user_id: Optional[int]) -> None:
+        """Reject submitted prices outside the allowed band around the batch selling price"""
+        product = context.products.get(batch.product_id)
+        product_name = product.name if product else batch.batch_name
+
+        if batch.selling_price:
+            actual_price = float(batch.selling_price)
+            if not actual_price * MIN_PRICE_FACTOR <= submitted_price <= actual_price * MAX_PRICE_FACTOR:
+                logger.warning(
+                    "Price manipulation attempt detected: User %s tried to set price %s for batch %s (actual: %s)",
+                    user_id, submitted_price, batch.batch_name, actual_price
+                )
+                raise InvoiceValidationError(
+                    f'Invalid price for {product_name} (Batch: {batch.batch_name}). '
+                    f'Expected: ${actual_price:.2f}, Submitted: ${submitted_price:.2f}'
+                )
+        elif submitted_price > 0:
+            # If no selling price set, require manual approval for non-zero prices
+            raise InvoiceValidationError(
+                f'Product {product_name} has no selling price configured. Please set selling price first.'
+            )
+
+    @classmethod
+    def price(cls, context: InvoiceLineContext, service_lines: List[Dict],
+              inventory_lines: List[Dict]) -> InvoiceLineContext:
+        """Compute subtotals from prefetched service prices and submitted inventory prices"""
+        # Service prices always come from the catalogue, never from the client
+        context.services_subtotal = sum(
+            context.services[line['service_id']].price * line['quantity'] for line in service_lines
+        )
+        context.inventory_subtotal = sum(line['unit_price'] * line['quantity'] for line in inventory_lines)
+        return context
+
+    @classmethod
+    def build(cls, service_lines: List[Dict], inventory_lines: List[Dict],
+              enforce_batch_pricing: bool = True, user_id: Optional[int] = None) -> InvoiceLineContext:
+        """Prefetch, validate and price in one pass; nothing is written"""
+        context = cls.prefetch(service_lines, inventory_lines)
+        cls.validate(context, service_lines, inventory_lines,
+                     enforce_batch_pricing=enforce_batch_pricing, user_id=user_id)
+        return cls.price(context, service_lines, inventory_lines)
+
+    @classmethod
+    def write(cls, invoice: EnhancedInvoice, context: InvoiceLineContext, service_lines: List[Dict],
+              inventory_lines: List[Dict], issued_to: str, consumption_notes: str,
+              user_id: Optional[int] = None) -> Dict:
+        """
+        Add the invoice, its items, consumption records and audit rows to the session and
+        decrement batch stock. Each decrement is a guarded UPDATE that only succeeds while
+        enough stock remains, so a concurrent sale surfaces as InsufficientStockError rather
+        than negative stock. Nothing is committed here; the caller commits or rolls back.
+        """
+        db.session.add(invoice)
+        db.session.flush()  # Get the invoice ID
+
+        items = []
+        for line in service_lines:
+            service = context.services[line['service_id']]
+            amount = service.price * line['quantity']
+            items.append({
+                'invoice_id': invoice.id,
+                'item_type': 'service',
+                'item_id': service.id,
+                'appointment_id': line.get('appointment_id'),
+                'product_id': None,
+                'batch_id': None,
+                'item_name': service.name,
+                'description': service.description,
+                'batch_name': None,
+                'quantity': line['quantity'],
+                'unit_price': service.price,
+                'original_amount': amount,
+                'final_amount': amount
+            })
+
+        consumptions = []
+        audit = AuditLogWriter()
+        for line in inventory_lines:
+            batch = context.batches[line['batch_id']]
+            product = context.products[line['product_id']]
+            amount = line['unit_price'] * line['quantity']
+            items.append({
+                'invoice_id': invoice.id,
+                'item_type': 'inventory',
+                'item_id': product.id,
+                'appointment_id': None,
+                'product_id': product.id,
+                'batch_id': batch.id,
+                'item_name': product.name,
+                'description': f"Batch: {batch.batch_name}",
+                'batch_name': batch.batch_name,
+                'quantity': line['quantity'],
+                'unit_price': line['unit_price'],
+                'original_amount': amount,
+                'final_amount': amount
+            })
+
+            stock_after = cls._decrement_batch(batch, line['quantity'])
+            consumption = InventoryConsumption(
+                batch_id=batch.id,
+                quantity=line['quantity'],
+                issued_to=issued_to,
+                reference=invoice.invoice_number,
+                notes=consumption_notes,
+                created_by=user_id
+            )
+            consumptions.append(consumption)
+            audit.record(batch, user_id, 'consumption', -line['quantity'], stock_after + line['quantity'],
+                         stock_after, reference_type='consumption', reference=consumption,
+                         notes=f"Consumed by: {issued_to}", product_id=batch.product_id or product.id)
+
+        if items:
+            # Bulk inserts skip the flush hook that keeps customer spend current
+            CustomerMetricsMaintainer.apply_invoice_lines(db.session, [item['appointment_id'] for item in items])
+            db.session.execute(insert(InvoiceItem), items)
+        db.session.add_all(consumptions)
+        audit.flush()  # Flushes the consumptions for their ids, then one INSERT
+
+        return {
+            'service_items_created': len(service_lines),
+            'inventory_items_created': len(inventory_lines),
+            'stock_reduced': len(consumptions)
+        }
+
+    @staticmethod
+    def _decrement_batch(batch: InventoryBatch, quantity: float) -> float:
+        """Atomically take quantity from a batch and return the remaining stock"""
+        return FefoAllocator.decrement(batch, quantity)
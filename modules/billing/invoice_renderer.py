@@ -0,0 +1,293 @@
+"""
+Invoice Rendering Subsystem
+Caches rendered professional invoices by (invoice id, updated_at) and exports date ranges
+to an on-disk archive. Export batches are loaded, rendered and converted inside a pool of
+spawned worker processes, each with its own app context and database engine
+"""
+import json
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, date, timedelta
+from typing import Dict, List, Optional, Tuple
+from flask import render_template
+from sqlalchemy.orm import joinedload
+from app import db
+from models import EnhancedInvoice, InvoiceItem
+from services.branch_router import branch_router
+from services.report_replica import report_replica
+import logging
+
+try:
+    from weasyprint import HTML as WeasyHTML
+except ImportError:
+    # PDF conversion is optional; the archive falls back to standalone HTML files
+    WeasyHTML = None
+
+logger = logging.getLogger(__name__)
+
+INVOICE_TEMPLATE = 'professional_invoice_print.html'
+
+# Rendered invoices kept in memory per worker process
+RENDER_CACHE_SIZE = 256
+
+# Invoices loaded and rendered per worker task during exports
+EXPORT_BATCH_SIZE = 200
+
+ARCHIVE_MANIFEST = 'manifest.json'
+
+
+def default_archive_dir() -> str:
+    """Archive root under the working directory; other branches archive to a subfolder"""
+    root = os.path.join(os.getcwd(), 'invoice_archive')
+    branch = branch_router.current()
+    return root if branch == branch_router.primary else os.path.join(root, branch)
+
+
+def _write_document(html: str, output_path: str) -> Optional[str]:
+    """Convert rendered HTML to a PDF (or write the HTML as-is when no PDF engine is installed)"""
+    try:
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        if WeasyHTML is not None:
+            WeasyHTML(string=html).write_pdf(output_path)
+        else:
+            with open(output_path, 'w', encoding='utf-8') as handle:
+                handle.write(html)
+        return None
+    except Exception as e:
+        return str(e)
+
+
+def _export_batch(job: Tuple[str, List[Tuple[int, str, str]]]) -> List[Tuple[int, str, Optional[str]]]:
+    """
+    Export worker: load, render and write one batch of (invoice_id, version, output_path)
+    in a fresh app context bound to the branch. Returns (invoice_id, output_path, error)
+    """
+    from app import app
+    branch, targets = job
+    results = []
+    with app.app_context():
+        branch_router.bind(branch)
+        with report_replica.reading():
+            invoices, items_by_invoice = InvoiceRenderer.load_batch([invoice_id for invoice_id, _, _ in targets])
+            for invoice_id, version, output_path in targets:
+                invoice = invoices.get(invoice_id)
+                if invoice is None:
+                    results.append((invoice_id, output_path, 'Invoice no longer exists'))
+                    continue
+                html = rendered_invoice_cache.get((invoice_id, version))
+                if html is None:
+                    html = InvoiceRenderer._render(invoice, items_by_invoice.get(invoice_id, []))
+                results.append((invoice_id, output_path, _write_document(html, output_path)))
+    return results
+
+
+class RenderedInvoiceCache:
+    """Thread-safe LRU of rendered HTML keyed by (invoice_id, updated_at), kept per branch"""
+
+    def __init__(self, max_size: int = RENDER_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: 'OrderedDict[Tuple[str, int, str], str]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _scoped(key: Tuple[int, str]) -> Tuple[str, int, str]:
+        # Invoice ids are only unique within one branch database
+        return (branch_router.current(),) + tuple(key)
+
+    def get(self, key: Tuple[int, str]) -> Optional[str]:
+        key = self._scoped(key)
+        with self._lock:
+            html = self._entries.get(key)
+            if html is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return html
+
+    def put(self, key: Tuple[int, str], html: str) -> None:
+        key = self._scoped(key)
+        with self._lock:
+            # An invoice only ever needs its latest version cached
+            for stale in [k for k in self._entries if k[:2] == key[:2] and k != key]:
+                del self._entries[stale]
+            self._entries[key] = html
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, invoice_id: int) -> None:
+        invoice_key = (branch_router.current(), invoice_id)
+        with self._lock:
+            for key in [k for k in self._entries if k[:2] == invoice_key]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'size': len(self._entries), 'max_size': self.max_size,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+rendered_invoice_cache = RenderedInvoiceCache()
+
+
+class InvoiceRenderer:
+    """Renders professional invoices through the cache and builds offline archives"""
+
+    @staticmethod
+    def _version(updated_at: Optional[datetime], created_at: Optional[datetime]) -> str:
+        stamp = updated_at or created_at
+        return stamp.isoformat() if stamp else ''
+
+    @staticmethod
+    def parse_tax_details(notes: Optional[str]) -> Dict:
+        """Tax breakdown stored as JSON in invoice.notes by the professional invoice flow"""
+        try:
+            details = json.loads(notes) if notes else {}
+            return details if isinstance(details, dict) else {}
+        except (TypeError, ValueError):
+            return {}
+
+    @classmethod
+    def _render(cls, invoice: EnhancedInvoice, invoice_items: List[InvoiceItem]) -> str:
+        return render_template(INVOICE_TEMPLATE,
+                               invoice=invoice,
+                               invoice_items=invoice_items,
+                               tax_details=cls.parse_tax_details(invoice.notes))
+
+    @classmethod
+    def render_html(cls, invoice_id: int) -> Optional[str]:
+        """
+        Return the printable HTML for an invoice, or None if it does not exist. A hit costs
+        one single-column lookup; a miss loads the invoice, customer and items and renders.
+        """
+        version_row = db.session.query(
+            EnhancedInvoice.updated_at, EnhancedInvoice.created_at
+        ).filter(EnhancedInvoice.id == invoice_id).first()
+        if version_row is None:
+            return None
+
+        key = (invoice_id, cls._version(version_row.updated_at, version_row.created_at))
+        html = rendered_invoice_cache.get(key)
+        if html is not None:
+            return html
+
+        invoice = EnhancedInvoice.query.options(
+            joinedload(EnhancedInvoice.customer)
+        ).filter(EnhancedInvoice.id == invoice_id).first()
+        invoice_items = InvoiceItem.query.filter_by(invoice_id=invoice_id).order_by(InvoiceItem.id).all()
+        html = cls._render(invoice, invoice_items)
+        rendered_invoice_cache.put(key, html)
+        return html
+
+    @classmethod
+    def load_batch(cls, invoice_ids: List[int]) -> Tuple[Dict[int, EnhancedInvoice], Dict[int, List[InvoiceItem]]]:
+        """Invoices (with customers) and their line items for one export batch, in two queries"""
+        invoices = {invoice.id: invoice for invoice in EnhancedInvoice.query.options(
+            joinedload(EnhancedInvoice.customer)
+        ).filter(EnhancedInvoice.id.in_(invoice_ids)).all()}
+        items_by_invoice: Dict[int, List[InvoiceItem]] = {}
+        for item in InvoiceItem.query.filter(
+            InvoiceItem.invoice_id.in_(invoice_ids)
+        ).order_by(InvoiceItem.id).all():
+            items_by_invoice.setdefault(item.invoice_id, []).append(item)
+        return invoices, items_by_invoice
+
+    @classmethod
+    def pending_exports(cls, start_date: date, end_date: date, manifest: Dict, archive_dir: str,
+                        extension: str) -> Tuple[List[Tuple[int, str, str]], Dict[int, Tuple[str, str]], int]:
+        """
+        (invoice_id, version, output_path) for every invoice dated within [start_date, end_date]
+        whose version differs from the manifest, read from slim columns only
+        """
+        range_start = datetime.combine(start_date, datetime.min.time())
+        range_end = datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+        rows = db.session.query(
+            EnhancedInvoice.id, EnhancedInvoice.invoice_number, EnhancedInvoice.invoice_date,
+            EnhancedInvoice.updated_at, EnhancedInvoice.created_at
+        ).filter(
+            EnhancedInvoice.invoice_date >= range_start,
+            EnhancedInvoice.invoice_date < range_end
+        ).order_by(EnhancedInvoice.id).all()
+
+        targets, versions, skipped = [], {}, 0
+        for row in rows:
+            version = cls._version(row.updated_at, row.created_at)
+            if manifest.get(row.invoice_number) == version:
+                skipped += 1
+                continue
+            output_path = os.path.join(archive_dir, row.invoice_date.strftime('%Y-%m'),
+                                       f"{row.invoice_number}.{extension}")
+            targets.append((row.id, version, output_path))
+            versions[row.id] = (row.invoice_number, version)
+        return targets, versions, skipped
+
+    @classmethod
+    def export_archive(cls, start_date: date, end_date: date, archive_dir: Optional[str] = None,
+                       workers: Optional[int] = None, force: bool = False) -> Dict:
+        """
+        Write one document per invoice in the range to <archive_dir>/<YYYY-MM>/<invoice_number>.
+        A manifest records the version each file was built from, so reruns only redo invoices
+        that changed. Batches are rendered in spawned worker processes (never forked from a
+        threaded web process holding open connections); a single batch or workers=1 runs in
+        this process instead. Run it from a background task or the CLI, not a request.
+        """
+        archive_dir = archive_dir or default_archive_dir()
+        os.makedirs(archive_dir, exist_ok=True)
+        manifest_path = os.path.join(archive_dir, ARCHIVE_MANIFEST)
+        manifest = {}
+        if os.path.exists(manifest_path) and not force:
+            with open(manifest_path, encoding='utf-8') as handle:
+                manifest = json.load(handle)
+
+        extension = 'pdf' if WeasyHTML is not None else 'html'
+        with report_replica.reading():
+            targets, versions, skipped = cls.pending_exports(start_date, end_date, manifest, archive_dir, extension)
+
+        branch = branch_router.current()
+        batches = [(branch, targets[i:i + EXPORT_BATCH_SIZE]) for i in range(0, len(targets), EXPORT_BATCH_SIZE)]
+        workers = max(1, min(workers or os.cpu_count() or 1, len(batches)))
+
+        written, errors = 0, []
+        if batches:
+            if workers == 1:
+                results = map(_export_batch, batches)
+                pool = None
+            else:
+                pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+                results = pool.map(_export_batch, batches)
+            try:
+                for batch in results:
+                    for invoice_id, output_path, error in batch:
+                        if error:
+                            errors.append({'file': output_path, 'error': error})
+                            continue
+                        invoice_number, version = versions[invoice_id]
+                        manifest[invoice_number] = version
+                        written += 1
+            finally:
+                if pool is not None:
+                    pool.shutdown()
+
+            with open(manifest_path, 'w', encoding='utf-8') as handle:
+                json.dump(manifest, handle, indent=2, sort_keys=True)
+
+        logger.info("Invoice archive %s..%s: %s written, %s unchanged, %s failed",
+                    start_date, end_date, written, skipped, len(errors))
+        return {
+            'success': not errors,
+            'archive_dir': archive_dir,
+            'format': extension,
+            'written': written,
+            'unchanged': skipped,
+            'errors': errors
+        }
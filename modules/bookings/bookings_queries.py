@@ -3,12 +3,17 @@ Bookings-related database queries
 """
 from datetime import datetime, date, timedelta
 from sqlalchemy import func, and_, or_
+from sqlalchemy.orm import joinedload
 from app import db
 from models import Appointment, Customer, Service, User
 
 def get_appointments_by_date(filter_date):
     """Get appointments for a specific date with full details"""
-    return Appointment.query.filter(
+    return Appointment.query.options(
+        joinedload(Appointment.client),
+        joinedload(Appointment.service),
+        joinedload(Appointment.assigned_staff)
+    ).filter(
         func.date(Appointment.appointment_date) == filter_date
     ).order_by(Appointment.appointment_date).all()
 
@@ -84,13 +89,13 @@ def get_time_slots(filter_date, staff_id=None, service_id=None):
         time_slots = []
         start_hour = 9
         end_hour = 18
+        existing_appointments = get_appointments_by_date(filter_date)
 
         for hour in range(start_hour, end_hour):
             for minutes in [0, 30]:
                 slot_time = datetime.combine(filter_date, datetime.min.time().replace(hour=hour, minute=minutes))
 
                 # Check if this slot is available
-                existing_appointments = get_appointments_by_date(filter_date)
                 is_available = True
 
                 for appointment in existing_appointments:
@@ -4,7 +4,8 @@ Bookings views and routes
 from flask import render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
 from datetime import datetime, date, timedelta, time
-from app import app
+from app import app, db
+from services.query_budget import query_budget
 from forms import AppointmentForm, QuickBookingForm
 from .bookings_queries import (
     get_appointments_by_date, get_active_clients, get_active_services, 
@@ -14,6 +15,7 @@ from .bookings_queries import (
 )
 # Import models
 from models import Appointment, Customer, Service, User, ShiftManagement, ShiftLogs
+from .waitlist_matcher import WaitlistMatcher
 # Late imports to avoid circular dependency
 from sqlalchemy import func
 import re # Import re for regular expressions
@@ -21,43 +23,43 @@ import re # Import re for regular expressions
 # Helper function to get staff schedule for a specific date
 def get_staff_schedule_for_date(staff_id, target_date):
     """Get the detailed schedule for a staff member on a specific date"""
-    try:
-        # Get shift management for this staff member and date
-        shift_management = ShiftManagement.query.filter(
-            ShiftManagement.staff_id == staff_id,
-            ShiftManagement.from_date <= target_date,
-            ShiftManagement.to_date >= target_date
-        ).first()
+    return get_staff_schedules_for_date([staff_id], target_date).get(staff_id)
 
-        if not shift_management:
-            return None
 
-        # Get specific shift log for this date
-        shift_log = ShiftLogs.query.filter(
-            ShiftLogs.shift_management_id == shift_management.id,
+def get_staff_schedules_for_date(staff_ids, target_date):
+    """Get the detailed schedules of several staff members on a specific date in one query, keyed by staff id"""
+    try:
+        rows = db.session.query(ShiftManagement, ShiftLogs).join(
+            ShiftLogs, ShiftLogs.shift_management_id == ShiftManagement.id
+        ).filter(
+            ShiftManagement.staff_id.in_(list(staff_ids)),
+            ShiftManagement.from_date <= target_date,
+            ShiftManagement.to_date >= target_date,
             ShiftLogs.individual_date == target_date
-        ).first()
+        ).order_by(ShiftManagement.id).all()
 
-        if not shift_log:
-            return None
-
-        return {
-            'schedule_id': shift_management.id,
-            'daily_schedule_id': shift_log.id,
-            'schedule_name': f'Shift {target_date}',
-            'shift_start_time': shift_log.shift_start_time,
-            'shift_end_time': shift_log.shift_end_time,
-            'break_start_time': shift_log.break_start_time,
-            'break_end_time': shift_log.break_end_time,
-            'break_duration_minutes': 0,
-            'break_time': shift_log.get_break_time_display() if shift_log.break_start_time and shift_log.break_end_time else 'No break',
-            'is_working_day': shift_log.status in ['scheduled', 'completed'],
-            'notes': ''
-        }
+        schedules = {}
+        for shift_management, shift_log in rows:
+            if shift_management.staff_id in schedules:
+                continue
+            schedules[shift_management.staff_id] = {
+                'schedule_id': shift_management.id,
+                'daily_schedule_id': shift_log.id,
+                'schedule_name': f'Shift {target_date}',
+                'shift_start_time': shift_log.shift_start_time,
+                'shift_end_time': shift_log.shift_end_time,
+                'break_start_time': shift_log.break_start_time,
+                'break_end_time': shift_log.break_end_time,
+                'break_duration_minutes': 0,
+                'break_time': shift_log.get_break_time_display() if shift_log.break_start_time and shift_log.break_end_time else 'No break',
+                'is_working_day': shift_log.status in ['scheduled', 'completed'],
+                'notes': ''
+            }
+        return schedules
 
     except Exception as e:
         print(f"Error getting staff schedule for date: {e}")
-        return None
+        return {}
 
 
 @app.route('/bookings')
@@ -262,6 +264,7 @@ def add_appointment():
 
 # API Endpoints for Dynamic Booking Features
 @app.route('/api/time-slots')
+@query_budget(2)
 @login_required
 def api_time_slots():
     """API endpoint to get available time slots"""
@@ -290,6 +293,7 @@ def api_time_slots():
     })
 
 @app.route('/calendar-booking')
+@query_budget(7)
 @login_required
 def calendar_booking():
     """Calendar timetable view for booking appointments with enhanced shift scheduler integration"""
@@ -320,9 +324,10 @@ def calendar_booking():
 
     # Get staff schedules for the selected date with enhanced logic
     staff_schedules = {}
+    schedules_for_date = get_staff_schedules_for_date([staff.id for staff in staff_members], selected_date)
     for staff in staff_members:
         # Find active schedules that cover the selected date and include the day of week
-        schedule_info = get_staff_schedule_for_date(staff.id, selected_date)
+        schedule_info = schedules_for_date.get(staff.id)
 
         if schedule_info and schedule_info.get('is_working_day'):
             staff_schedules[staff.id] = {
@@ -343,7 +348,7 @@ def calendar_booking():
             staff_schedules[staff.id] = {
                 'shift_start': None,
                 'shift_end': None,
-                'schedule_name': schedule_info.get('schedule_name', 'Not Scheduled'),
+                'schedule_name': schedule_info.get('schedule_name', 'Not Scheduled') if schedule_info else 'Not Scheduled',
                 'break_time': None,
                 'break_start': None,
                 'break_end': None,
@@ -351,7 +356,7 @@ def calendar_booking():
                 'has_shift': False,
                 'schedule_id': None,
                 'daily_schedule_id': None,
-                'notes': schedule_info.get('notes', 'No shift scheduled or day off')
+                'notes': schedule_info.get('notes', 'No shift scheduled or day off') if schedule_info else 'No shift scheduled or day off'
             }
 
     # Generate time slots from 8 AM to 8 PM with 30-minute intervals
@@ -623,6 +628,7 @@ def book_appointment_api():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/booking-services')
+@query_budget(2)
 @login_required
 def api_booking_services():
     """API endpoint to get all active services"""
@@ -693,6 +699,7 @@ def api_quick_book():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/staff-availability')
+@query_budget(6)
 @login_required
 def staff_availability():
     """Enhanced staff availability with proper shift scheduler integration"""
@@ -731,15 +738,20 @@ def staff_availability():
         current_time += timedelta(minutes=30)
 
     # Get existing appointments for the selected date
-    existing_appointments = Appointment.query.filter(
+    from sqlalchemy.orm import joinedload
+    existing_appointments = Appointment.query.options(
+        joinedload(Appointment.client),
+        joinedload(Appointment.service)
+    ).filter(
         func.date(Appointment.appointment_date) == selected_date,
         Appointment.status != 'cancelled'
     ).all()
 
     # Get enhanced staff schedules for the selected date using new shift schema
     staff_schedules = {}
+    schedules_for_date = get_staff_schedules_for_date([staff.id for staff in staff_members], selected_date)
     for staff in staff_members:
-        schedule_info = get_staff_schedule_for_date(staff.id, selected_date)
+        schedule_info = schedules_for_date.get(staff.id)
 
         if schedule_info and schedule_info.get('is_working_day'):
             staff_schedules[staff.id] = {
@@ -920,7 +932,8 @@ def staff_availability():
                          today_revenue=today_revenue,
                          total_staff_on_duty=total_staff_on_duty,
                          total_available_slots=total_available_slots,
-                         total_booked_slots=total_booked_slots)
+                         total_booked_slots=total_booked_slots,
+                         timedelta=timedelta)
 
 @app.route('/api/appointment/<int:appointment_id>')
 @login_required
@@ -1019,6 +1032,7 @@ def api_appointment_details(appointment_id):
         return jsonify({'error': f'Error fetching appointment details: {str(e)}'}), 500
 
 @app.route('/api/appointments')
+@query_budget(2)
 @login_required
 def api_all_appointments():
     """API endpoint to get all appointments with filters"""
@@ -1034,8 +1048,13 @@ def api_all_appointments():
         client_id = request.args.get('client_id', type=int)
         status = request.args.get('status')
 
-        # Base query
-        appointments_query = Appointment.query
+        # Base query, with the related rows each appointment is serialized with
+        from sqlalchemy.orm import joinedload
+        appointments_query = Appointment.query.options(
+            joinedload(Appointment.client),
+            joinedload(Appointment.service),
+            joinedload(Appointment.assigned_staff)
+        )
 
         # Apply filters
         if date_filter:
@@ -1108,7 +1127,7 @@ def update_appointment_status(appointment_id):
         return redirect(url_for('dashboard'))
 
     new_status = request.form.get('status')
-    if new_status not in ['pending', 'confirmed', 'completed', 'cancelled']:
+    if new_status not in ['pending', 'confirmed', 'completed', 'cancelled', 'no_show']:
         flash('Invalid status', 'danger')
         return redirect(url_for('bookings'))
 
@@ -1117,7 +1136,18 @@ def update_appointment_status(appointment_id):
         flash('Appointment not found', 'danger')
         return redirect(url_for('bookings'))
 
-    update_appointment(appointment_id, {'status': new_status})
+    if new_status == 'completed':
+        # Status change and bill-of-materials consumption commit together
+        appointment.status = new_status
+        try:
+            appointment.process_inventory_deduction(user_id=current_user.id)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Error completing appointment: {str(e)}', 'danger')
+            return redirect(url_for('bookings'))
+    else:
+        update_appointment(appointment_id, {'status': new_status})
     flash(f'Appointment status updated to {new_status}', 'success')
 
     return redirect(url_for('bookings'))
@@ -1364,6 +1394,9 @@ def cancel_appointment(appointment_id):
         else:
             cancellation_reason = request.form.get('reason', '')
 
+        frees_slot = (appointment.status not in ['cancelled', 'completed', 'no_show']
+                      and appointment.appointment_date > datetime.now())
+
         # Update status to cancelled
         appointment_data = {
             'status': 'cancelled',
@@ -1374,13 +1407,21 @@ def cancel_appointment(appointment_id):
         updated_appointment = update_appointment(appointment_id, appointment_data)
 
         if updated_appointment:
+            waitlist_result = {}
+            if frees_slot:
+                # Offer the freed slot to the waitlist
+                waitlist_result = WaitlistMatcher.on_slot_freed(
+                    updated_appointment.service_id, updated_appointment.appointment_date,
+                    staff_id=updated_appointment.staff_id, created_by=current_user.id
+                )
             success_msg = 'Appointment cancelled successfully!'
             if request.is_json:
                 return jsonify({
                     'success': True,
                     'message': success_msg,
                     'appointment_id': appointment_id,
-                    'status': 'cancelled'
+                    'status': 'cancelled',
+                    'waitlist_notified': waitlist_result.get('notified', [])
                 })
             flash(success_msg, 'success')
         else:
@@ -1423,15 +1464,26 @@ def delete_appointment_permanent(appointment_id):
 
     try:
         appointment_date = appointment.appointment_date.strftime('%Y-%m-%d')
+        freed_service_id = appointment.service_id
+        freed_slot_start = appointment.appointment_date
+        freed_staff_id = appointment.staff_id
+        frees_slot = appointment.status not in ['cancelled', 'completed', 'no_show']
 
         # Permanently delete the appointment
         if delete_appointment(appointment_id):
+            waitlist_result = {}
+            if frees_slot:
+                # Offer the freed slot to the waitlist
+                waitlist_result = WaitlistMatcher.on_slot_freed(
+                    freed_service_id, freed_slot_start, staff_id=freed_staff_id, created_by=current_user.id
+                )
             success_msg = 'Appointment deleted permanently!'
             if request.is_json:
                 return jsonify({
                     'success': True,
                     'message': success_msg,
-                    'appointment_id': appointment_id
+                    'appointment_id': appointment_id,
+                    'waitlist_notified': waitlist_result.get('notified', [])
                 })
             flash(success_msg, 'success')
         else:
@@ -1569,4 +1621,111 @@ def edit_appointment(appointment_id):
                          appointment=appointment,
                          clients=clients,
                          services=services,
-                         staff_members=staff_members)
\ No newline at end of file
+                         staff_members=staff_members)
+
+
+@app.route('/api/recurring-appointments', methods=['GET', 'POST'])
+@login_required
+def api_recurring_appointments():
+    """List recurrence rules or create one and expand it over the booking horizon"""
+    if not current_user.can_access('bookings'):
+        return jsonify({'error': 'Access denied'}), 403
+
+    from models import RecurringAppointment
+    from .recurring_appointments import RecurringAppointmentEngine, DEFAULT_HORIZON_DAYS
+
+    if request.method == 'GET':
+        rules = RecurringAppointment.query.filter_by(is_active=True).order_by(RecurringAppointment.start_date).all()
+        return jsonify({
+            'success': True,
+            'recurring_appointments': [{
+                'id': rule.id,
+                'client_id': rule.client_id,
+                'service_id': rule.service_id,
+                'staff_id': rule.staff_id,
+                'frequency': rule.frequency,
+                'day_of_week': rule.day_of_week,
+                'time_slot': rule.time_slot.strftime('%H:%M'),
+                'start_date': rule.start_date.isoformat(),
+                'end_date': rule.end_date.isoformat() if rule.end_date else None,
+                'generated_until': rule.generated_until.isoformat() if rule.generated_until else None
+            } for rule in rules]
+        })
+
+    try:
+        data = request.get_json() or {}
+        rule_data = {
+            'client_id': int(data['client_id']),
+            'service_id': int(data['service_id']),
+            'staff_id': int(data['staff_id']),
+            'frequency': data.get('frequency', 'weekly'),
+            'day_of_week': int(data['day_of_week']) if data.get('day_of_week') not in (None, '') else None,
+            'time_slot': datetime.strptime(data['time_slot'], '%H:%M').time(),
+            'start_date': datetime.strptime(data['start_date'], '%Y-%m-%d').date(),
+            'end_date': datetime.strptime(data['end_date'], '%Y-%m-%d').date() if data.get('end_date') else None
+        }
+        horizon_days = int(data.get('horizon_days', DEFAULT_HORIZON_DAYS))
+        require_shift = str(data.get('require_shift', True)).lower() in ('1', 'true', 'yes')
+        result = RecurringAppointmentEngine.create_rule(rule_data, horizon_days=horizon_days,
+                                                        require_shift=require_shift)
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': f'Invalid recurring appointment data: {e}'}), 400
+
+    return jsonify(result), (201 if result.get('success') else 500)
+
+
+@app.route('/api/recurring-appointments/expand', methods=['POST'])
+@login_required
+def api_expand_recurring_appointments():
+    """Roll all active recurrence rules forward to the booking horizon"""
+    if not current_user.can_access('bookings'):
+        return jsonify({'error': 'Access denied'}), 403
+
+    from .recurring_appointments import RecurringAppointmentEngine, DEFAULT_HORIZON_DAYS
+
+    data = request.get_json(silent=True) or {}
+    try:
+        horizon_days = int(data.get('horizon_days', DEFAULT_HORIZON_DAYS))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'horizon_days must be a whole number of days'}), 400
+
+    result = RecurringAppointmentEngine.expand(
+        rule_ids=data.get('rule_ids'),
+        horizon_days=horizon_days,
+        require_shift=str(data.get('require_shift', True)).lower() in ('1', 'true', 'yes')
+    )
+    return jsonify(result), (200 if result.get('success') else 500)
+
+
+@app.route('/api/waitlist/matches')
+@login_required
+def api_waitlist_matches():
+    """Rank waitlist candidates for a slot without notifying anyone"""
+    if not current_user.can_access('bookings'):
+        return jsonify({'error': 'Access denied'}), 403
+
+    try:
+        service_id = request.args.get('service_id', type=int)
+        staff_id = request.args.get('staff_id', type=int)
+        slot_start = datetime.strptime(request.args.get('start', ''), '%Y-%m-%d %H:%M')
+    except ValueError:
+        return jsonify({'error': 'start must be formatted as YYYY-MM-DD HH:MM'}), 400
+    if not service_id:
+        return jsonify({'error': 'service_id is required'}), 400
+
+    candidates = WaitlistMatcher.find_candidates(service_id, slot_start, staff_id=staff_id)
+    return jsonify({'success': True, 'candidates': candidates, 'total': len(candidates)})
+
+@app.route('/api/waitlist/sweep', methods=['POST'])
+@login_required
+def api_waitlist_sweep():
+    """Expire stale waitlist entries in batches"""
+    if not current_user.can_access('bookings'):
+        return jsonify({'error': 'Access denied'}), 403
+
+    try:
+        expired = WaitlistMatcher.sweep_expired()
+        return jsonify({'success': True, 'expired': expired})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
@@ -0,0 +1,319 @@
+"""
+Recurring Appointment Expansion Engine
+Generates appointments from RecurringAppointment rules over a rolling horizon,
+checks every occurrence against shifts and existing bookings in one batched pass
+and bulk-inserts the ones that fit
+"""
+import calendar
+from bisect import bisect_left
+from dataclasses import dataclass
+from datetime import datetime, date, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import insert, or_
+from app import db
+from models import Appointment, RecurringAppointment, Service
+from services.staff_schedule_service import staff_schedule_service
+from modules.staff.demand_cube import DemandCubeMaintainer
+import logging
+
+logger = logging.getLogger(__name__)
+
+FREQUENCY_STEP_DAYS = {
+    'weekly': 7,
+    'biweekly': 14
+}
+
+RECURRENCE_FREQUENCIES = ('weekly', 'biweekly', 'monthly')
+
+DEFAULT_HORIZON_DAYS = 60
+
+# Marker written to appointment notes so generated rows can be traced back to their rule
+RECURRING_NOTE_PREFIX = '[Recurring #{rule_id}]'
+
+
+@dataclass
+class Occurrence:
+    """One concrete appointment generated from a recurrence rule"""
+    rule_id: int
+    client_id: int
+    service_id: int
+    staff_id: int
+    start: datetime
+    end: datetime
+    amount: float
+
+    def to_dict(self, reason: Optional[str] = None) -> Dict:
+        data = {
+            'recurring_appointment_id': self.rule_id,
+            'client_id': self.client_id,
+            'service_id': self.service_id,
+            'staff_id': self.staff_id,
+            'start': self.start.isoformat(),
+            'end': self.end.isoformat()
+        }
+        if reason:
+            data['reason'] = reason
+        return data
+
+
+def _add_months(source: date, months: int, day: int) -> date:
+    """Move a date by whole months, clamping the day to the target month's length"""
+    month_index = source.month - 1 + months
+    year = source.year + month_index // 12
+    month = month_index % 12 + 1
+    return date(year, month, min(day, calendar.monthrange(year, month)[1]))
+
+
+def iter_occurrence_dates(rule: RecurringAppointment, window_start: date, window_end: date) -> Iterator[date]:
+    """
+    Lazily yield the dates a rule fires on within [window_start, window_end].
+    Weekly and biweekly rules keep their phase from the first occurrence on or after
+    start_date; monthly rules repeat on start_date's day of month.
+    """
+    last_date = min(window_end, rule.end_date) if rule.end_date else window_end
+    window_start = max(window_start, rule.start_date)
+    if window_start > last_date:
+        return
+
+    step = FREQUENCY_STEP_DAYS.get(rule.frequency)
+    if step:
+        weekday = rule.day_of_week if rule.day_of_week is not None else rule.start_date.weekday()
+        current = rule.start_date + timedelta(days=(weekday - rule.start_date.weekday()) % 7)
+        if current < window_start:
+            periods = -(-(window_start - current).days // step)  # ceiling division
+            current += timedelta(days=periods * step)
+        while current <= last_date:
+            yield current
+            current += timedelta(days=step)
+    elif rule.frequency == 'monthly':
+        day = rule.start_date.day
+        months = (window_start.year - rule.start_date.year) * 12 + window_start.month - rule.start_date.month
+        current = _add_months(rule.start_date, months, day)
+        while current <= last_date:
+            if current >= window_start:
+                yield current
+            months += 1
+            current = _add_months(rule.start_date, months, day)
+    else:
+        logger.warning("Unknown recurrence frequency '%s' on rule %s", rule.frequency, rule.id)
+
+
+class RecurringAppointmentEngine:
+    """Expands recurrence rules into appointments with batched conflict checking"""
+
+    @classmethod
+    def generate_occurrences(cls, rules: List[RecurringAppointment], horizon_end: date,
+                             from_date: Optional[date] = None) -> List[Occurrence]:
+        """Build occurrences for each rule from where it was last expanded up to horizon_end"""
+        from_date = from_date or date.today()
+        service_ids = {rule.service_id for rule in rules}
+        services = {
+            row.id: row for row in Service.query.with_entities(
+                Service.id, Service.duration, Service.price
+            ).filter(Service.id.in_(service_ids)).all()
+        } if service_ids else {}
+
+        occurrences = []
+        for rule in rules:
+            service = services.get(rule.service_id)
+            if not service:
+                logger.warning("Recurring rule %s references missing service %s", rule.id, rule.service_id)
+                continue
+            window_start = from_date
+            if rule.generated_until and rule.generated_until >= window_start:
+                window_start = rule.generated_until + timedelta(days=1)
+
+            for occurrence_date in iter_occurrence_dates(rule, window_start, horizon_end):
+                start = datetime.combine(occurrence_date, rule.time_slot)
+                occurrences.append(Occurrence(
+                    rule_id=rule.id,
+                    client_id=rule.client_id,
+                    service_id=rule.service_id,
+                    staff_id=rule.staff_id,
+                    start=start,
+                    end=start + timedelta(minutes=service.duration or 60),
+                    amount=service.price
+                ))
+        return occurrences
+
+    @classmethod
+    def check_conflicts(cls, occurrences: List[Occurrence],
+                        require_shift: bool = True) -> Tuple[List[Occurrence], List[Dict]]:
+        """
+        Split occurrences into (accepted, conflicts) using one appointment query and one
+        shift query for the whole batch. Accepted occurrences also block later ones in
+        the same batch.
+        """
+        if not occurrences:
+            return [], []
+
+        staff_ids = sorted({occ.staff_id for occ in occurrences})
+        client_ids = sorted({occ.client_id for occ in occurrences})
+        window_start = min(occ.start for occ in occurrences)
+        window_end = max(occ.end for occ in occurrences)
+
+        existing = db.session.query(
+            Appointment.staff_id, Appointment.client_id,
+            Appointment.appointment_date, Appointment.end_time
+        ).filter(
+            or_(Appointment.staff_id.in_(staff_ids), Appointment.client_id.in_(client_ids)),
+            Appointment.appointment_date < window_end,
+            Appointment.end_time > window_start,
+            Appointment.status.notin_(['cancelled', 'no_show'])
+        ).all()
+
+        # Sorted interval lists per staff and per client for bisect lookups
+        staff_busy: Dict[int, List[Tuple[datetime, datetime]]] = {}
+        client_busy: Dict[int, List[Tuple[datetime, datetime]]] = {}
+        for row in existing:
+            interval = (row.appointment_date, row.end_time)
+            staff_busy.setdefault(row.staff_id, []).append(interval)
+            client_busy.setdefault(row.client_id, []).append(interval)
+        for intervals in list(staff_busy.values()) + list(client_busy.values()):
+            intervals.sort()
+
+        shifts = {}
+        if require_shift:
+            shifts = staff_schedule_service.get_shift_rows_for_range(
+                staff_ids, window_start.date(), window_end.date()
+            )
+
+        accepted, conflicts = [], []
+        for occ in sorted(occurrences, key=lambda o: o.start):
+            reason = None
+            if require_shift:
+                reason = cls._shift_conflict(shifts.get(occ.staff_id, {}).get(occ.start.date()), occ)
+            if not reason and cls._overlaps(staff_busy.get(occ.staff_id, []), occ.start, occ.end):
+                reason = 'Staff already booked'
+            if not reason and cls._overlaps(client_busy.get(occ.client_id, []), occ.start, occ.end):
+                reason = 'Client already booked'
+
+            if reason:
+                conflicts.append(occ.to_dict(reason))
+                continue
+            accepted.append(occ)
+            for busy, key in ((staff_busy, occ.staff_id), (client_busy, occ.client_id)):
+                intervals = busy.setdefault(key, [])
+                intervals.insert(bisect_left(intervals, (occ.start, occ.end)), (occ.start, occ.end))
+
+        return accepted, conflicts
+
+    @staticmethod
+    def _overlaps(intervals: List[Tuple[datetime, datetime]], start: datetime, end: datetime) -> bool:
+        """Check a sorted interval list for overlap with [start, end)"""
+        index = bisect_left(intervals, (end,))
+        # Only intervals starting before `end` can overlap; walk back over them
+        while index > 0:
+            index -= 1
+            interval_start, interval_end = intervals[index]
+            if interval_end > start:
+                return True
+            if interval_start < start - timedelta(days=1):
+                break
+        return False
+
+    @staticmethod
+    def _shift_conflict(shift_row, occ: Occurrence) -> Optional[str]:
+        """Return a reason if the occurrence does not fit inside the staff member's shift"""
+        if shift_row is None or shift_row.status not in ('scheduled', 'completed'):
+            return 'Staff not scheduled'
+        if not (shift_row.shift_start_time and shift_row.shift_end_time):
+            return 'Staff not scheduled'
+        day = occ.start.date()
+        if occ.start < datetime.combine(day, shift_row.shift_start_time) or \
+                occ.end > datetime.combine(day, shift_row.shift_end_time):
+            return 'Outside working hours'
+        if shift_row.break_start_time and shift_row.break_end_time:
+            break_start = datetime.combine(day, shift_row.break_start_time)
+            break_end = datetime.combine(day, shift_row.break_end_time)
+            if occ.start < break_end and occ.end > break_start:
+                return 'Conflicts with break time'
+        return None
+
+    @classmethod
+    def insert_occurrences(cls, occurrences: List[Occurrence]) -> int:
+        """Bulk-insert accepted occurrences as scheduled appointments; the caller commits"""
+        if not occurrences:
+            return 0
+        now = datetime.utcnow()
+        db.session.execute(insert(Appointment), [{
+            'client_id': occ.client_id,
+            'service_id': occ.service_id,
+            'staff_id': occ.staff_id,
+            'appointment_date': occ.start,
+            'end_time': occ.end,
+            'status': 'scheduled',
+            'amount': occ.amount,
+            'notes': RECURRING_NOTE_PREFIX.format(rule_id=occ.rule_id),
+            'created_at': now,
+            'updated_at': now
+        } for occ in occurrences])
+        DemandCubeMaintainer.touch(occ.start for occ in occurrences)
+        return len(occurrences)
+
+    @classmethod
+    def expand(cls, rule_ids: Optional[List[int]] = None, horizon_days: int = DEFAULT_HORIZON_DAYS,
+               require_shift: bool = True, from_date: Optional[date] = None) -> Dict:
+        """
+        Roll every active rule (or the given ones) forward to today + horizon_days.
+        Rules remember how far they were expanded, so repeated runs only add new dates.
+        """
+        from_date = from_date or date.today()
+        horizon_end = from_date + timedelta(days=horizon_days)
+
+        try:
+            query = RecurringAppointment.query.filter(
+                RecurringAppointment.is_active == True,
+                RecurringAppointment.start_date <= horizon_end,
+                or_(RecurringAppointment.end_date.is_(None), RecurringAppointment.end_date >= from_date),
+                or_(RecurringAppointment.generated_until.is_(None),
+                    RecurringAppointment.generated_until < horizon_end)
+            )
+            if rule_ids:
+                query = query.filter(RecurringAppointment.id.in_(rule_ids))
+            rules = query.all()
+
+            occurrences = cls.generate_occurrences(rules, horizon_end, from_date)
+            accepted, conflicts = cls.check_conflicts(occurrences, require_shift=require_shift)
+            created = cls.insert_occurrences(accepted)
+
+            for rule in rules:
+                rule.generated_until = min(horizon_end, rule.end_date) if rule.end_date else horizon_end
+
+            db.session.commit()
+            logger.info("Recurring expansion: %s rules, %s created, %s conflicts",
+                        len(rules), created, len(conflicts))
+            return {
+                'success': True,
+                'rules_processed': len(rules),
+                'occurrences_generated': len(occurrences),
+                'appointments_created': created,
+                'conflicts': conflicts,
+                'horizon_end': horizon_end.isoformat()
+            }
+        except Exception as e:
+            db.session.rollback()
+            logger.exception("Error expanding recurring appointments")
+            return {'success': False, 'error': str(e)}
+
+    @classmethod
+    def create_rule(cls, rule_data: Dict, horizon_days: int = DEFAULT_HORIZON_DAYS,
+                    require_shift: bool = True) -> Dict:
+        """
+        Create a recurrence rule and immediately expand it over the horizon. Raises
+        ValueError for an unsupported frequency
+        """
+        if rule_data.get('frequency') not in RECURRENCE_FREQUENCIES:
+            raise ValueError('Frequency must be weekly, biweekly or monthly')
+        try:
+            rule = RecurringAppointment(**rule_data)
+            db.session.add(rule)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.exception("Error creating recurring appointment")
+            return {'success': False, 'error': str(e)}
+
+        result = cls.expand(rule_ids=[rule.id], horizon_days=horizon_days, require_shift=require_shift)
+        result['recurring_appointment_id'] = rule.id
+        return result
@@ -0,0 +1,183 @@
+"""
+Waitlist Matcher
+Offers freed appointment slots to waiting clients using the (service, status, date)
+waitlist index, and expires stale entries with a batched sweep
+"""
+from datetime import datetime, date, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import and_, or_, select, update
+from app import db
+from models import Waitlist, Customer, Service, Communication
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Flexible entries are considered for slots this many days either side of their preferred date
+FLEXIBLE_WINDOW_DAYS = 7
+
+# Number of top candidates notified when a slot frees up
+DEFAULT_NOTIFY_COUNT = 1
+
+# Rows flipped per transaction by the expiry sweep
+SWEEP_BATCH_SIZE = 500
+
+
+class WaitlistMatcher:
+    """Finds and notifies the best waitlist candidates for a freed slot"""
+
+    @classmethod
+    def find_candidates(cls, service_id: int, slot_start: datetime, staff_id: Optional[int] = None,
+                        limit: int = 10) -> List[Dict]:
+        """
+        Rank waiting entries for a slot. The lookup is a single range scan on
+        ix_waitlist_service_status_date; ranking happens in memory on that small set.
+        """
+        slot_date = slot_start.date()
+        now = datetime.utcnow()
+
+        rows = db.session.query(
+            Waitlist.id,
+            Waitlist.client_id,
+            Waitlist.staff_id,
+            Waitlist.preferred_date,
+            Waitlist.preferred_time,
+            Waitlist.is_flexible,
+            Waitlist.created_at,
+            Customer.first_name,
+            Customer.last_name,
+            Customer.phone,
+            Customer.preferred_communication
+        ).join(
+            Customer, Waitlist.client_id == Customer.id
+        ).filter(
+            Waitlist.service_id == service_id,
+            Waitlist.status == 'waiting',
+            Waitlist.preferred_date >= slot_date - timedelta(days=FLEXIBLE_WINDOW_DAYS),
+            Waitlist.preferred_date <= slot_date + timedelta(days=FLEXIBLE_WINDOW_DAYS),
+            or_(Waitlist.expires_at.is_(None), Waitlist.expires_at > now)
+        ).all()
+
+        candidates = []
+        for row in rows:
+            exact_date = row.preferred_date == slot_date
+            if not exact_date and not row.is_flexible:
+                continue
+            if row.staff_id and staff_id and row.staff_id != staff_id:
+                continue
+
+            if row.preferred_time:
+                preferred = datetime.combine(slot_date, row.preferred_time)
+                time_gap_minutes = abs((slot_start - preferred).total_seconds()) / 60
+            else:
+                time_gap_minutes = 0
+            day_gap = abs((row.preferred_date - slot_date).days)
+
+            candidates.append({
+                'waitlist_id': row.id,
+                'client_id': row.client_id,
+                'client_name': f"{row.first_name} {row.last_name}",
+                'phone': row.phone,
+                'preferred_communication': row.preferred_communication or 'sms',
+                'preferred_date': row.preferred_date.isoformat(),
+                'preferred_time': row.preferred_time.strftime('%H:%M') if row.preferred_time else None,
+                'is_flexible': bool(row.is_flexible),
+                'staff_match': bool(row.staff_id and row.staff_id == staff_id),
+                'time_gap_minutes': int(time_gap_minutes),
+                'day_gap': day_gap,
+                # Exact date first, then requested staff, then time proximity, then first come
+                '_rank': (
+                    0 if exact_date else 1,
+                    0 if row.staff_id and row.staff_id == staff_id else 1,
+                    day_gap,
+                    time_gap_minutes,
+                    row.created_at or now
+                )
+            })
+
+        candidates.sort(key=lambda candidate: candidate['_rank'])
+        for candidate in candidates:
+            del candidate['_rank']
+        return candidates[:limit]
+
+    @classmethod
+    def notify_candidates(cls, candidates: List[Dict], service_name: str, slot_start: datetime,
+                          created_by: Optional[int] = None) -> List[int]:
+        """Queue a notification per candidate and mark their entries contacted; the caller commits"""
+        if not candidates:
+            return []
+
+        slot_text = slot_start.strftime('%d %b %Y at %I:%M %p')
+        db.session.add_all([
+            Communication(
+                client_id=candidate['client_id'],
+                type=candidate['preferred_communication'],
+                subject='A slot has opened up',
+                message=f"Hi {candidate['client_name']}, a {service_name} slot is now available on {slot_text}. "
+                        f"Reply to confirm your booking.",
+                status='pending',
+                created_by=created_by
+            ) for candidate in candidates
+        ])
+
+        waitlist_ids = [candidate['waitlist_id'] for candidate in candidates]
+        db.session.execute(
+            update(Waitlist).where(Waitlist.id.in_(waitlist_ids)).values(status='contacted'),
+            execution_options={'synchronize_session': False}
+        )
+        return waitlist_ids
+
+    @classmethod
+    def on_slot_freed(cls, service_id: int, slot_start: datetime, staff_id: Optional[int] = None,
+                      notify_count: int = DEFAULT_NOTIFY_COUNT, created_by: Optional[int] = None) -> Dict:
+        """Match a freed slot against the waitlist and notify the top candidates; past slots are skipped"""
+        if slot_start <= datetime.now():
+            return {'success': True, 'candidates': [], 'notified': []}
+        try:
+            candidates = cls.find_candidates(service_id, slot_start, staff_id=staff_id)
+            if not candidates:
+                return {'success': True, 'candidates': [], 'notified': []}
+
+            service = Service.query.with_entities(Service.name).filter(Service.id == service_id).first()
+            notified = cls.notify_candidates(
+                candidates[:notify_count], service.name if service else 'service', slot_start, created_by
+            )
+            db.session.commit()
+            return {'success': True, 'candidates': candidates, 'notified': notified}
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error matching waitlist for freed slot: {e}")
+            return {'success': False, 'error': str(e), 'candidates': [], 'notified': []}
+
+    @classmethod
+    def sweep_expired(cls, batch_size: int = SWEEP_BATCH_SIZE, today: Optional[date] = None) -> int:
+        """
+        Expire entries past expires_at, or past their preferred date (plus the flexible
+        window for flexible entries). Works in id batches so each transaction stays short.
+        """
+        now = datetime.utcnow()
+        today = today or date.today()
+        stale = or_(
+            and_(Waitlist.expires_at.isnot(None), Waitlist.expires_at < now),
+            and_(or_(Waitlist.is_flexible == False, Waitlist.is_flexible.is_(None)),
+                 Waitlist.preferred_date < today),
+            Waitlist.preferred_date < today - timedelta(days=FLEXIBLE_WINDOW_DAYS)
+        )
+
+        total = 0
+        while True:
+            batch_ids = db.session.execute(
+                select(Waitlist.id).where(
+                    Waitlist.status.in_(['waiting', 'contacted']), stale
+                ).limit(batch_size)
+            ).scalars().all()
+            if not batch_ids:
+                break
+            db.session.execute(
+                update(Waitlist).where(Waitlist.id.in_(batch_ids)).values(status='expired'),
+                execution_options={'synchronize_session': False}
+            )
+            db.session.commit()
+            total += len(batch_ids)
+
+        logger.info("Waitlist sweep expired %s entries", total)
+        return total
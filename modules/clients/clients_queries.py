@@ -90,14 +90,11 @@ def get_customer_stats(customer_id):
         return None
     
     total_appointments = Appointment.query.filter_by(client_id=customer_id).count()
-    total_spent = db.session.query(func.sum(Appointment.amount)).filter(
-        Appointment.client_id == customer_id,
-        Appointment.is_paid == True
-    ).scalar() or 0
     
+    # Spend is kept current by modules/clients/customer_metrics.py
     return {
         'total_appointments': total_appointments,
-        'total_spent': total_spent,
+        'total_spent': customer.total_spent or 0,
         'last_visit': customer.last_visit,
         'member_since': customer.created_at
     }
@@ -7,6 +7,8 @@ from app import app, db
 from models import Customer
 from forms import CustomerForm, AdvancedCustomerForm
 from .clients_queries import *
+from .customer_360 import Customer360Service
+from .customer_metrics import CustomerMetricsMaintainer, SEGMENTS
 
 @app.route('/customers')
 @app.route('/clients')  # Keep for backward compatibility
@@ -363,6 +365,53 @@ def api_get_customer(customer_id):
         return jsonify({'success': False, 'error': f'Server error: {str(e)}'}), 500
 
 
+@app.route('/api/customers/<int:customer_id>/360')
+@login_required
+def api_customer_360(customer_id):
+    """Front-desk customer profile: visits, invoices, payments, packages and messages"""
+    if not current_user.can_access('clients'):
+        return jsonify({'success': False, 'error': 'Access denied'}), 403
+
+    try:
+        refresh = request.args.get('refresh', '').lower() in ('1', 'true')
+        profile = Customer360Service.get_profile(customer_id, use_cache=not refresh)
+        if profile is None:
+            return jsonify({'success': False, 'error': 'Customer not found'}), 404
+        return jsonify({'success': True, 'profile': profile.to_dict()})
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'Server error: {str(e)}'}), 500
+
+
+@app.route('/api/customers/segments/<segment>')
+@login_required
+def api_customer_segment(segment):
+    """VIP, loyal or lapsed customers from the maintained metric columns"""
+    if not current_user.can_access('clients'):
+        return jsonify({'success': False, 'error': 'Access denied'}), 403
+    if segment not in SEGMENTS:
+        return jsonify({'success': False, 'error': f"Segment must be one of: {', '.join(SEGMENTS)}"}), 400
+
+    try:
+        limit = min(request.args.get('limit', 100, type=int), 1000)
+        offset = request.args.get('offset', 0, type=int)
+        customers = CustomerMetricsMaintainer.get_segment(segment, limit=limit, offset=offset)
+        return jsonify({'success': True, 'segment': segment, 'customers': customers, 'count': len(customers)})
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'Server error: {str(e)}'}), 500
+
+
+@app.route('/api/customers/metrics/recompute', methods=['POST'])
+@login_required
+def api_recompute_customer_metrics():
+    """Repair drifted customer metric columns from appointments and payments"""
+    if not current_user.can_access('clients'):
+        return jsonify({'success': False, 'error': 'Access denied'}), 403
+
+    data = request.get_json(silent=True) or {}
+    result = CustomerMetricsMaintainer.recompute(customer_ids=data.get('customer_ids'))
+    return jsonify(result), (200 if result['success'] else 500)
+
+
 @app.route('/api/customers', methods=['GET'])
 @login_required
 def api_customers():
@@ -0,0 +1,435 @@
+"""
+Customer 360 Service
+Builds a compact front-desk profile (recent visits, invoices, payments, packages, benefit
+balances and communications) with a fixed set of queries and caches it per customer
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+from app import db
+from models import (
+    Customer, Appointment, Service, User, EnhancedInvoice, InvoicePayment, Communication,
+    CustomerPackage, CustomerPackageItem, PackageTemplate, ServicePackageAssignment,
+    PackageBenefitTracker, PrepaidPackage, ServicePackage, Membership, StudentOffer,
+    YearlyMembership, KittyParty
+)
+from services.branch_router import branch_router
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Rows returned per recent-activity section
+RECENT_LIMIT = 10
+
+# Cached profiles per process; the TTL bounds staleness from writes made by other workers
+CACHE_SIZE = 1000
+CACHE_TTL_SECONDS = 300
+
+PACKAGE_TEMPLATES = {
+    'prepaid': PrepaidPackage,
+    'service_package': ServicePackage,
+    'membership': Membership,
+    'yearly_membership': YearlyMembership,
+    'kitty_party': KittyParty
+}
+
+
+def _iso(value) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+@dataclass
+class Customer360:
+    """Compact profile DTO; every field is JSON-serialisable"""
+    customer: Dict
+    stats: Dict
+    recent_appointments: List[Dict] = field(default_factory=list)
+    upcoming_appointments: List[Dict] = field(default_factory=list)
+    recent_invoices: List[Dict] = field(default_factory=list)
+    recent_payments: List[Dict] = field(default_factory=list)
+    active_packages: List[Dict] = field(default_factory=list)
+    benefit_balances: List[Dict] = field(default_factory=list)
+    recent_communications: List[Dict] = field(default_factory=list)
+    generated_at: str = ''
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+class Customer360Cache:
+    """Thread-safe LRU with a TTL, keyed by branch and customer id"""
+
+    def __init__(self, max_size: int = CACHE_SIZE, ttl_seconds: int = CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: 'OrderedDict[tuple, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(customer_id: int) -> tuple:
+        # Customer ids are only unique within one branch database
+        return branch_router.current(), customer_id
+
+    def get(self, customer_id: int) -> Optional[Customer360]:
+        key = self._key(customer_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, profile = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return profile
+
+    def put(self, customer_id: int, profile: Customer360) -> None:
+        key = self._key(customer_id)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), profile)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, customer_ids) -> None:
+        keys = [self._key(customer_id) for customer_id in customer_ids]
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+customer_360_cache = Customer360Cache()
+
+
+class Customer360Service:
+    """Assembles the customer 360 profile with a bounded number of batched queries"""
+
+    @classmethod
+    def get_profile(cls, customer_id: int, use_cache: bool = True) -> Optional[Customer360]:
+        if use_cache:
+            profile = customer_360_cache.get(customer_id)
+            if profile is not None:
+                return profile
+
+        profile = cls.build_profile(customer_id)
+        if profile is not None and use_cache:
+            customer_360_cache.put(customer_id, profile)
+        return profile
+
+    @classmethod
+    def build_profile(cls, customer_id: int, limit: int = RECENT_LIMIT) -> Optional[Customer360]:
+        customer = db.session.get(Customer, customer_id)
+        if customer is None:
+            return None
+        now = datetime.utcnow()
+
+        return Customer360(
+            customer={
+                'id': customer.id,
+                'full_name': customer.full_name,
+                'phone': customer.phone,
+                'email': customer.email or '',
+                'is_vip': bool(customer.is_vip),
+                'is_active': bool(customer.is_active),
+                'status': customer.status,
+                'loyalty_points': customer.loyalty_points or 0,
+                'allergies': customer.allergies or '',
+                'preferred_communication': customer.preferred_communication,
+                'member_since': _iso(customer.created_at),
+                'last_visit': _iso(customer.last_visit)
+            },
+            stats=cls._stats(customer_id),
+            recent_appointments=cls._appointments(customer_id, now, limit, upcoming=False),
+            upcoming_appointments=cls._appointments(customer_id, now, limit, upcoming=True),
+            recent_invoices=cls._invoices(customer_id, limit),
+            recent_payments=cls._payments(customer_id, limit),
+            active_packages=cls._packages(customer_id),
+            benefit_balances=cls._benefits(customer_id, now),
+            recent_communications=cls._communications(customer_id, limit),
+            generated_at=now.isoformat()
+        )
+
+    @staticmethod
+    def _stats(customer_id: int) -> Dict:
+        """All headline aggregates as scalar subqueries in one statement"""
+        appointments = select(func.count(Appointment.id)).where(
+            Appointment.client_id == customer_id).scalar_subquery()
+        no_shows = select(func.count(Appointment.id)).where(
+            Appointment.client_id == customer_id, Appointment.status == 'no_show').scalar_subquery()
+        paid_appointments = select(func.coalesce(func.sum(Appointment.amount), 0)).where(
+            Appointment.client_id == customer_id, Appointment.is_paid == True).scalar_subquery()
+        invoiced = select(func.coalesce(func.sum(EnhancedInvoice.total_amount), 0)).where(
+            EnhancedInvoice.client_id == customer_id).scalar_subquery()
+        outstanding = select(func.coalesce(func.sum(EnhancedInvoice.balance_due), 0)).where(
+            EnhancedInvoice.client_id == customer_id,
+            EnhancedInvoice.payment_status.in_(['pending', 'partial', 'overdue'])).scalar_subquery()
+
+        row = db.session.execute(select(
+            appointments.label('total_appointments'),
+            no_shows.label('no_shows'),
+            paid_appointments.label('total_spent'),
+            invoiced.label('total_invoiced'),
+            outstanding.label('outstanding_balance')
+        )).one()
+        return {
+            'total_appointments': row.total_appointments,
+            'no_shows': row.no_shows,
+            'total_spent': float(row.total_spent or 0),
+            'total_invoiced': float(row.total_invoiced or 0),
+            'outstanding_balance': float(row.outstanding_balance or 0)
+        }
+
+    @staticmethod
+    def _appointments(customer_id: int, now: datetime, limit: int, upcoming: bool) -> List[Dict]:
+        query = db.session.query(
+            Appointment.id, Appointment.appointment_date, Appointment.status, Appointment.amount,
+            Appointment.is_paid, Service.name.label('service_name'),
+            User.first_name.label('staff_first_name'), User.last_name.label('staff_last_name')
+        ).join(
+            Service, Appointment.service_id == Service.id
+        ).outerjoin(
+            User, Appointment.staff_id == User.id
+        ).filter(Appointment.client_id == customer_id)
+
+        if upcoming:
+            query = query.filter(
+                Appointment.appointment_date >= now,
+                Appointment.status.notin_(['cancelled', 'no_show'])
+            ).order_by(Appointment.appointment_date.asc())
+        else:
+            query = query.filter(
+                Appointment.appointment_date < now
+            ).order_by(Appointment.appointment_date.desc())
+
+        return [{
+            'id': row.id,
+            'date': _iso(row.appointment_date),
+            'service': row.service_name,
+            'staff': f"{row.staff_first_name or ''} {row.staff_last_name or ''}".strip(),
+            'status': row.status,
+            'amount': float(row.amount or 0),
+            'is_paid': bool(row.is_paid)
+        } for row in query.limit(limit).all()]
+
+    @staticmethod
+    def _invoices(customer_id: int, limit: int) -> List[Dict]:
+        rows = db.session.query(
+            EnhancedInvoice.id, EnhancedInvoice.invoice_number, EnhancedInvoice.invoice_date,
+            EnhancedInvoice.total_amount, EnhancedInvoice.balance_due, EnhancedInvoice.payment_status
+        ).filter(
+            EnhancedInvoice.client_id == customer_id
+        ).order_by(EnhancedInvoice.invoice_date.desc()).limit(limit).all()
+        return [{
+            'id': row.id,
+            'invoice_number': row.invoice_number,
+            'date': _iso(row.invoice_date),
+            'total_amount': float(row.total_amount or 0),
+            'balance_due': float(row.balance_due or 0),
+            'payment_status': row.payment_status
+        } for row in rows]
+
+    @staticmethod
+    def _payments(customer_id: int, limit: int) -> List[Dict]:
+        rows = db.session.query(
+            InvoicePayment.id, InvoicePayment.amount, InvoicePayment.payment_method,
+            InvoicePayment.payment_date, EnhancedInvoice.invoice_number
+        ).join(
+            EnhancedInvoice, InvoicePayment.invoice_id == EnhancedInvoice.id
+        ).filter(
+            EnhancedInvoice.client_id == customer_id
+        ).order_by(InvoicePayment.payment_date.desc()).limit(limit).all()
+        return [{
+            'id': row.id,
+            'invoice_number': row.invoice_number,
+            'amount': float(row.amount or 0),
+            'method': row.payment_method,
+            'date': _iso(row.payment_date)
+        } for row in rows]
+
+    @staticmethod
+    def _packages(customer_id: int) -> List[Dict]:
+        """Active template packages and package assignments, with names resolved per type"""
+        item_totals = select(
+            CustomerPackageItem.customer_package_id.label('package_id'),
+            func.sum(CustomerPackageItem.total_qty).label('total_qty'),
+            func.sum(CustomerPackageItem.used_qty).label('used_qty')
+        ).group_by(CustomerPackageItem.customer_package_id).subquery()
+
+        template_rows = db.session.query(
+            CustomerPackage.id, CustomerPackage.expires_on, PackageTemplate.name,
+            item_totals.c.total_qty, item_totals.c.used_qty
+        ).join(
+            PackageTemplate, CustomerPackage.package_id == PackageTemplate.id
+        ).outerjoin(
+            item_totals, item_totals.c.package_id == CustomerPackage.id
+        ).filter(
+            CustomerPackage.customer_id == customer_id,
+            CustomerPackage.status == 'active'
+        ).all()
+
+        packages = [{
+            'source': 'customer_package',
+            'id': row.id,
+            'name': row.name,
+            'package_type': 'template',
+            'expires_on': _iso(row.expires_on),
+            'sessions_remaining': max(int(row.total_qty or 0) - int(row.used_qty or 0), 0),
+            'credit_remaining': None
+        } for row in template_rows]
+
+        assignments = db.session.query(
+            ServicePackageAssignment.id, ServicePackageAssignment.package_type,
+            ServicePackageAssignment.package_reference_id, ServicePackageAssignment.expires_on,
+            ServicePackageAssignment.remaining_sessions, ServicePackageAssignment.remaining_credit
+        ).filter(
+            ServicePackageAssignment.customer_id == customer_id,
+            ServicePackageAssignment.status == 'active'
+        ).all()
+
+        # One name lookup per package type present, not per assignment
+        reference_ids: Dict[str, Set[int]] = {}
+        for row in assignments:
+            reference_ids.setdefault(row.package_type, set()).add(row.package_reference_id)
+        names: Dict[tuple, str] = {}
+        for package_type, ids in reference_ids.items():
+            if package_type == 'student_offer':
+                for offer in db.session.query(StudentOffer.id, StudentOffer.discount_percentage).filter(
+                        StudentOffer.id.in_(ids)):
+                    names[(package_type, offer.id)] = f"Student Offer ({offer.discount_percentage:g}% off)"
+                continue
+            model = PACKAGE_TEMPLATES.get(package_type)
+            if model is None:
+                continue
+            for template in db.session.query(model.id, model.name).filter(model.id.in_(ids)):
+                names[(package_type, template.id)] = template.name
+
+        for row in assignments:
+            packages.append({
+                'source': 'assignment',
+                'id': row.id,
+                'name': names.get((row.package_type, row.package_reference_id), 'Package'),
+                'package_type': row.package_type,
+                'expires_on': _iso(row.expires_on),
+                'sessions_remaining': row.remaining_sessions,
+                'credit_remaining': float(row.remaining_credit) if row.remaining_credit is not None else None
+            })
+        return packages
+
+    @staticmethod
+    def _benefits(customer_id: int, now: datetime) -> List[Dict]:
+        rows = db.session.query(
+            PackageBenefitTracker.id, PackageBenefitTracker.package_assignment_id,
+            PackageBenefitTracker.benefit_type, PackageBenefitTracker.remaining_count,
+            PackageBenefitTracker.balance_remaining, PackageBenefitTracker.discount_percentage,
+            PackageBenefitTracker.valid_to, Service.name.label('service_name')
+        ).outerjoin(
+            Service, PackageBenefitTracker.service_id == Service.id
+        ).filter(
+            PackageBenefitTracker.customer_id == customer_id,
+            PackageBenefitTracker.is_active == True,
+            PackageBenefitTracker.valid_to >= now
+        ).order_by(PackageBenefitTracker.valid_to).all()
+        return [{
+            'id': row.id,
+            'assignment_id': row.package_assignment_id,
+            'benefit_type': row.benefit_type,
+            'service': row.service_name,
+            'remaining_count': row.remaining_count,
+            'balance_remaining': float(row.balance_remaining or 0),
+            'discount_percentage': float(row.discount_percentage or 0),
+            'valid_to': _iso(row.valid_to)
+        } for row in rows]
+
+    @staticmethod
+    def _communications(customer_id: int, limit: int) -> List[Dict]:
+        rows = db.session.query(
+            Communication.id, Communication.type, Communication.subject, Communication.status,
+            Communication.created_at
+        ).filter(
+            Communication.client_id == customer_id
+        ).order_by(Communication.created_at.desc()).limit(limit).all()
+        return [{
+            'id': row.id,
+            'type': row.type,
+            'subject': row.subject,
+            'status': row.status,
+            'date': _iso(row.created_at)
+        } for row in rows]
+
+
+# ---------------------------------------------------------------------------
+# Cache invalidation: any flushed change to a table that feeds the profile drops
+# the affected customers once the transaction commits. Bulk statements on those
+# tables cannot be attributed to customers cheaply, so they clear the cache.
+# ---------------------------------------------------------------------------
+
+# Model -> attribute holding the customer id
+_CUSTOMER_KEYS = {
+    Customer: 'id',
+    Appointment: 'client_id',
+    EnhancedInvoice: 'client_id',
+    Communication: 'client_id',
+    CustomerPackage: 'customer_id',
+    ServicePackageAssignment: 'customer_id',
+    PackageBenefitTracker: 'customer_id'
+}
+_TRACKED_MODELS = tuple(_CUSTOMER_KEYS) + (InvoicePayment, CustomerPackageItem)
+_PENDING_KEY = 'customer_360_pending'
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_customer_changes(session, flush_context):
+    pending = session.info.setdefault(_PENDING_KEY, set())
+    invoice_ids, package_ids = set(), set()
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(instance, _TRACKED_MODELS):
+            continue
+        if isinstance(instance, InvoicePayment):
+            invoice_ids.add(instance.invoice_id)
+        elif isinstance(instance, CustomerPackageItem):
+            package_ids.add(instance.customer_package_id)
+        else:
+            pending.add(getattr(instance, _CUSTOMER_KEYS[type(instance)]))
+
+    # Payments and package items only carry a parent id; resolve it on the flush connection
+    connection = session.connection()
+    if invoice_ids:
+        pending.update(connection.execute(
+            select(EnhancedInvoice.client_id).where(EnhancedInvoice.id.in_(invoice_ids))).scalars())
+    if package_ids:
+        pending.update(connection.execute(
+            select(CustomerPackage.customer_id).where(CustomerPackage.id.in_(package_ids))).scalars())
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk_changes(orm_execute_state):
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and issubclass(mapper.class_, _TRACKED_MODELS):
+        orm_execute_state.session.info.setdefault(_PENDING_KEY, set()).add(None)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_customer_invalidation(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    if None in pending:
+        customer_360_cache.clear()
+    else:
+        customer_360_cache.invalidate(pending)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_customer_invalidation(session):
+    session.info.pop(_PENDING_KEY, None)
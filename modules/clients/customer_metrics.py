@@ -0,0 +1,320 @@
+"""
+Customer Lifetime Metrics
+Keeps the Customer metric columns (visits, spend, lifetime value, loyalty points, no-shows)
+current in the same transaction as the writes that change them, with a set-based
+recompute for drift repair and segment lists served from the indexed columns.
+Spend counts each visit once: its invoice payments once an invoice line covers it, its
+appointment amount while it is paid but not invoiced
+"""
+from datetime import datetime, timedelta
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import case, cast, event, func, inspect, or_, select, update, Integer
+from sqlalchemy.orm import Session
+from app import db
+from models import Customer, Appointment, EnhancedInvoice, InvoiceItem, InvoicePayment
+import logging
+
+logger = logging.getLogger(__name__)
+
+# One loyalty point per this much lifetime spend
+LOYALTY_SPEND_PER_POINT = 100
+
+# Segment thresholds
+LOYAL_MIN_VISITS = 10          # matches Customer.status
+LAPSED_AFTER_DAYS = 90         # matches Customer.status
+VIP_MIN_LIFETIME_VALUE = 50000
+
+SEGMENTS = ('vip', 'loyal', 'lapsed')
+
+METRIC_ATTRIBUTES = ['total_visits', 'total_spent', 'lifetime_value', 'loyalty_points',
+                     'last_visit', 'no_show_count', 'last_no_show']
+
+
+def _empty_delta() -> Dict:
+    return {'visits': 0, 'spent': 0.0, 'no_shows': 0, 'last_visit': None, 'last_no_show': None}
+
+
+def _latest(current: Optional[datetime], candidate: Optional[datetime]) -> Optional[datetime]:
+    if candidate is None:
+        return current
+    return candidate if current is None or candidate > current else current
+
+
+def _non_negative(expression):
+    return case((expression < 0, 0), else_=expression)
+
+
+def _appointment_spend(amount, is_paid, invoiced: bool) -> float:
+    """What a visit adds to spend outside its invoice payments"""
+    return float(amount or 0) if is_paid and not invoiced else 0.0
+
+
+def _previous_value(instance, attribute):
+    """Committed value of an attribute before this flush (None for new objects)"""
+    history = inspect(instance).attrs[attribute].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return None
+
+
+class CustomerMetricsMaintainer:
+    """Translates appointment and payment changes into metric deltas"""
+
+    @classmethod
+    def collect_deltas(cls, session) -> Dict[int, Dict]:
+        deltas: Dict[int, Dict] = {}
+        appointments: Dict[int, Appointment] = {}
+        line_changes: Counter = Counter()
+
+        def delta_for(customer_id):
+            return deltas.setdefault(customer_id, _empty_delta())
+
+        for instance in session.new:
+            if isinstance(instance, Appointment):
+                delta = delta_for(instance.client_id)
+                cls._appointment_change(delta, instance, None, instance.status)
+                delta['spent'] += _appointment_spend(instance.amount, instance.is_paid,
+                                                     bool(instance.__dict__.get('invoice_items')))
+            elif isinstance(instance, InvoicePayment):
+                customer_id = cls._invoice_customer(session, instance)
+                if customer_id:
+                    delta_for(customer_id)['spent'] += float(instance.amount or 0)
+            elif isinstance(instance, InvoiceItem):
+                # A line attached to a new appointment is counted with the appointment above
+                appointment = instance.__dict__.get('appointment')
+                line_changes[instance.appointment_id or getattr(appointment, 'id', None)] += 1
+
+        for instance in session.dirty:
+            if isinstance(instance, Appointment) and session.is_modified(instance):
+                cls._appointment_change(delta_for(instance.client_id), instance,
+                                        _previous_value(instance, 'status'), instance.status)
+                state = inspect(instance)
+                if state.attrs.amount.history.has_changes() or state.attrs.is_paid.history.has_changes():
+                    appointments[instance.id] = instance
+            elif isinstance(instance, InvoiceItem) and session.is_modified(instance):
+                previous = _previous_value(instance, 'appointment_id')
+                if previous != instance.appointment_id:
+                    line_changes[previous] -= 1
+                    line_changes[instance.appointment_id] += 1
+
+        for instance in session.deleted:
+            if isinstance(instance, Appointment):
+                cls._appointment_change(delta_for(instance.client_id), instance,
+                                        _previous_value(instance, 'status'), None)
+                appointments[instance.id] = instance
+            elif isinstance(instance, InvoicePayment):
+                customer_id = cls._invoice_customer(session, instance)
+                if customer_id:
+                    delta_for(customer_id)['spent'] -= float(_previous_value(instance, 'amount') or 0)
+            elif isinstance(instance, InvoiceItem):
+                line_changes[_previous_value(instance, 'appointment_id')] -= 1
+
+        for customer_id, spent in cls._appointment_spend_changes(session, appointments, line_changes).items():
+            delta_for(customer_id)['spent'] += spent
+
+        return {customer_id: delta for customer_id, delta in deltas.items()
+                if customer_id and (delta['visits'] or delta['spent'] or delta['no_shows'])}
+
+    @staticmethod
+    def _appointment_change(delta: Dict, appointment: Appointment, old_status, new_status) -> None:
+        if old_status != new_status:
+            if new_status == 'completed':
+                delta['visits'] += 1
+                delta['last_visit'] = _latest(delta['last_visit'], appointment.appointment_date)
+            elif old_status == 'completed':
+                delta['visits'] -= 1
+            if new_status == 'no_show':
+                delta['no_shows'] += 1
+                delta['last_no_show'] = _latest(delta['last_no_show'], appointment.appointment_date)
+            elif old_status == 'no_show':
+                delta['no_shows'] -= 1
+
+    @staticmethod
+    def _appointment_spend_changes(session, appointments: Dict[int, Appointment],
+                                   line_changes: Counter) -> Dict[int, float]:
+        """
+        Spend change per customer for persistent appointments whose amount, paid flag or
+        invoice lines change; line_changes is the net number of lines added per appointment
+        """
+        appointment_ids = {appointment_id for appointment_id in set(appointments) | set(line_changes)
+                           if appointment_id}
+        if not appointment_ids:
+            return {}
+        lines_before = dict(session.execute(
+            select(InvoiceItem.appointment_id, func.count(InvoiceItem.id))
+            .where(InvoiceItem.appointment_id.in_(appointment_ids))
+            .group_by(InvoiceItem.appointment_id)
+        ).all())
+
+        changes: Dict[int, float] = {}
+        for appointment_id in appointment_ids:
+            appointment = appointments.get(appointment_id) or session.get(Appointment, appointment_id)
+            if appointment is None:
+                continue
+            lines = lines_before.get(appointment_id, 0)
+            before = _appointment_spend(_previous_value(appointment, 'amount'),
+                                        _previous_value(appointment, 'is_paid'), lines > 0)
+            after = 0.0 if appointment in session.deleted else _appointment_spend(
+                appointment.amount, appointment.is_paid, lines + line_changes.get(appointment_id, 0) > 0)
+            if after != before:
+                changes[appointment.client_id] = changes.get(appointment.client_id, 0.0) + after - before
+        return changes
+
+    @classmethod
+    def apply_invoice_lines(cls, session, appointment_ids: Iterable[int]) -> None:
+        """
+        Account for invoice lines about to be bulk-inserted for these appointments, which
+        bypass the flush hook; call it before the INSERT
+        """
+        line_changes = Counter(appointment_id for appointment_id in appointment_ids if appointment_id)
+        deltas: Dict[int, Dict] = {}
+        for customer_id, spent in cls._appointment_spend_changes(session, {}, line_changes).items():
+            if customer_id and spent:
+                deltas[customer_id] = dict(_empty_delta(), spent=spent)
+        if deltas:
+            cls.apply_deltas(session, deltas)
+
+    @staticmethod
+    def _invoice_customer(session, payment: InvoicePayment) -> Optional[int]:
+        if 'invoice' in payment.__dict__ and payment.invoice is not None:
+            return payment.invoice.client_id
+        invoice = session.get(EnhancedInvoice, payment.invoice_id) if payment.invoice_id else None
+        return invoice.client_id if invoice else None
+
+    @classmethod
+    def apply_deltas(cls, session, deltas: Dict[int, Dict]) -> None:
+        """One atomic increment per customer on the flush connection"""
+        connection = session.connection()
+        table = Customer.__table__
+        for customer_id, delta in deltas.items():
+            spent_after = func.coalesce(table.c.total_spent, 0) + delta['spent']
+            values = {
+                'total_visits': _non_negative(func.coalesce(table.c.total_visits, 0) + delta['visits']),
+                'no_show_count': _non_negative(func.coalesce(table.c.no_show_count, 0) + delta['no_shows']),
+                'total_spent': spent_after,
+                'lifetime_value': spent_after,
+                'loyalty_points': cast(_non_negative(spent_after) / LOYALTY_SPEND_PER_POINT, Integer)
+            }
+            if delta['last_visit']:
+                values['last_visit'] = case(
+                    (or_(table.c.last_visit.is_(None), table.c.last_visit < delta['last_visit']),
+                     delta['last_visit']),
+                    else_=table.c.last_visit
+                )
+            if delta['last_no_show']:
+                values['last_no_show'] = case(
+                    (or_(table.c.last_no_show.is_(None), table.c.last_no_show < delta['last_no_show']),
+                     delta['last_no_show']),
+                    else_=table.c.last_no_show
+                )
+            connection.execute(update(table).where(table.c.id == customer_id).values(**values))
+
+            # Loaded customers would otherwise keep showing pre-update numbers
+            customer = session.identity_map.get(inspect(Customer).identity_key_from_primary_key((customer_id,)))
+            if customer is not None:
+                session.expire(customer, METRIC_ATTRIBUTES)
+
+    @classmethod
+    def recompute(cls, customer_ids: Optional[List[int]] = None) -> Dict:
+        """
+        Rebuild every metric column from appointments and payments in one UPDATE with
+        correlated subqueries. Only rows whose stored values drifted are written, so the
+        row count is the number of customers repaired.
+        """
+        completed_visits = select(func.count(Appointment.id)).where(
+            Appointment.client_id == Customer.id, Appointment.status == 'completed').scalar_subquery()
+        no_shows = select(func.count(Appointment.id)).where(
+            Appointment.client_id == Customer.id, Appointment.status == 'no_show').scalar_subquery()
+        last_visit = select(func.max(Appointment.appointment_date)).where(
+            Appointment.client_id == Customer.id, Appointment.status == 'completed').scalar_subquery()
+        last_no_show = select(func.max(Appointment.appointment_date)).where(
+            Appointment.client_id == Customer.id, Appointment.status == 'no_show').scalar_subquery()
+        invoiced = select(InvoiceItem.id).where(InvoiceItem.appointment_id == Appointment.id).exists()
+        paid_appointments = select(func.coalesce(func.sum(Appointment.amount), 0)).where(
+            Appointment.client_id == Customer.id, Appointment.is_paid == True, ~invoiced).scalar_subquery()
+        invoice_payments = select(func.coalesce(func.sum(InvoicePayment.amount), 0)).join(
+            EnhancedInvoice, InvoicePayment.invoice_id == EnhancedInvoice.id
+        ).where(EnhancedInvoice.client_id == Customer.id).scalar_subquery()
+        spent = paid_appointments + invoice_payments
+        loyalty = cast(spent / LOYALTY_SPEND_PER_POINT, Integer)
+
+        drifted = or_(
+            func.coalesce(Customer.total_visits, -1) != completed_visits,
+            func.coalesce(Customer.no_show_count, -1) != no_shows,
+            func.abs(func.coalesce(Customer.total_spent, -1) - spent) > 0.005,
+            func.abs(func.coalesce(Customer.lifetime_value, -1) - spent) > 0.005,
+            func.coalesce(Customer.loyalty_points, -1) != loyalty,
+            Customer.last_visit.is_distinct_from(last_visit),
+            Customer.last_no_show.is_distinct_from(last_no_show)
+        )
+        statement = update(Customer).where(drifted).values(
+            total_visits=completed_visits,
+            no_show_count=no_shows,
+            total_spent=spent,
+            lifetime_value=spent,
+            loyalty_points=loyalty,
+            last_visit=last_visit,
+            last_no_show=last_no_show
+        )
+        if customer_ids:
+            statement = statement.where(Customer.id.in_(customer_ids))
+
+        try:
+            repaired = db.session.execute(
+                statement, execution_options={'synchronize_session': False}
+            ).rowcount or 0
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error recomputing customer metrics: {e}")
+            return {'success': False, 'error': str(e)}
+
+        logger.info("Customer metrics recompute repaired %s rows", repaired)
+        return {'success': True, 'customers_repaired': repaired, 'recomputed_at': datetime.utcnow().isoformat()}
+
+    @classmethod
+    def get_segment(cls, segment: str, limit: int = 100, offset: int = 0,
+                    now: Optional[datetime] = None) -> List[Dict]:
+        """VIP, loyal or lapsed customers, read straight from the indexed metric columns"""
+        now = now or datetime.utcnow()
+        query = db.session.query(
+            Customer.id, Customer.first_name, Customer.last_name, Customer.phone, Customer.email,
+            Customer.total_visits, Customer.total_spent, Customer.lifetime_value,
+            Customer.loyalty_points, Customer.last_visit, Customer.is_vip
+        ).filter(Customer.is_active == True)
+
+        if segment == 'vip':
+            query = query.filter(or_(Customer.is_vip == True,
+                                     Customer.lifetime_value >= VIP_MIN_LIFETIME_VALUE)
+                                 ).order_by(Customer.lifetime_value.desc())
+        elif segment == 'loyal':
+            query = query.filter(Customer.total_visits >= LOYAL_MIN_VISITS).order_by(Customer.total_visits.desc())
+        elif segment == 'lapsed':
+            query = query.filter(
+                Customer.last_visit < now - timedelta(days=LAPSED_AFTER_DAYS)
+            ).order_by(Customer.last_visit.asc())
+        else:
+            raise ValueError(f"Unknown segment '{segment}'. Expected one of: {', '.join(SEGMENTS)}")
+
+        return [{
+            'id': row.id,
+            'full_name': f"{row.first_name} {row.last_name}",
+            'phone': row.phone,
+            'email': row.email or '',
+            'total_visits': row.total_visits or 0,
+            'total_spent': float(row.total_spent or 0),
+            'lifetime_value': float(row.lifetime_value or 0),
+            'loyalty_points': row.loyalty_points or 0,
+            'last_visit': row.last_visit.isoformat() if row.last_visit else None,
+            'is_vip': bool(row.is_vip)
+        } for row in query.offset(offset).limit(limit).all()]
+
+
+@event.listens_for(Session, 'before_flush')
+def _maintain_customer_metrics(session, flush_context, instances):
+    deltas = CustomerMetricsMaintainer.collect_deltas(session)
+    if deltas:
+        CustomerMetricsMaintainer.apply_deltas(session, deltas)
@@ -58,9 +58,8 @@ def get_low_stock_items(limit=5):
 def get_expiring_items(limit=5):
     """Get items expiring soon - BATCH-CENTRIC"""
     try:
-        from modules.inventory.queries import get_expiring_batches
-        batches = get_expiring_batches(days=30)
-        return batches[:limit]  # Return only the first 'limit' items
+        from modules.inventory.expiry_timeline import ExpiryTimeline
+        return ExpiryTimeline.expiring_batches(limit=limit)
     except Exception as e:
         print(f"Error getting expiring items: {e}")
         return []
\ No newline at end of file
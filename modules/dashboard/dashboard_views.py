@@ -43,49 +43,24 @@ def alerts():
     """Product alerts and notifications page"""
     try:
         # Get inventory alerts
-        from modules.inventory.models import InventoryBatch, InventoryProduct
-        from sqlalchemy.orm import joinedload
-        from datetime import date, timedelta
+        from modules.inventory.expiry_timeline import ExpiryTimeline, EXPIRY_WARNING_DAYS
+        from modules.inventory.stock_alerts import StockAlertEvaluator
+        from datetime import date
 
         today = date.today()
 
-        # Get expired batches
-        expired_batches = InventoryBatch.query.options(
-            joinedload(InventoryBatch.product),
-            joinedload(InventoryBatch.location)
-        ).filter(
-            InventoryBatch.expiry_date < today,
-            InventoryBatch.status == 'active',
-            InventoryBatch.qty_available > 0
-        ).order_by(InventoryBatch.expiry_date.desc()).all()
+        # Expired batches, and items expiring within 2 months (60 days)
+        expired_batches = ExpiryTimeline.expired_batches(today=today)
+        expiring_soon = ExpiryTimeline.expiring_batches(days=EXPIRY_WARNING_DAYS, today=today)
 
-        # Get items expiring within 2 months (60 days)
-        expiry_threshold = today + timedelta(days=60)
-        expiring_soon = InventoryBatch.query.options(
-            joinedload(InventoryBatch.product),
-            joinedload(InventoryBatch.location)
-        ).filter(
-            InventoryBatch.expiry_date <= expiry_threshold,
-            InventoryBatch.expiry_date >= today,
-            InventoryBatch.status == 'active',
-            InventoryBatch.qty_available > 0
-        ).order_by(InventoryBatch.expiry_date.asc()).all()
-
-        # Get low stock items (product-wise)
-        low_stock_items = []
-        products = InventoryProduct.query.filter(InventoryProduct.is_active == True).all()
-        for product in products:
-            total_stock = sum(float(batch.qty_available or 0) for batch in product.batches if batch.status == 'active')
-            if total_stock <= 10 and total_stock > 0:  # Low stock threshold
-                low_stock_items.append({
-                    'product': product,
-                    'current_stock': total_stock
-                })
+        # Low stock items come from the alerts the stock alert evaluator maintains
+        low_stock_items = StockAlertEvaluator.low_stock_items()
 
         return render_template('alerts.html', 
                              expired_items=expired_batches,
                              expiring_soon=expiring_soon,
-                             low_stock_items=low_stock_items)
+                             low_stock_items=low_stock_items,
+                             today=today)
     except Exception as e:
         print(f"Alerts error: {e}")
         flash('Error loading alerts', 'danger')
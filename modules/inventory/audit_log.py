@@ -0,0 +1,90 @@
+"""
+Inventory Audit Log Writer
+Queues audit rows for a unit of work and writes them with one INSERT inside the caller's
+transaction, so the log commits (or rolls back) together with the stock change it records
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from sqlalchemy import insert
+from app import db
+from .models import InventoryAuditLog
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AuditLogWriter:
+    """
+    Usage:
+        audit = AuditLogWriter()
+        audit.record(batch, user_id, 'consumption', -2, 10, 8, reference=consumption)
+        ...
+        audit.flush()        # one INSERT; the caller commits
+
+    or as a context manager that flushes on a clean exit. reference may be an unsaved
+    model instance; its id is resolved at flush time, after the session has assigned it.
+    """
+
+    def __init__(self, session=None):
+        self.session = session or db.session
+        self._rows: List[Dict[str, Any]] = []
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __enter__(self) -> 'AuditLogWriter':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.flush()
+        else:
+            self._rows.clear()
+
+    def record(self, batch, user_id: Optional[int], action_type: str, quantity_delta: float,
+               stock_before: float, stock_after: float, reference_type: Optional[str] = None,
+               reference: Any = None, notes: Optional[str] = None,
+               product_id: Optional[int] = None) -> bool:
+        """
+        Queue one row. batch is an InventoryBatch or a batch id (then product_id is required).
+        Rows without a user are skipped, as the log requires one.
+        """
+        if not user_id:
+            return False
+        batch_id = batch if isinstance(batch, int) else batch.id
+        if product_id is None and not isinstance(batch, int):
+            product_id = batch.product_id
+        self._rows.append({
+            'batch_id': batch_id,
+            'product_id': product_id,
+            'user_id': user_id,
+            'action_type': action_type,
+            'quantity_delta': float(quantity_delta),
+            'stock_before': float(stock_before),
+            'stock_after': float(stock_after),
+            'reference_type': reference_type,
+            'reference': reference,
+            'notes': notes
+        })
+        return True
+
+    def flush(self) -> int:
+        """Insert every queued row in one statement; returns the number written. Does not commit."""
+        if not self._rows:
+            return 0
+
+        references = [row['reference'] for row in self._rows if hasattr(row['reference'], '__table__')]
+        if any(getattr(reference, 'id', None) is None for reference in references):
+            self.session.flush()  # Assign ids to the records being referenced
+
+        now = datetime.utcnow()
+        rows = []
+        for row in self._rows:
+            reference = row.pop('reference')
+            row['reference_id'] = reference.id if hasattr(reference, '__table__') else reference
+            row['timestamp'] = now
+            rows.append(row)
+
+        self.session.execute(insert(InventoryAuditLog), rows)
+        self._rows.clear()
+        return len(rows)
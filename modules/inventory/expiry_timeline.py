@@ -0,0 +1,217 @@
+"""
+Batch Expiry Timeline
+Expiring stock by week or month, per product and location, from one grouped query on the
+(status, expiry_date, qty_available) index, plus the batch lists the dashboard and alerts
+pages show and a purchase plan that nets expiring stock off what is on hand
+"""
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import func, select
+from sqlalchemy.orm import joinedload
+from app import db
+from .models import InventoryBatch, InventoryLocation, InventoryProduct
+from .stock_alerts import LOW_STOCK_THRESHOLD
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Windows used across the inventory pages
+EXPIRING_SOON_DAYS = 30        # dashboard card and InventoryBatch.is_near_expiry
+EXPIRY_WARNING_DAYS = 60       # alerts page
+
+GRANULARITIES = ('week', 'month')
+MAX_HORIZON_DAYS = 366
+
+
+def bucket_start(expiry: date, granularity: str) -> date:
+    """Monday of the expiry's week, or the first of its month"""
+    if granularity == 'week':
+        return expiry - timedelta(days=expiry.weekday())
+    return expiry.replace(day=1)
+
+
+def bucket_end(start: date, granularity: str) -> date:
+    """Last day covered by a bucket"""
+    if granularity == 'week':
+        return start + timedelta(days=6)
+    next_start = date(start.year + 1, 1, 1) if start.month == 12 else date(start.year, start.month + 1, 1)
+    return next_start - timedelta(days=1)
+
+
+def _in_stock():
+    return [InventoryBatch.status == 'active', InventoryBatch.qty_available > 0]
+
+
+class ExpiryTimeline:
+    """Read-only expiry views over active, in-stock batches"""
+
+    @staticmethod
+    def expiring_batches(days: int = EXPIRING_SOON_DAYS, location_id: Optional[str] = None,
+                         limit: Optional[int] = None, today: Optional[date] = None) -> List[InventoryBatch]:
+        """In-stock batches expiring from today through today + days, soonest first"""
+        today = today or date.today()
+        query = InventoryBatch.query.options(
+            joinedload(InventoryBatch.product), joinedload(InventoryBatch.location)
+        ).filter(
+            *_in_stock(),
+            InventoryBatch.expiry_date >= today,
+            InventoryBatch.expiry_date <= today + timedelta(days=days)
+        )
+        if location_id:
+            query = query.filter(InventoryBatch.location_id == location_id)
+        query = query.order_by(InventoryBatch.expiry_date.asc(), InventoryBatch.id)
+        return query.limit(limit).all() if limit else query.all()
+
+    @staticmethod
+    def expired_batches(location_id: Optional[str] = None, limit: Optional[int] = None,
+                        today: Optional[date] = None) -> List[InventoryBatch]:
+        """In-stock batches already past their expiry date, most recent first"""
+        query = InventoryBatch.query.options(
+            joinedload(InventoryBatch.product), joinedload(InventoryBatch.location)
+        ).filter(
+            *_in_stock(),
+            InventoryBatch.expiry_date < (today or date.today())
+        )
+        if location_id:
+            query = query.filter(InventoryBatch.location_id == location_id)
+        query = query.order_by(InventoryBatch.expiry_date.desc(), InventoryBatch.id)
+        return query.limit(limit).all() if limit else query.all()
+
+    @staticmethod
+    def _grouped(until: Optional[date], location_id: Optional[str] = None,
+                 product_ids: Optional[Iterable[int]] = None, since: Optional[date] = None) -> List:
+        """(product, location, expiry_date, batches, quantity, value) rows with names, one query"""
+        query = select(
+            InventoryBatch.product_id, InventoryProduct.name, InventoryProduct.sku,
+            InventoryBatch.location_id, InventoryLocation.name,
+            InventoryBatch.expiry_date,
+            func.count(InventoryBatch.id),
+            func.sum(InventoryBatch.qty_available),
+            func.sum(InventoryBatch.qty_available * func.coalesce(InventoryBatch.unit_cost, 0))
+        ).join(
+            InventoryProduct, InventoryProduct.id == InventoryBatch.product_id
+        ).outerjoin(
+            InventoryLocation, InventoryLocation.id == InventoryBatch.location_id
+        ).where(*_in_stock()).group_by(
+            InventoryBatch.product_id, InventoryProduct.name, InventoryProduct.sku,
+            InventoryBatch.location_id, InventoryLocation.name, InventoryBatch.expiry_date
+        )
+        if since is not None:
+            query = query.where(InventoryBatch.expiry_date >= since)
+        if until is not None:
+            query = query.where(InventoryBatch.expiry_date <= until)
+        if location_id:
+            query = query.where(InventoryBatch.location_id == location_id)
+        if product_ids:
+            query = query.where(InventoryBatch.product_id.in_(list(product_ids)))
+        return db.session.execute(query).all()
+
+    @classmethod
+    def timeline(cls, granularity: str = 'week', horizon_days: int = 90, location_id: Optional[str] = None,
+                 product_ids: Optional[Iterable[int]] = None, include_expired: bool = True,
+                 today: Optional[date] = None) -> Dict:
+        """
+        Quantity and cost value expiring per bucket, broken down by product and location.
+        Stock already past expiry is reported in a separate 'expired' bucket.
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Unknown granularity '{granularity}'. Expected one of: {', '.join(GRANULARITIES)}")
+        horizon_days = max(1, min(int(horizon_days), MAX_HORIZON_DAYS))
+        today = today or date.today()
+        until = today + timedelta(days=horizon_days)
+
+        rows = cls._grouped(until, location_id, product_ids, since=None if include_expired else today)
+
+        buckets: Dict = {}
+        for product_id, product_name, sku, loc_id, location_name, expiry, batches, quantity, value in rows:
+            if expiry < today:
+                key, start, end, label = 'expired', None, today - timedelta(days=1), 'Expired'
+            else:
+                start = bucket_start(expiry, granularity)
+                end = bucket_end(start, granularity)
+                key = start.isoformat()
+                label = (f"Week of {start.strftime('%d %b %Y')}" if granularity == 'week'
+                         else start.strftime('%b %Y'))
+            bucket = buckets.setdefault(key, {
+                'key': key, 'label': label,
+                'start': start.isoformat() if start else None, 'end': end.isoformat(),
+                'quantity': 0.0, 'value': 0.0, 'batches': 0, 'items': {}
+            })
+            item = bucket['items'].setdefault((product_id, loc_id), {
+                'product_id': product_id, 'product_name': product_name, 'sku': sku,
+                'location_id': loc_id, 'location_name': location_name or 'Unassigned',
+                'quantity': 0.0, 'value': 0.0, 'batches': 0, 'first_expiry': expiry.isoformat()
+            })
+            item['first_expiry'] = min(item['first_expiry'], expiry.isoformat())
+            for target in (bucket, item):
+                target['quantity'] += float(quantity or 0)
+                target['value'] += float(value or 0)
+                target['batches'] += batches
+
+        ordered = sorted(buckets.values(), key=lambda bucket: (bucket['key'] != 'expired', bucket['key']))
+        for bucket in ordered:
+            bucket['quantity'] = round(bucket['quantity'], 2)
+            bucket['value'] = round(bucket['value'], 2)
+            bucket['items'] = sorted(
+                ({**item, 'quantity': round(item['quantity'], 2), 'value': round(item['value'], 2)}
+                 for item in bucket['items'].values()),
+                key=lambda item: (-item['value'], item['product_name'])
+            )
+        return {
+            'granularity': granularity,
+            'from': today.isoformat(),
+            'to': until.isoformat(),
+            'location_id': location_id,
+            'total_quantity': round(sum(bucket['quantity'] for bucket in ordered), 2),
+            'total_value': round(sum(bucket['value'] for bucket in ordered), 2),
+            'buckets': ordered
+        }
+
+    @classmethod
+    def purchase_plan(cls, horizon_days: int = EXPIRY_WARNING_DAYS, location_id: Optional[str] = None,
+                      today: Optional[date] = None) -> List[Dict]:
+        """
+        Per product: usable stock on hand, how much of it expires within the horizon, and
+        the quantity to reorder so what remains afterwards is back above the low stock level.
+        Products with nothing to reorder are left out.
+        """
+        horizon_days = max(1, min(int(horizon_days), MAX_HORIZON_DAYS))
+        today = today or date.today()
+        until = today + timedelta(days=horizon_days)
+
+        products: Dict[int, Dict] = {
+            product_id: {'product_id': product_id, 'product_name': name, 'sku': sku,
+                         'min_stock_level': float(threshold), 'on_hand': 0.0, 'expiring': 0.0,
+                         'expiring_value': 0.0, 'next_expiry': None}
+            for product_id, name, sku, threshold in db.session.execute(select(
+                InventoryProduct.id, InventoryProduct.name, InventoryProduct.sku,
+                func.coalesce(InventoryProduct.min_stock_level, LOW_STOCK_THRESHOLD)
+            ).where(InventoryProduct.is_active == True)).all()
+        }
+
+        for product_id, _, _, _, _, expiry, _, quantity, value in cls._grouped(None, location_id, since=today):
+            product = products.get(product_id)
+            if product is None:
+                continue
+            product['on_hand'] += float(quantity or 0)
+            if expiry <= until:
+                product['expiring'] += float(quantity or 0)
+                product['expiring_value'] += float(value or 0)
+                if product['next_expiry'] is None or expiry.isoformat() < product['next_expiry']:
+                    product['next_expiry'] = expiry.isoformat()
+
+        plan = []
+        for product in products.values():
+            remaining = product['on_hand'] - product['expiring']
+            reorder = max(product['min_stock_level'] - remaining, 0.0)
+            if reorder <= 0:
+                continue
+            plan.append({
+                **product,
+                'on_hand': round(product['on_hand'], 2),
+                'expiring': round(product['expiring'], 2),
+                'expiring_value': round(product['expiring_value'], 2),
+                'remaining_after_expiry': round(remaining, 2),
+                'suggested_reorder': round(reorder, 2)
+            })
+        return sorted(plan, key=lambda item: (item['remaining_after_expiry'], item['product_name']))
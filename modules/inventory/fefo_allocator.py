@@ -0,0 +1,192 @@
+"""
+FEFO Batch Allocator
+Picks stock first-expiry-first-out across a product's batches, splits a quantity over as
+many batches as it takes, and removes it with guarded decrements in the caller's transaction
+"""
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import update
+from sqlalchemy.orm.attributes import set_committed_value
+from app import db
+from .models import InventoryBatch, InventoryConsumption
+from .audit_log import AuditLogWriter
+from .stock_alerts import StockAlertEvaluator
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class InsufficientStockError(ValueError):
+    """Raised when batches cannot cover a quantity, or a guarded decrement loses a race"""
+
+
+@dataclass
+class BatchAllocation:
+    """A quantity taken (or planned) from one batch"""
+    batch: InventoryBatch
+    quantity: float
+    stock_after: Optional[float] = None
+
+    @property
+    def stock_before(self) -> Optional[float]:
+        return None if self.stock_after is None else self.stock_after + self.quantity
+
+
+class FefoAllocator:
+    """First-expiry-first-out allocation over active, unexpired batches"""
+
+    @staticmethod
+    def candidates(product_ids: Iterable[int], today: Optional[date] = None,
+                   location_id: Optional[str] = None) -> Dict[int, List[InventoryBatch]]:
+        """
+        Usable batches per product in FEFO order, optionally at one location, from one query
+        on the (product_id, status, expiry_date) index. Rows are locked where the backend allows.
+        """
+        product_ids = set(product_ids)
+        if not product_ids:
+            return {}
+        query = InventoryBatch.query.filter(
+            InventoryBatch.product_id.in_(product_ids),
+            InventoryBatch.status == 'active',
+            InventoryBatch.expiry_date >= (today or date.today()),
+            InventoryBatch.qty_available > 0
+        )
+        if location_id:
+            query = query.filter(InventoryBatch.location_id == location_id)
+        batches = query.order_by(
+            InventoryBatch.product_id, InventoryBatch.expiry_date, InventoryBatch.id
+        ).with_for_update().all()
+
+        grouped: Dict[int, List[InventoryBatch]] = {product_id: [] for product_id in product_ids}
+        for batch in batches:
+            grouped[batch.product_id].append(batch)
+        return grouped
+
+    @staticmethod
+    def plan(batches: List[InventoryBatch], quantity: float,
+             reserved: Optional[Dict[int, float]] = None) -> Tuple[List[BatchAllocation], float]:
+        """
+        Split quantity over batches in the given order without writing anything.
+        reserved holds quantities other lines already claim per batch id.
+        Returns the allocations and any shortfall.
+        """
+        reserved = reserved or {}
+        remaining = float(quantity)
+        allocations = []
+        for batch in batches:
+            if remaining <= 0:
+                break
+            available = float(batch.qty_available or 0) - reserved.get(batch.id, 0)
+            if available <= 0:
+                continue
+            take = min(available, remaining)
+            allocations.append(BatchAllocation(batch, take))
+            remaining -= take
+        return allocations, max(remaining, 0.0)
+
+    @staticmethod
+    def decrement(batch: InventoryBatch, quantity: float) -> float:
+        """
+        Atomically take quantity from a batch and return the remaining stock. The UPDATE
+        only matches while enough stock is left, so concurrent sales cannot drive it negative.
+        """
+        remaining = db.session.execute(
+            update(InventoryBatch)
+            .where(InventoryBatch.id == batch.id, InventoryBatch.qty_available >= quantity)
+            .values(qty_available=InventoryBatch.qty_available - quantity,
+                    updated_at=datetime.utcnow())
+            .returning(InventoryBatch.qty_available),
+            execution_options={'synchronize_session': False}
+        ).scalar()
+        if remaining is None:
+            raise InsufficientStockError(f'Insufficient stock in batch {batch.batch_name}')
+        # Keep the loaded batch in step without marking it dirty
+        set_committed_value(batch, 'qty_available', remaining)
+        StockAlertEvaluator.touch([batch.product_id])
+        return float(remaining)
+
+    @classmethod
+    def allocate(cls, product_id: int, quantity: float, allow_partial: bool = False,
+                 candidates: Optional[List[InventoryBatch]] = None) -> List[BatchAllocation]:
+        """
+        Take quantity of a product FEFO across batches. Without allow_partial a shortfall
+        raises InsufficientStockError and the caller rolls the transaction back; with it,
+        whatever stock exists is taken and the rest is left unallocated.
+        """
+        if candidates is None:
+            candidates = cls.candidates([product_id]).get(product_id, [])
+
+        planned, shortfall = cls.plan(candidates, quantity)
+        if shortfall and not allow_partial:
+            raise InsufficientStockError(
+                f'Insufficient stock for product {product_id}. '
+                f'Available: {float(quantity) - shortfall}, Required: {quantity}'
+            )
+
+        taken = []
+        for allocation in planned:
+            try:
+                allocation.stock_after = cls.decrement(allocation.batch, allocation.quantity)
+            except InsufficientStockError:
+                if not allow_partial:
+                    raise
+                logger.warning("Batch %s changed during allocation; skipped", allocation.batch.batch_name)
+                continue
+            taken.append(allocation)
+        return taken
+
+    @classmethod
+    def consume_for_service(cls, service, issued_to: str, reference: Optional[str] = None,
+                            user_id: Optional[int] = None) -> List[Dict]:
+        """
+        Consume a service's bill of materials (ServiceInventoryItem rows) FEFO. Stock
+        shortfalls do not block the service; they are logged and reported as shortfall.
+        Nothing is committed here.
+        """
+        bill_of_materials = [item for item in service.inventory_items if item.quantity_per_service]
+        if not bill_of_materials:
+            return []
+
+        candidates = cls.candidates(item.inventory_id for item in bill_of_materials)
+        movements = []
+        consumptions = []
+        for item in bill_of_materials:
+            allocations = cls.allocate(item.inventory_id, item.quantity_per_service, allow_partial=True,
+                                       candidates=candidates.get(item.inventory_id, []))
+            consumed = sum(allocation.quantity for allocation in allocations)
+            shortfall = round(float(item.quantity_per_service) - consumed, 4)
+            if shortfall > 0:
+                logger.warning("Service %s short of product %s by %s", service.name, item.inventory_id, shortfall)
+
+            for allocation in allocations:
+                consumptions.append((allocation, InventoryConsumption(
+                    batch_id=allocation.batch.id,
+                    quantity=allocation.quantity,
+                    issued_to=issued_to,
+                    reference=reference,
+                    notes=f'Used in service: {service.name}',
+                    created_by=user_id
+                )))
+            movements.append({
+                'product_id': item.inventory_id,
+                'required': float(item.quantity_per_service),
+                'consumed': consumed,
+                'shortfall': max(shortfall, 0.0),
+                'batches': [{
+                    'batch_id': allocation.batch.id,
+                    'batch_name': allocation.batch.batch_name,
+                    'quantity': allocation.quantity,
+                    'stock_before': allocation.stock_before,
+                    'stock_after': allocation.stock_after
+                } for allocation in allocations]
+            })
+
+        db.session.add_all(consumption for _, consumption in consumptions)
+        with AuditLogWriter() as audit:
+            for allocation, consumption in consumptions:
+                audit.record(allocation.batch, user_id, 'service_use', -allocation.quantity,
+                             allocation.stock_before, allocation.stock_after,
+                             reference_type='consumption', reference=consumption,
+                             notes=f'Used in service: {service.name}')
+        return movements
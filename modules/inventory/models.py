@@ -32,11 +32,8 @@ class InventoryLocation(db.Model):
     @property
     def total_stock_value(self):
         """Calculate total stock value for this location based on batches"""
-        total_value = 0
-        for batch in self.batches:
-            if batch.qty_available and batch.unit_cost:
-                total_value += float(batch.qty_available) * float(batch.unit_cost)
-        return total_value
+        from .valuation import InventoryValuation
+        return InventoryValuation.total_value(location_id=self.id)
 
 
 class InventoryCategory(db.Model):
@@ -70,6 +67,7 @@ class InventoryProduct(db.Model):
     # Product details only - NO STOCK FIELDS
     unit_of_measure = db.Column(db.String(20), default='pcs')  # pieces, liters, kg, etc.
     barcode = db.Column(db.String(50))
+    min_stock_level = db.Column(db.Float)  # Low stock alert threshold; falls back to LOW_STOCK_THRESHOLD
 
     # Status tracking
     is_active = db.Column(db.Boolean, default=True)
@@ -133,6 +131,10 @@ class InventoryAlert(db.Model):
     product = db.relationship('InventoryProduct', backref='alerts')
     resolver = db.relationship('User', backref='resolved_alerts')
 
+    __table_args__ = (
+        db.Index('ix_inventory_alert_product_resolved_type', 'product_id', 'is_resolved', 'alert_type'),
+    )
+
 class InventoryBatch(db.Model):
     """Batch tracking - CENTRAL element for all stock transactions"""
     __tablename__ = 'inventory_batches'
@@ -167,6 +169,12 @@ class InventoryBatch(db.Model):
     product = db.relationship('InventoryProduct', back_populates='batches')
     location = db.relationship('InventoryLocation', back_populates='batches')
 
+    # Indexes
+    __table_args__ = (
+        db.Index('ix_inventory_batch_product_status_expiry', 'product_id', 'status', 'expiry_date'),
+        db.Index('ix_inventory_batch_status_expiry_qty', 'status', 'expiry_date', 'qty_available'),
+    )
+
     @property
     def is_expired(self):
         """Check if batch is expired"""
@@ -275,8 +283,10 @@ class InventoryTransfer(db.Model):
     source_batch_id = db.Column(db.Integer, db.ForeignKey('inventory_batches.id'), nullable=False)
     dest_batch_id = db.Column(db.Integer, db.ForeignKey('inventory_batches.id'), nullable=True)  # Created during transfer
     dest_location_id = db.Column(db.String(50), db.ForeignKey('inventory_locations.id'), nullable=False)
+    source_location_id = db.Column(db.String(50), db.ForeignKey('inventory_locations.id'), nullable=True)
 
     # Transfer details
+    reference = db.Column(db.String(50))  # Shared by every line of one multi-line transfer
     quantity = db.Column(db.Numeric(10, 2), nullable=False)
     notes = db.Column(db.Text)
 
@@ -287,5 +297,11 @@ class InventoryTransfer(db.Model):
     # Relationships
     source_batch = db.relationship('InventoryBatch', foreign_keys=[source_batch_id], backref='transfers_out')
     dest_batch = db.relationship('InventoryBatch', foreign_keys=[dest_batch_id], backref='transfers_in')
-    dest_location = db.relationship('InventoryLocation', backref='transfers_received')
-    user = db.relationship('User', backref='transfers')
\ No newline at end of file
+    dest_location = db.relationship('InventoryLocation', foreign_keys=[dest_location_id], backref='transfers_received')
+    source_location = db.relationship('InventoryLocation', foreign_keys=[source_location_id], backref='transfers_sent')
+    user = db.relationship('User', backref='transfers')
+
+    # Indexes
+    __table_args__ = (
+        db.Index('ix_inventory_transfer_reference', 'reference'),
+    )
\ No newline at end of file
@@ -3,17 +3,25 @@ Inventory Management Database Queries - BATCH-CENTRIC APPROACH
 """
 from datetime import datetime, date, timedelta
 from sqlalchemy import func, and_, or_, desc
+from sqlalchemy.orm import joinedload, selectinload
 from app import db
 from .models import (
     InventoryProduct, InventoryCategory, InventoryAlert, InventoryConsumption, InventoryBatch,
     InventoryAuditLog, InventoryAdjustment, InventoryTransfer, InventoryLocation
 )
+from .audit_log import AuditLogWriter
+from .stock_alerts import StockAlertEvaluator
+from .expiry_timeline import ExpiryTimeline, EXPIRING_SOON_DAYS
+from .valuation import InventoryValuation
 
 # ============ PRODUCT MANAGEMENT (NO STOCK TRACKING) ============
 
 def get_all_products(include_inactive=False):
-    """Get all products with optional inactive filter"""
-    query = InventoryProduct.query
+    """Get all products with optional inactive filter, with category and batches loaded for stock totals"""
+    query = InventoryProduct.query.options(
+        joinedload(InventoryProduct.category),
+        selectinload(InventoryProduct.batches)
+    )
     if not include_inactive:
         query = query.filter(InventoryProduct.is_active == True)
     return query.order_by(InventoryProduct.name).all()
@@ -39,7 +47,7 @@ def search_products(search_term):
 def create_product(product_data):
     """Create new product - NO STOCK FIELDS"""
     try:
-        valid_fields = ['sku', 'name', 'description', 'category_id', 'unit_of_measure', 'barcode', 'is_active', 'is_service_item', 'is_retail_item']
+        valid_fields = ['sku', 'name', 'description', 'category_id', 'unit_of_measure', 'barcode', 'is_active', 'is_service_item', 'is_retail_item', 'min_stock_level']
         filtered_data = {k: v for k, v in product_data.items() if k in valid_fields}
 
         product = InventoryProduct(**filtered_data)
@@ -57,7 +65,7 @@ def update_product(product_id, product_data):
         if not product:
             return None
 
-        valid_fields = ['sku', 'name', 'description', 'category_id', 'unit_of_measure', 'barcode', 'is_active', 'is_service_item', 'is_retail_item']
+        valid_fields = ['sku', 'name', 'description', 'category_id', 'unit_of_measure', 'barcode', 'is_active', 'is_service_item', 'is_retail_item', 'min_stock_level']
         for key, value in product_data.items():
             if key in valid_fields and hasattr(product, key) and value is not None:
                 setattr(product, key, value)
@@ -284,48 +292,32 @@ def get_available_batches_for_transactions():
         )
     ).order_by(InventoryBatch.expiry_date.asc().nullslast(), InventoryBatch.batch_name).all()
 
-def get_expiring_batches(days=30):
-    """Get batches expiring within specified days"""
-    from datetime import date, timedelta
-    expiry_threshold = date.today() + timedelta(days=days)
-    return InventoryBatch.query.filter(
-        and_(
-            InventoryBatch.expiry_date <= expiry_threshold,
-            InventoryBatch.expiry_date > date.today(),
-            InventoryBatch.qty_available > 0
-        )
-    ).all()
+def get_expiring_batches(days=EXPIRING_SOON_DAYS):
+    """Get in-stock batches expiring within specified days"""
+    return ExpiryTimeline.expiring_batches(days=days)
 
 def get_expired_batches():
-    """Get all expired batches"""
-    from datetime import date
-    return InventoryBatch.query.filter(
-        InventoryBatch.expiry_date <= date.today()
-    ).all()
+    """Get in-stock batches past their expiry date"""
+    return ExpiryTimeline.expired_batches()
 
 # ============ AUDIT LOG MANAGEMENT ============
 
 def create_audit_log(batch_id, product_id, user_id, action_type, quantity_delta, stock_before, stock_after, reference_type=None, reference_id=None, notes=None):
-    """Create audit log entry for batch stock changes"""
-    try:
-        audit_log = InventoryAuditLog(
-            batch_id=batch_id,
-            product_id=product_id,
-            user_id=user_id,
-            action_type=action_type,
-            quantity_delta=quantity_delta,
-            stock_before=stock_before,
-            stock_after=stock_after,
-            reference_type=reference_type,
-            reference_id=reference_id,
-            notes=notes
-        )
-        db.session.add(audit_log)
-        db.session.commit()
-        return audit_log
-    except Exception as e:
-        db.session.rollback()
-        raise e
+    """Add an audit log entry to the current transaction; the caller commits"""
+    audit_log = InventoryAuditLog(
+        batch_id=batch_id,
+        product_id=product_id,
+        user_id=user_id,
+        action_type=action_type,
+        quantity_delta=quantity_delta,
+        stock_before=stock_before,
+        stock_after=stock_after,
+        reference_type=reference_type,
+        reference_id=reference_id,
+        notes=notes
+    )
+    db.session.add(audit_log)
+    return audit_log
 
 def get_recent_audit_logs(limit=50):
     """Get recent audit logs for dashboard"""
@@ -362,24 +354,15 @@ def create_consumption_record(batch_id, quantity, issued_to, reference=None, not
 
         # Update batch quantity
         old_qty = float(batch.qty_available)
-        batch.qty_available -= float(quantity)
-
-        # Create audit log only if user_id is provided
-        if user_id:
-            create_audit_log(
-                batch_id=batch_id,
-                product_id=batch.product_id,
-                user_id=user_id,
-                action_type='consumption',
-                quantity_delta=-float(quantity),
-                stock_before=old_qty,
-                stock_after=float(batch.qty_available),
-                reference_type='consumption',
-                reference_id=consumption.id,
-                notes=f"Consumed by: {issued_to}"
-            )
-
+        batch.qty_available = old_qty - float(quantity)
         db.session.add(consumption)
+
+        # Audit row is written with the consumption, in the same commit
+        with AuditLogWriter() as audit:
+            audit.record(batch, user_id, 'consumption', -float(quantity), old_qty,
+                         float(batch.qty_available), reference_type='consumption',
+                         reference=consumption, notes=f"Consumed by: {issued_to}")
+
         db.session.commit()
         return consumption
     except Exception as e:
@@ -413,30 +396,22 @@ def create_adjustment_record(batch_id, adjustment_type, quantity, remarks, user_
         # Update batch quantity
         old_qty = float(batch.qty_available)
         if adjustment_type == 'add':
-            batch.qty_available += float(quantity)
+            batch.qty_available = old_qty + float(quantity)
             quantity_delta = float(quantity)
         else:  # remove
             if float(quantity) > old_qty:
                 raise ValueError(f"Cannot remove {quantity}. Only {old_qty} available.")
-            batch.qty_available -= float(quantity)
+            batch.qty_available = old_qty - float(quantity)
             quantity_delta = -float(quantity)
 
-        # Create audit log only if user_id is provided
-        if user_id:
-            create_audit_log(
-                batch_id=batch_id,
-                product_id=batch.product_id,
-                user_id=user_id,
-                action_type=f'adjustment_{adjustment_type}',
-                quantity_delta=quantity_delta,
-                stock_before=old_qty,
-                stock_after=float(batch.qty_available),
-                reference_type='adjustment',
-                reference_id=adjustment.id,
-                notes=remarks
-            )
-
         db.session.add(adjustment)
+
+        # Audit row is written with the adjustment, in the same commit
+        with AuditLogWriter() as audit:
+            audit.record(batch, user_id, f'adjustment_{adjustment_type}', quantity_delta, old_qty,
+                         float(batch.qty_available), reference_type='adjustment',
+                         reference=adjustment, notes=remarks)
+
         db.session.commit()
         return adjustment
     except Exception as e:
@@ -450,36 +425,9 @@ def get_active_alerts():
     return InventoryAlert.query.filter_by(is_resolved=False).order_by(desc(InventoryAlert.created_at)).all()
 
 def check_stock_alerts(product):
-    """Check and create stock alerts for a product based on batch totals"""
+    """Re-evaluate stock alerts for a product; only alerts whose state changed are written"""
     try:
-        # Clear existing unresolved alerts for this product
-        InventoryAlert.query.filter_by(
-            product_id=product.id,
-            is_resolved=False
-        ).delete()
-
-        alerts_to_create = []
-        total_stock = product.total_stock
-
-        if total_stock <= 0:
-            alerts_to_create.append({
-                'alert_type': 'out_of_stock',
-                'message': f'{product.name} is out of stock',
-                'severity': 'critical'
-            })
-        elif total_stock <= 10:
-            alerts_to_create.append({
-                'alert_type': 'low_stock',
-                'message': f'{product.name} is running low (Current: {total_stock})',
-                'severity': 'high'
-            })
-
-        # Create alerts
-        for alert_data in alerts_to_create:
-            alert_data['product_id'] = product.id
-            alert = InventoryAlert(**alert_data)
-            db.session.add(alert)
-
+        StockAlertEvaluator.evaluate([product.id])
         db.session.commit()
     except Exception as e:
         db.session.rollback()
@@ -494,12 +442,9 @@ def get_inventory_dashboard_stats():
         low_stock_count = len(get_low_stock_products())
         out_of_stock_count = len(get_out_of_stock_products())
 
-        # Total inventory value from batches
-        total_value = 0
-        batches = InventoryBatch.query.filter(InventoryBatch.status == 'active').all()
-        for batch in batches:
-            if batch.qty_available and batch.unit_cost:
-                total_value += float(batch.qty_available) * float(batch.unit_cost)
+        # Total inventory value from batches, summed in SQL
+        total_batches = InventoryBatch.query.filter(InventoryBatch.status == 'active').count()
+        total_value = InventoryValuation.total_value(active_only=True)
 
         # Recent audit logs instead of movements
         recent_movements = get_recent_audit_logs(limit=10)
@@ -509,7 +454,7 @@ def get_inventory_dashboard_stats():
 
         return {
             'total_products': total_products,
-            'total_batches': len(batches),
+            'total_batches': total_batches,
             'low_stock_count': low_stock_count,
             'out_of_stock_count': out_of_stock_count,
             'total_value': float(total_value),
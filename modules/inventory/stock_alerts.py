@@ -0,0 +1,230 @@
+"""
+Stock Alert Evaluator
+Re-evaluates low and out-of-stock alerts for the products a transaction actually touched,
+just before it commits, and only writes the alerts whose state changed. A set-based
+rebuild over the whole catalog reconciles anything that was changed outside the ORM
+"""
+import os
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import case, event, func, insert, inspect, select, update
+from sqlalchemy.orm import Session, joinedload
+from app import db
+from .models import InventoryAlert, InventoryBatch, InventoryProduct
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _threshold_from_env(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+# Stock at or below this is low unless the product sets its own min_stock_level
+LOW_STOCK_THRESHOLD = _threshold_from_env('LOW_STOCK_THRESHOLD', 10)
+
+STOCK_ALERT_TYPES = ('out_of_stock', 'low_stock')
+
+# session.info key holding the product ids changed in the current transaction
+TOUCHED_KEY = 'stock_alert_products'
+
+# Attributes whose change can move a product between stock states
+BATCH_ATTRIBUTES = ('qty_available', 'status', 'product_id')
+PRODUCT_ATTRIBUTES = ('min_stock_level', 'is_active')
+
+
+def _attribute_changed(instance, attributes) -> bool:
+    state = inspect(instance)
+    return any(state.attrs[attribute].history.has_changes() for attribute in attributes)
+
+
+class StockAlertEvaluator:
+    """
+    Alert states per active product, from the sum of its active batches:
+      out_of_stock  total <= 0                      (critical)
+      low_stock     0 < total <= min_stock_level    (high)
+    Inactive products have no stock alerts.
+    """
+
+    @staticmethod
+    def touch(product_ids: Iterable[int], session=None) -> None:
+        """Mark products for re-evaluation at commit; used by writers that bypass the ORM"""
+        session = session or db.session
+        session.info.setdefault(TOUCHED_KEY, set()).update(
+            product_id for product_id in product_ids if product_id
+        )
+
+    @classmethod
+    def collect_touched(cls, session) -> None:
+        products = set()
+        for instance in session.new:
+            if isinstance(instance, InventoryBatch):
+                products.add(instance.product_id)
+            elif isinstance(instance, InventoryProduct):
+                products.add(instance.id)
+        for instance in session.dirty:
+            if isinstance(instance, InventoryBatch) and _attribute_changed(instance, BATCH_ATTRIBUTES):
+                products.add(instance.product_id)
+                products.update(inspect(instance).attrs['product_id'].history.deleted)
+            elif isinstance(instance, InventoryProduct) and _attribute_changed(instance, PRODUCT_ATTRIBUTES):
+                products.add(instance.id)
+        for instance in session.deleted:
+            if isinstance(instance, InventoryBatch):
+                products.add(instance.product_id)
+        if products:
+            cls.touch(products, session)
+
+    @staticmethod
+    def desired_state(total: float, threshold: float) -> Optional[str]:
+        if total <= 0:
+            return 'out_of_stock'
+        if total <= threshold:
+            return 'low_stock'
+        return None
+
+    @classmethod
+    def stock_levels(cls, product_ids: Optional[Iterable[int]] = None, session=None) -> List:
+        """(id, name, is_active, threshold, total) per product with one grouped query"""
+        session = session or db.session
+        total = func.coalesce(func.sum(case(
+            (InventoryBatch.status == 'active', InventoryBatch.qty_available), else_=0
+        )), 0)
+        query = select(
+            InventoryProduct.id, InventoryProduct.name, InventoryProduct.is_active,
+            func.coalesce(InventoryProduct.min_stock_level, LOW_STOCK_THRESHOLD), total
+        ).outerjoin(
+            InventoryBatch, InventoryBatch.product_id == InventoryProduct.id
+        ).group_by(InventoryProduct.id)
+        if product_ids is not None:
+            query = query.where(InventoryProduct.id.in_(list(product_ids)))
+        return session.execute(query).all()
+
+    @classmethod
+    def evaluate(cls, product_ids: Optional[Iterable[int]] = None, session=None,
+                 now: Optional[datetime] = None) -> Dict:
+        """
+        Bring open stock alerts in line with current stock for the given products (all
+        products when None): one INSERT for alerts that start, one UPDATE resolving alerts
+        that no longer apply, nothing for products whose state is unchanged. Does not commit.
+        """
+        session = session or db.session
+        now = now or datetime.utcnow()
+        if product_ids is not None:
+            product_ids = {product_id for product_id in product_ids if product_id}
+            if not product_ids:
+                return {'evaluated': 0, 'raised': 0, 'resolved': 0}
+
+        open_query = select(InventoryAlert.id, InventoryAlert.product_id, InventoryAlert.alert_type).where(
+            InventoryAlert.is_resolved == False,
+            InventoryAlert.alert_type.in_(STOCK_ALERT_TYPES)
+        ).order_by(InventoryAlert.id)
+        if product_ids is not None:
+            open_query = open_query.where(InventoryAlert.product_id.in_(list(product_ids)))
+        open_alerts: Dict[int, List] = {}
+        for alert_id, product_id, alert_type in session.execute(open_query).all():
+            open_alerts.setdefault(product_id, []).append((alert_id, alert_type))
+
+        levels = cls.stock_levels(product_ids, session)
+        raised = []
+        resolved = []
+        for product_id, name, is_active, threshold, total in levels:
+            total = float(total or 0)
+            wanted = cls.desired_state(total, float(threshold)) if is_active else None
+            kept = False
+            for alert_id, alert_type in open_alerts.pop(product_id, []):
+                if alert_type == wanted and not kept:
+                    kept = True
+                else:
+                    resolved.append(alert_id)
+            if wanted and not kept:
+                raised.append({
+                    'product_id': product_id,
+                    'alert_type': wanted,
+                    'message': (f'{name} is out of stock' if wanted == 'out_of_stock'
+                                else f'{name} is running low (Current: {total:g})'),
+                    'severity': 'critical' if wanted == 'out_of_stock' else 'high',
+                    'is_read': False,
+                    'is_resolved': False,
+                    'created_at': now
+                })
+        # Alerts left over belong to products that no longer exist
+        for alerts in open_alerts.values():
+            resolved.extend(alert_id for alert_id, _ in alerts)
+
+        if raised:
+            session.execute(insert(InventoryAlert), raised)
+        if resolved:
+            session.execute(
+                update(InventoryAlert).where(InventoryAlert.id.in_(resolved))
+                .values(is_resolved=True, resolved_at=now),
+                execution_options={'synchronize_session': False}
+            )
+        return {'evaluated': len(levels), 'raised': len(raised), 'resolved': len(resolved)}
+
+    @classmethod
+    def rebuild(cls) -> Dict:
+        """Nightly reconciliation of every product's stock alerts; commits"""
+        try:
+            result = cls.evaluate()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error rebuilding stock alerts: {e}")
+            raise
+        logger.info("Stock alert rebuild: %s", result)
+        return {'success': True, **result}
+
+    @classmethod
+    def low_stock_items(cls, include_out_of_stock: bool = False) -> List[Dict]:
+        """Products with an open stock alert, with their current totals, for the alerts pages"""
+        alert_types = STOCK_ALERT_TYPES if include_out_of_stock else ('low_stock',)
+        alerts = InventoryAlert.query.options(
+            joinedload(InventoryAlert.product).joinedload(InventoryProduct.category)
+        ).filter(
+            InventoryAlert.is_resolved == False,
+            InventoryAlert.alert_type.in_(alert_types)
+        ).order_by(InventoryAlert.created_at.desc()).all()
+
+        levels = {row[0]: row for row in cls.stock_levels({alert.product_id for alert in alerts})} if alerts else {}
+        items = []
+        for alert in alerts:
+            _, _, _, threshold, total = levels.get(alert.product_id, (None, None, None, LOW_STOCK_THRESHOLD, 0))
+            product = alert.product
+            items.append({
+                'alert_id': alert.id,
+                'alert_type': alert.alert_type,
+                'severity': alert.severity,
+                'product': product,
+                'product_id': alert.product_id,
+                'name': product.name,
+                'description': product.description,
+                'category': product.category.name if product.category else 'Uncategorized',
+                'current_stock': float(total or 0),
+                'min_stock_level': float(threshold),
+                'unit_of_measure': product.unit_of_measure,
+                'since': alert.created_at
+            })
+        return items
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_stock_changes(session, flush_context):
+    # History and the new/dirty/deleted collections still hold the pre-flush state here
+    StockAlertEvaluator.collect_touched(session)
+
+
+@event.listens_for(Session, 'before_commit')
+def _evaluate_stock_alerts(session):
+    if session.new or session.dirty or session.deleted:
+        session.flush()
+    product_ids = session.info.pop(TOUCHED_KEY, set())
+    if product_ids:
+        StockAlertEvaluator.evaluate(product_ids, session)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_stock_changes(session):
+    session.info.pop(TOUCHED_KEY, None)
@@ -0,0 +1,321 @@
+"""
+Inventory Transfer Engine
+Moves stock between locations. A full batch moves by re-pointing its location; a partial
+quantity is split into a batch at the destination (reused on later transfers). All lines
+of a transfer are validated with one read and applied in one transaction with bulk audit rows
+"""
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Dict, List, Optional
+from sqlalchemy import case, insert, update
+from app import db
+from .models import InventoryBatch, InventoryLocation, InventoryTransfer
+from .fefo_allocator import FefoAllocator
+from .audit_log import AuditLogWriter
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TransferValidationError(ValueError):
+    """Raised when a transfer line fails validation; nothing has been written"""
+
+
+@dataclass
+class TransferLine:
+    """One batch movement after validation"""
+    batch: InventoryBatch
+    quantity: float
+    source_location_id: Optional[str] = None
+    stock_before: float = 0.0
+    dest_batch_id: Optional[int] = None
+    dest_stock_before: float = 0.0
+    transfer_id: Optional[int] = None
+
+    @property
+    def is_full_move(self) -> bool:
+        return self.quantity >= self.stock_before
+
+
+@dataclass
+class TransferPlan:
+    reference: str
+    source_location_id: Optional[str]
+    dest_location_id: str
+    lines: List[TransferLine] = field(default_factory=list)
+
+
+def split_batch_name(batch_name: str, location_id: str) -> str:
+    """Name of the batch that holds a split of batch_name at location_id"""
+    suffix = f"@{location_id}"
+    return batch_name[:100 - len(suffix)] + suffix
+
+
+def generate_transfer_reference(now: Optional[datetime] = None) -> str:
+    return f"TRF-{(now or datetime.utcnow()).strftime('%Y%m%d%H%M%S%f')[:-3]}"
+
+
+class TransferEngine:
+    """Validates and applies multi-line transfers between InventoryLocations"""
+
+    @classmethod
+    def plan(cls, dest_location_id: str, items: List[Dict], source_location_id: Optional[str] = None,
+             reference: Optional[str] = None) -> TransferPlan:
+        """
+        Resolve transfer items into batch movements. An item is either
+        {'batch_id': id, 'quantity': q} (quantity omitted = whole batch) or
+        {'product_id': id, 'quantity': q}, which is picked FEFO at source_location_id.
+        """
+        if not items:
+            raise TransferValidationError('At least one transfer item is required')
+
+        locations = {location.id: location for location in InventoryLocation.query.filter(
+            InventoryLocation.id.in_({dest_location_id, source_location_id} - {None})
+        ).all()}
+        dest = locations.get(dest_location_id)
+        if not dest or dest.status != 'active':
+            raise TransferValidationError(f'Destination location {dest_location_id} not found or inactive')
+        if source_location_id and source_location_id not in locations:
+            raise TransferValidationError(f'Source location {source_location_id} not found')
+
+        plan = TransferPlan(reference or generate_transfer_reference(), source_location_id, dest_location_id)
+
+        # Every referenced batch (and FEFO candidate) in one locked read of the stock ledger
+        batch_ids = {int(item['batch_id']) for item in items if item.get('batch_id')}
+        batches = {batch.id: batch for batch in InventoryBatch.query.filter(
+            InventoryBatch.id.in_(batch_ids)
+        ).with_for_update().all()} if batch_ids else {}
+
+        product_items = [item for item in items if not item.get('batch_id')]
+        if product_items and not source_location_id:
+            raise TransferValidationError('A source location is required to transfer by product')
+        candidates = FefoAllocator.candidates(
+            (int(item['product_id']) for item in product_items), location_id=source_location_id
+        ) if product_items else {}
+
+        requested: Dict[int, float] = {}
+        today = date.today()
+        for item in items:
+            if item.get('batch_id'):
+                batch = batches.get(int(item['batch_id']))
+                if not batch:
+                    raise TransferValidationError(f'Batch {item["batch_id"]} not found')
+                quantity = float(item['quantity']) if item.get('quantity') else float(batch.qty_available or 0)
+                allocations = [(batch, quantity)]
+            else:
+                if not item.get('product_id') or not item.get('quantity'):
+                    raise TransferValidationError('Each item needs a batch_id, or a product_id and quantity')
+                planned, shortfall = FefoAllocator.plan(candidates.get(int(item['product_id']), []),
+                                                        float(item['quantity']), requested)
+                if shortfall:
+                    raise TransferValidationError(
+                        f'Insufficient stock for product {item["product_id"]} at {source_location_id}. '
+                        f'Short by {shortfall}'
+                    )
+                allocations = [(allocation.batch, allocation.quantity) for allocation in planned]
+
+            for batch, quantity in allocations:
+                cls._validate_line(batch, quantity, requested.get(batch.id, 0), plan, today)
+                requested[batch.id] = requested.get(batch.id, 0) + quantity
+                plan.lines.append(TransferLine(batch, quantity))
+
+        # Lines on the same batch are applied as one movement
+        merged: Dict[int, TransferLine] = {}
+        for line in plan.lines:
+            if line.batch.id in merged:
+                merged[line.batch.id].quantity += line.quantity
+            else:
+                merged[line.batch.id] = line
+        plan.lines = list(merged.values())
+        for line in plan.lines:
+            line.source_location_id = line.batch.location_id
+            line.stock_before = float(line.batch.qty_available or 0)
+        return plan
+
+    @staticmethod
+    def _validate_line(batch: InventoryBatch, quantity: float, already_requested: float,
+                       plan: TransferPlan, today: date) -> None:
+        if quantity <= 0:
+            raise TransferValidationError(f'Quantity for batch {batch.batch_name} must be positive')
+        if batch.status != 'active':
+            raise TransferValidationError(f'Batch {batch.batch_name} is {batch.status}')
+        if batch.expiry_date and batch.expiry_date < today:
+            raise TransferValidationError(f'Cannot transfer expired batch {batch.batch_name}')
+        if not batch.product_id:
+            raise TransferValidationError(f'Batch {batch.batch_name} has no product assigned')
+        if batch.location_id == plan.dest_location_id:
+            raise TransferValidationError(f'Batch {batch.batch_name} is already at {plan.dest_location_id}')
+        if plan.source_location_id and batch.location_id != plan.source_location_id:
+            raise TransferValidationError(f'Batch {batch.batch_name} is not at {plan.source_location_id}')
+        available = float(batch.qty_available or 0)
+        if already_requested + quantity > available:
+            raise TransferValidationError(
+                f'Insufficient stock in batch {batch.batch_name}. '
+                f'Available: {available}, Required: {already_requested + quantity}'
+            )
+
+    @classmethod
+    def apply(cls, plan: TransferPlan, user_id: Optional[int] = None, notes: Optional[str] = None) -> Dict:
+        """
+        Write a validated plan with a fixed number of statements: one guarded bulk decrement,
+        one relocation UPDATE, one increment and one INSERT for split batches, one INSERT of
+        transfer rows and one of audit rows. Nothing is committed here.
+        """
+        now = datetime.utcnow()
+        full_moves = [line for line in plan.lines if line.is_full_move]
+        splits = [line for line in plan.lines if not line.is_full_move]
+
+        if splits:
+            cls._decrement_sources(splits, now)
+
+        if full_moves:
+            db.session.execute(update(InventoryBatch), [
+                {'id': line.batch.id, 'location_id': plan.dest_location_id, 'updated_at': now}
+                for line in full_moves
+            ])
+            for line in full_moves:
+                line.dest_batch_id = line.batch.id
+
+        if splits:
+            cls._receive_splits(splits, plan.dest_location_id, now)
+
+        transfer_ids = db.session.scalars(
+            insert(InventoryTransfer).returning(InventoryTransfer.id, sort_by_parameter_order=True),
+            [{
+                'source_batch_id': line.batch.id,
+                'dest_batch_id': line.dest_batch_id,
+                'dest_location_id': plan.dest_location_id,
+                'source_location_id': line.source_location_id,
+                'reference': plan.reference,
+                'quantity': line.quantity,
+                'notes': notes,
+                'created_by': user_id,
+                'created_at': now
+            } for line in plan.lines]
+        ).all()
+
+        with AuditLogWriter() as audit:
+            for line, transfer_id in zip(plan.lines, transfer_ids):
+                line.transfer_id = transfer_id
+                product_id = line.batch.product_id
+                audit.record(line.batch.id, user_id, 'transfer_out', -line.quantity, line.stock_before,
+                             line.stock_before - line.quantity, reference_type='transfer',
+                             reference=transfer_id, notes=f'{plan.reference} to {plan.dest_location_id}',
+                             product_id=product_id)
+                audit.record(line.dest_batch_id, user_id, 'transfer_in', line.quantity,
+                             line.dest_stock_before, line.dest_stock_before + line.quantity,
+                             reference_type='transfer', reference=transfer_id,
+                             notes=f'{plan.reference} from {line.source_location_id or "unassigned"}',
+                             product_id=product_id)
+
+        # Relocated batches were changed with Core statements; drop stale loaded state
+        for line in full_moves:
+            db.session.expire(line.batch, ['location_id', 'updated_at'])
+
+        return {
+            'reference': plan.reference,
+            'dest_location_id': plan.dest_location_id,
+            'lines': len(plan.lines),
+            'batches_relocated': len(full_moves),
+            'batches_split': len(splits),
+            'total_quantity': round(sum(line.quantity for line in plan.lines), 2),
+            'transfers': [{
+                'transfer_id': line.transfer_id,
+                'source_batch_id': line.batch.id,
+                'dest_batch_id': line.dest_batch_id,
+                'quantity': line.quantity
+            } for line in plan.lines]
+        }
+
+    @staticmethod
+    def _decrement_sources(lines: List[TransferLine], now: datetime) -> None:
+        """One UPDATE for every partial line; it must match every row or the transfer is stale"""
+        quantities = {line.batch.id: line.quantity for line in lines}
+        requested = case(quantities, value=InventoryBatch.id)
+        matched = db.session.execute(
+            update(InventoryBatch).where(
+                InventoryBatch.id.in_(quantities),
+                InventoryBatch.qty_available >= requested
+            ).values(qty_available=InventoryBatch.qty_available - requested, updated_at=now),
+            execution_options={'synchronize_session': False}
+        ).rowcount
+        if matched != len(quantities):
+            raise TransferValidationError('Stock changed while the transfer was being applied; please retry')
+        for line in lines:
+            db.session.expire(line.batch, ['qty_available', 'updated_at'])
+
+    @staticmethod
+    def _receive_splits(lines: List[TransferLine], dest_location_id: str, now: datetime) -> None:
+        """Top up existing split batches at the destination and create the missing ones"""
+        names = {split_batch_name(line.batch.batch_name, dest_location_id): line for line in lines}
+        existing = {batch.batch_name: batch for batch in InventoryBatch.query.filter(
+            InventoryBatch.batch_name.in_(names)
+        ).all()}
+
+        top_ups = {}
+        new_rows = []
+        for name, line in names.items():
+            batch = existing.get(name)
+            if batch is not None:
+                if batch.product_id != line.batch.product_id or batch.location_id != dest_location_id:
+                    raise TransferValidationError(f'Batch name {name} is already used by another batch')
+                line.dest_batch_id = batch.id
+                line.dest_stock_before = float(batch.qty_available or 0)
+                top_ups[batch.id] = line.quantity
+            else:
+                line.dest_stock_before = 0.0
+                source = line.batch
+                new_rows.append({
+                    'batch_name': name,
+                    'created_date': now.date(),
+                    'mfg_date': source.mfg_date,
+                    'expiry_date': source.expiry_date,
+                    'product_id': source.product_id,
+                    'location_id': dest_location_id,
+                    'qty_available': line.quantity,
+                    'unit_cost': source.unit_cost,
+                    'selling_price': source.selling_price,
+                    'status': 'active',
+                    'created_at': now,
+                    'updated_at': now
+                })
+
+        if top_ups:
+            db.session.execute(
+                update(InventoryBatch).where(InventoryBatch.id.in_(top_ups)).values(
+                    qty_available=InventoryBatch.qty_available + case(top_ups, value=InventoryBatch.id),
+                    updated_at=now
+                ),
+                execution_options={'synchronize_session': False}
+            )
+            for batch in existing.values():
+                db.session.expire(batch, ['qty_available', 'updated_at'])
+
+        if new_rows:
+            created = db.session.execute(
+                insert(InventoryBatch).returning(InventoryBatch.id, InventoryBatch.batch_name,
+                                                 sort_by_parameter_order=True),
+                new_rows
+            ).all()
+            for batch_id, batch_name in created:
+                names[batch_name].dest_batch_id = batch_id
+
+    @classmethod
+    def transfer(cls, dest_location_id: str, items: List[Dict], source_location_id: Optional[str] = None,
+                 user_id: Optional[int] = None, notes: Optional[str] = None,
+                 reference: Optional[str] = None) -> Dict:
+        """Plan, apply and commit a transfer; returns {'success': False, 'error': ...} on failure"""
+        try:
+            plan = cls.plan(dest_location_id, items, source_location_id=source_location_id, reference=reference)
+            result = cls.apply(plan, user_id=user_id, notes=notes)
+            db.session.commit()
+        except TransferValidationError as e:
+            db.session.rollback()
+            return {'success': False, 'error': str(e)}
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error applying inventory transfer: {e}")
+            return {'success': False, 'error': str(e)}
+
+        logger.info("Inventory transfer %s: %s lines to %s", result['reference'], result['lines'], dest_location_id)
+        return {'success': True, **result}
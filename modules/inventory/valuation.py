@@ -0,0 +1,240 @@
+"""
+Inventory Valuation Engine
+Values stock on hand by product, category or location entirely in SQL aggregates. Batch
+cost values each batch at its own unit cost; FIFO and weighted average derive cost layers
+from the audit log (a batch's opening stock plus every receipt), and any date in the past
+is valued by rolling batch quantities back through the audit entries made after it
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional
+from sqlalchemy import case, func, literal, select, union_all
+from app import db
+from .models import (
+    InventoryAuditLog, InventoryBatch, InventoryCategory, InventoryLocation, InventoryProduct
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+METHODS = ('batch_cost', 'fifo', 'weighted_average')
+DIMENSIONS = ('product', 'category', 'location')
+
+# Movements between locations are not purchases and never open a cost layer
+TRANSFER_ACTIONS = ('transfer_in', 'transfer_out')
+
+
+def _cutoff(as_of: Optional[date]) -> Optional[datetime]:
+    """Start of the day after as_of; entries at or after it happened after the close"""
+    if as_of is None:
+        return None
+    return datetime.combine(as_of + timedelta(days=1), datetime.min.time())
+
+
+class InventoryValuation:
+    """Set-based stock valuation; every method returns plain rows, no ORM objects are loaded"""
+
+    @staticmethod
+    def positions(cutoff: Optional[datetime] = None):
+        """Subquery: quantity on hand per batch at the cutoff (now when None), with its dimensions"""
+        quantity = InventoryBatch.qty_available
+        query = select(
+            InventoryBatch.id.label('batch_id'),
+            InventoryBatch.product_id.label('product_id'),
+            InventoryProduct.category_id.label('category_id'),
+            InventoryBatch.location_id.label('location_id'),
+            func.coalesce(InventoryBatch.unit_cost, 0).label('unit_cost')
+        ).join(InventoryProduct, InventoryProduct.id == InventoryBatch.product_id)
+
+        if cutoff is not None:
+            later = select(
+                InventoryAuditLog.batch_id, func.sum(InventoryAuditLog.quantity_delta).label('delta')
+            ).where(InventoryAuditLog.timestamp >= cutoff).group_by(InventoryAuditLog.batch_id).subquery()
+            quantity = InventoryBatch.qty_available - func.coalesce(later.c.delta, 0)
+            query = query.outerjoin(later, later.c.batch_id == InventoryBatch.id).where(
+                InventoryBatch.created_at < cutoff
+            )
+        return query.add_columns(quantity.label('quantity')).where(quantity > 0).subquery('positions')
+
+    @staticmethod
+    def layers(positions, cutoff: Optional[datetime] = None):
+        """
+        Subquery of cost layers (product, received_at, quantity, unit_cost): each batch's
+        opening stock (stock_before of its first audit entry, or its whole quantity when it
+        has none) plus every non-transfer receipt into it up to the cutoff.
+        """
+        logged = [InventoryAuditLog.timestamp < cutoff] if cutoff is not None else []
+        first_entry = select(
+            InventoryAuditLog.batch_id, func.min(InventoryAuditLog.id).label('first_id')
+        ).where(*logged).group_by(InventoryAuditLog.batch_id).subquery()
+        first_log = InventoryAuditLog.__table__.alias('first_log')
+
+        opening = select(
+            InventoryBatch.product_id,
+            InventoryBatch.created_at.label('received_at'),
+            (InventoryBatch.id * 2).label('layer_id'),
+            func.coalesce(first_log.c.stock_before, positions.c.quantity, 0).label('quantity'),
+            func.coalesce(InventoryBatch.unit_cost, 0).label('unit_cost')
+        ).outerjoin(
+            first_entry, first_entry.c.batch_id == InventoryBatch.id
+        ).outerjoin(
+            first_log, first_log.c.id == first_entry.c.first_id
+        ).outerjoin(
+            positions, positions.c.batch_id == InventoryBatch.id
+        ).where(InventoryBatch.product_id.isnot(None))
+        if cutoff is not None:
+            opening = opening.where(InventoryBatch.created_at < cutoff)
+
+        receipts = select(
+            InventoryBatch.product_id,
+            InventoryAuditLog.timestamp.label('received_at'),
+            (InventoryAuditLog.id * 2 + 1).label('layer_id'),
+            InventoryAuditLog.quantity_delta.label('quantity'),
+            func.coalesce(InventoryBatch.unit_cost, 0).label('unit_cost')
+        ).join(InventoryBatch, InventoryBatch.id == InventoryAuditLog.batch_id).where(
+            InventoryAuditLog.quantity_delta > 0,
+            InventoryAuditLog.action_type.notin_(TRANSFER_ACTIONS),
+            *logged
+        )
+        return union_all(opening, receipts).subquery('layers')
+
+    @classmethod
+    def unit_costs(cls, method: str, positions, cutoff: Optional[datetime] = None):
+        """Subquery: one unit cost per product under the method (fifo / weighted_average)"""
+        on_hand = select(
+            positions.c.product_id,
+            func.sum(positions.c.quantity).label('on_hand'),
+            (func.sum(positions.c.quantity * positions.c.unit_cost)
+             / func.sum(positions.c.quantity)).label('batch_average')
+        ).group_by(positions.c.product_id).subquery('on_hand')
+        layers = cls.layers(positions, cutoff)
+
+        if method == 'weighted_average':
+            averages = select(
+                layers.c.product_id,
+                (func.sum(layers.c.quantity * layers.c.unit_cost)
+                 / func.nullif(func.sum(layers.c.quantity), 0)).label('average')
+            ).group_by(layers.c.product_id).subquery('averages')
+            return select(
+                on_hand.c.product_id,
+                func.coalesce(averages.c.average, on_hand.c.batch_average).label('unit_cost')
+            ).outerjoin(averages, averages.c.product_id == on_hand.c.product_id).subquery('unit_costs')
+
+        # FIFO: stock on hand is made of the newest layers, so walk them newest first
+        newer_inclusive = func.sum(layers.c.quantity).over(
+            partition_by=layers.c.product_id,
+            order_by=(layers.c.received_at.desc(), layers.c.layer_id.desc())
+        )
+        ranked = select(
+            layers.c.product_id, layers.c.quantity, layers.c.unit_cost,
+            newer_inclusive.label('newer_inclusive')
+        ).subquery('ranked')
+        still_needed = on_hand.c.on_hand - (ranked.c.newer_inclusive - ranked.c.quantity)
+        taken = case(
+            (still_needed <= 0, literal(0)),
+            (still_needed >= ranked.c.quantity, ranked.c.quantity),
+            else_=still_needed
+        )
+        fifo = select(
+            ranked.c.product_id,
+            func.sum(taken * ranked.c.unit_cost).label('value'),
+            func.sum(taken).label('covered')
+        ).join(on_hand, on_hand.c.product_id == ranked.c.product_id).group_by(ranked.c.product_id).subquery('fifo')
+
+        # Stock the log cannot explain (edits outside it) is valued at its batch cost
+        uncovered = on_hand.c.on_hand - func.coalesce(fifo.c.covered, 0)
+        return select(
+            on_hand.c.product_id,
+            ((func.coalesce(fifo.c.value, 0) + uncovered * on_hand.c.batch_average)
+             / on_hand.c.on_hand).label('unit_cost')
+        ).outerjoin(fifo, fifo.c.product_id == on_hand.c.product_id).subquery('unit_costs')
+
+    @classmethod
+    def valuation(cls, method: str = 'batch_cost', group_by: str = 'product',
+                  as_of: Optional[date] = None) -> Dict:
+        """
+        Quantity and value on hand per product, category or location, at the end of as_of
+        (now when None). Under FIFO and weighted average a product has one unit cost, so
+        its value splits across locations in proportion to quantity.
+        """
+        if method not in METHODS:
+            raise ValueError(f"Unknown valuation method '{method}'. Expected one of: {', '.join(METHODS)}")
+        if group_by not in DIMENSIONS:
+            raise ValueError(f"Unknown grouping '{group_by}'. Expected one of: {', '.join(DIMENSIONS)}")
+
+        cutoff = _cutoff(as_of)
+        positions = cls.positions(cutoff)
+        if method == 'batch_cost':
+            value = func.sum(positions.c.quantity * positions.c.unit_cost)
+            source = positions
+        else:
+            unit_costs = cls.unit_costs(method, positions, cutoff)
+            value = func.sum(positions.c.quantity * unit_costs.c.unit_cost)
+            source = positions.join(unit_costs, unit_costs.c.product_id == positions.c.product_id)
+
+        totals = [func.sum(positions.c.quantity).label('quantity'), value.label('value'),
+                  func.count(positions.c.batch_id).label('batches')]
+        if group_by == 'product':
+            query = select(
+                positions.c.product_id.label('id'), InventoryProduct.name, InventoryProduct.sku, *totals
+            ).select_from(source).join(
+                InventoryProduct, InventoryProduct.id == positions.c.product_id
+            ).group_by(positions.c.product_id, InventoryProduct.name, InventoryProduct.sku)
+        elif group_by == 'category':
+            query = select(
+                positions.c.category_id.label('id'), InventoryCategory.name, *totals
+            ).select_from(source).outerjoin(
+                InventoryCategory, InventoryCategory.id == positions.c.category_id
+            ).group_by(positions.c.category_id, InventoryCategory.name)
+        else:
+            query = select(
+                positions.c.location_id.label('id'), InventoryLocation.name, *totals
+            ).select_from(source).outerjoin(
+                InventoryLocation, InventoryLocation.id == positions.c.location_id
+            ).group_by(positions.c.location_id, InventoryLocation.name)
+
+        rows = []
+        for row in db.session.execute(query.order_by(value.desc())).mappings():
+            quantity = float(row['quantity'] or 0)
+            item = {
+                'id': row['id'],
+                'name': row['name'] or ('Unassigned' if group_by == 'location' else 'Uncategorized'),
+                'quantity': round(quantity, 2),
+                'value': round(float(row['value'] or 0), 2),
+                'unit_cost': round(float(row['value'] or 0) / quantity, 4) if quantity else 0.0,
+                'batches': row['batches']
+            }
+            if group_by == 'product':
+                item['sku'] = row['sku']
+            rows.append(item)
+
+        return {
+            'method': method,
+            'group_by': group_by,
+            'as_of': (as_of or date.today()).isoformat(),
+            'total_quantity': round(sum(row['quantity'] for row in rows), 2),
+            'total_value': round(sum(row['value'] for row in rows), 2),
+            'rows': rows
+        }
+
+    @classmethod
+    def total_value(cls, location_id: Optional[str] = None, active_only: bool = False) -> float:
+        """Current stock value at batch cost, optionally for one location or active batches only"""
+        query = select(func.coalesce(func.sum(
+            InventoryBatch.qty_available * func.coalesce(InventoryBatch.unit_cost, 0)
+        ), 0)).where(InventoryBatch.qty_available > 0)
+        if location_id:
+            query = query.where(InventoryBatch.location_id == location_id)
+        if active_only:
+            query = query.where(InventoryBatch.status == 'active')
+        return float(db.session.execute(query).scalar() or 0)
+
+    @classmethod
+    def by_location(cls) -> Dict[str, Dict]:
+        """Batches in stock and value at batch cost per location id, from one grouped query"""
+        rows = db.session.execute(select(
+            InventoryBatch.location_id,
+            func.count(InventoryBatch.id),
+            func.sum(InventoryBatch.qty_available * func.coalesce(InventoryBatch.unit_cost, 0))
+        ).where(InventoryBatch.qty_available > 0).group_by(InventoryBatch.location_id)).all()
+        return {location_id: {'batches': batches, 'value': float(value or 0)}
+                for location_id, batches, value in rows}
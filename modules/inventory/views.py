@@ -1,8 +1,13 @@
 from flask import render_template, request, jsonify, flash, redirect, url_for
 from flask_login import login_required, current_user
 from app import app, db
+from services.query_budget import query_budget
 from .models import InventoryProduct, InventoryCategory, InventoryLocation, InventoryBatch, InventoryAdjustment, InventoryConsumption, InventoryTransfer
 from .queries import *
+from .audit_log import AuditLogWriter
+from .transfer_engine import TransferEngine
+from .expiry_timeline import ExpiryTimeline, EXPIRY_WARNING_DAYS
+from .valuation import InventoryValuation
 from datetime import datetime, date
 import json
 
@@ -48,6 +53,7 @@ def api_get_products_master():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/inventory/products', methods=['GET'])
+@query_budget(3)
 @login_required
 def api_get_products():
     """Get all products - BATCH-CENTRIC"""
@@ -224,6 +230,7 @@ def api_get_locations():
     """Get all locations"""
     try:
         locations = get_all_locations()
+        stock = InventoryValuation.by_location()
         return jsonify({
             'locations': [{
                 'id': l.id,
@@ -233,8 +240,8 @@ def api_get_locations():
                 'contact_person': l.contact_person,
                 'phone': l.phone,
                 'status': l.status,
-                'total_products': l.total_batches,
-                'total_stock_value': l.total_stock_value
+                'total_products': stock.get(l.id, {}).get('batches', 0),
+                'total_stock_value': stock.get(l.id, {}).get('value', 0.0)
             } for l in locations]
         })
     except Exception as e:
@@ -281,12 +288,16 @@ def api_create_location():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/inventory/batches', methods=['GET'])
+@query_budget(2)
 @login_required
 def api_get_batches():
     """Get all batches"""
     try:
         from .models import InventoryBatch
-        batches = InventoryBatch.query.all()
+        from sqlalchemy.orm import joinedload
+        batches = InventoryBatch.query.options(
+            joinedload(InventoryBatch.product), joinedload(InventoryBatch.location)
+        ).all()
         return jsonify({
             'batches': [{
                 'id': b.id,
@@ -372,79 +383,100 @@ def api_create_batch():
 @app.route('/api/inventory/adjustments', methods=['POST'])
 @login_required
 def api_create_adjustment():
-    """Create inventory adjustment and assign product/location to batch if needed"""
+    """Create inventory adjustments (one or many lines, e.g. a stock take) and assign product/location to batches if needed"""
     try:
         data = request.get_json()
 
-        # Handle both single item and items array structures
         if 'items' in data and data['items']:
-            # New structure with items array
-            item = data['items'][0]  # Get first item
-            batch_id = item.get('batch_id')
-            quantity = float(item.get('quantity_in', 0))
-            unit_cost = float(item.get('unit_cost', 0))
-            product_id = item.get('product_id')
-            location_id = item.get('location_id')
-            adjustment_type = item.get('adjustment_type', 'add')
+            # New structure with items array; every line is applied in one transaction
+            lines = [{
+                'batch_id': item.get('batch_id'),
+                'quantity': float(item.get('quantity_in', 0)),
+                'unit_cost': float(item.get('unit_cost', 0)),
+                'product_id': item.get('product_id'),
+                'location_id': item.get('location_id'),
+                'adjustment_type': item.get('adjustment_type', 'add'),
+                'notes': item.get('notes') or data.get('notes', '')
+            } for item in data['items']]
         else:
             # Direct structure
-            batch_id = data.get('batch_id')
-            quantity = float(data.get('quantity', 0))
-            unit_cost = float(data.get('unit_cost', 0))
-            product_id = data.get('product_id')
-            location_id = data.get('location_id')
-            adjustment_type = data.get('adjustment_type', 'add')
+            lines = [{
+                'batch_id': data.get('batch_id'),
+                'quantity': float(data.get('quantity', 0)),
+                'unit_cost': float(data.get('unit_cost', 0)),
+                'product_id': data.get('product_id'),
+                'location_id': data.get('location_id'),
+                'adjustment_type': data.get('adjustment_type', 'add'),
+                'notes': data.get('notes', '')
+            }]
 
         # Validate required fields
-        if not batch_id:
-            return jsonify({'error': 'Batch is required'}), 400
-        if quantity <= 0:
-            return jsonify({'error': 'Quantity must be positive'}), 400
-        if adjustment_type not in ['add', 'remove']:
-            return jsonify({'error': 'Invalid adjustment type'}), 400
-
-        batch = InventoryBatch.query.get(batch_id)
-        if not batch:
-            return jsonify({'error': 'Batch not found'}), 404
-
-        # Additional validation for remove operations
-        if adjustment_type == 'remove':
+        for line in lines:
+            if not line['batch_id']:
+                return jsonify({'error': 'Batch is required'}), 400
+            if line['quantity'] <= 0:
+                return jsonify({'error': 'Quantity must be positive'}), 400
+            if line['adjustment_type'] not in ['add', 'remove']:
+                return jsonify({'error': 'Invalid adjustment type'}), 400
+
+        batches = {batch.id: batch for batch in InventoryBatch.query.filter(
+            InventoryBatch.id.in_({int(line['batch_id']) for line in lines})
+        ).all()}
+
+        audit = AuditLogWriter()
+        for line in lines:
+            batch = batches.get(int(line['batch_id']))
+            if not batch:
+                db.session.rollback()
+                return jsonify({'error': 'Batch not found'}), 404
+
+            quantity = line['quantity']
+            adjustment_type = line['adjustment_type']
             current_stock = float(batch.qty_available or 0)
-            if quantity > current_stock:
+
+            # Additional validation for remove operations
+            if adjustment_type == 'remove' and quantity > current_stock:
+                db.session.rollback()
                 return jsonify({'error': f'Cannot remove {quantity}. Only {current_stock} available in stock.'}), 400
 
-        # Assign product and location to batch if provided and not already assigned
-        if product_id and not batch.product_id:
-            batch.product_id = int(product_id)
+            # Assign product and location to batch if provided and not already assigned
+            if line['product_id'] and not batch.product_id:
+                batch.product_id = int(line['product_id'])
 
-        if location_id and not batch.location_id:
-            batch.location_id = str(location_id)
+            if line['location_id'] and not batch.location_id:
+                batch.location_id = str(line['location_id'])
 
-        adjustment = InventoryAdjustment(
-            batch_id=batch_id,
-            adjustment_type=adjustment_type,
-            quantity=quantity,
-            remarks=data.get('notes', '') or f'Stock {adjustment_type} via inventory management',
-            created_by=None  # No user tracking for now
-        )
+            remarks = line['notes'] or f'Stock {adjustment_type} via inventory management'
+            adjustment = InventoryAdjustment(
+                batch_id=batch.id,
+                adjustment_type=adjustment_type,
+                quantity=quantity,
+                remarks=remarks,
+                created_by=current_user.id
+            )
 
-        # Update batch quantity based on adjustment type
-        if adjustment_type == 'add':
-            batch.qty_available = float(batch.qty_available or 0) + quantity
-            if unit_cost > 0:
-                batch.unit_cost = unit_cost
-        else:  # remove
-            batch.qty_available = float(batch.qty_available or 0) - quantity
-            # Ensure qty_available doesn't go negative
-            if batch.qty_available < 0:
-                batch.qty_available = 0
-
-        db.session.add(adjustment)
+            # Update batch quantity based on adjustment type
+            if adjustment_type == 'add':
+                batch.qty_available = current_stock + quantity
+                if line['unit_cost'] > 0:
+                    batch.unit_cost = line['unit_cost']
+            else:  # remove
+                batch.qty_available = current_stock - quantity
+
+            db.session.add(adjustment)
+            audit.record(batch, current_user.id, f'adjustment_{adjustment_type}',
+                         quantity if adjustment_type == 'add' else -quantity,
+                         current_stock, float(batch.qty_available),
+                         reference_type='adjustment', reference=adjustment, notes=remarks)
+
+        # Adjustments, stock changes and their audit rows commit together
+        audit.flush()
         db.session.commit()
 
         return jsonify({
             'success': True,
-            'message': 'Inventory adjustment created successfully'
+            'message': 'Inventory adjustment created successfully',
+            'adjustments_created': len(lines)
         })
     except Exception as e:
         db.session.rollback()
@@ -593,6 +625,151 @@ def api_create_consumption():
 
 # ============ BATCH-CENTRIC ADJUSTMENT ENDPOINTS ============
 
+# ============ LOCATION TRANSFER ENDPOINTS ============
+
+@app.route('/api/inventory/transfers', methods=['GET'])
+@login_required
+def api_get_transfers():
+    """Get transfer lines, newest first, optionally for one transfer reference"""
+    try:
+        query = InventoryTransfer.query.options(
+            db.joinedload(InventoryTransfer.source_batch),
+            db.joinedload(InventoryTransfer.dest_batch)
+        )
+        if request.args.get('reference'):
+            query = query.filter(InventoryTransfer.reference == request.args['reference'])
+        transfers = query.order_by(desc(InventoryTransfer.created_at), InventoryTransfer.id).limit(
+            min(request.args.get('limit', 100, type=int), 500)
+        ).all()
+
+        return jsonify([{
+            'id': t.id,
+            'reference': t.reference,
+            'source_batch_id': t.source_batch_id,
+            'source_batch_name': t.source_batch.batch_name if t.source_batch else '',
+            'dest_batch_id': t.dest_batch_id,
+            'dest_batch_name': t.dest_batch.batch_name if t.dest_batch else '',
+            'source_location_id': t.source_location_id,
+            'dest_location_id': t.dest_location_id,
+            'quantity': float(t.quantity),
+            'notes': t.notes or '',
+            'created_at': t.created_at.isoformat() if t.created_at else None
+        } for t in transfers])
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/inventory/transfers', methods=['POST'])
+@login_required
+def api_create_transfer():
+    """
+    Move stock to another location. items: [{batch_id, quantity?}] or
+    [{product_id, quantity}] picked FEFO at from_location_id; all lines apply together.
+    """
+    try:
+        data = request.get_json() or {}
+        if not data.get('to_location_id'):
+            return jsonify({'error': 'Destination location is required'}), 400
+
+        result = TransferEngine.transfer(
+            dest_location_id=str(data['to_location_id']),
+            items=data.get('items') or [],
+            source_location_id=str(data['from_location_id']) if data.get('from_location_id') else None,
+            user_id=current_user.id,
+            notes=data.get('notes')
+        )
+        if not result['success']:
+            return jsonify({'error': result['error']}), 400
+        return jsonify(result)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/inventory/alerts', methods=['GET'])
+@login_required
+def api_get_stock_alerts():
+    """Open low / out-of-stock alerts with current stock levels"""
+    try:
+        include_out_of_stock = request.args.get('include_out_of_stock', 'true').lower() != 'false'
+        items = StockAlertEvaluator.low_stock_items(include_out_of_stock=include_out_of_stock)
+        return jsonify([{
+            'alert_id': item['alert_id'],
+            'alert_type': item['alert_type'],
+            'severity': item['severity'],
+            'product_id': item['product_id'],
+            'product_name': item['name'],
+            'category': item['category'],
+            'current_stock': item['current_stock'],
+            'min_stock_level': item['min_stock_level'],
+            'unit_of_measure': item['unit_of_measure'],
+            'since': item['since'].isoformat() if item['since'] else None
+        } for item in items])
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/inventory/alerts/rebuild', methods=['POST'])
+@login_required
+def api_rebuild_stock_alerts():
+    """Reconcile every product's stock alerts with current batch totals"""
+    if not current_user.can_access('inventory'):
+        return jsonify({'error': 'Access denied'}), 403
+    try:
+        return jsonify(StockAlertEvaluator.rebuild())
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/inventory/expiry/timeline', methods=['GET'])
+@login_required
+def api_get_expiry_timeline():
+    """Expiring quantity and value per week or month, by product and location"""
+    try:
+        product_ids = [int(p) for p in request.args.get('product_ids', '').split(',') if p.strip()]
+        return jsonify(ExpiryTimeline.timeline(
+            granularity=request.args.get('granularity', 'week'),
+            horizon_days=int(request.args.get('horizon_days', 90)),
+            location_id=request.args.get('location_id') or None,
+            product_ids=product_ids or None,
+            include_expired=request.args.get('include_expired', 'true').lower() != 'false'
+        ))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/inventory/expiry/purchase-plan', methods=['GET'])
+@login_required
+def api_get_expiry_purchase_plan():
+    """Products whose stock left after upcoming expiries falls to or below their minimum level"""
+    try:
+        return jsonify(ExpiryTimeline.purchase_plan(
+            horizon_days=int(request.args.get('horizon_days', EXPIRY_WARNING_DAYS)),
+            location_id=request.args.get('location_id') or None
+        ))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/inventory/valuation', methods=['GET'])
+@login_required
+def api_get_inventory_valuation():
+    """
+    Stock value by product, category or location. method: batch_cost, fifo or
+    weighted_average; as_of (YYYY-MM-DD) values stock as at the end of that day.
+    """
+    if not current_user.can_access('inventory'):
+        return jsonify({'error': 'Access denied'}), 403
+    try:
+        as_of = request.args.get('as_of')
+        return jsonify(InventoryValuation.valuation(
+            method=request.args.get('method', 'batch_cost'),
+            group_by=request.args.get('group_by', 'product'),
+            as_of=datetime.strptime(as_of, '%Y-%m-%d').date() if as_of else None
+        ))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/inventory/adjustments', methods=['GET'])
 @login_required  
 def api_get_adjustments():
@@ -777,6 +954,7 @@ def api_update_batch(batch_id):
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/products', methods=['GET'])
+@query_budget(3)
 @login_required
 def api_get_products_simple():
     """Simple products API endpoint"""
@@ -4,6 +4,7 @@ New Package Management Views - Separate endpoints for each package type
 from flask import render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
 from app import app, db
+from services.query_budget import query_budget
 from models import Service, ServicePackage, ServicePackageAssignment, Customer, PrepaidPackage, Membership # Added missing imports
 from .new_packages_queries import (
     # Statistics
@@ -116,6 +117,7 @@ def customer_packages():
 # ========================================
 
 @app.route('/api/prepaid-packages', methods=['GET'])
+@query_budget(2)
 @login_required
 def api_get_prepaid_packages():
     """Get all prepaid packages"""
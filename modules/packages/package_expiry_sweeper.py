@@ -0,0 +1,122 @@
+"""
+Package Expiry Sweeper
+Set-based status maintenance for customer packages, package assignments and benefit
+trackers, so read paths can trust the stored status instead of re-checking dates
+"""
+from datetime import datetime
+from typing import Dict, Optional
+from sqlalchemy import and_, exists, or_, select, update
+from app import db
+from models import (
+    CustomerPackage, CustomerPackageItem, ServicePackageAssignment, PackageBenefitTracker
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PackageExpirySweeper:
+    """Flips expired and exhausted packages with one UPDATE per rule"""
+
+    @staticmethod
+    def _execute(statement) -> int:
+        return db.session.execute(statement, execution_options={'synchronize_session': False}).rowcount or 0
+
+    @classmethod
+    def sweep_customer_packages(cls, now: datetime) -> Dict[str, int]:
+        """Expire customer packages past expires_on and complete those with no sessions left"""
+        expired = cls._execute(
+            update(CustomerPackage).where(
+                CustomerPackage.status.in_(['active', 'paused']),
+                CustomerPackage.expires_on < now
+            ).values(status='expired', updated_at=now)
+        )
+
+        has_items = exists().where(CustomerPackageItem.customer_package_id == CustomerPackage.id)
+        has_remaining = exists().where(
+            CustomerPackageItem.customer_package_id == CustomerPackage.id,
+            CustomerPackageItem.used_qty < CustomerPackageItem.total_qty
+        )
+        # Value-type packages carry no items, so only itemised packages can run out
+        completed = cls._execute(
+            update(CustomerPackage).where(
+                CustomerPackage.status == 'active',
+                has_items,
+                ~has_remaining
+            ).values(status='completed', updated_at=now)
+        )
+        return {'expired': expired, 'completed': completed}
+
+    @classmethod
+    def sweep_assignments(cls, now: datetime) -> Dict[str, int]:
+        """Same rules as ServicePackageAssignment.auto_update_status, applied in bulk"""
+        expired = cls._execute(
+            update(ServicePackageAssignment).where(
+                ServicePackageAssignment.status == 'active',
+                ServicePackageAssignment.expires_on < now
+            ).values(status='expired', updated_at=now)
+        )
+        completed = cls._execute(
+            update(ServicePackageAssignment).where(
+                ServicePackageAssignment.status == 'active',
+                or_(
+                    and_(ServicePackageAssignment.package_type == 'service_package',
+                         ServicePackageAssignment.remaining_sessions <= 0),
+                    and_(ServicePackageAssignment.package_type == 'prepaid',
+                         ServicePackageAssignment.remaining_credit <= 0)
+                )
+            ).values(status='completed', updated_at=now)
+        )
+        return {'expired': expired, 'completed': completed}
+
+    @classmethod
+    def sweep_benefit_trackers(cls, now: datetime) -> Dict[str, int]:
+        """Deactivate trackers that are past valid_to, used up, or whose assignment has ended"""
+        expired = cls._execute(
+            update(PackageBenefitTracker).where(
+                PackageBenefitTracker.is_active == True,
+                PackageBenefitTracker.valid_to < now
+            ).values(is_active=False, updated_at=now)
+        )
+        exhausted = cls._execute(
+            update(PackageBenefitTracker).where(
+                PackageBenefitTracker.is_active == True,
+                or_(
+                    and_(PackageBenefitTracker.benefit_type == 'free',
+                         PackageBenefitTracker.remaining_count <= 0),
+                    and_(PackageBenefitTracker.benefit_type == 'prepaid',
+                         PackageBenefitTracker.balance_remaining <= 0)
+                )
+            ).values(is_active=False, updated_at=now)
+        )
+        ended_assignments = select(ServicePackageAssignment.id).where(
+            ServicePackageAssignment.status.in_(['expired', 'completed', 'cancelled'])
+        )
+        orphaned = cls._execute(
+            update(PackageBenefitTracker).where(
+                PackageBenefitTracker.is_active == True,
+                PackageBenefitTracker.package_assignment_id.in_(ended_assignments)
+            ).values(is_active=False, updated_at=now)
+        )
+        return {'expired': expired, 'exhausted': exhausted, 'assignment_ended': orphaned}
+
+    @classmethod
+    def run(cls, now: Optional[datetime] = None) -> Dict:
+        """Run every sweep in one transaction and return the per-table counts"""
+        now = now or datetime.utcnow()
+        try:
+            counts = {
+                'customer_packages': cls.sweep_customer_packages(now),
+                'assignments': cls.sweep_assignments(now),
+                # Runs after assignments so trackers of just-ended assignments are caught
+                'benefit_trackers': cls.sweep_benefit_trackers(now)
+            }
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error sweeping package expiry: {e}")
+            raise
+
+        total = sum(sum(group.values()) for group in counts.values())
+        logger.info("Package expiry sweep updated %s rows: %s", total, counts)
+        return {'success': True, 'swept_at': now.isoformat(), 'total_updated': total, **counts}
@@ -5,6 +5,7 @@ Enhanced package management with comprehensive billing integration
 from flask import render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
 from app import app, db
+from services.report_replica import reads_snapshot
 from datetime import datetime, timedelta
 from sqlalchemy import and_, or_, desc
 
@@ -327,8 +328,27 @@ def api_reverse_package_usage(usage_id):
         app.logger.error(f"Error reversing package usage: {str(e)}")
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@app.route('/api/professional-packages/expiry-sweep', methods=['GET', 'POST'])
+@login_required
+def api_package_expiry_sweep():
+    """Run the package expiry sweep now (POST) or report the scheduled job status (GET)"""
+    if not hasattr(current_user, 'can_access') or not current_user.can_access('packages'):
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+
+    from services.background_jobs import background_jobs
+    if request.method == 'GET':
+        return jsonify({'success': True, 'jobs': background_jobs.status()})
+
+    try:
+        from .package_expiry_sweeper import PackageExpirySweeper
+        return jsonify(PackageExpirySweeper.run())
+    except Exception as e:
+        app.logger.error(f"Error running package expiry sweep: {str(e)}")
+        return jsonify({'success': False, 'message': str(e)}), 500
+
 @app.route('/professional-packages/analytics')
 @login_required
+@reads_snapshot
 def professional_packages_analytics():
     """Professional packages analytics and reporting"""
     if not hasattr(current_user, 'can_access') or not current_user.can_access('packages'):
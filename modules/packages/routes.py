@@ -4,6 +4,7 @@ Customer Packages Routes - Blueprint for package assignment, usage tracking, and
 from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for
 from flask_login import login_required, current_user
 from app import db
+from services.query_budget import query_budget
 from models import Service, Customer, User, Appointment
 from models import PackageTemplate, PackageTemplateItem, CustomerPackage, CustomerPackageItem, PackageUsage, ServicePackageAssignment
 from datetime import datetime, timedelta
@@ -56,11 +57,14 @@ def edit_student_offer(offer_id):
 # ========================================
 
 @packages_bp.route("/api/templates", methods=['GET'])
+@query_budget(3)
 @login_required
 def api_get_templates():
     """Get all package templates with items"""
     try:
-        templates = PackageTemplate.query.filter_by(is_active=True).all()
+        templates = PackageTemplate.query.options(
+            db.selectinload(PackageTemplate.template_items).joinedload(PackageTemplateItem.service)
+        ).filter_by(is_active=True).all()
 
         result = []
         for template in templates:
@@ -166,6 +170,7 @@ def api_assign_package():
 
 
 @packages_bp.route("/api/customer-packages", methods=['GET'])
+@query_budget(4)
 @login_required
 def api_get_customer_packages():
     """Get customer packages with filters"""
@@ -178,7 +183,11 @@ def api_get_customer_packages():
         per_page = request.args.get('per_page', 20, type=int)
 
         # Build query
-        query = CustomerPackage.query.join(Customer).join(PackageTemplate)
+        query = CustomerPackage.query.join(Customer).join(PackageTemplate).options(
+            db.contains_eager(CustomerPackage.customer),
+            db.contains_eager(CustomerPackage.package_template),
+            db.selectinload(CustomerPackage.package_items)
+        )
 
         # Apply filters
         if customer_id:
@@ -212,9 +221,9 @@ def api_get_customer_packages():
                 'package_name': cp.package_template.name,
                 'status': cp.status,
                 'assigned_date': cp.assigned_on.strftime('%Y-%m-%d') if cp.assigned_on else None,
-                'expires_date': cp.expires_date.strftime('%Y-%m-%d') if cp.expires_date else None,
-                'sessions_remaining': cp.sessions_remaining,
-                'total_sessions': cp.total_sessions
+                'expires_date': cp.expires_on.strftime('%Y-%m-%d') if cp.expires_on else None,
+                'sessions_remaining': cp.get_remaining_services(),
+                'total_sessions': cp.get_total_services()
             })
 
         return jsonify({
@@ -0,0 +1,366 @@
+"""
+Analytics Export
+Copies the reporting tables into month-partitioned columnar files for BI tools, so history
+can be queried without touching the production database. Each run reads only rows past the
+table's watermark (updated_at or id) in keyset-paged chunks, appends them as part files and
+then compacts each month into one file with the latest version of each row, dropping older
+copies of re-exported rows from whichever month they were in before
+"""
+import glob
+import json
+import os
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Set
+import pandas as pd
+from sqlalchemy import and_, or_, select
+from app import db
+from models import (
+    Appointment, EnhancedInvoice, InvoiceItem, InvoicePayment, PackageUsage, PackageUsageHistory
+)
+from modules.inventory.models import InventoryAuditLog
+from services.branch_router import branch_router
+import logging
+
+try:
+    import pyarrow  # noqa: F401
+    PARQUET_ENGINE = 'pyarrow'
+except ImportError:
+    try:
+        import fastparquet  # noqa: F401
+        PARQUET_ENGINE = 'fastparquet'
+    except ImportError:
+        # Parquet is optional; partitions fall back to gzip-compressed CSV with the same layout
+        PARQUET_ENGINE = None
+
+logger = logging.getLogger(__name__)
+
+# Rows fetched per keyset page
+EXPORT_CHUNK_SIZE = 5000
+
+# updated_at rows younger than this wait for the next run, so a transaction that stamped
+# a row just before the run but committed after it is not skipped by the watermark
+WATERMARK_SAFETY_LAG = timedelta(minutes=5)
+
+STATE_FILE = '_watermarks.json'
+EXPORTED_AT_COLUMN = '_exported_at'
+
+
+def default_export_dir() -> str:
+    """
+    Export root; ANALYTICS_EXPORT_DIR overrides the directory next to the app. Other
+    branches export to a subfolder, with their own watermarks
+    """
+    root = os.environ.get('ANALYTICS_EXPORT_DIR') or os.path.join(os.getcwd(), 'analytics_export')
+    branch = branch_router.current()
+    return root if branch == branch_router.primary else os.path.join(root, branch)
+
+
+def _extension() -> str:
+    return 'parquet' if PARQUET_ENGINE else 'csv.gz'
+
+
+@dataclass
+class ExportTable:
+    """One exported dataset: what to select, how to page it and how to partition it"""
+    name: str
+    query: Callable[[], object]
+    id_column: object
+    partition_column: str
+    updated_column: Optional[object] = None  # None: append-only, paged by id alone
+    updated_key: Optional[str] = None        # result column holding updated_column
+    # Rows exported as a group under this key: when the group changes, every older row of
+    # the group is dropped, so rows deleted from the source disappear from the export too.
+    # replace_ids selects the group keys; it is filtered by updated_column like the rows
+    replace_key: Optional[str] = None
+    replace_ids: Optional[Callable[[], object]] = None
+
+    @property
+    def incremental_by(self) -> str:
+        return 'updated_at' if self.updated_column is not None else 'id'
+
+    @property
+    def updated_name(self) -> Optional[str]:
+        return self.updated_key or (self.updated_column.name if self.updated_column is not None else None)
+
+
+EXPORT_TABLES: Dict[str, ExportTable] = {table.name: table for table in [
+    ExportTable('appointments', lambda: select(Appointment.__table__), Appointment.id,
+                'appointment_date', Appointment.updated_at),
+    ExportTable('invoices', lambda: select(EnhancedInvoice.__table__), EnhancedInvoice.id,
+                'invoice_date', EnhancedInvoice.updated_at),
+    # Lines have no timestamps of their own; an edited invoice re-exports all of its lines
+    ExportTable('invoice_items', lambda: select(
+        InvoiceItem.__table__, EnhancedInvoice.invoice_date,
+        EnhancedInvoice.updated_at.label('invoice_updated_at')
+    ).join(EnhancedInvoice, EnhancedInvoice.id == InvoiceItem.invoice_id), InvoiceItem.id,
+                'invoice_date', EnhancedInvoice.updated_at, 'invoice_updated_at',
+                replace_key='invoice_id', replace_ids=lambda: select(EnhancedInvoice.id)),
+    ExportTable('payments', lambda: select(InvoicePayment.__table__), InvoicePayment.id, 'payment_date'),
+    ExportTable('package_usage', lambda: select(PackageUsage.__table__), PackageUsage.id, 'usage_date'),
+    ExportTable('package_usage_history', lambda: select(PackageUsageHistory.__table__),
+                PackageUsageHistory.id, 'charge_date'),
+    ExportTable('inventory_audit', lambda: select(InventoryAuditLog.__table__), InventoryAuditLog.id,
+                'timestamp'),
+]}
+
+
+class AnalyticsExport:
+    """
+    Layout: <export_dir>/<table>/month=YYYY-MM/data.parquet (hive-style, so pandas, pyarrow
+    and DuckDB read a table directory directly); rows with no partition date go to
+    month=unknown. Watermarks live in <export_dir>/_watermarks.json.
+    """
+
+    @staticmethod
+    def load_state(export_dir: str) -> Dict:
+        path = os.path.join(export_dir, STATE_FILE)
+        if not os.path.exists(path):
+            return {}
+        with open(path, encoding='utf-8') as handle:
+            return json.load(handle)
+
+    @staticmethod
+    def save_state(export_dir: str, state: Dict) -> None:
+        path = os.path.join(export_dir, STATE_FILE)
+        with open(path + '.tmp', 'w', encoding='utf-8') as handle:
+            json.dump(state, handle, indent=2, sort_keys=True)
+        os.replace(path + '.tmp', path)
+
+    @staticmethod
+    def _chunks(table: ExportTable, watermark: Dict, until: datetime,
+                chunk_size: int) -> Iterable[pd.DataFrame]:
+        """Keyset pages of rows past the watermark, in watermark order"""
+        connection = db.session.connection()
+        id_column = table.id_column
+        last_id = watermark.get('id')
+
+        if table.updated_column is None:
+            while True:
+                query = table.query()
+                if last_id is not None:
+                    query = query.where(id_column > last_id)
+                frame = pd.read_sql(query.order_by(id_column).limit(chunk_size), connection)
+                if frame.empty:
+                    return
+                last_id = int(frame[id_column.name].iloc[-1])
+                yield frame
+                if len(frame) < chunk_size:
+                    return
+
+        updated = table.updated_column
+        last_updated = datetime.fromisoformat(watermark['updated_at']) if watermark.get('updated_at') else None
+        if last_updated is None:
+            # First run: rows never stamped with updated_at are only picked up here
+            never_stamped_id = None
+            while True:
+                query = table.query().where(updated.is_(None))
+                if never_stamped_id is not None:
+                    query = query.where(id_column > never_stamped_id)
+                frame = pd.read_sql(query.order_by(id_column).limit(chunk_size), connection)
+                if frame.empty:
+                    break
+                never_stamped_id = int(frame[id_column.name].iloc[-1])
+                yield frame
+                if len(frame) < chunk_size:
+                    break
+
+        while True:
+            query = table.query().where(updated <= until)
+            if last_updated is not None:
+                query = query.where(or_(
+                    updated > last_updated,
+                    and_(updated == last_updated, id_column > (last_id or 0))
+                ))
+            else:
+                query = query.where(updated.isnot(None))
+            frame = pd.read_sql(query.order_by(updated, id_column).limit(chunk_size), connection)
+            if frame.empty:
+                return
+            last_updated = pd.Timestamp(frame[table.updated_name].iloc[-1]).to_pydatetime()
+            last_id = int(frame[id_column.name].iloc[-1])
+            yield frame
+            if len(frame) < chunk_size:
+                return
+
+    @staticmethod
+    def _months(frame: pd.DataFrame, column: str) -> pd.Series:
+        return pd.to_datetime(frame[column], errors='coerce').dt.strftime('%Y-%m').fillna('unknown')
+
+    @staticmethod
+    def _write(frame: pd.DataFrame, path: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if PARQUET_ENGINE:
+            frame.to_parquet(path + '.tmp', engine=PARQUET_ENGINE, index=False)
+        else:
+            frame.to_csv(path + '.tmp', index=False, compression='gzip')
+        os.replace(path + '.tmp', path)
+
+    @staticmethod
+    def _read(path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        if path.endswith('.parquet'):
+            return pd.read_parquet(path, engine=PARQUET_ENGINE, columns=columns)
+        return pd.read_csv(path, compression='gzip', usecols=columns)
+
+    @classmethod
+    def _compact(cls, month_dir: str, id_column: str, run_tag: str, run_ids: Set[int],
+                 replace_key: Optional[str] = None, replace_keys: Set[int] = frozenset()) -> bool:
+        """
+        Merge one month's data file with its part files. Older copies of rows exported by
+        this run (run_ids) are dropped wherever they are, so a row whose partition date
+        changed leaves its old month; so is every older row of a replaced group. Months
+        this run wrote nothing to are only rewritten when they hold such rows. Returns
+        whether the month changed
+        """
+        extension = _extension()
+        data_path = os.path.join(month_dir, f'data.{extension}')
+        parts = sorted(glob.glob(os.path.join(month_dir, f'part-*.{extension}')))
+        new_parts = [part for part in parts if os.path.basename(part).startswith(f'part-{run_tag}-')]
+        old_paths = ([data_path] if os.path.exists(data_path) else []) + [part for part in parts
+                                                                           if part not in new_parts]
+
+        def stale(frame: pd.DataFrame) -> pd.Series:
+            mask = frame[id_column].isin(run_ids)
+            if replace_key is not None and replace_keys:
+                mask |= frame[replace_key].isin(replace_keys)
+            return mask
+
+        if not new_parts and not old_paths:
+            return False
+        if not new_parts and old_paths == [data_path]:
+            key_columns = [id_column] + ([replace_key] if replace_key is not None else [])
+            if not stale(cls._read(data_path, columns=key_columns)).any():
+                return False
+
+        frames = [frame[~stale(frame)] for frame in (cls._read(path) for path in old_paths)]
+        frames += [cls._read(part) for part in new_parts]
+        merged = pd.concat(frames, ignore_index=True).drop_duplicates(subset=[id_column], keep='last')
+        if merged.empty:
+            if os.path.exists(data_path):
+                os.remove(data_path)
+        else:
+            cls._write(merged.sort_values(id_column).reset_index(drop=True), data_path)
+        for part in parts:
+            os.remove(part)
+        if not os.listdir(month_dir):
+            os.rmdir(month_dir)
+        return True
+
+    @staticmethod
+    def _replaced_keys(table: ExportTable, watermark: Dict, until: datetime) -> Set[int]:
+        """Group keys changed since the watermark; on a first run nothing exported exists yet"""
+        if table.replace_ids is None or not watermark.get('updated_at'):
+            return set()
+        last_updated = datetime.fromisoformat(watermark['updated_at'])
+        # Strictly after the watermark: a group stamped exactly at it may be half exported
+        query = table.replace_ids().where(table.updated_column > last_updated,
+                                          table.updated_column <= until)
+        return set(db.session.execute(query).scalars())
+
+    @classmethod
+    def export_table(cls, table: ExportTable, export_dir: str, watermark: Dict, now: datetime,
+                     chunk_size: int = EXPORT_CHUNK_SIZE) -> Dict:
+        """Export one table's delta and return its new watermark and counts"""
+        table_dir = os.path.join(export_dir, table.name)
+        run_tag = now.strftime('%Y%m%dT%H%M%S')
+        extension = _extension()
+        until = now - WATERMARK_SAFETY_LAG
+        id_name = table.id_column.name
+
+        replace_keys = cls._replaced_keys(table, watermark, until)
+        exported, run_ids = 0, set()
+        new_watermark = dict(watermark)
+        for number, frame in enumerate(cls._chunks(table, watermark, until, chunk_size)):
+            frame[EXPORTED_AT_COLUMN] = now
+            months = cls._months(frame, table.partition_column)
+            for month, rows in frame.groupby(months):
+                month_dir = os.path.join(table_dir, f'month={month}')
+                cls._write(rows, os.path.join(month_dir, f'part-{run_tag}-{number:05d}.{extension}'))
+            run_ids.update(int(value) for value in frame[id_name])
+            exported += len(frame)
+
+            # Pages arrive in watermark order, so the last row of a page is the new high mark
+            if table.updated_column is None:
+                new_watermark['id'] = int(frame[id_name].iloc[-1])
+            else:
+                stamped = frame[table.updated_name].dropna()
+                if not stamped.empty:
+                    new_watermark['updated_at'] = pd.Timestamp(stamped.iloc[-1]).to_pydatetime().isoformat()
+                    new_watermark['id'] = int(frame.loc[stamped.index[-1], id_name])
+
+        touched = 0
+        if run_ids or replace_keys:
+            for month_dir in sorted(glob.glob(os.path.join(table_dir, 'month=*'))):
+                touched += cls._compact(month_dir, id_name, run_tag, run_ids, table.replace_key, replace_keys)
+
+        if table.updated_column is not None and not new_watermark.get('updated_at') and exported:
+            # Everything exported so far was unstamped; later runs start from the cutoff
+            new_watermark['updated_at'] = until.isoformat()
+            new_watermark['id'] = 0
+        new_watermark.update({
+            'incremental_by': table.incremental_by,
+            'last_run': now.isoformat(),
+            'last_exported': exported,
+            'total_exported': (watermark.get('total_exported') or 0) + exported
+        })
+        return {'watermark': new_watermark, 'exported': exported, 'months': touched}
+
+    @classmethod
+    def run(cls, tables: Optional[List[str]] = None, export_dir: Optional[str] = None,
+            full: bool = False, chunk_size: int = EXPORT_CHUNK_SIZE) -> Dict:
+        """
+        Export the delta of every table (or the named ones). full ignores the watermarks
+        and rewrites from scratch. A table's watermark is saved only after its months
+        are compacted, so a failed run repeats that table's delta next time.
+        """
+        unknown = [name for name in (tables or []) if name not in EXPORT_TABLES]
+        if unknown:
+            raise ValueError(f"Unknown export tables: {', '.join(unknown)}. "
+                             f"Expected any of: {', '.join(EXPORT_TABLES)}")
+
+        export_dir = export_dir or default_export_dir()
+        os.makedirs(export_dir, exist_ok=True)
+        state = {} if full else cls.load_state(export_dir)
+        now = datetime.utcnow()
+
+        results, errors = {}, []
+        for name in tables or list(EXPORT_TABLES):
+            table = EXPORT_TABLES[name]
+            if full:
+                for stale in glob.glob(os.path.join(export_dir, name, 'month=*', '*')):
+                    os.remove(stale)
+            try:
+                result = cls.export_table(table, export_dir, state.get(name, {}), now, chunk_size)
+            except Exception as e:
+                logger.exception("Analytics export of %s failed", name)
+                errors.append({'table': name, 'error': str(e)})
+                continue
+            state[name] = result['watermark']
+            cls.save_state(export_dir, state)
+            results[name] = {'exported': result['exported'], 'months': result['months']}
+
+        db.session.rollback()  # Read-only; release the snapshot
+        logger.info("Analytics export to %s: %s", export_dir, results)
+        return {
+            'success': not errors,
+            'export_dir': export_dir,
+            'format': 'parquet' if PARQUET_ENGINE else 'csv.gz',
+            'tables': results,
+            'errors': errors
+        }
+
+    @classmethod
+    def read(cls, table: str, start_month: Optional[str] = None, end_month: Optional[str] = None,
+             export_dir: Optional[str] = None) -> pd.DataFrame:
+        """Load an exported table (optionally months YYYY-MM..YYYY-MM) for analysis"""
+        if table not in EXPORT_TABLES:
+            raise ValueError(f"Unknown export table '{table}'")
+        paths = []
+        for month_dir in sorted(glob.glob(os.path.join(export_dir or default_export_dir(), table, 'month=*'))):
+            month = month_dir.rsplit('month=', 1)[1]
+            if month != 'unknown' and ((start_month and month < start_month) or (end_month and month > end_month)):
+                continue
+            paths.extend(sorted(glob.glob(os.path.join(month_dir, f'data.{_extension()}'))))
+        if not paths:
+            return pd.DataFrame()
+        return pd.concat([cls._read(path) for path in paths], ignore_index=True)
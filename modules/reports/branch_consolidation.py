@@ -0,0 +1,70 @@
+"""
+Cross-Branch Consolidation
+Head-office figures built by running the single-branch report queries against every
+branch database in parallel and merging the results. A branch that fails or times out
+is reported alongside the totals instead of failing the whole report
+"""
+from datetime import date
+from typing import Dict, List, Optional
+from modules.dashboard.dashboard_queries import get_dashboard_stats
+from services.branch_router import branch_router
+from .reports_queries import get_revenue_report
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Dashboard stats that describe the shared service catalogue rather than branch activity,
+# so the consolidated value is the largest branch's and not the sum
+CATALOGUE_STATS = ('total_services',)
+
+
+def _branch_figures(start_date: date, end_date: date) -> Dict:
+    """Runs inside one branch's app context; returns plain values only"""
+    return {
+        'stats': get_dashboard_stats(),
+        'revenue': [{
+            'date': str(row.date),
+            'revenue': float(row.total_revenue or 0),
+            'appointments': int(row.appointment_count or 0)
+        } for row in get_revenue_report(start_date, end_date)]
+    }
+
+
+class BranchConsolidation:
+    """Merges per-branch dashboard stats and revenue into one head-office view"""
+
+    @classmethod
+    def collect(cls, start_date: date, end_date: date, branches: Optional[List[str]] = None) -> Dict:
+        results = branch_router.fan_out(lambda: _branch_figures(start_date, end_date), branches)
+
+        succeeded = {name: result.value for name, result in results.items() if result.error is None}
+        return {
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat(),
+            'branches': list(results),
+            'errors': {name: result.error for name, result in results.items() if result.error},
+            'totals': cls.merge_stats([figures['stats'] for figures in succeeded.values()]),
+            'revenue': cls.merge_revenue([figures['revenue'] for figures in succeeded.values()]),
+            'by_branch': {name: figures['stats'] for name, figures in succeeded.items()}
+        }
+
+    @staticmethod
+    def merge_stats(branch_stats: List[Dict]) -> Dict:
+        totals: Dict = {}
+        for stats in branch_stats:
+            for key, value in stats.items():
+                if key in CATALOGUE_STATS:
+                    totals[key] = max(totals.get(key, 0), value)
+                else:
+                    totals[key] = totals.get(key, 0) + value
+        return totals
+
+    @staticmethod
+    def merge_revenue(branch_revenue: List[List[Dict]]) -> List[Dict]:
+        by_date: Dict[str, Dict] = {}
+        for rows in branch_revenue:
+            for row in rows:
+                merged = by_date.setdefault(row['date'], {'date': row['date'], 'revenue': 0.0, 'appointments': 0})
+                merged['revenue'] += row['revenue']
+                merged['appointments'] += row['appointments']
+        return [by_date[day] for day in sorted(by_date)]
@@ -0,0 +1,246 @@
+"""
+Cohort and Retention Analytics
+First-visit cohorts, monthly retention curves, repeat-visit intervals and churn flags,
+computed with pandas/NumPy over slim appointment columns loaded in keyset-paged chunks.
+Results are cached per process for the rest of the day
+"""
+import threading
+from datetime import date
+from typing import Callable, Dict, Hashable, Optional
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+from app import db
+from models import Appointment, Customer
+from modules.clients.customer_metrics import LAPSED_AFTER_DAYS
+from services.branch_router import branch_router
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Appointment rows fetched per keyset page
+LOAD_CHUNK_SIZE = 50000
+
+# Default number of cohort months shown
+DEFAULT_COHORT_MONTHS = 12
+
+COHORT_METRICS = ('retention', 'customers', 'revenue')
+
+# A customer is churned once their gap since the last visit exceeds this multiple of their
+# usual interval between visits, and never before CHURN_MIN_DAYS; single-visit customers
+# churn after LAPSED_AFTER_DAYS, as in the lapsed customer segment
+CHURN_INTERVAL_MULTIPLIER = 2.5
+CHURN_MIN_DAYS = 45
+
+INTERVAL_BUCKETS = [0, 7, 14, 30, 60, 90, 180, np.inf]
+INTERVAL_LABELS = ['0-7', '8-14', '15-30', '31-60', '61-90', '91-180', '181+']
+
+
+class DailyResultCache:
+    """Thread-safe results cache whose entries expire when the date changes, kept per branch"""
+
+    def __init__(self):
+        self._day: Optional[date] = None
+        self._entries: Dict[Hashable, object] = {}
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], object]):
+        today = date.today()
+        key = (branch_router.current(), key)
+        with self._lock:
+            if self._day != today:
+                self._day, self._entries = today, {}
+            if key in self._entries:
+                return self._entries[key]
+        value = compute()
+        with self._lock:
+            if self._day == today:
+                self._entries[key] = value
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+cohort_cache = DailyResultCache()
+
+
+def _month_label(index: int) -> str:
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def _month_index(values: pd.Series) -> np.ndarray:
+    return (values.dt.year * 12 + values.dt.month - 1).to_numpy(dtype=np.int32)
+
+
+class CohortAnalytics:
+    """All computations work on the completed-visit frame from visits()"""
+
+    @staticmethod
+    def load_appointments(chunk_size: int = LOAD_CHUNK_SIZE) -> pd.DataFrame:
+        """client_id, appointment_date, amount and status of every appointment, in id-keyset chunks"""
+        connection = db.session.connection()
+        frames, last_id = [], 0
+        while True:
+            chunk = pd.read_sql(select(
+                Appointment.id, Appointment.client_id, Appointment.appointment_date,
+                Appointment.amount, Appointment.status
+            ).where(Appointment.id > last_id).order_by(Appointment.id).limit(chunk_size), connection)
+            if chunk.empty:
+                break
+            last_id = int(chunk['id'].iloc[-1])
+            frames.append(chunk.drop(columns='id').astype({
+                'client_id': 'int32', 'amount': 'float64', 'status': 'category'
+            }))
+            if len(chunk) < chunk_size:
+                break
+        if not frames:
+            return pd.DataFrame({'client_id': pd.Series(dtype='int32'),
+                                 'appointment_date': pd.Series(dtype='datetime64[ns]'),
+                                 'amount': pd.Series(dtype='float64'),
+                                 'status': pd.Series(dtype='category')})
+        frame = pd.concat(frames, ignore_index=True)
+        frame['appointment_date'] = pd.to_datetime(frame['appointment_date'])
+        frame['status'] = frame['status'].astype('category')
+        return frame
+
+    @classmethod
+    def visits(cls) -> pd.DataFrame:
+        """Completed visits sorted by customer and date, with their calendar month index"""
+        def compute():
+            frame = cls.load_appointments()
+            visits = frame.loc[frame['status'] == 'completed', ['client_id', 'appointment_date', 'amount']]
+            visits = visits.sort_values(['client_id', 'appointment_date'], kind='mergesort').reset_index(drop=True)
+            visits['month'] = _month_index(visits['appointment_date'])
+            visits['amount'] = visits['amount'].fillna(0)
+            return visits
+        return cohort_cache.get_or_compute('visits', compute)
+
+    @classmethod
+    def cohort_frames(cls, months: int = DEFAULT_COHORT_MONTHS) -> Dict[str, pd.DataFrame]:
+        """Cohort (first-visit month) x months-since-first matrices of customers, retention and revenue"""
+        def compute():
+            visits = cls.visits()
+            current = date.today().year * 12 + date.today().month - 1
+            first = visits.groupby('client_id')['month'].transform('min').to_numpy()
+            age = visits['month'].to_numpy() - first
+            scoped = pd.DataFrame({'cohort': first, 'age': age, 'client_id': visits['client_id'].to_numpy(),
+                                   'amount': visits['amount'].to_numpy()})
+            scoped = scoped[scoped['cohort'] > current - months]
+
+            ages = np.arange(months)
+            customers = scoped.drop_duplicates(['cohort', 'age', 'client_id']).groupby(
+                ['cohort', 'age']).size().unstack(fill_value=0).reindex(columns=ages, fill_value=0)
+            revenue = scoped.groupby(['cohort', 'age'])['amount'].sum().unstack(
+                fill_value=0).reindex(columns=ages, fill_value=0)
+            sizes = customers[0] if not customers.empty else pd.Series(dtype='int64')
+
+            # Months a cohort has not reached yet are unknown, not zero
+            reached = (customers.index.to_numpy()[:, None] + ages[None, :]) <= current
+            retention = customers.div(sizes.replace(0, np.nan), axis=0).where(reached)
+            return {'customers': customers.where(reached), 'revenue': revenue.where(reached),
+                    'retention': retention, 'sizes': sizes}
+        return cohort_cache.get_or_compute(('cohorts', months), compute)
+
+    @classmethod
+    def cohort_matrix(cls, months: int = DEFAULT_COHORT_MONTHS, metric: str = 'retention') -> pd.DataFrame:
+        """One metric as a labelled frame: a row per cohort month, a column per month since first visit"""
+        if metric not in COHORT_METRICS:
+            raise ValueError(f"Unknown metric '{metric}'. Expected one of: {', '.join(COHORT_METRICS)}")
+        frames = cls.cohort_frames(months)
+        matrix = frames[metric].copy()
+        matrix = (matrix * 100).round(1) if metric == 'retention' else matrix.round(2)
+        matrix.insert(0, 'cohort_size', frames['sizes'])
+        matrix.index = [_month_label(index) for index in matrix.index]
+        matrix.index.name = 'cohort'
+        matrix.columns = ['cohort_size'] + [f'month_{age}' for age in matrix.columns[1:]]
+        return matrix
+
+    @classmethod
+    def retention_curve(cls, months: int = DEFAULT_COHORT_MONTHS) -> pd.DataFrame:
+        """Share of customers still visiting N months after their first visit, over cohorts old enough"""
+        frames = cls.cohort_frames(months)
+        customers, sizes = frames['customers'], frames['sizes']
+        eligible = customers.notna()
+        active = customers.fillna(0).sum(axis=0)
+        base = eligible.mul(sizes, axis=0).sum(axis=0)
+        return pd.DataFrame({
+            'months_since_first_visit': customers.columns.astype(int),
+            'cohorts': eligible.sum(axis=0).to_numpy(),
+            'customers': base.to_numpy().astype(int),
+            'retained': active.to_numpy().astype(int),
+            'retention_percentage': (active / base.replace(0, np.nan) * 100).round(1).to_numpy()
+        })
+
+    @classmethod
+    def customer_intervals(cls) -> pd.DataFrame:
+        """Per customer: visits, spend, first/last visit and the median days between visits"""
+        def compute():
+            visits = cls.visits()
+            if visits.empty:
+                return pd.DataFrame({
+                    'visits': pd.Series(dtype='int64'),
+                    'total_spent': pd.Series(dtype='float64'),
+                    'first_visit': pd.Series(dtype='datetime64[ns]'),
+                    'last_visit': pd.Series(dtype='datetime64[ns]'),
+                    'median_interval_days': pd.Series(dtype='float64')
+                }, index=pd.Index([], dtype='int32', name='client_id'))
+            clients = visits['client_id'].to_numpy()
+            days = visits['appointment_date'].to_numpy().astype('datetime64[D]').astype(np.int64)
+            same_client = np.r_[False, clients[1:] == clients[:-1]]
+            gaps = np.where(same_client, np.r_[0, np.diff(days)], np.nan)
+
+            grouped = pd.DataFrame({'client_id': clients, 'gap': gaps}).groupby('client_id')['gap']
+            summary = visits.groupby('client_id').agg(
+                visits=('month', 'size'),
+                total_spent=('amount', 'sum'),
+                first_visit=('appointment_date', 'min'),
+                last_visit=('appointment_date', 'max')
+            )
+            summary['median_interval_days'] = grouped.median()
+            return summary
+        return cohort_cache.get_or_compute('intervals', compute)
+
+    @classmethod
+    def repeat_intervals(cls) -> Dict:
+        """Distribution of days between consecutive visits of the same customer"""
+        visits = cls.visits()
+        clients = visits['client_id'].to_numpy()
+        days = visits['appointment_date'].to_numpy().astype('datetime64[D]').astype(np.int64)
+        gaps = np.diff(days)[clients[1:] == clients[:-1]]
+        counts = pd.cut(pd.Series(gaps), bins=INTERVAL_BUCKETS, labels=INTERVAL_LABELS,
+                        include_lowest=True).value_counts().reindex(INTERVAL_LABELS, fill_value=0)
+        intervals = cls.customer_intervals()
+        return {
+            'repeat_visits': int(gaps.size),
+            'repeat_customers': int((intervals['visits'] > 1).sum()),
+            'mean_days': round(float(gaps.mean()), 1) if gaps.size else None,
+            'median_days': float(np.median(gaps)) if gaps.size else None,
+            'p25_days': float(np.percentile(gaps, 25)) if gaps.size else None,
+            'p75_days': float(np.percentile(gaps, 75)) if gaps.size else None,
+            'buckets': [{'days': label, 'visits': int(count)} for label, count in counts.items()]
+        }
+
+    @classmethod
+    def churn_flags(cls, as_of: Optional[date] = None) -> pd.DataFrame:
+        """Per customer churn flag against their own visit rhythm, with names for outreach lists"""
+        def compute():
+            intervals = cls.customer_intervals().copy()
+            today = np.datetime64(as_of or date.today(), 'D')
+            last = intervals['last_visit'].to_numpy().astype('datetime64[D]')
+            intervals['days_since_last_visit'] = (today - last).astype(np.int64)
+            expected = np.where(
+                intervals['median_interval_days'].isna(), LAPSED_AFTER_DAYS,
+                np.maximum(intervals['median_interval_days'].to_numpy() * CHURN_INTERVAL_MULTIPLIER, CHURN_MIN_DAYS)
+            )
+            intervals['expected_gap_days'] = np.round(expected, 1)
+            intervals['churned'] = intervals['days_since_last_visit'] > expected
+
+            names = pd.DataFrame(db.session.execute(select(
+                Customer.id, Customer.first_name, Customer.last_name, Customer.phone
+            )).all(), columns=['client_id', 'first_name', 'last_name', 'phone']).set_index('client_id')
+            result = intervals.join(names, how='left')
+            result['name'] = (result['first_name'].fillna('') + ' ' + result['last_name'].fillna('')).str.strip()
+            return result.drop(columns=['first_name', 'last_name']).reset_index()
+        return cohort_cache.get_or_compute(('churn', as_of), compute)
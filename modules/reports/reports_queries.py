@@ -2,22 +2,25 @@
 Reports related database queries
 """
 from datetime import datetime, date, timedelta
-from sqlalchemy import func, and_, extract
+from sqlalchemy import func, and_, extract, Date
 from app import db
 from models import Appointment, Invoice, Expense, Customer, User
 from modules.inventory.models import InventoryProduct as Inventory
+from modules.inventory.stock_alerts import StockAlertEvaluator
+from modules.inventory.expiry_timeline import ExpiryTimeline, EXPIRING_SOON_DAYS
+from modules.inventory.valuation import InventoryValuation
 
 def get_revenue_report(start_date, end_date):
     """Get revenue report for date range"""
     revenue_data = db.session.query(
-        func.date(Appointment.appointment_date).label('date'),
+        func.date(Appointment.appointment_date, type_=Date).label('date'),
         func.sum(Appointment.amount).label('total_revenue'),
         func.count(Appointment.id).label('appointment_count')
     ).filter(
         Appointment.appointment_date >= start_date,
         Appointment.appointment_date <= end_date,
         Appointment.is_paid == True
-    ).group_by(func.date(Appointment.appointment_date)).all()
+    ).group_by(func.date(Appointment.appointment_date)).order_by(func.date(Appointment.appointment_date)).all()
     
     return revenue_data
 
@@ -66,16 +69,14 @@ def get_client_report(start_date, end_date):
     
     return client_data
 
-def get_inventory_report():
-    """Get inventory report"""
-    inventory_data = Inventory.query.filter_by(is_active=True).all()
-    
-    low_stock = [item for item in inventory_data if item.current_stock <= item.min_stock_level]
-    expiring_soon = [item for item in inventory_data if item.expiry_date and item.expiry_date <= date.today() + timedelta(days=30)]
-    
+def get_inventory_report(method='batch_cost', as_of=None):
+    """Get inventory report - stock levels come from batches, value from SQL aggregates"""
+    valuation = InventoryValuation.valuation(method=method, group_by='category', as_of=as_of)
+
     return {
-        'total_items': len(inventory_data),
-        'low_stock_items': low_stock,
-        'expiring_items': expiring_soon,
-        'total_value': sum(item.current_stock * item.cost_price for item in inventory_data)
+        'total_items': Inventory.query.filter_by(is_active=True).count(),
+        'low_stock_items': StockAlertEvaluator.low_stock_items(include_out_of_stock=True),
+        'expiring_items': ExpiryTimeline.expiring_batches(days=EXPIRING_SOON_DAYS),
+        'total_value': valuation['total_value'],
+        'value_by_category': valuation['rows']
     }
\ No newline at end of file
@@ -1,10 +1,15 @@
 """
 Reports views and routes
 """
-from flask import render_template, request, redirect, url_for, flash, jsonify
+from flask import render_template, request, redirect, url_for, flash, jsonify, make_response
 from flask_login import login_required, current_user
 from datetime import datetime, date, timedelta
 from app import app
+from services.branch_router import branch_router
+from services.report_replica import reads_snapshot
+import pandas as pd
+from .branch_consolidation import BranchConsolidation
+from .cohort_analytics import CohortAnalytics, DEFAULT_COHORT_MONTHS
 from .reports_queries import (
     get_revenue_report, get_expense_report, get_staff_performance_report,
     get_client_report, get_inventory_report
@@ -12,6 +17,7 @@ from .reports_queries import (
 
 @app.route('/reports')
 @login_required
+@reads_snapshot
 def reports():
     if not current_user.can_access('reports'):
         flash('Access denied', 'danger')
@@ -50,6 +56,7 @@ def reports():
 
 @app.route('/reports/revenue')
 @login_required
+@reads_snapshot
 def revenue_report():
     if not current_user.can_access('reports'):
         return jsonify({'error': 'Access denied'}), 403
@@ -78,4 +85,123 @@ def revenue_report():
             }
             for item in revenue_data
         ]
-    })
\ No newline at end of file
+    })
+
+
+@app.route('/reports/branches')
+@login_required
+def branch_consolidated_report():
+    """Dashboard stats and daily revenue summed across every branch database"""
+    if not current_user.can_access('reports'):
+        return jsonify({'error': 'Access denied'}), 403
+    # Every branch's figures: head-office admins only, never a login made on a branch database
+    is_admin = current_user.has_role('admin') or current_user.has_role('super_admin')
+    if branch_router.current() != branch_router.primary or not is_admin:
+        return jsonify({'error': 'Consolidated reports are only available to head office admins'}), 403
+
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+
+    if start_date and end_date:
+        try:
+            start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
+            end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
+        except ValueError:
+            return jsonify({'error': 'Invalid date format'}), 400
+    else:
+        end_date = date.today()
+        start_date = end_date - timedelta(days=30)
+
+    return jsonify(BranchConsolidation.collect(start_date, end_date))
+
+
+def _csv_response(frame, name):
+    """Send a DataFrame as a CSV download"""
+    response = make_response(frame.to_csv(index=False))
+    response.headers['Content-Type'] = 'text/csv'
+    response.headers['Content-Disposition'] = f'attachment; filename={name}_{date.today().strftime("%Y%m%d")}.csv'
+    return response
+
+
+def _cohort_months():
+    return max(1, min(request.args.get('months', DEFAULT_COHORT_MONTHS, type=int), 60))
+
+
+@app.route('/reports/cohorts')
+@login_required
+@reads_snapshot
+def cohort_report():
+    """First-visit cohort matrix; metric is retention (%), customers or revenue"""
+    if not current_user.can_access('reports'):
+        return jsonify({'error': 'Access denied'}), 403
+
+    metric = request.args.get('metric', 'retention')
+    try:
+        matrix = CohortAnalytics.cohort_matrix(_cohort_months(), metric)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if request.args.get('format') == 'csv':
+        return _csv_response(matrix.reset_index(), f'cohorts_{metric}')
+    values = matrix.drop(columns='cohort_size')
+    return jsonify({
+        'metric': metric,
+        'periods': list(values.columns),
+        'cohorts': [{
+            'cohort': cohort,
+            'size': int(matrix.at[cohort, 'cohort_size']),
+            'values': [None if pd.isna(value) else float(value) for value in row]
+        } for cohort, row in zip(values.index, values.to_numpy())]
+    })
+
+
+@app.route('/reports/retention')
+@login_required
+@reads_snapshot
+def retention_report():
+    """Retention curve across cohorts by months since first visit"""
+    if not current_user.can_access('reports'):
+        return jsonify({'error': 'Access denied'}), 403
+
+    curve = CohortAnalytics.retention_curve(_cohort_months())
+    if request.args.get('format') == 'csv':
+        return _csv_response(curve, 'retention_curve')
+    curve = curve.astype(object).where(curve.notna(), None)
+    return jsonify({'data': curve.to_dict('records')})
+
+
+@app.route('/reports/repeat-intervals')
+@login_required
+@reads_snapshot
+def repeat_interval_report():
+    """Days between consecutive visits of the same customer"""
+    if not current_user.can_access('reports'):
+        return jsonify({'error': 'Access denied'}), 403
+    return jsonify(CohortAnalytics.repeat_intervals())
+
+
+@app.route('/reports/churn')
+@login_required
+@reads_snapshot
+def churn_report():
+    """Churn flag per customer; only_churned=false includes active customers too"""
+    if not current_user.can_access('reports'):
+        return jsonify({'error': 'Access denied'}), 403
+
+    flags = CohortAnalytics.churn_flags()
+    if request.args.get('only_churned', 'true').lower() != 'false':
+        flags = flags[flags['churned']]
+    flags = flags.sort_values('total_spent', ascending=False)
+    columns = ['client_id', 'name', 'phone', 'visits', 'total_spent', 'first_visit', 'last_visit',
+               'median_interval_days', 'days_since_last_visit', 'expected_gap_days', 'churned']
+    flags = flags[columns].assign(
+        total_spent=flags['total_spent'].round(2),
+        first_visit=flags['first_visit'].dt.strftime('%Y-%m-%d'),
+        last_visit=flags['last_visit'].dt.strftime('%Y-%m-%d')
+    )
+    if request.args.get('format') == 'csv':
+        return _csv_response(flags, 'churn')
+    return jsonify({
+        'customers': int(len(flags)),
+        'data': flags.astype(object).where(flags.notna(), None).to_dict('records')
+    })
@@ -5,6 +5,7 @@ Implements comprehensive CRUD operations as per requirements document
 from flask import render_template, request, redirect, url_for, flash, jsonify, make_response
 from flask_login import login_required, current_user
 from app import app, db
+from services.report_replica import reads_snapshot
 from models import Service
 from forms import ServiceForm
 try:
@@ -259,6 +260,7 @@ def toggle_service(service_id):
 
 @app.route('/services/export')
 @login_required
+@reads_snapshot
 def export_services():
     """Export services to CSV"""
     if not current_user.can_access('services'):
@@ -0,0 +1,153 @@
+"""
+Commission Engine
+Computes staff commissions for a pay period from paid invoice lines of completed
+appointments: one query pulls the lines joined to staff and to the rate of the service
+each line invoiced (which may differ from the one booked, e.g. an add-on), pandas
+applies the rate rules across the whole period at once, and Commission rows are
+bulk-inserted so re-running a period replaces its unpaid rows instead of duplicating them
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Optional
+import numpy as np
+import pandas as pd
+from sqlalchemy import delete, exists, insert, or_, select
+from app import db
+from models import User, Service, Appointment, EnhancedInvoice, InvoiceItem, Commission
+import logging
+
+logger = logging.getLogger(__name__)
+
+LINE_COLUMNS = ['staff_id', 'appointment_id', 'service_id', 'quantity', 'final_amount',
+                'staff_percentage', 'staff_rate', 'fixed_commission', 'service_rate']
+
+
+class CommissionEngine:
+    """
+    Rate rules, most specific first:
+      1. the staff member's commission_percentage (or legacy commission_rate) when set
+      2. otherwise the service's commission_rate
+    plus the staff member's fixed_commission for every service performed.
+    """
+
+    @classmethod
+    def load_lines(cls, start: date, end: date, staff_ids: Optional[Iterable[int]] = None) -> pd.DataFrame:
+        """Paid service lines for completed appointments invoiced between start and end (inclusive)"""
+        already_settled = exists().where(
+            Commission.appointment_id == InvoiceItem.appointment_id,
+            or_(Commission.is_paid == True,
+                Commission.pay_period_start != start,
+                Commission.pay_period_end != end)
+        )
+        query = select(
+            Appointment.staff_id, InvoiceItem.appointment_id, InvoiceItem.item_id,
+            InvoiceItem.quantity, InvoiceItem.final_amount,
+            User.commission_percentage, User.commission_rate, User.fixed_commission,
+            Service.commission_rate
+        ).join(
+            EnhancedInvoice, EnhancedInvoice.id == InvoiceItem.invoice_id
+        ).join(
+            Appointment, Appointment.id == InvoiceItem.appointment_id
+        ).join(
+            User, User.id == Appointment.staff_id
+        ).outerjoin(
+            Service, Service.id == InvoiceItem.item_id
+        ).where(
+            InvoiceItem.item_type == 'service',
+            EnhancedInvoice.payment_status == 'paid',
+            Appointment.status == 'completed',
+            EnhancedInvoice.invoice_date >= datetime.combine(start, datetime.min.time()),
+            EnhancedInvoice.invoice_date < datetime.combine(end + timedelta(days=1), datetime.min.time()),
+            ~already_settled
+        )
+        if staff_ids:
+            query = query.where(Appointment.staff_id.in_(list(staff_ids)))
+
+        return pd.DataFrame(db.session.execute(query).all(), columns=LINE_COLUMNS)
+
+    @staticmethod
+    def apply_rules(lines: pd.DataFrame) -> pd.DataFrame:
+        """
+        One row per (staff, appointment) with the service amount, rate and commission. Rates
+        apply per line before grouping, so the stored rate is the amount-weighted one
+        """
+        numeric = lines.fillna({'quantity': 1, 'final_amount': 0, 'staff_percentage': 0,
+                                'staff_rate': 0, 'fixed_commission': 0, 'service_rate': 0}).infer_objects()
+        staff_rate = np.where(numeric['staff_percentage'] > 0, numeric['staff_percentage'], numeric['staff_rate'])
+        rate = np.where(staff_rate > 0, staff_rate, numeric['service_rate'])
+
+        rate_amount = numeric['final_amount'] * rate / 100
+        computed = numeric.assign(
+            commission_rate=rate,
+            rate_amount=rate_amount,
+            commission_amount=rate_amount + numeric['fixed_commission'] * numeric['quantity']
+        )
+        grouped = computed.groupby(['staff_id', 'appointment_id'], as_index=False).agg(
+            service_amount=('final_amount', 'sum'),
+            rate_amount=('rate_amount', 'sum'),
+            max_rate=('commission_rate', 'max'),
+            commission_amount=('commission_amount', 'sum')
+        )
+        # Lines at different rates: the rate the whole amount was effectively paid at
+        amount = grouped['service_amount']
+        grouped['commission_rate'] = np.where(
+            amount > 0, grouped['rate_amount'] / amount.replace(0, np.nan) * 100, grouped['max_rate'])
+        grouped = grouped.drop(columns=['rate_amount', 'max_rate'])
+        return grouped.round({'service_amount': 2, 'commission_rate': 2, 'commission_amount': 2})
+
+    @classmethod
+    def calculate(cls, start: date, end: date, staff_ids: Optional[Iterable[int]] = None) -> Dict:
+        """
+        Replace the period's unpaid appointment commissions with freshly computed rows.
+        Paid rows and appointments already commissioned in another period are left alone.
+        """
+        if end < start:
+            raise ValueError("Pay period end must not be before its start")
+        staff_ids = list(staff_ids) if staff_ids else None
+
+        try:
+            commissions = cls.apply_rules(cls.load_lines(start, end, staff_ids))
+
+            stale = delete(Commission).where(
+                Commission.pay_period_start == start,
+                Commission.pay_period_end == end,
+                Commission.is_paid == False,
+                Commission.appointment_id.isnot(None)
+            )
+            if staff_ids:
+                stale = stale.where(Commission.staff_id.in_(staff_ids))
+            removed = db.session.execute(stale, execution_options={'synchronize_session': False}).rowcount or 0
+
+            rows = commissions.assign(
+                staff_id=commissions['staff_id'].astype(int),
+                appointment_id=commissions['appointment_id'].astype(int),
+                pay_period_start=start,
+                pay_period_end=end,
+                is_paid=False,
+                created_at=datetime.utcnow()
+            ).to_dict('records')
+            if rows:
+                db.session.execute(insert(Commission), rows)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error calculating commissions: {e}")
+            return {'success': False, 'error': str(e)}
+
+        per_staff = commissions.groupby('staff_id').agg(
+            appointments=('appointment_id', 'count'),
+            service_amount=('service_amount', 'sum'),
+            commission_amount=('commission_amount', 'sum')
+        ).round(2).reset_index()
+
+        logger.info("Commissions %s to %s: %s rows written, %s replaced", start, end, len(rows), removed)
+        return {
+            'success': True,
+            'pay_period_start': start.isoformat(),
+            'pay_period_end': end.isoformat(),
+            'commissions_written': len(rows),
+            'commissions_replaced': removed,
+            'total_service_amount': round(float(commissions['service_amount'].sum()), 2),
+            'total_commission': round(float(commissions['commission_amount'].sum()), 2),
+            'staff': [{key: (int(value) if key in ('staff_id', 'appointments') else float(value))
+                       for key, value in row.items()} for row in per_staff.to_dict('records')]
+        }
@@ -0,0 +1,315 @@
+"""
+Demand Cube
+Bookings and booked minutes per week x weekday x hour x service category x branch, kept in
+DemandCube and refreshed at commit for just the weeks a transaction's appointments fall in,
+next to scheduled staff-minutes from ShiftLogs on the same grid, so the shift scheduler can
+compare demand with capacity for any week without scanning appointments
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from sqlalchemy import and_, delete, event, exists, func, insert, inspect, or_, select
+from sqlalchemy.orm import Session
+from app import db
+from services.branch_router import branch_router
+from models import (
+    Appointment, Category, DemandCube, Service, ShiftLogs, ShiftManagement, StaffService, User
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Cancelled appointments free their slot, so they are not demand
+EXCLUDED_STATUSES = ('cancelled',)
+
+# Shift log states in which a staff member is on the floor
+WORKING_SHIFT_STATUSES = ('scheduled', 'completed')
+
+UNCATEGORIZED = 'uncategorized'
+
+# Past weeks averaged into the baseline shown next to the selected week
+DEFAULT_BASELINE_WEEKS = 4
+MAX_BASELINE_WEEKS = 26
+
+# session.info key holding the week starts changed in the current transaction
+TOUCHED_KEY = 'demand_cube_weeks'
+
+# Attributes whose change moves an appointment between cube cells
+APPOINTMENT_ATTRIBUTES = ('status', 'appointment_date', 'end_time', 'service_id')
+
+Cell = Tuple[date, int, int, str]
+
+
+def week_start(day: date) -> date:
+    """Monday of the week a date falls in"""
+    if isinstance(day, datetime):
+        day = day.date()
+    return day - timedelta(days=day.weekday())
+
+
+def hour_minutes(start: datetime, end: datetime) -> Iterator[Tuple[datetime, float]]:
+    """(start of clock hour, minutes) for every clock hour the interval overlaps"""
+    cursor = start.replace(minute=0, second=0, microsecond=0)
+    while cursor < end:
+        following = cursor + timedelta(hours=1)
+        minutes = (min(end, following) - max(start, cursor)).total_seconds() / 60
+        if minutes > 0:
+            yield cursor, minutes
+        cursor = following
+
+
+def _category_column():
+    return func.coalesce(Category.name, Service.category, UNCATEGORIZED)
+
+
+def _week_range(week: date) -> Tuple[datetime, datetime]:
+    start = datetime.combine(week, datetime.min.time())
+    return start, start + timedelta(days=7)
+
+
+class DemandCubeMaintainer:
+    """Builds and incrementally refreshes DemandCube for the current branch"""
+
+    @staticmethod
+    def touch(days: Iterable, session=None) -> None:
+        """Mark the weeks of these dates for refresh at commit; used by writers that bypass the ORM"""
+        session = session or db.session
+        session.info.setdefault(TOUCHED_KEY, set()).update(week_start(day) for day in days if day)
+
+    @classmethod
+    def collect_touched(cls, session) -> None:
+        days = []
+        for instance in session.new:
+            if isinstance(instance, Appointment):
+                days.append(instance.appointment_date)
+        for instance in session.dirty:
+            if not isinstance(instance, Appointment):
+                continue
+            state = inspect(instance)
+            if any(state.attrs[attribute].history.has_changes() for attribute in APPOINTMENT_ATTRIBUTES):
+                days.append(instance.appointment_date)
+                days.extend(state.attrs['appointment_date'].history.deleted)
+        for instance in session.deleted:
+            if isinstance(instance, Appointment):
+                days.append(instance.appointment_date)
+        if days:
+            cls.touch(days, session)
+
+    @staticmethod
+    def compute(weeks: Optional[Iterable[date]] = None, session=None) -> Dict[Cell, List]:
+        """
+        [bookings, booked_minutes] per (week_start, weekday, hour, category) from one grouped
+        pass over appointments (all of them when weeks is None). Bookings count in the hour an
+        appointment starts; its minutes are spread over every hour it covers.
+        """
+        session = session or db.session
+        query = select(
+            Appointment.appointment_date, Appointment.end_time, _category_column(),
+            Service.duration, func.count(Appointment.id)
+        ).outerjoin(
+            Service, Service.id == Appointment.service_id
+        ).outerjoin(
+            Category, Category.id == Service.category_id
+        ).where(
+            func.coalesce(Appointment.status, 'scheduled').notin_(EXCLUDED_STATUSES)
+        ).group_by(
+            Appointment.appointment_date, Appointment.end_time, _category_column(), Service.duration
+        )
+        if weeks is not None:
+            ranges = [_week_range(week) for week in sorted(set(weeks))]
+            if not ranges:
+                return {}
+            # From the Sunday before, so appointments running past midnight into the week count
+            query = query.where(or_(*[
+                and_(Appointment.appointment_date >= start - timedelta(days=1),
+                     Appointment.appointment_date < end)
+                for start, end in ranges
+            ]))
+
+        cells: Dict[Cell, List] = {}
+        for start, end, category, duration, count in session.execute(query).all():
+            if end is None or end <= start:
+                end = start + timedelta(minutes=duration or 0)
+            first = cells.setdefault((week_start(start), start.weekday(), start.hour, category), [0, 0.0])
+            first[0] += count
+            for hour, minutes in hour_minutes(start, end):
+                cell = cells.setdefault((week_start(hour), hour.weekday(), hour.hour, category), [0, 0.0])
+                cell[1] += minutes * count
+        return cells
+
+    @classmethod
+    def _write(cls, cells: Dict[Cell, List], weeks: Optional[Set[date]], session) -> int:
+        """Replace the branch's cells for the given weeks (every week when None)"""
+        branch = branch_router.current()
+        statement = delete(DemandCube).where(DemandCube.branch == branch)
+        if weeks is not None:
+            statement = statement.where(DemandCube.week_start.in_(list(weeks)))
+            cells = {key: value for key, value in cells.items() if key[0] in weeks}
+        session.execute(statement, execution_options={'synchronize_session': False})
+        now = datetime.utcnow()
+        rows = [{
+            'branch': branch, 'week_start': week, 'weekday': weekday, 'hour': hour, 'category': category,
+            'bookings': bookings, 'booked_minutes': round(minutes, 2), 'updated_at': now
+        } for (week, weekday, hour, category), (bookings, minutes) in cells.items()]
+        if rows:
+            session.execute(insert(DemandCube), rows)
+        return len(rows)
+
+    @classmethod
+    def refresh_weeks(cls, weeks: Iterable[date], session=None) -> int:
+        """Recompute the cube for the given weeks; does not commit"""
+        session = session or db.session
+        weeks = {week_start(week) for week in weeks}
+        if not weeks:
+            return 0
+        return cls._write(cls.compute(weeks, session), weeks, session)
+
+    @classmethod
+    def rebuild(cls) -> Dict:
+        """Rebuild the whole cube for this branch in one grouped pass; commits"""
+        try:
+            cells = cls._write(cls.compute(), None, db.session)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error rebuilding demand cube: {e}")
+            raise
+        logger.info("Demand cube rebuilt: %s cells", cells)
+        return {'success': True, 'cells': cells}
+
+    @staticmethod
+    def demand(weeks: Iterable[date], category: Optional[str] = None) -> Dict[Tuple[int, int], List]:
+        """[bookings, booked_minutes] per (weekday, hour) summed over the given weeks"""
+        query = select(
+            DemandCube.weekday, DemandCube.hour,
+            func.sum(DemandCube.bookings), func.sum(DemandCube.booked_minutes)
+        ).where(
+            DemandCube.branch == branch_router.current(),
+            DemandCube.week_start.in_([week_start(week) for week in weeks])
+        ).group_by(DemandCube.weekday, DemandCube.hour)
+        if category:
+            query = query.where(DemandCube.category == category)
+        return {(weekday, hour): [int(bookings or 0), float(minutes or 0)]
+                for weekday, hour, bookings, minutes in db.session.execute(query).all()}
+
+    @staticmethod
+    def capacity(week: date, category: Optional[str] = None) -> Dict[Tuple[int, int], List]:
+        """
+        [staff_minutes, staff] per (weekday, hour) scheduled in ShiftLogs for one week, with
+        breaks taken out. With a category, only staff assigned a service in it count.
+        """
+        week = week_start(week)
+        query = select(
+            ShiftManagement.staff_id, ShiftLogs.individual_date, ShiftLogs.shift_start_time,
+            ShiftLogs.shift_end_time, ShiftLogs.break_start_time, ShiftLogs.break_end_time
+        ).join(
+            ShiftManagement, ShiftManagement.id == ShiftLogs.shift_management_id
+        ).join(
+            User, User.id == ShiftManagement.staff_id
+        ).where(
+            ShiftLogs.individual_date >= week,
+            ShiftLogs.individual_date < week + timedelta(days=7),
+            ShiftLogs.status.in_(WORKING_SHIFT_STATUSES),
+            User.is_active == True
+        )
+        if category:
+            query = query.where(exists(
+                select(StaffService.id).join(
+                    Service, Service.id == StaffService.service_id
+                ).outerjoin(
+                    Category, Category.id == Service.category_id
+                ).where(
+                    StaffService.staff_id == ShiftManagement.staff_id,
+                    StaffService.is_active == True,
+                    _category_column() == category
+                )
+            ))
+
+        cells: Dict[Tuple[int, int], List] = {}
+        staff: Dict[Tuple[int, int], Set[int]] = {}
+        for staff_id, day, shift_start, shift_end, break_start, break_end in db.session.execute(query).all():
+            if not (shift_start and shift_end):
+                continue
+            start, end = datetime.combine(day, shift_start), datetime.combine(day, shift_end)
+            minutes = {hour: value for hour, value in hour_minutes(start, end)}
+            if break_start and break_end:
+                for hour, value in hour_minutes(max(start, datetime.combine(day, break_start)),
+                                                min(end, datetime.combine(day, break_end))):
+                    minutes[hour] = minutes.get(hour, 0) - value
+            for hour, value in minutes.items():
+                if value <= 0:
+                    continue
+                key = (hour.weekday(), hour.hour)
+                cells.setdefault(key, [0.0, 0])[0] += value
+                staff.setdefault(key, set()).add(staff_id)
+        for key, members in staff.items():
+            cells[key][1] = len(members)
+        return cells
+
+    @classmethod
+    def demand_vs_capacity(cls, week: date, category: Optional[str] = None,
+                           baseline_weeks: int = DEFAULT_BASELINE_WEEKS) -> Dict:
+        """
+        Weekday x hour grid for one week: bookings and booked minutes from the cube, the
+        average of the previous baseline_weeks weeks, and scheduled staff-minutes. Only
+        cells with demand, baseline or capacity are listed.
+        """
+        week = week_start(week)
+        baseline_weeks = max(0, min(int(baseline_weeks), MAX_BASELINE_WEEKS))
+        demand = cls.demand([week], category)
+        baseline = cls.demand([week - timedelta(weeks=offset) for offset in range(1, baseline_weeks + 1)],
+                              category) if baseline_weeks else {}
+        capacity = cls.capacity(week, category)
+
+        cells = []
+        for key in sorted(set(demand) | set(baseline) | set(capacity)):
+            bookings, booked = demand.get(key, [0, 0.0])
+            base_bookings, base_minutes = baseline.get(key, [0, 0.0])
+            staff_minutes, staff = capacity.get(key, [0.0, 0])
+            weekday, hour = key
+            cells.append({
+                'date': (week + timedelta(days=weekday)).isoformat(),
+                'weekday': weekday,
+                'hour': hour,
+                'bookings': bookings,
+                'booked_minutes': round(booked, 1),
+                'baseline_bookings': round(base_bookings / baseline_weeks, 2) if baseline_weeks else None,
+                'baseline_minutes': round(base_minutes / baseline_weeks, 1) if baseline_weeks else None,
+                'staff_minutes': round(staff_minutes, 1),
+                'staff': staff,
+                'utilization_percentage': round(booked / staff_minutes * 100, 1) if staff_minutes else None,
+                'understaffed': booked > staff_minutes
+            })
+
+        booked_total = sum(cell['booked_minutes'] for cell in cells)
+        staff_total = sum(cell['staff_minutes'] for cell in cells)
+        return {
+            'branch': branch_router.current(),
+            'week_start': week.isoformat(),
+            'category': category,
+            'baseline_weeks': baseline_weeks,
+            'total_bookings': sum(cell['bookings'] for cell in cells),
+            'total_booked_minutes': round(booked_total, 1),
+            'total_staff_minutes': round(staff_total, 1),
+            'utilization_percentage': round(booked_total / staff_total * 100, 1) if staff_total else None,
+            'cells': cells
+        }
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_demand_changes(session, flush_context):
+    # History and the new/dirty/deleted collections still hold the pre-flush state here
+    DemandCubeMaintainer.collect_touched(session)
+
+
+@event.listens_for(Session, 'before_commit')
+def _refresh_demand_cube(session):
+    if session.new or session.dirty or session.deleted:
+        session.flush()
+    weeks = session.info.pop(TOUCHED_KEY, set())
+    if weeks:
+        DemandCubeMaintainer.refresh_weeks(weeks, session)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_demand_changes(session):
+    session.info.pop(TOUCHED_KEY, None)
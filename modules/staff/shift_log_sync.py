@@ -0,0 +1,181 @@
+"""
+Shift Log Sync Engine
+Diff-based upserts of ShiftLogs rows and grouped schedule listings for the shift scheduler
+"""
+from dataclasses import dataclass, field
+from datetime import datetime, date
+from typing import Dict, List, Optional
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.orm import aliased
+from app import db
+from models import User, ShiftManagement, ShiftLogs
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Columns compared when deciding whether an existing shift log needs an update
+SHIFT_LOG_FIELDS = ('shift_start_time', 'shift_end_time', 'break_start_time', 'break_end_time')
+
+
+def _parse_time(value):
+    """Parse an HH:MM string from the scheduler UI, returning None for blanks"""
+    return datetime.strptime(value, '%H:%M').time() if value else None
+
+
+def parse_schedule_days(schedule_days) -> Dict[date, Dict]:
+    """Convert submitted schedule days into {date: shift values} for working days only"""
+    parsed = {}
+    for day in schedule_days:
+        if not day.get('working', False):
+            continue
+        day_date = datetime.strptime(day['date'], '%Y-%m-%d').date()
+        parsed[day_date] = {
+            'shift_start_time': _parse_time(day.get('startTime')),
+            'shift_end_time': _parse_time(day.get('endTime')),
+            'break_start_time': _parse_time(day.get('breakStart')),
+            'break_end_time': _parse_time(day.get('breakEnd')),
+        }
+    return parsed
+
+
+@dataclass
+class ShiftLogDiff:
+    """Set of bulk statements needed to bring stored shift logs in line with a submission"""
+    inserts: List[Dict] = field(default_factory=list)
+    updates: List[Dict] = field(default_factory=list)
+    deletes: List[int] = field(default_factory=list)
+    unchanged: int = 0
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.inserts or self.updates or self.deletes)
+
+    def to_dict(self) -> Dict:
+        return {
+            'inserted': len(self.inserts),
+            'updated': len(self.updates),
+            'deleted': len(self.deletes),
+            'unchanged': self.unchanged
+        }
+
+
+class ShiftLogSyncService:
+    """Keeps ShiftLogs in sync with scheduler submissions without delete/re-insert churn"""
+
+    @classmethod
+    def compute_diff(cls, shift_management_id: int, submitted: Dict[date, Dict],
+                     prune: bool = True) -> ShiftLogDiff:
+        """
+        Compare submitted days against stored rows for one shift management entry.
+        With prune=True, stored days missing from the submission are deleted.
+        """
+        existing_rows = db.session.execute(
+            select(ShiftLogs.id, ShiftLogs.individual_date,
+                   *[getattr(ShiftLogs, name) for name in SHIFT_LOG_FIELDS])
+            .where(ShiftLogs.shift_management_id == shift_management_id)
+            .order_by(ShiftLogs.id)
+        ).all()
+
+        diff = ShiftLogDiff()
+        seen_dates = set()
+        for row in existing_rows:
+            row_date = row.individual_date
+            # Duplicate rows for the same date are left over from older saves
+            if row_date in seen_dates:
+                diff.deletes.append(row.id)
+                continue
+            seen_dates.add(row_date)
+
+            values = submitted.get(row_date)
+            if values is None:
+                if prune:
+                    diff.deletes.append(row.id)
+                else:
+                    diff.unchanged += 1
+                continue
+
+            changed = {name: values[name] for name in SHIFT_LOG_FIELDS
+                       if getattr(row, name) != values[name]}
+            if changed:
+                changed['id'] = row.id
+                diff.updates.append(changed)
+            else:
+                diff.unchanged += 1
+
+        for day_date in sorted(set(submitted) - seen_dates):
+            diff.inserts.append({
+                'shift_management_id': shift_management_id,
+                'individual_date': day_date,
+                'status': 'scheduled',
+                **submitted[day_date]
+            })
+
+        return diff
+
+    @classmethod
+    def apply_diff(cls, diff: ShiftLogDiff) -> None:
+        """Apply a diff with one bulk statement per operation; the caller commits"""
+        if diff.deletes:
+            db.session.execute(
+                delete(ShiftLogs).where(ShiftLogs.id.in_(diff.deletes)),
+                execution_options={'synchronize_session': False}
+            )
+        if diff.updates:
+            db.session.execute(update(ShiftLogs), diff.updates)
+        if diff.inserts:
+            db.session.execute(insert(ShiftLogs), diff.inserts)
+
+    @classmethod
+    def sync(cls, shift_management_id: int, schedule_days, prune: bool = True) -> ShiftLogDiff:
+        """Parse submitted schedule days, compute the diff and apply it"""
+        submitted = parse_schedule_days(schedule_days)
+        diff = cls.compute_diff(shift_management_id, submitted, prune=prune)
+        cls.apply_diff(diff)
+        logger.debug("Shift logs synced for management %s: %s", shift_management_id, diff.to_dict())
+        return diff
+
+    @classmethod
+    def get_schedule_summaries(cls, staff_id: Optional[int] = None, start_date: Optional[date] = None,
+                               end_date: Optional[date] = None, active_only: bool = True):
+        """
+        List shift management entries with their log statistics in one grouped query.
+        Each row carries ShiftManagement, User, the first ShiftLogs row (or None),
+        total_logs, first_date and last_date.
+        """
+        log_stats = select(
+            ShiftLogs.shift_management_id.label('management_id'),
+            func.min(ShiftLogs.id).label('first_log_id'),
+            func.min(ShiftLogs.individual_date).label('first_date'),
+            func.max(ShiftLogs.individual_date).label('last_date'),
+            func.count(ShiftLogs.id).label('total_logs')
+        ).group_by(ShiftLogs.shift_management_id).subquery()
+        first_log = aliased(ShiftLogs)
+
+        query = db.session.query(
+            ShiftManagement,
+            User,
+            first_log,
+            func.coalesce(log_stats.c.total_logs, 0).label('total_logs'),
+            log_stats.c.first_date,
+            log_stats.c.last_date
+        ).join(
+            User, ShiftManagement.staff_id == User.id
+        ).outerjoin(
+            log_stats, log_stats.c.management_id == ShiftManagement.id
+        ).outerjoin(
+            first_log, first_log.id == log_stats.c.first_log_id
+        )
+
+        if active_only:
+            query = query.filter(User.is_active == True)
+        if staff_id:
+            query = query.filter(ShiftManagement.staff_id == staff_id)
+        if start_date:
+            query = query.filter(ShiftManagement.to_date >= start_date)
+        if end_date:
+            query = query.filter(ShiftManagement.from_date <= end_date)
+
+        return query.order_by(
+            ShiftManagement.created_at.desc(), User.first_name, User.last_name
+        ).all()
+
@@ -7,7 +7,10 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from flask_login import login_required, current_user
 from werkzeug.exceptions import BadRequest
 from app import app, db
+from services.query_budget import query_budget
 from models import User, ShiftManagement, ShiftLogs
+from .shift_log_sync import ShiftLogSyncService
+from .demand_cube import DemandCubeMaintainer, DEFAULT_BASELINE_WEEKS
 from datetime import datetime, date, timedelta
 import json
 
@@ -81,17 +84,13 @@ def api_staff_day_schedule(staff_id):
         end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
 
         # Get all shift managements that overlap with the requested date range
-        schedules = ShiftManagement.query.filter(
-            ShiftManagement.staff_id == staff_id,
-            ShiftManagement.from_date <= end_date,
-            ShiftManagement.to_date >= start_date
-        ).order_by(ShiftManagement.from_date).all()
+        schedules = ShiftLogSyncService.get_schedule_summaries(
+            staff_id=staff_id, start_date=start_date, end_date=end_date, active_only=False
+        )
+        schedules.sort(key=lambda row: row[0].from_date)
 
         schedule_data = []
-        for schedule in schedules:
-            # Get first shift log for this management entry to show times
-            first_log = ShiftLogs.query.filter_by(shift_management_id=schedule.id).first()
-            
+        for schedule, _staff, first_log, _total_logs, _first_date, _last_date in schedules:
             schedule_data.append({
                 'id': schedule.id,
                 'schedule_name': f"Shift {schedule.from_date.strftime('%Y-%m-%d')} to {schedule.to_date.strftime('%Y-%m-%d')}",
@@ -153,13 +152,10 @@ def save_daily_schedule():
         existing_management = ShiftManagement.query.filter_by(staff_id=staff_id).first()
         
         if existing_management:
-            # Update existing entry - extend date range and clear old logs
+            # Update existing entry - extend date range; logs are synced below
             existing_management.from_date = min(existing_management.from_date, from_date)
             existing_management.to_date = max(existing_management.to_date, to_date)
             existing_management.updated_at = datetime.utcnow()
-            
-            # Clear existing shift logs for this management entry
-            ShiftLogs.query.filter_by(shift_management_id=existing_management.id).delete()
             shift_management = existing_management
         else:
             # Create new shift management entry
@@ -171,41 +167,29 @@ def save_daily_schedule():
             db.session.add(shift_management)
             db.session.flush()  # Get the ID
 
-        # Create shift logs for each working day
-        logs_created = 0
-        for day in working_days:
-            day_date = datetime.strptime(day['date'], '%Y-%m-%d').date()
-            start_time = datetime.strptime(day['startTime'], '%H:%M').time() if day.get('startTime') else None
-            end_time = datetime.strptime(day['endTime'], '%H:%M').time() if day.get('endTime') else None
-            break_start = datetime.strptime(day['breakStart'], '%H:%M').time() if day.get('breakStart') else None
-            break_end = datetime.strptime(day['breakEnd'], '%H:%M').time() if day.get('breakEnd') else None
-
-            shift_log = ShiftLogs(
-                shift_management_id=shift_management.id,
-                individual_date=day_date,
-                shift_start_time=start_time,
-                shift_end_time=end_time,
-                break_start_time=break_start,
-                break_end_time=break_end,
-                status='scheduled'
-            )
-            db.session.add(shift_log)
-            logs_created += 1
+        # Insert, update and delete only the days that changed
+        diff = ShiftLogSyncService.sync(shift_management.id, working_days)
+        changes = diff.to_dict()
+        logs_created = changes['inserted']
 
         db.session.commit()
 
         return jsonify({
             'success': True,
-            'message': f'Schedule saved successfully! Created {logs_created} shift log(s)',
+            'message': (f"Schedule saved successfully! Created {changes['inserted']}, updated "
+                        f"{changes['updated']} and removed {changes['deleted']} shift log(s)"),
             'shift_management_id': shift_management.id,
-            'logs_created': logs_created
+            'logs_created': logs_created,
+            'changes': changes
         })
 
     except Exception as e:
+        db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
 
 # Get all schedules from all staff members for management table
 @shift_scheduler_bp.route('/api/all-schedules', methods=['GET'])
+@query_budget(2)
 @login_required
 def api_get_all_schedules():
     """Get consolidated schedule view using new shift management schema"""
@@ -213,19 +197,12 @@ def api_get_all_schedules():
         return jsonify({'error': 'Access denied'}), 403
 
     try:
-        # Get all shift managements with staff information, ordered by most recent first
-        schedules = db.session.query(ShiftManagement, User).join(
-            User, ShiftManagement.staff_id == User.id
-        ).filter(
-            User.is_active == True
-        ).order_by(ShiftManagement.created_at.desc(), User.first_name, User.last_name).all()
+        # Get all shift managements with staff information and log statistics in one grouped query
+        schedules = ShiftLogSyncService.get_schedule_summaries()
 
         # Create schedule list directly - one entry per staff since we now have unique constraint
         schedule_list = []
-        for schedule, staff in schedules:
-            # Get first shift log for working days info
-            first_log = ShiftLogs.query.filter_by(shift_management_id=schedule.id).first()
-            
+        for schedule, staff, first_log, total_logs, first_date, last_date in schedules:
             # Default working days
             working_days = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri']
             working_days_str = "Mon to Fri"
@@ -239,9 +216,6 @@ def api_get_all_schedules():
                 shift_end_time = first_log.shift_end_time.strftime('%H:%M') if first_log.shift_end_time else ''
                 break_time = first_log.get_break_time_display()
 
-            # Get total working days for this staff
-            total_logs = ShiftLogs.query.filter_by(shift_management_id=schedule.id).count()
-
             schedule_list.append({
                 'id': schedule.id,
                 'staff_id': staff.id,
@@ -511,37 +485,20 @@ def update_daily_schedule(schedule_id):
         shift_management.from_date = from_date
         shift_management.to_date = to_date
 
-        # Delete existing shift logs
-        ShiftLogs.query.filter_by(shift_management_id=schedule_id).delete()
-
-        # Create new shift logs for each working day
-        logs_updated = 0
-        for day in working_days:
-            day_date = datetime.strptime(day['date'], '%Y-%m-%d').date()
-            start_time = datetime.strptime(day['startTime'], '%H:%M').time() if day.get('startTime') else None
-            end_time = datetime.strptime(day['endTime'], '%H:%M').time() if day.get('endTime') else None
-            break_start = datetime.strptime(day['breakStart'], '%H:%M').time() if day.get('breakStart') else None
-            break_end = datetime.strptime(day['breakEnd'], '%H:%M').time() if day.get('breakEnd') else None
-
-            shift_log = ShiftLogs(
-                shift_management_id=shift_management.id,
-                individual_date=day_date,
-                shift_start_time=start_time,
-                shift_end_time=end_time,
-                break_start_time=break_start,
-                break_end_time=break_end,
-                status='scheduled'
-            )
-            db.session.add(shift_log)
-            logs_updated += 1
+        # Insert, update and delete only the days that changed
+        diff = ShiftLogSyncService.sync(shift_management.id, working_days)
+        changes = diff.to_dict()
+        logs_updated = changes['updated']
 
         db.session.commit()
 
         return jsonify({
             'success': True,
-            'message': f'Schedule updated successfully! Updated {logs_updated} shift log(s)',
+            'message': (f"Schedule updated successfully! Created {changes['inserted']}, updated "
+                        f"{changes['updated']} and removed {changes['deleted']} shift log(s)"),
             'shift_management_id': shift_management.id,
-            'logs_updated': logs_updated
+            'logs_updated': logs_updated,
+            'changes': changes
         })
 
     except Exception as e:
@@ -619,4 +576,40 @@ def api_get_database_records():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Demand versus scheduled capacity per weekday and hour for one week
+@shift_scheduler_bp.route('/api/shift-scheduler/demand-capacity', methods=['GET'])
+@login_required
+def api_demand_capacity():
+    """Bookings and booked minutes from the demand cube next to scheduled staff-minutes"""
+    if not current_user.can_access('staff'):
+        return jsonify({'error': 'Access denied'}), 403
+
+    try:
+        week_str = request.args.get('week')
+        week = datetime.strptime(week_str, '%Y-%m-%d').date() if week_str else date.today()
+        result = DemandCubeMaintainer.demand_vs_capacity(
+            week,
+            category=request.args.get('category') or None,
+            baseline_weeks=request.args.get('baseline_weeks', DEFAULT_BASELINE_WEEKS, type=int)
+        )
+        return jsonify({'success': True, **result})
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Rebuild the demand cube from all appointments
+@shift_scheduler_bp.route('/api/shift-scheduler/demand-cube/rebuild', methods=['POST'])
+@login_required
+def api_rebuild_demand_cube():
+    """Full rebuild; the cube is otherwise refreshed as appointments change"""
+    if not current_user.can_access('staff'):
+        return jsonify({'error': 'Access denied'}), 403
+
+    try:
+        return jsonify(DemandCubeMaintainer.rebuild())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 print("Shift Scheduler views registered successfully")
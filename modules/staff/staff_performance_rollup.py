@@ -0,0 +1,192 @@
+"""
+Staff Performance Rollup
+Computes every staff member's monthly appointments, revenue, hours, utilization, rating
+and commission with a handful of grouped queries and upserts them into StaffPerformance,
+so the staff performance pages read precomputed rows
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+from sqlalchemy import case, func, insert, update
+from app import db
+from models import (
+    User, Appointment, Attendance, Review, Commission, Service,
+    ShiftManagement, ShiftLogs, StaffPerformance
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+STAFF_ROLES = ['staff', 'manager', 'admin']
+
+# Monday-Saturday; used for attendance percentage when a staff member has no shift logs
+WORKING_WEEKDAYS = 6
+
+# During the first days of a month the previous month is refreshed too, so late
+# completions and attendance edits still land in its final numbers
+PREVIOUS_MONTH_GRACE_DAYS = 3
+
+
+def month_bounds(year: int, month: int) -> Tuple[date, date]:
+    """First day of the month and first day of the next month (half-open range)"""
+    start = date(year, month, 1)
+    next_start = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return start, next_start
+
+
+def _working_days(start: date, end: date) -> int:
+    """Days from start up to (not including) end that fall on working weekdays"""
+    return sum(1 for offset in range((end - start).days)
+               if (start + timedelta(days=offset)).weekday() < WORKING_WEEKDAYS)
+
+
+class StaffPerformanceRollup:
+    """Set-based monthly rollup into StaffPerformance"""
+
+    @classmethod
+    def compute_month(cls, year: int, month: int, as_of: Optional[date] = None,
+                      staff_ids: Optional[Iterable[int]] = None) -> Dict[int, Dict]:
+        """Metrics per staff id for one month; date filters are plain ranges so indexes apply"""
+        start, next_start = month_bounds(year, month)
+        # Attendance percentage only counts days that have already happened
+        period_end = min(next_start, (as_of or date.today()) + timedelta(days=1))
+        start_dt = datetime.combine(start, datetime.min.time())
+        next_start_dt = datetime.combine(next_start, datetime.min.time())
+        staff_filter = list(staff_ids) if staff_ids else None
+
+        def scoped(query, column):
+            return query.filter(column.in_(staff_filter)) if staff_filter else query
+
+        completed = Appointment.status == 'completed'
+        appointment_rows = scoped(db.session.query(
+            Appointment.staff_id,
+            func.count(Appointment.id),
+            func.sum(case((completed, 1), else_=0)),
+            func.sum(case((completed, func.coalesce(Appointment.amount, 0)
+                           - func.coalesce(Appointment.discount, 0)), else_=0)),
+            func.sum(case((completed, func.coalesce(Service.duration, 0)), else_=0))
+        ).outerjoin(Service, Service.id == Appointment.service_id).filter(
+            Appointment.appointment_date >= start_dt,
+            Appointment.appointment_date < next_start_dt
+        ), Appointment.staff_id).group_by(Appointment.staff_id).all()
+
+        attendance_rows = scoped(db.session.query(
+            Attendance.staff_id,
+            func.count(func.distinct(Attendance.date)),
+            func.sum(func.coalesce(Attendance.total_hours, 0))
+        ).filter(
+            Attendance.date >= start,
+            Attendance.date < next_start
+        ), Attendance.staff_id).group_by(Attendance.staff_id).all()
+
+        scheduled_rows = scoped(db.session.query(
+            ShiftManagement.staff_id,
+            func.count(func.distinct(ShiftLogs.individual_date))
+        ).join(ShiftLogs, ShiftLogs.shift_management_id == ShiftManagement.id).filter(
+            ShiftLogs.individual_date >= start,
+            ShiftLogs.individual_date < period_end,
+            ShiftLogs.status != 'holiday'
+        ), ShiftManagement.staff_id).group_by(ShiftManagement.staff_id).all()
+
+        rating_rows = scoped(db.session.query(
+            Review.staff_id, func.avg(Review.rating)
+        ).filter(
+            Review.staff_id.isnot(None),
+            Review.created_at >= start_dt,
+            Review.created_at < next_start_dt
+        ), Review.staff_id).group_by(Review.staff_id).all()
+
+        commission_rows = scoped(db.session.query(
+            Commission.staff_id, func.sum(Commission.commission_amount)
+        ).filter(
+            Commission.pay_period_start >= start,
+            Commission.pay_period_start < next_start
+        ), Commission.staff_id).group_by(Commission.staff_id).all()
+
+        staff_rows = scoped(db.session.query(User.id).filter(
+            User.is_active == True,
+            User.role.in_(STAFF_ROLES)
+        ), User.id).all()
+
+        metrics: Dict[int, Dict] = {}
+
+        def metrics_for(staff_id):
+            return metrics.setdefault(staff_id, {
+                'appointments_total': 0, 'services_completed': 0, 'revenue_generated': 0.0,
+                'booked_hours': 0.0, 'attendance_days': 0, 'hours_worked': 0.0,
+                'client_ratings_avg': 0.0, 'commission_earned': 0.0, 'scheduled_days': None
+            })
+
+        for (staff_id,) in staff_rows:
+            metrics_for(staff_id)
+        for staff_id, total, completed_count, revenue, booked_minutes in appointment_rows:
+            row = metrics_for(staff_id)
+            row['appointments_total'] = total or 0
+            row['services_completed'] = int(completed_count or 0)
+            row['revenue_generated'] = round(float(revenue or 0), 2)
+            row['booked_hours'] = round(float(booked_minutes or 0) / 60, 2)
+        for staff_id, days, hours in attendance_rows:
+            row = metrics_for(staff_id)
+            row['attendance_days'] = days or 0
+            row['hours_worked'] = round(float(hours or 0), 2)
+        for staff_id, days in scheduled_rows:
+            metrics_for(staff_id)['scheduled_days'] = days
+        for staff_id, rating in rating_rows:
+            metrics_for(staff_id)['client_ratings_avg'] = round(float(rating or 0), 2)
+        for staff_id, commission in commission_rows:
+            metrics_for(staff_id)['commission_earned'] = round(float(commission or 0), 2)
+
+        default_working_days = _working_days(start, period_end) if period_end > start else 0
+        for row in metrics.values():
+            scheduled_days = row.pop('scheduled_days') or default_working_days
+            row['attendance_percentage'] = (
+                round(min(row['attendance_days'] / scheduled_days * 100, 100), 1) if scheduled_days else 0.0
+            )
+            row['utilization_percentage'] = (
+                round(row['booked_hours'] / row['hours_worked'] * 100, 1) if row['hours_worked'] else 0.0
+            )
+        return metrics
+
+    @classmethod
+    def refresh_month(cls, year: int, month: int, staff_ids: Optional[Iterable[int]] = None,
+                      now: Optional[datetime] = None) -> Dict:
+        """Upsert one month's rows: one bulk INSERT for new staff, one bulk UPDATE for the rest"""
+        now = now or datetime.utcnow()
+        metrics = cls.compute_month(year, month, as_of=now.date(), staff_ids=staff_ids)
+
+        existing = dict(db.session.query(StaffPerformance.staff_id, StaffPerformance.id).filter(
+            StaffPerformance.year == year,
+            StaffPerformance.month == month,
+            StaffPerformance.staff_id.in_(list(metrics))
+        ).all()) if metrics else {}
+
+        new_rows = [{'staff_id': staff_id, 'year': year, 'month': month,
+                     'created_at': now, 'updated_at': now, **values}
+                    for staff_id, values in metrics.items() if staff_id not in existing]
+        changed_rows = [{'id': existing[staff_id], 'updated_at': now, **values}
+                        for staff_id, values in metrics.items() if staff_id in existing]
+
+        if new_rows:
+            db.session.execute(insert(StaffPerformance), new_rows)
+        if changed_rows:
+            db.session.execute(update(StaffPerformance), changed_rows)
+        return {'year': year, 'month': month, 'inserted': len(new_rows), 'updated': len(changed_rows)}
+
+    @classmethod
+    def run(cls, now: Optional[datetime] = None) -> Dict:
+        """Refresh the current month (and the previous one early in a month) and commit"""
+        now = now or datetime.utcnow()
+        periods = [(now.year, now.month)]
+        if now.day <= PREVIOUS_MONTH_GRACE_DAYS:
+            previous = now.date().replace(day=1) - timedelta(days=1)
+            periods.append((previous.year, previous.month))
+
+        try:
+            results = [cls.refresh_month(year, month, now=now) for year, month in periods]
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error rolling up staff performance: {e}")
+            raise
+
+        logger.info("Staff performance rollup: %s", results)
+        return {'success': True, 'refreshed_at': now.isoformat(), 'periods': results}
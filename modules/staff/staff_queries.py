@@ -12,6 +12,7 @@ from models import (
 )
 from datetime import datetime, date, timedelta
 from werkzeug.security import generate_password_hash
+from .staff_performance_rollup import month_bounds
 
 def get_all_staff():
     """Get all active staff members with comprehensive data"""
@@ -20,7 +21,7 @@ def get_all_staff():
 def get_comprehensive_staff():
     """Get all staff with comprehensive information including relationships"""
     return User.query.options(
-        db.joinedload(User.user_role),
+        db.joinedload(User.dynamic_role),
         db.joinedload(User.staff_department),
         db.joinedload(User.staff_services)
     ).filter_by(is_active=True).order_by(User.first_name).all()
@@ -209,31 +210,42 @@ def get_staff_commissions(staff_id):
 def get_staff_stats(staff_id):
     """Get comprehensive statistics for a staff member"""
     today = date.today()
-    current_month = today.month
-    current_year = today.year
 
     # Basic stats
     total_appointments = Appointment.query.filter_by(staff_id=staff_id).count()
+
+    # Monthly figures come from the rollup row when the job has produced one
+    performance = get_staff_performance(staff_id, today.month, today.year)
+    if performance and performance.updated_at:
+        return {
+            'total_appointments': total_appointments,
+            'monthly_appointments': performance.appointments_total or 0,
+            'monthly_hours': performance.hours_worked or 0,
+            'attendance_days': performance.attendance_days or 0
+        }
+
+    month_start, next_month_start = month_bounds(today.year, today.month)
     monthly_appointments = Appointment.query.filter(
         Appointment.staff_id == staff_id,
-        func.extract('month', Appointment.appointment_date) == current_month,
-        func.extract('year', Appointment.appointment_date) == current_year
+        Appointment.appointment_date >= month_start,
+        Appointment.appointment_date < next_month_start
     ).count()
 
     # Attendance stats
-    monthly_attendance = Attendance.query.filter(
+    attendance_days, total_hours = db.session.query(
+        func.count(Attendance.id),
+        func.coalesce(func.sum(Attendance.total_hours), 0)
+    ).filter(
         Attendance.staff_id == staff_id,
-        func.extract('month', Attendance.date) == current_month,
-        func.extract('year', Attendance.date) == current_year
-    ).all()
-
-    total_hours = sum([att.total_hours or 0 for att in monthly_attendance])
+        Attendance.date >= month_start,
+        Attendance.date < next_month_start
+    ).one()
 
     return {
         'total_appointments': total_appointments,
         'monthly_appointments': monthly_appointments,
         'monthly_hours': total_hours,
-        'attendance_days': len(monthly_attendance)
+        'attendance_days': attendance_days
     }
 
 def get_staff_attendance(staff_id, start_date=None, end_date=None):
@@ -316,7 +328,7 @@ def get_comprehensive_staff():
         db.session.expire_all()
         
         staff_members = User.query.options(
-            db.joinedload(User.user_role),
+            db.joinedload(User.dynamic_role),
             db.joinedload(User.staff_department),
             db.joinedload(User.staff_services)
         ).filter(
@@ -325,7 +337,8 @@ def get_comprehensive_staff():
         ).order_by(User.first_name).all()
 
         # Only update fields that are truly missing, avoid conflicts
-        existing_codes = set([u.staff_code for u in User.query.filter(User.staff_code.isnot(None)).all()])
+        existing_codes = set(code for code, in db.session.query(User.staff_code).filter(User.staff_code.isnot(None)))
+        any_updated = False
         
         for member in staff_members:
             try:
@@ -352,12 +365,15 @@ def get_comprehensive_staff():
                 
                 if updated:
                     db.session.flush()  # Flush individual changes
+                    any_updated = True
             except Exception as member_error:
                 print(f"Error updating member {member.id}: {member_error}")
                 continue
 
+        # Committing expires every loaded member, so only commit when something was backfilled
         try:
-            db.session.commit()
+            if any_updated:
+                db.session.commit()
         except Exception as commit_error:
             print(f"Error committing staff updates: {commit_error}")
             db.session.rollback()
@@ -7,6 +7,8 @@ from flask_login import login_required, current_user
 from werkzeug.security import generate_password_hash
 from werkzeug.utils import secure_filename
 from app import app
+from services.query_budget import query_budget
+from services.report_replica import reads_snapshot
 
 # Create Blueprint for staff management
 staff_bp = Blueprint('staff', __name__, url_prefix='/staff')
@@ -23,6 +25,7 @@ from .staff_queries import (
     get_staff_appointments, get_staff_commissions, get_staff_stats, 
     get_comprehensive_staff, create_comprehensive_staff
 )
+from .staff_performance_rollup import StaffPerformanceRollup
 import os
 import csv
 import io
@@ -462,8 +465,53 @@ def staff_performance(staff_id):
                          recent_appointments=recent_appointments,
                          commissions=commissions)
 
+@app.route('/api/staff/performance/rollup', methods=['POST'])
+@login_required
+def api_staff_performance_rollup():
+    """Recompute StaffPerformance rows; defaults to the current month"""
+    if not current_user.can_access('staff'):
+        return jsonify({'error': 'Access denied'}), 403
+
+    data = request.get_json(silent=True) or {}
+    try:
+        if data.get('year') or data.get('month'):
+            result = StaffPerformanceRollup.refresh_month(int(data['year']), int(data['month']),
+                                                          staff_ids=data.get('staff_ids'))
+            db.session.commit()
+        else:
+            result = StaffPerformanceRollup.run()
+        return jsonify({'success': True, 'result': result})
+    except (KeyError, ValueError):
+        return jsonify({'error': 'year and month must both be given as numbers'}), 400
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error in api_staff_performance_rollup: {e}")
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+
+@app.route('/api/staff/commissions/calculate', methods=['POST'])
+@login_required
+def api_calculate_commissions():
+    """Compute commissions for a pay period from paid invoices of completed appointments"""
+    if not current_user.can_access('staff'):
+        return jsonify({'error': 'Access denied'}), 403
+
+    data = request.get_json(silent=True) or request.form
+    try:
+        start = datetime.strptime(data['pay_period_start'], '%Y-%m-%d').date()
+        end = datetime.strptime(data['pay_period_end'], '%Y-%m-%d').date()
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'pay_period_start and pay_period_end are required (YYYY-MM-DD)'}), 400
+    if end < start:
+        return jsonify({'error': 'pay_period_end must not be before pay_period_start'}), 400
+
+    # pandas is only loaded when payroll is actually run
+    from .commission_engine import CommissionEngine
+    result = CommissionEngine.calculate(start, end, staff_ids=data.get('staff_ids') or None)
+    return jsonify(result), (200 if result['success'] else 500)
+
 @app.route('/staff/export')
 @login_required
+@reads_snapshot
 def export_staff():
     """Export staff data to CSV"""
     if not current_user.can_access('staff'):
@@ -777,6 +825,7 @@ def test_comprehensive_staff():
 # ===== API ENDPOINTS FOR JAVASCRIPT CRUD OPERATIONS =====
 
 @app.route('/api/staff', methods=['GET'])
+@query_budget(5)
 def api_get_all_staff():
     """API endpoint to get all staff data for JavaScript"""
     if not current_user.can_access('staff'):
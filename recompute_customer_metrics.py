@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Rebuild customer lifetime metrics (visits, spend, loyalty points, no-shows) from
+appointments and invoice payments, repairing any rows that have drifted
+Usage: python recompute_customer_metrics.py [CUSTOMER_ID ...]
+"""
+
+from app import app
+import sys
+
+def recompute_metrics(argv):
+    """Recompute all customers, or only the given customer ids"""
+    try:
+        customer_ids = [int(arg) for arg in argv]
+    except ValueError:
+        print(__doc__.strip())
+        return False
+
+    with app.app_context():
+        from modules.clients.customer_metrics import CustomerMetricsMaintainer
+        scope = f"{len(customer_ids)} customer(s)" if customer_ids else "all customers"
+        print(f"Recomputing customer metrics for {scope}...")
+        result = CustomerMetricsMaintainer.recompute(customer_ids=customer_ids or None)
+
+    if not result['success']:
+        print(f"✗ Error during recompute: {result['error']}")
+        return False
+
+    print(f"✓ Customers repaired: {result['customers_repaired']}")
+    return True
+
+if __name__ == "__main__":
+    success = recompute_metrics(sys.argv[1:])
+    sys.exit(0 if success else 1)
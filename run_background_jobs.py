@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+Run the periodic maintenance jobs (package expiry sweep, metrics, rollups, stock alerts,
+analytics export, demand cube, report snapshots) in one dedicated process next to the
+web workers. Only one such process per database runs the jobs; extra ones exit.
+Usage: python run_background_jobs.py
+"""
+
+from app import app
+import sys
+
+def run_jobs():
+    """Start every registered job and idle until interrupted"""
+    from services.background_jobs import background_jobs, start_background_jobs
+
+    start_background_jobs(app, enabled=True)
+    if not background_jobs.started:
+        print("⚠ Background jobs are already running in another process")
+        return False
+
+    print(f"✓ Running jobs: {', '.join(background_jobs.status())}")
+    try:
+        background_jobs.wait()
+    except KeyboardInterrupt:
+        background_jobs.stop()
+    return True
+
+if __name__ == "__main__":
+    success = run_jobs()
+    sys.exit(0 if success else 1)
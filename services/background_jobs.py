@@ -0,0 +1,336 @@
+"""
+Background Job Runner
+Runs periodic maintenance jobs on daemon threads inside the application context, once
+per branch database unless a job covers every branch itself
+"""
+import json
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+import logging
+
+try:
+    import fcntl
+except ImportError:
+    # No advisory file locks on Windows; there the single-process guard is skipped
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Delay before a job's first run so startup and migrations finish first
+DEFAULT_INITIAL_DELAY_SECONDS = 60
+
+# One-off tasks run one at a time per process; their state is kept on disk so any worker
+# process can answer a status poll
+TASK_WORKERS = 1
+TASK_STATE_DIR = os.path.join(os.getcwd(), 'hanamantdatabase', 'background_tasks')
+
+# Held by the one process per database that runs the periodic jobs
+JOBS_LOCK_DIR = os.path.join(os.getcwd(), 'hanamantdatabase')
+
+
+@dataclass
+class PeriodicJob:
+    """A registered job and the outcome of its latest run"""
+    name: str
+    func: Callable[[], Any]
+    interval_seconds: int
+    initial_delay_seconds: int = DEFAULT_INITIAL_DELAY_SECONDS
+    per_branch: bool = True
+    last_started: Optional[datetime] = None
+    last_finished: Optional[datetime] = None
+    last_result: Any = None
+    last_error: Optional[str] = None
+    branch_errors: Dict[str, str] = field(default_factory=dict)
+    runs: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def to_dict(self) -> Dict:
+        return {
+            'name': self.name,
+            'interval_seconds': self.interval_seconds,
+            'last_started': self.last_started.isoformat() if self.last_started else None,
+            'last_finished': self.last_finished.isoformat() if self.last_finished else None,
+            'last_result': self.last_result,
+            'last_error': self.last_error,
+            'branch_errors': self.branch_errors,
+            'runs': self.runs
+        }
+
+
+@dataclass
+class BackgroundTask:
+    """A one-off task submitted from a request and the outcome of its run"""
+    id: str
+    name: str
+    status: str = 'queued'
+    submitted_at: datetime = field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    result: Any = None
+    error: Optional[str] = None
+
+    def to_dict(self) -> Dict:
+        return {
+            'id': self.id,
+            'name': self.name,
+            'status': self.status,
+            'submitted_at': self.submitted_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'result': self.result,
+            'error': self.error
+        }
+
+    def save(self) -> None:
+        os.makedirs(TASK_STATE_DIR, exist_ok=True)
+        path = os.path.join(TASK_STATE_DIR, f"{self.id}.json")
+        with open(f"{path}.tmp", 'w', encoding='utf-8') as handle:
+            json.dump(self.to_dict(), handle, default=str)
+        os.replace(f"{path}.tmp", path)
+
+
+class BackgroundJobRunner:
+    """
+    Registry of periodic jobs, each on its own daemon thread once started, plus a small
+    queue for one-off tasks submitted by requests
+    """
+
+    def __init__(self):
+        self._jobs: Dict[str, PeriodicJob] = {}
+        self._stop = threading.Event()
+        self._app = None
+        self._started = False
+        self._tasks: Optional[ThreadPoolExecutor] = None
+        self._tasks_lock = threading.Lock()
+
+    def register(self, name: str, func: Callable[[], Any], interval_seconds: int,
+                 initial_delay_seconds: int = DEFAULT_INITIAL_DELAY_SECONDS,
+                 per_branch: bool = True) -> PeriodicJob:
+        """per_branch=False runs func once, for jobs that visit every branch themselves"""
+        job = PeriodicJob(name, func, interval_seconds, initial_delay_seconds, per_branch)
+        self._jobs[name] = job
+        if self._started:
+            self._spawn(job)
+        return job
+
+    def start(self, app) -> None:
+        if self._started:
+            return
+        self._app = app
+        self._started = True
+        for job in self._jobs.values():
+            self._spawn(job)
+
+    @property
+    def started(self) -> bool:
+        return self._started
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def wait(self) -> None:
+        """Block until stop() is called (the dedicated jobs process idles here)"""
+        while not self._stop.wait(1):
+            pass
+
+    def _spawn(self, job: PeriodicJob) -> None:
+        thread = threading.Thread(target=self._loop, args=(job,), name=f"job-{job.name}", daemon=True)
+        thread.start()
+
+    def _loop(self, job: PeriodicJob) -> None:
+        delay = job.initial_delay_seconds
+        while not self._stop.wait(delay):
+            self.run_now(job.name)
+            delay = job.interval_seconds
+
+    def run_now(self, name: str) -> Any:
+        """
+        Run a job immediately; overlapping runs of one job are skipped. A per-branch job runs
+        in a fresh app context bound to each branch in turn, so one failing branch does not
+        stop the others; its result and errors are then keyed by branch
+        """
+        job = self._jobs[name]
+        if not job.lock.acquire(blocking=False):
+            logger.info("Background job %s is already running", name)
+            return None
+        try:
+            from services.branch_router import branch_router
+            job.last_started = datetime.utcnow()
+            try:
+                if job.per_branch:
+                    results, errors = {}, {}
+                    for branch in branch_router.branches():
+                        value, error = self._run_in_context(job, branch)
+                        if error is None:
+                            results[branch] = value
+                        else:
+                            errors[branch] = error
+                    job.last_result, job.branch_errors = results, errors
+                    job.last_error = '; '.join(f"{branch}: {error}" for branch, error in errors.items()) or None
+                else:
+                    job.last_result, job.last_error = self._run_in_context(job, None)
+            finally:
+                job.last_finished = datetime.utcnow()
+                job.runs += 1
+            return job.last_result
+        finally:
+            job.lock.release()
+
+    def _run_in_context(self, job: PeriodicJob, branch: Optional[str]):
+        """(result, None) or (None, error) of one run, in an app context bound to branch"""
+        from app import app as flask_app, db
+        from services.branch_router import branch_router
+        with (self._app or flask_app).app_context():
+            try:
+                if branch is not None:
+                    branch_router.bind(branch)
+                return job.func(), None
+            except Exception as e:
+                db.session.rollback()
+                logger.exception("Background job %s failed%s", job.name,
+                                 f" on branch '{branch}'" if branch else '')
+                return None, str(e)
+            finally:
+                db.session.remove()
+
+    def status(self) -> Dict[str, Dict]:
+        return {name: job.to_dict() for name, job in self._jobs.items()}
+
+    def submit(self, name: str, func: Callable[..., Any], *args, **kwargs) -> BackgroundTask:
+        """
+        Queue func(*args, **kwargs) to run off the request thread, in an app context bound
+        to the caller's branch. Poll task_status() with the returned task's id
+        """
+        from services.branch_router import branch_router
+        task = BackgroundTask(uuid.uuid4().hex, name)
+        task.save()
+        branch = branch_router.current()
+        with self._tasks_lock:
+            if self._tasks is None:
+                self._tasks = ThreadPoolExecutor(max_workers=TASK_WORKERS, thread_name_prefix='task')
+            self._tasks.submit(self._run_task, task, branch, func, args, kwargs)
+        return task
+
+    def _run_task(self, task: BackgroundTask, branch: str, func: Callable[..., Any], args, kwargs) -> None:
+        from app import app as flask_app, db
+        from services.branch_router import branch_router
+        with (self._app or flask_app).app_context():
+            task.status, task.started_at = 'running', datetime.utcnow()
+            task.save()
+            try:
+                branch_router.bind(branch)
+                task.result = func(*args, **kwargs)
+                task.status = 'finished'
+            except Exception as e:
+                db.session.rollback()
+                task.status, task.error = 'failed', str(e)
+                logger.exception("Background task %s (%s) failed", task.name, task.id)
+            finally:
+                task.finished_at = datetime.utcnow()
+                task.save()
+                db.session.remove()
+
+    @staticmethod
+    def task_status(task_id: str) -> Optional[Dict]:
+        if not all(char in '0123456789abcdef' for char in task_id):
+            return None
+        path = os.path.join(TASK_STATE_DIR, f"{task_id}.json")
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding='utf-8') as handle:
+            return json.load(handle)
+
+
+background_jobs = BackgroundJobRunner()
+
+
+def _interval_from_env(name: str, default_minutes: int) -> int:
+    try:
+        return int(float(os.environ.get(name, default_minutes)) * 60)
+    except ValueError:
+        return default_minutes * 60
+
+
+_jobs_lock_handle = None
+
+
+def _acquire_jobs_lock() -> bool:
+    """Take the per-database jobs lock; False when another process already runs the jobs"""
+    global _jobs_lock_handle
+    if fcntl is None:
+        return True
+    from app import db_instance_name
+    os.makedirs(JOBS_LOCK_DIR, exist_ok=True)
+    handle = open(os.path.join(JOBS_LOCK_DIR, f"{db_instance_name()}.jobs.lock"), 'w')
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return False
+    # Kept open for the life of the process; the lock is released when it exits
+    _jobs_lock_handle = handle
+    handle.write(str(os.getpid()))
+    handle.flush()
+    return True
+
+
+def start_background_jobs(app, enabled: Optional[bool] = None) -> BackgroundJobRunner:
+    """
+    Register the maintenance jobs and start their threads. Never called on import: run
+    them in one dedicated process with run_background_jobs.py, or set BACKGROUND_JOBS=1
+    for the development server. A file lock keeps them to a single process per database
+    even if several processes try; a job whose interval is set to 0 is not registered.
+    """
+    if enabled is None:
+        enabled = os.environ.get('BACKGROUND_JOBS', '0') == '1'
+    if not enabled or background_jobs.started:
+        return background_jobs
+    if not _acquire_jobs_lock():
+        logger.info("Background jobs already run in another process (pid %s skipped them)", os.getpid())
+        return background_jobs
+
+    from modules.packages.package_expiry_sweeper import PackageExpirySweeper
+    from modules.clients.customer_metrics import CustomerMetricsMaintainer
+    from modules.staff.staff_performance_rollup import StaffPerformanceRollup
+    from modules.inventory.stock_alerts import StockAlertEvaluator
+    from modules.reports.analytics_export import AnalyticsExport
+    from modules.staff.demand_cube import DemandCubeMaintainer
+    from services.report_replica import report_replica
+
+    sweep_interval = _interval_from_env('PACKAGE_SWEEP_INTERVAL_MINUTES', 60)
+    if sweep_interval > 0:
+        background_jobs.register('package_expiry_sweep', PackageExpirySweeper.run, sweep_interval)
+
+    metrics_interval = _interval_from_env('CUSTOMER_METRICS_RECOMPUTE_INTERVAL_MINUTES', 24 * 60)
+    if metrics_interval > 0:
+        background_jobs.register('customer_metrics_recompute', CustomerMetricsMaintainer.recompute,
+                                 metrics_interval)
+
+    rollup_interval = _interval_from_env('STAFF_PERFORMANCE_ROLLUP_INTERVAL_MINUTES', 30)
+    if rollup_interval > 0:
+        background_jobs.register('staff_performance_rollup', StaffPerformanceRollup.run, rollup_interval)
+
+    alerts_interval = _interval_from_env('STOCK_ALERT_REBUILD_INTERVAL_MINUTES', 24 * 60)
+    if alerts_interval > 0:
+        background_jobs.register('stock_alert_rebuild', StockAlertEvaluator.rebuild, alerts_interval)
+
+    export_interval = _interval_from_env('ANALYTICS_EXPORT_INTERVAL_MINUTES', 24 * 60)
+    if export_interval > 0:
+        background_jobs.register('analytics_export', AnalyticsExport.run, export_interval)
+
+    demand_interval = _interval_from_env('DEMAND_CUBE_REBUILD_INTERVAL_MINUTES', 24 * 60)
+    if demand_interval > 0:
+        background_jobs.register('demand_cube_rebuild', DemandCubeMaintainer.rebuild, demand_interval)
+
+    snapshot_interval = _interval_from_env('REPORT_SNAPSHOT_INTERVAL_MINUTES', 5)
+    if snapshot_interval > 0:
+        background_jobs.register('report_snapshot', report_replica.sync_all, snapshot_interval,
+                                 per_branch=False)
+
+    background_jobs.start(app)
+    return background_jobs
@@ -0,0 +1,229 @@
+"""
+Branch Database Router
+One deployment serving several branches, each with its own SQLite database
+(hanamantdatabase/<branch>.db). Requests are routed to a branch engine by header,
+subdomain or the branch the login view pinned to the session; engines live in a
+bounded LRU cache. fan_out() runs a function against every branch in parallel threads
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+from flask import current_app, g, has_app_context, request, session
+from flask_login.config import COOKIE_NAME as REMEMBER_COOKIE_NAME
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Comma-separated branch names served besides the primary instance
+BRANCHES_ENV = 'SPA_BRANCHES'
+
+# Request header that selects a branch, e.g. X-Spa-Branch: andheri
+BRANCH_HEADER = 'X-Spa-Branch'
+
+# Session key pinning a signed-in user to the branch database they authenticated against
+SESSION_BRANCH_KEY = 'branch'
+
+# Most branch engines kept open at once; the least recently used one is disposed
+DEFAULT_ENGINE_CACHE_SIZE = 8
+
+# Parallel workers and overall time limit for cross-branch queries
+DEFAULT_FANOUT_WORKERS = 8
+FANOUT_TIMEOUT_SECONDS = 60
+
+# Flask-Login keys dropped when a session crosses into another branch
+LOGIN_SESSION_KEYS = ('_user_id', '_fresh', '_id', '_remember', SESSION_BRANCH_KEY)
+
+
+def branch_name(value: str) -> str:
+    """Sanitized branch name, safe to use as a database file name"""
+    return re.sub(r'[^A-Za-z0-9_-]', '_', value.strip())
+
+
+class BranchRoutingSession(Session):
+    """
+    Sends every statement to the engine of the branch bound to the current app context,
+    or to its reporting snapshot while a report view reads from one
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context():
+            engine = g.get('read_engine') or g.get('branch_engine')
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class BranchEngineCache:
+    """Thread-safe LRU cache of branch engines; new branch databases get the full schema"""
+
+    def __init__(self, max_engines: int = DEFAULT_ENGINE_CACHE_SIZE):
+        self.max_engines = max(1, max_engines)
+        self._engines: 'OrderedDict[str, Any]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, branch: str):
+        with self._lock:
+            engine = self._engines.get(branch)
+            if engine is not None:
+                self._engines.move_to_end(branch)
+                return engine
+
+        engine = self._create(branch)
+        with self._lock:
+            existing = self._engines.get(branch)
+            if existing is not None:
+                # Another thread created it first
+                engine.dispose()
+                self._engines.move_to_end(branch)
+                return existing
+            self._engines[branch] = engine
+            while len(self._engines) > self.max_engines:
+                evicted, old_engine = self._engines.popitem(last=False)
+                old_engine.dispose()
+                logger.info(f"Disposed engine of branch '{evicted}'")
+        return engine
+
+    @staticmethod
+    def _create(branch: str):
+        from app import app, db, compute_sqlite_uri
+        engine = create_engine(compute_sqlite_uri(branch), **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+        db.metadata.create_all(engine)
+        return engine
+
+    def cached(self) -> List[str]:
+        with self._lock:
+            return list(self._engines)
+
+    def dispose_all(self) -> None:
+        with self._lock:
+            for engine in self._engines.values():
+                engine.dispose()
+            self._engines.clear()
+
+
+@dataclass
+class BranchResult:
+    branch: str
+    value: Any = None
+    error: Optional[str] = None
+
+
+class BranchRouter:
+    """Branch registry, per-request engine selection and cross-branch fan-out"""
+
+    def __init__(self):
+        self.engines = BranchEngineCache(int(os.environ.get('BRANCH_ENGINE_CACHE_SIZE', DEFAULT_ENGINE_CACHE_SIZE)))
+        self._app = None
+        self._registered: List[str] = []
+
+    @property
+    def primary(self) -> str:
+        from app import db_instance_name
+        return db_instance_name()
+
+    def init_app(self, app) -> None:
+        """Route requests when more than one branch is configured"""
+        self._app = app
+        self.refresh()
+        if len(self.branches()) > 1:
+            app.before_request(self._route_request)
+            logger.info(f"Branch routing enabled for: {', '.join(self.branches())}")
+
+    def refresh(self) -> None:
+        """Reload the branch list from SPA_BRANCHES and Locations that carry a branch key"""
+        names = [branch_name(name) for name in os.environ.get(BRANCHES_ENV, '').split(',') if name.strip()]
+        try:
+            from app import db
+            from models import Location
+            with self._app.app_context():
+                names.extend(branch_name(key) for key, in db.session.query(Location.branch_key).filter(
+                    Location.branch_key.isnot(None), Location.is_active == True
+                ))
+        except Exception as e:
+            logger.warning(f"Could not read branch locations: {e}")
+        self._registered = names
+
+    def branches(self) -> List[str]:
+        """Primary instance first, then every registered branch"""
+        return list(OrderedDict.fromkeys([self.primary] + self._registered))
+
+    def bind(self, branch: Optional[str]) -> str:
+        """Send this app context's queries to branch (the primary when None)"""
+        branch = branch_name(branch) if branch else self.primary
+        if branch not in self.branches():
+            raise ValueError(f"Unknown branch '{branch}'")
+        g.branch = branch
+        g.branch_engine = None if branch == self.primary else self.engines.get(branch)
+        return branch
+
+    def current(self) -> str:
+        return g.get('branch', self.primary) if has_app_context() else self.primary
+
+    def requested_branch(self) -> Optional[str]:
+        """Branch named by the request header or subdomain, if it is a known branch"""
+        known = self.branches()
+        header = request.headers.get(BRANCH_HEADER)
+        if header and branch_name(header) in known:
+            return branch_name(header)
+        host = request.host.split(':', 1)[0]
+        labels = host.split('.')
+        if len(labels) > 2 and branch_name(labels[0]) in known:
+            return branch_name(labels[0])
+        return None
+
+    def _route_request(self):
+        requested = self.requested_branch()
+        pinned = session.get(SESSION_BRANCH_KEY)
+        if pinned not in self.branches() or (requested and requested != pinned):
+            # User ids are per branch database, so a login only holds on the branch the
+            # login view pinned; an unpinned one is dropped rather than adopted
+            for key in LOGIN_SESSION_KEYS:
+                if key in session:
+                    session.pop(key)
+            pinned = None
+            if current_app.config.get('REMEMBER_COOKIE_NAME', REMEMBER_COOKIE_NAME) in request.cookies:
+                # A remember-me cookie does not say which branch issued it either
+                session['_remember'] = 'clear'
+        self.bind(requested or pinned or self.primary)
+
+    def fan_out(self, func: Callable[[], Any], branches: Optional[List[str]] = None,
+                max_workers: int = DEFAULT_FANOUT_WORKERS,
+                timeout: float = FANOUT_TIMEOUT_SECONDS) -> Dict[str, BranchResult]:
+        """Run func once per branch in parallel threads, each in its own app context and session"""
+        app = self._app
+        branches = branches or self.branches()
+
+        def run(branch):
+            with app.app_context():
+                self.bind(branch)
+                return func()
+
+        results = {}
+        executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(branches))),
+                                      thread_name_prefix='branch-fanout')
+        try:
+            futures = {branch: executor.submit(run, branch) for branch in branches}
+            deadline = time.monotonic() + timeout
+            for branch, future in futures.items():
+                try:
+                    value = future.result(timeout=max(0.0, deadline - time.monotonic()))
+                    results[branch] = BranchResult(branch, value=value)
+                except FutureTimeoutError:
+                    results[branch] = BranchResult(branch, error=f'Timed out after {timeout}s')
+                except Exception as e:
+                    logger.error(f"Branch '{branch}' query failed: {e}")
+                    results[branch] = BranchResult(branch, error=str(e))
+        finally:
+            # A slow branch must not hold up the response once the deadline has passed
+            executor.shutdown(wait=False, cancel_futures=True)
+        return results
+
+
+branch_router = BranchRouter()
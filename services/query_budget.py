@@ -0,0 +1,142 @@
+"""
+Query Budgets
+Per-endpoint limits on the number of SQL statements a request may issue. Views declare
+their budget with @query_budget; tests check it with assert_query_budget, and
+QUERY_BUDGET_MODE=warn|enforce applies it to live requests as well
+"""
+import functools
+import os
+import threading
+from collections import Counter
+from typing import Callable, List, Optional, Tuple
+from sqlalchemy import event
+import logging
+
+logger = logging.getLogger(__name__)
+
+# off: budgets are only checked by tests; warn: log requests over budget; enforce: fail them
+QUERY_BUDGET_MODE_ENV = 'QUERY_BUDGET_MODE'
+QUERY_BUDGET_MODES = ('off', 'warn', 'enforce')
+
+# Statements shown in a failure message before the rest are summarised
+MAX_REPORTED_STATEMENTS = 40
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised when a request issues more statements than its declared budget"""
+
+    def __init__(self, label: str, budget: int, statements: List[Tuple[str, object]]):
+        self.label = label
+        self.budget = budget
+        self.statements = statements
+        super().__init__(self._format())
+
+    def _format(self) -> str:
+        lines = [f"{self.label} issued {len(self.statements)} SQL statements, budget is {self.budget}"]
+        repeated = [(sql, count) for sql, count in Counter(sql for sql, _ in self.statements).most_common()
+                    if count > 1]
+        if repeated:
+            lines.append("Repeated statements (likely a lazy load inside a loop):")
+            lines.extend(f"  {count}x {_one_line(sql)}" for sql, count in repeated[:5])
+        lines.append("Statements:")
+        for index, (sql, parameters) in enumerate(self.statements[:MAX_REPORTED_STATEMENTS], start=1):
+            lines.append(f"  {index:>3}. {_one_line(sql)}  {parameters!r}")
+        if len(self.statements) > MAX_REPORTED_STATEMENTS:
+            lines.append(f"  ... {len(self.statements) - MAX_REPORTED_STATEMENTS} more")
+        return '\n'.join(lines)
+
+
+def _one_line(sql: str, limit: int = 240) -> str:
+    text = ' '.join(sql.split())
+    return text if len(text) <= limit else text[:limit] + '...'
+
+
+class StatementRecorder:
+    """Records the statements the current thread sends to an engine while active"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements: List[Tuple[str, object]] = []
+        self._thread = None
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == self._thread:
+            self.statements.append((statement, parameters))
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def __enter__(self):
+        self.statements = []
+        self._thread = threading.get_ident()
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+
+    def check(self, budget: int, label: str) -> None:
+        if self.count > budget:
+            raise QueryBudgetExceeded(label, budget, self.statements)
+
+
+def budget_mode() -> str:
+    mode = os.environ.get(QUERY_BUDGET_MODE_ENV, 'off').strip().lower()
+    return mode if mode in QUERY_BUDGET_MODES else 'off'
+
+
+def query_budget(max_queries: int) -> Callable:
+    """
+    Declare the most statements a view may issue against the budget fixture in
+    test_query_budgets.py. Place it directly under the route decorator so the budget
+    is readable from app.view_functions
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            mode = budget_mode()
+            if mode == 'off':
+                return view(*args, **kwargs)
+            from app import db
+            with StatementRecorder(db.session.get_bind()) as recorder:
+                response = view(*args, **kwargs)
+            try:
+                recorder.check(max_queries, view.__name__)
+            except QueryBudgetExceeded as e:
+                if mode == 'enforce':
+                    raise
+                logger.warning(str(e))
+            return response
+
+        wrapper.query_budget = max_queries
+        return wrapper
+    return decorator
+
+
+def declared_budget(app, path: str, method: str = 'GET') -> Optional[int]:
+    """Budget declared on the view that serves path, or None"""
+    adapter = app.url_map.bind('localhost')
+    endpoint, _ = adapter.match(path.split('?', 1)[0], method=method)
+    return getattr(app.view_functions[endpoint], 'query_budget', None)
+
+
+def assert_query_budget(client, path: str, method: str = 'GET', max_queries: Optional[int] = None,
+                        expected_status: int = 200, **request_kwargs):
+    """
+    Request path through a Flask test client and fail with the offending statements
+    when it issues more than the view's declared budget (or max_queries). Returns
+    the response and the number of statements issued
+    """
+    from app import app, db
+    budget = max_queries if max_queries is not None else declared_budget(app, path, method)
+    if budget is None:
+        raise AssertionError(f"{method} {path} has no declared query budget")
+    with app.app_context():
+        engine = db.engine
+    with StatementRecorder(engine) as recorder:
+        response = client.open(path, method=method, **request_kwargs)
+    if response.status_code != expected_status:
+        raise AssertionError(f"{method} {path} returned {response.status_code}, expected {expected_status}")
+    recorder.check(budget, f"{method} {path}")
+    return response, recorder.count
@@ -0,0 +1,189 @@
+"""
+Reporting Replica
+A read-only snapshot of each branch database for long report and export queries. A
+background job copies the live file with SQLite's online backup API a few hundred pages
+at a time, so booking and billing writes only ever wait for one short step. Views
+decorated with @reads_snapshot query the snapshot while it is fresh and fall back to the
+live database otherwise
+"""
+import functools
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from flask import g, has_app_context, make_response
+from sqlalchemy import create_engine
+from services.branch_router import branch_router
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Snapshot of <instance>.db is written to <instance>.report.db next to it
+SNAPSHOT_SUFFIX = '.report.db'
+
+# Pages copied per backup step, and the pause after each step that lets writers in
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_STEP_PAUSE_SECONDS = 0.005
+
+# Longest a snapshot copy may run; the backup restarts whenever the live database is
+# written mid-copy, so a busy branch is given up on and keeps its previous snapshot
+DEFAULT_MAX_COPY_SECONDS = 300
+
+# Snapshots older than this are ignored and reports read the live database instead
+DEFAULT_MAX_AGE_MINUTES = 60
+
+# Response header carrying the time of the snapshot a response was built from
+SNAPSHOT_HEADER = 'X-Report-Snapshot-At'
+
+
+def _max_age() -> timedelta:
+    try:
+        return timedelta(minutes=float(os.environ.get('REPORT_SNAPSHOT_MAX_AGE_MINUTES', DEFAULT_MAX_AGE_MINUTES)))
+    except ValueError:
+        return timedelta(minutes=DEFAULT_MAX_AGE_MINUTES)
+
+
+def _max_copy_seconds() -> float:
+    try:
+        return float(os.environ.get('REPORT_SNAPSHOT_MAX_SECONDS', DEFAULT_MAX_COPY_SECONDS))
+    except ValueError:
+        return DEFAULT_MAX_COPY_SECONDS
+
+
+class ReportReplica:
+    """Builds branch snapshots and hands out read-only engines over them"""
+
+    def __init__(self):
+        self._engines: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def live_path(branch: str) -> str:
+        from app import compute_sqlite_uri
+        return compute_sqlite_uri(branch)[len('sqlite:///'):]
+
+    @classmethod
+    def snapshot_path(cls, branch: str) -> str:
+        return cls.live_path(branch)[:-len('.db')] + SNAPSHOT_SUFFIX
+
+    @classmethod
+    def snapshot_at(cls, branch: Optional[str] = None) -> Optional[datetime]:
+        path = cls.snapshot_path(branch or branch_router.current())
+        return datetime.fromtimestamp(os.path.getmtime(path)) if os.path.exists(path) else None
+
+    def sync(self, branch: Optional[str] = None) -> Dict:
+        """
+        Copy the live database into a new snapshot file and swap it in. The backup restarts
+        by itself if the source changes mid-copy, so the result is consistent as of the end;
+        a copy still running after REPORT_SNAPSHOT_MAX_SECONDS raises TimeoutError and the
+        previous snapshot stays in place
+        """
+        branch = branch or branch_router.current()
+        live_path, snapshot_path = self.live_path(branch), self.snapshot_path(branch)
+        temp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+        started = time.monotonic()
+        deadline = started + _max_copy_seconds()
+        progress = {'pages': 0}
+
+        def pause(status, remaining, total):
+            progress['pages'] = total
+            if time.monotonic() > deadline:
+                # Raising from the callback aborts the backup
+                raise TimeoutError(f"Snapshot copy of branch '{branch}' exceeded {_max_copy_seconds():g}s")
+            time.sleep(BACKUP_STEP_PAUSE_SECONDS)
+
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        source = sqlite3.connect(live_path)
+        target = sqlite3.connect(temp_path)
+        try:
+            try:
+                source.backup(target, pages=BACKUP_PAGES_PER_STEP, progress=pause)
+                # A WAL-mode copy could not be opened read-only without its -shm file
+                target.execute('PRAGMA journal_mode=DELETE')
+            finally:
+                target.close()
+                source.close()
+        except Exception:
+            os.remove(temp_path)
+            logger.warning(f"Report snapshot of branch '{branch}' abandoned after "
+                           f"{time.monotonic() - started:.2f}s; keeping the previous snapshot")
+            raise
+        os.replace(temp_path, snapshot_path)
+        seconds = round(time.monotonic() - started, 2)
+        logger.info(f"Report snapshot of branch '{branch}' copied {progress['pages']} pages in {seconds}s")
+
+        with self._lock:
+            # Pooled connections still point at the replaced file
+            engine = self._engines.pop(branch, None)
+        if engine is not None:
+            engine.dispose()
+
+        return {
+            'branch': branch,
+            'snapshot_at': self.snapshot_at(branch).isoformat(),
+            'pages': progress['pages'],
+            'seconds': seconds
+        }
+
+    def sync_all(self) -> Dict:
+        """Background job entry point: refresh the snapshot of every branch"""
+        results = {}
+        for branch in branch_router.branches():
+            try:
+                results[branch] = self.sync(branch)
+            except Exception as e:
+                logger.error(f"Report snapshot of branch '{branch}' failed: {e}")
+                results[branch] = {'branch': branch, 'error': str(e)}
+        return results
+
+    def engine(self, branch: Optional[str] = None):
+        """Read-only engine over the branch snapshot, or None when it is missing or stale"""
+        branch = branch or branch_router.current()
+        snapshot_at = self.snapshot_at(branch)
+        if snapshot_at is None or datetime.now() - snapshot_at > _max_age():
+            return None
+        with self._lock:
+            engine = self._engines.get(branch)
+            if engine is None:
+                from app import app
+                engine = create_engine(f"sqlite:///file:{self.snapshot_path(branch)}?mode=ro&uri=true",
+                                       **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+                self._engines[branch] = engine
+            return engine
+
+    @contextmanager
+    def reading(self):
+        """Send this app context's queries to the snapshot; yields its time, or None on the live database"""
+        engine = self.engine() if has_app_context() else None
+        if engine is None:
+            yield None
+            return
+        previous = g.get('read_engine'), g.get('report_snapshot_at')
+        g.read_engine = engine
+        g.report_snapshot_at = self.snapshot_at()
+        try:
+            yield g.report_snapshot_at
+        finally:
+            g.read_engine, g.report_snapshot_at = previous
+
+
+report_replica = ReportReplica()
+
+
+def reads_snapshot(view):
+    """
+    Serve a read-only report or export view from the reporting snapshot. Place it under
+    @login_required so the signed-in user is still loaded from the live database
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with report_replica.reading() as snapshot_at:
+            response = make_response(view(*args, **kwargs))
+        if snapshot_at is not None:
+            response.headers[SNAPSHOT_HEADER] = snapshot_at.isoformat(timespec='seconds')
+        return response
+    return wrapper
@@ -370,53 +370,220 @@ class StaffScheduleService:
         else:
             return "Unavailable"
     
+    def get_shift_rows_for_range(self, staff_ids: List[int], start_date: date,
+                                 end_date: date) -> Dict[int, Dict[date, Any]]:
+        """
+        Load every shift log overlapping the range for many staff in one query.
+        Returns {staff_id: {date: row}} where each row carries the shift, break and
+        status columns plus the owning schedule's from/to dates.
+        """
+        from app import db
+        from models import ShiftManagement, ShiftLogs
+
+        if not staff_ids:
+            return {}
+
+        rows = db.session.query(
+            ShiftManagement.staff_id,
+            ShiftManagement.from_date,
+            ShiftManagement.to_date,
+            ShiftLogs.individual_date,
+            ShiftLogs.shift_start_time,
+            ShiftLogs.shift_end_time,
+            ShiftLogs.break_start_time,
+            ShiftLogs.break_end_time,
+            ShiftLogs.status
+        ).join(
+            ShiftLogs, ShiftLogs.shift_management_id == ShiftManagement.id
+        ).filter(
+            ShiftManagement.staff_id.in_(staff_ids),
+            ShiftLogs.individual_date >= start_date,
+            ShiftLogs.individual_date <= end_date
+        ).order_by(ShiftLogs.id).all()
+
+        shifts_by_staff: Dict[int, Dict[date, Any]] = {staff_id: {} for staff_id in staff_ids}
+        for row in rows:
+            # First row wins if an older save left duplicates behind
+            shifts_by_staff[row.staff_id].setdefault(row.individual_date, row)
+        return shifts_by_staff
+
+    def get_booked_intervals_for_range(self, staff_ids: List[int], start_date: date,
+                                       end_date: date) -> Dict[Tuple[int, date], List[Tuple[datetime, datetime]]]:
+        """Load non-cancelled appointment intervals for many staff in one query, keyed by (staff_id, date)"""
+        from app import db
+        from models import Appointment
+
+        if not staff_ids:
+            return {}
+
+        range_start = datetime.combine(start_date, time.min)
+        range_end = datetime.combine(end_date + timedelta(days=1), time.min)
+        rows = db.session.query(
+            Appointment.staff_id,
+            Appointment.appointment_date,
+            Appointment.end_time
+        ).filter(
+            Appointment.staff_id.in_(staff_ids),
+            Appointment.appointment_date >= range_start,
+            Appointment.appointment_date < range_end,
+            Appointment.status.notin_(['cancelled', 'no_show'])
+        ).all()
+
+        booked: Dict[Tuple[int, date], List[Tuple[datetime, datetime]]] = {}
+        for row in rows:
+            apt_end = row.end_time or (row.appointment_date + timedelta(minutes=60))
+            booked.setdefault((row.staff_id, row.appointment_date.date()), []).append(
+                (row.appointment_date, apt_end)
+            )
+        return booked
+
+    @staticmethod
+    def _merge_intervals(intervals: List[Tuple[datetime, datetime]]) -> List[Tuple[datetime, datetime]]:
+        """Merge overlapping (start, end) intervals"""
+        merged: List[Tuple[datetime, datetime]] = []
+        for start, end in sorted(intervals):
+            if end <= start:
+                continue
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        return merged
+
+    @staticmethod
+    def _overlap_minutes(intervals: List[Tuple[datetime, datetime]],
+                         windows: List[WorkingInterval]) -> int:
+        """Total minutes of the (merged) intervals falling inside the working windows"""
+        total = 0.0
+        for start, end in intervals:
+            for window in windows:
+                overlap_start = max(start, window.start_time)
+                overlap_end = min(end, window.end_time)
+                if overlap_end > overlap_start:
+                    total += (overlap_end - overlap_start).total_seconds() / 60
+        return int(total)
+
+    def _build_daily_availability(self, shift_row: Any, target_date: date,
+                                  booked: List[Tuple[datetime, datetime]]) -> Dict[str, Any]:
+        """Compute working hours, break minutes and booked minutes for one staff day"""
+        daily_summary = {
+            'date': target_date.isoformat(),
+            'is_working': False,
+            'schedule_name': "No Schedule",
+            'working_hours': 0,
+            'break_minutes': 0,
+            'booked_minutes': 0,
+            'available_minutes': 0
+        }
+        if shift_row is None:
+            return daily_summary
+
+        daily_summary['schedule_name'] = (
+            f"Shift {shift_row.from_date.strftime('%Y-%m-%d')} to {shift_row.to_date.strftime('%Y-%m-%d')}"
+        )
+        if shift_row.status not in ('scheduled', 'completed'):
+            daily_summary['status'] = shift_row.status
+            return daily_summary
+        if not (shift_row.shift_start_time and shift_row.shift_end_time):
+            return daily_summary
+
+        shift_start_dt = datetime.combine(target_date, shift_row.shift_start_time)
+        shift_end_dt = datetime.combine(target_date, shift_row.shift_end_time)
+        windows = [WorkingInterval(shift_start_dt, shift_end_dt)]
+        break_minutes = 0
+
+        if shift_row.break_start_time and shift_row.break_end_time:
+            break_start_dt = max(datetime.combine(target_date, shift_row.break_start_time), shift_start_dt)
+            break_end_dt = min(datetime.combine(target_date, shift_row.break_end_time), shift_end_dt)
+            if break_end_dt > break_start_dt:
+                break_minutes = int((break_end_dt - break_start_dt).total_seconds() / 60)
+                windows = [
+                    window for window in (
+                        WorkingInterval(shift_start_dt, break_start_dt),
+                        WorkingInterval(break_end_dt, shift_end_dt)
+                    ) if window.end_time > window.start_time
+                ]
+
+        working_minutes = sum((w.end_time - w.start_time).total_seconds() / 60 for w in windows)
+        booked_minutes = self._overlap_minutes(self._merge_intervals(booked), windows)
+
+        daily_summary.update({
+            'is_working': True,
+            'working_hours': (shift_end_dt - shift_start_dt).total_seconds() / 3600,
+            'net_working_hours': working_minutes / 60,
+            'break_minutes': break_minutes,
+            'booked_minutes': booked_minutes,
+            'available_minutes': max(int(working_minutes) - booked_minutes, 0),
+            'shift_start': shift_row.shift_start_time.strftime('%H:%M'),
+            'shift_end': shift_row.shift_end_time.strftime('%H:%M')
+        })
+        return daily_summary
+
+    def get_staff_availability_summaries(self, staff_ids: List[int], start_date: date,
+                                         end_date: date, include_daily: bool = True) -> Dict[int, Dict[str, Any]]:
+        """
+        Range-mode availability summaries for many staff at once.
+        Uses one query for shift logs and one for appointments regardless of range length,
+        then derives working, break and booked minutes with interval arithmetic.
+        """
+        from models import User
+
+        staff_ids = list(dict.fromkeys(staff_ids))
+        staff_names = {}
+        if staff_ids:
+            staff_rows = User.query.with_entities(User.id, User.first_name, User.last_name).filter(
+                User.id.in_(staff_ids)
+            ).all()
+            staff_names = {row.id: f"{row.first_name} {row.last_name}" for row in staff_rows}
+        shifts_by_staff = self.get_shift_rows_for_range(staff_ids, start_date, end_date)
+        booked_by_day = self.get_booked_intervals_for_range(staff_ids, start_date, end_date)
+
+        summaries = {}
+        for staff_id in staff_ids:
+            summary = {
+                'staff_id': staff_id,
+                'staff_name': staff_names.get(staff_id, ''),
+                'date_range': {
+                    'start': start_date.isoformat(),
+                    'end': end_date.isoformat()
+                },
+                'daily_schedules': [],
+                'total_working_days': 0,
+                'total_working_hours': 0,
+                'total_net_working_hours': 0,
+                'total_break_minutes': 0,
+                'total_booked_minutes': 0,
+                'utilization_percentage': 0.0
+            }
+            staff_shifts = shifts_by_staff.get(staff_id, {})
+
+            current_date = start_date
+            while current_date <= end_date:
+                daily_summary = self._build_daily_availability(
+                    staff_shifts.get(current_date), current_date,
+                    booked_by_day.get((staff_id, current_date), [])
+                )
+                if daily_summary['is_working']:
+                    summary['total_working_days'] += 1
+                    summary['total_working_hours'] += daily_summary['working_hours']
+                    summary['total_net_working_hours'] += daily_summary['net_working_hours']
+                    summary['total_break_minutes'] += daily_summary['break_minutes']
+                    summary['total_booked_minutes'] += daily_summary['booked_minutes']
+                if include_daily:
+                    summary['daily_schedules'].append(daily_summary)
+                current_date += timedelta(days=1)
+
+            net_minutes = summary['total_net_working_hours'] * 60
+            if net_minutes:
+                summary['utilization_percentage'] = round(summary['total_booked_minutes'] / net_minutes * 100, 2)
+            summaries[staff_id] = summary
+
+        return summaries
+
     def get_staff_availability_summary(self, staff_id: int, start_date: date, 
                                      end_date: date) -> Dict[str, Any]:
         """Get comprehensive availability summary for a date range"""
-        summary = {
-            'staff_id': staff_id,
-            'date_range': {
-                'start': start_date.isoformat(),
-                'end': end_date.isoformat()
-            },
-            'daily_schedules': [],
-            'total_working_days': 0,
-            'total_working_hours': 0,
-            'total_break_minutes': 0
-        }
-        
-        current_date = start_date
-        while current_date <= end_date:
-            schedule_info = self.get_staff_schedule_for_date(staff_id, current_date)
-            
-            daily_summary = {
-                'date': current_date.isoformat(),
-                'is_working': schedule_info.is_working if schedule_info else False,
-                'schedule_name': schedule_info.schedule_name if schedule_info else "No Schedule",
-                'working_hours': 0,
-                'break_minutes': 0
-            }
-            
-            if schedule_info and schedule_info.is_working:
-                summary['total_working_days'] += 1
-                
-                if schedule_info.shift_start and schedule_info.shift_end:
-                    shift_duration = (datetime.combine(current_date, schedule_info.shift_end) - 
-                                    datetime.combine(current_date, schedule_info.shift_start))
-                    working_hours = shift_duration.total_seconds() / 3600
-                    
-                    daily_summary['working_hours'] = working_hours
-                    daily_summary['break_minutes'] = schedule_info.break_minutes
-                    daily_summary['shift_start'] = schedule_info.shift_start.strftime('%H:%M')
-                    daily_summary['shift_end'] = schedule_info.shift_end.strftime('%H:%M')
-                    
-                    summary['total_working_hours'] += working_hours
-                    summary['total_break_minutes'] += schedule_info.break_minutes
-            
-            summary['daily_schedules'].append(daily_summary)
-            current_date += timedelta(days=1)
-        
-        return summary
+        return self.get_staff_availability_summaries([staff_id], start_date, end_date)[staff_id]
     
     def validate_booking_request(self, staff_id: int, appointment_datetime: datetime, 
                                service_duration: int) -> Dict[str, Any]:
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Cohort Analytics Tests
+Checks the cohort, retention, repeat-interval and churn reports on an empty database
+(hanamantdatabase/<COHORT_ANALYTICS_DB_INSTANCE>.db, default 'cohort_analytics') and on a
+handful of known visits
+
+Usage:
+    python -m pytest test_cohort_analytics.py -q
+    python test_cohort_analytics.py
+"""
+
+import os
+import sys
+
+# The app picks its database when it is imported, so point it at the test instance first
+os.environ['SPA_DB_INSTANCE'] = os.environ.get('COHORT_ANALYTICS_DB_INSTANCE', 'cohort_analytics')
+os.environ.setdefault('SESSION_SECRET', 'cohort-analytics')
+
+from datetime import date, datetime, timedelta
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from app import app, db
+from models import Appointment, Customer, Service, User
+from modules.reports.cohort_analytics import CohortAnalytics, cohort_cache
+
+REPORT_PATHS = ['/reports/cohorts', '/reports/retention', '/reports/repeat-intervals',
+                '/reports/churn', '/reports/churn?format=csv']
+
+
+@pytest.fixture
+def empty_db():
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add(User(username='admin', first_name='Admin', last_name='User', email='admin@spa.com',
+                            password_hash=generate_password_hash('admin123'), role='admin', is_active=True))
+        db.session.commit()
+    cohort_cache.clear()
+    yield
+    cohort_cache.clear()
+
+
+@pytest.fixture
+def client(empty_db):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+        session['_fresh'] = True
+    return client
+
+
+def add_visits(client_id, dates):
+    for day in dates:
+        start = datetime.combine(day, datetime.min.time())
+        db.session.add(Appointment(client_id=client_id, service_id=1, staff_id=1, status='completed',
+                                   appointment_date=start, end_time=start + timedelta(hours=1), amount=100.0))
+
+
+@pytest.mark.parametrize('path', REPORT_PATHS)
+def test_reports_on_empty_database(client, path):
+    response = client.get(path)
+    assert response.status_code == 200, response.data[:500]
+
+
+def test_empty_database_summaries(empty_db):
+    with app.app_context():
+        assert CohortAnalytics.customer_intervals().empty
+        assert CohortAnalytics.churn_flags(as_of=date(2026, 1, 1)).empty
+        summary = CohortAnalytics.repeat_intervals()
+    assert summary['repeat_visits'] == 0
+    assert summary['median_days'] is None
+
+
+def test_intervals_and_churn(empty_db):
+    with app.app_context():
+        db.session.add(Service(name='Massage', duration=60, price=100.0, category='massage', is_active=True))
+        db.session.add_all([Customer(first_name='Regular', last_name='Guest', phone='9000000001'),
+                            Customer(first_name='Lapsed', last_name='Guest', phone='9000000002')])
+        db.session.flush()
+        add_visits(1, [date(2026, 1, 1), date(2026, 1, 11), date(2026, 1, 21)])
+        add_visits(2, [date(2025, 6, 1)])
+        db.session.commit()
+
+        intervals = CohortAnalytics.customer_intervals()
+        flags = CohortAnalytics.churn_flags(as_of=date(2026, 2, 1)).set_index('client_id')
+
+    assert intervals.loc[1, 'visits'] == 3
+    assert intervals.loc[1, 'median_interval_days'] == 10
+    assert not flags.loc[1, 'churned']
+    assert flags.loc[2, 'churned']
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Query Budget Tests
+Requests every view that declares a @query_budget against a fixed-size fixture and fails
+with the offending SQL when a view issues more statements than its budget allows
+
+The fixture is built with the bulk demo data generator in its own database instance
+(hanamantdatabase/<QUERY_BUDGET_DB_INSTANCE>.db, default 'query_budget'): 6 therapists,
+300 customers, 2,000 appointments over three months, 60 inventory batches and a package
+for 5% of customers. A lazy load inside a loop over any of those rows costs more
+statements than the budgets leave room for.
+
+Usage:
+    python -m pytest test_query_budgets.py -q
+    python test_query_budgets.py
+"""
+
+import os
+import sys
+
+# The app picks its database when it is imported, so point it at the fixture instance first
+os.environ['SPA_DB_INSTANCE'] = os.environ.get('QUERY_BUDGET_DB_INSTANCE', 'query_budget')
+os.environ.setdefault('BACKGROUND_JOBS', '0')
+os.environ.setdefault('SESSION_SECRET', 'query-budget')
+
+from datetime import date
+
+import pytest
+
+from app import app, db
+from models import CustomerPackage, EnhancedInvoice
+from demo_data.scale_data_generator import ScaleDataGenerator, ScaleSpec
+from services.query_budget import QueryBudgetExceeded, assert_query_budget
+
+BUDGET_FIXTURE = ScaleSpec(appointments=2000, customers=300, years=0.25, staff=6, batches=60, seed=7)
+
+
+@pytest.fixture(scope='module')
+def fixture_ids():
+    ScaleDataGenerator(BUDGET_FIXTURE).generate()
+    with app.app_context():
+        return {
+            'package_customer_id': db.session.query(CustomerPackage.customer_id).filter(
+                CustomerPackage.status == 'active').order_by(CustomerPackage.id).limit(1).scalar(),
+            'invoice_id': db.session.query(EnhancedInvoice.id).order_by(EnhancedInvoice.id.desc()).limit(1).scalar()
+        }
+
+
+@pytest.fixture
+def client(fixture_ids):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+        session['_fresh'] = True
+    return client
+
+
+def budgeted_paths(ids):
+    today = date.today().isoformat()
+    return {
+        # Booking
+        'api_appointments': f'/api/appointments?date={today}',
+        'api_time_slots': f'/api/time-slots?date={today}',
+        'api_booking_services': '/api/booking-services',
+        'calendar_booking': f'/calendar-booking?date={today}',
+        'staff_availability': f'/staff-availability?date={today}',
+        # Billing
+        'integrated_billing': '/integrated-billing',
+        'billing_customer_packages': f"/integrated-billing/customer-packages/{ids['package_customer_id']}",
+        'billing_invoice': f"/integrated-billing/invoice/{ids['invoice_id']}",
+        # Inventory
+        'api_inventory_products': '/api/inventory/products',
+        'api_inventory_batches': '/api/inventory/batches',
+        'api_products': '/api/products',
+        # Staff
+        'api_staff': '/api/staff',
+        'api_all_schedules': '/shift-scheduler/api/all-schedules',
+        # Packages
+        'package_templates': '/packages/api/templates',
+        'customer_packages': '/packages/api/customer-packages',
+        'prepaid_packages': '/api/prepaid-packages',
+    }
+
+
+BUDGETED_NAMES = list(budgeted_paths({'package_customer_id': 0, 'invoice_id': 0}))
+
+
+@pytest.mark.parametrize('name', BUDGETED_NAMES)
+def test_endpoint_within_query_budget(client, fixture_ids, name):
+    assert_query_budget(client, budgeted_paths(fixture_ids)[name])
+
+
+def test_every_budgeted_view_is_exercised(fixture_ids):
+    adapter = app.url_map.bind('localhost')
+    exercised = {adapter.match(path.split('?', 1)[0], method='GET')[0]
+                 for path in budgeted_paths(fixture_ids).values()}
+    declared = {endpoint for endpoint, view in app.view_functions.items() if hasattr(view, 'query_budget')}
+    assert declared - exercised == set(), f"Views with a budget but no request here: {declared - exercised}"
+
+
+def test_budget_failure_lists_statements(client):
+    with pytest.raises(QueryBudgetExceeded) as excinfo:
+        assert_query_budget(client, '/api/inventory/products', max_queries=0)
+    assert 'budget is 0' in str(excinfo.value)
+    assert 'inventory_products' in str(excinfo.value)
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__, '-q']))